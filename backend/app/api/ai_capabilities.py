@@ -9,7 +9,7 @@ AI 能力 API
 - GET /api/ai-capabilities/events/{session_id}: SSE 事件流
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List, AsyncGenerator
@@ -235,50 +235,61 @@ async def get_task_status(task_id: str):
 # SSE 事件流
 # ==========================================
 
-async def event_generator(session_id: str) -> AsyncGenerator[str, None]:
-    """生成 SSE 事件流"""
-    service = get_ai_capability_service()
-    queue = await service.subscribe(session_id)
+async def event_generator(session_id: str, last_event_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+    """
+    生成 SSE 事件流
+    
+    事件来自跨进程事件总线；带 last_event_id 重连时先补发断线期间的事件
+    """
+    from app.services.task_event_bus import get_task_event_bus, is_valid_event_id
+    bus = get_task_event_bus()
+    cursor = last_event_id if is_valid_event_id(last_event_id) else await bus.latest_id(session_id)
     
     try:
         # 发送初始连接确认
         yield f"event: connected\ndata: {json.dumps({'session_id': session_id})}\n\n"
         
         while True:
-            try:
-                # 等待事件，超时后发送心跳
-                event = await asyncio.wait_for(queue.get(), timeout=30.0)
-                
-                # 发送事件
-                event_data = event.to_dict()
-                yield f"event: {event.event_type}\ndata: {json.dumps(event_data)}\n\n"
-                
-            except asyncio.TimeoutError:
+            # 等待事件，超时后发送心跳
+            events = await bus.read(session_id, cursor, timeout=30.0)
+            if not events:
                 # 发送心跳保持连接
                 yield f"event: heartbeat\ndata: {json.dumps({'timestamp': datetime.utcnow().isoformat()})}\n\n"
+                continue
+            
+            for event_id, event_type, event_data in events:
+                cursor = event_id
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(event_data)}\n\n"
                 
     except asyncio.CancelledError:
         logger.info(f"[SSE] 连接取消: session={session_id}")
     except Exception as e:
         logger.error(f"[SSE] 事件流错误: {e}")
-    finally:
-        await service.unsubscribe(session_id, queue)
 
 
 @router.get("/events/{session_id}")
-async def subscribe_events(session_id: str):
+async def subscribe_events(
+    session_id: str,
+    last_event_id: Optional[str] = Query(None, description="断线重连时补发该事件之后的事件"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
     """
     订阅会话的任务事件流 (SSE)
     
     事件类型:
     - connected: 连接成功
     - progress: 进度更新
+    - first_result: 多结果任务的第一个结果已就绪
+    - first_result_retracted: 其余结果转存失败，撤回 first_result 的 URL（文件将被删除）
     - completed: 任务完成
     - failed: 任务失败
     - heartbeat: 心跳（每30秒）
+    
+    每个任务事件带 id；浏览器自动重连时发送 Last-Event-ID 头，
+    手动重连可通过 last_event_id 参数传入，服务端补发之后的事件
     """
     return StreamingResponse(
-        event_generator(session_id),
+        event_generator(session_id, last_event_id or last_event_id_header),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
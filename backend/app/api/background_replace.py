@@ -223,6 +223,7 @@ async def create_workflow(
             
             duration_seconds = duration_ms / 1000
             all_tasks = []
+            segment_tasks = []
             
             if not is_valid_duration(duration_seconds):
                 # ★★★ 时长不符合，自动分片并为每个分片创建任务 ★★★
@@ -279,10 +280,9 @@ async def create_workflow(
                     
                     logger.info(f"[WorkflowAPI] 智能分片完成: {len(new_clips)} 个新节点")
                     
-                    # 为每个新 clip 创建任务
-                    for new_clip in new_clips:
+                    # 为每个新 clip 创建任务（记录分片区间，后台统一下载一次原视频后裁剪）
+                    for i, new_clip in enumerate(new_clips):
                         new_clip_id = new_clip["id"]
-                        new_duration_ms = int(new_clip.get("duration", 0) * 1000)
                         
                         task = await service.create_background_replace_task(
                             clip_id=new_clip_id,
@@ -292,6 +292,15 @@ async def create_workflow(
                             user_id=user_id,
                             project_id=request.project_id,
                         )
+                        task.segment_info = {
+                            "parent_task_id": request.clip_id,
+                            "segment_index": i,
+                            "total_segments": len(new_clips),
+                            "start_ms": new_clip["source_start"],
+                            "end_ms": new_clip["source_end"],
+                            "duration_ms": new_clip["source_end"] - new_clip["source_start"],
+                        }
+                        segment_tasks.append(task)
                         all_tasks.append(task)
                 else:
                     # 无法分片，但时长又不符合，创建单个任务尝试处理
@@ -324,8 +333,17 @@ async def create_workflow(
                 except Exception as e:
                     logger.error(f"[WorkflowAPI] 后台执行任务失败: {task_id}, error: {e}")
             
-            for task in all_tasks:
-                asyncio.create_task(execute_in_background(task.id))
+            async def execute_segments_in_background(task_ids: List[str]):
+                try:
+                    await service.execute_segment_tasks(task_ids, merge=False)
+                except Exception as e:
+                    logger.error(f"[WorkflowAPI] 后台执行分片任务失败: {task_ids}, error: {e}")
+            
+            if segment_tasks:
+                asyncio.create_task(execute_segments_in_background([task.id for task in segment_tasks]))
+            else:
+                for task in all_tasks:
+                    asyncio.create_task(execute_in_background(task.id))
             
             logger.info(f"[WorkflowAPI] 创建 {len(all_tasks)} 个任务")
             
@@ -379,14 +397,31 @@ async def cancel_workflow(workflow_id: str):
     if task.status == WorkflowStatus.FAILED:
         raise HTTPException(status_code=400, detail="工作流已失败")
     
-    # TODO: 实现取消逻辑
-    task.status = WorkflowStatus.FAILED
-    task.error = "用户取消"
-    task.updated_at = datetime.utcnow()
+    await workflow.cancel_task(workflow_id)
     
     return {"status": "cancelled", "workflow_id": workflow_id}
 
 
+@router.post("/workflows/{workflow_id}/resume", response_model=WorkflowResponse)
+async def resume_workflow(workflow_id: str):
+    """
+    续跑中断的工作流
+    
+    从最后完成的阶段继续；任务仍在其他实例执行或已结束时返回 409
+    """
+    workflow = get_background_replace_workflow()
+    task = await workflow.get_task(workflow_id)
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="工作流不存在")
+    
+    resumed = await workflow.resume_task(workflow_id)
+    if not resumed:
+        raise HTTPException(status_code=409, detail="工作流已结束或仍在执行中")
+    
+    return WorkflowResponse.from_task(resumed)
+
+
 @router.get("/workflows/{workflow_id}/events")
 async def workflow_events(workflow_id: str):
     """
@@ -15,7 +15,6 @@ Lepus AI - 可灵AI Callback 接收器
 import os
 import logging
 import tempfile
-import httpx
 import asyncio
 from datetime import datetime
 from typing import Dict, Any, List, Optional
@@ -33,6 +32,21 @@ router = APIRouter(prefix="/callback", tags=["Callback"])
 
 STORAGE_BUCKET = "ai-creations"
 
+# 回调结果并发转存数（下载 + 上传）
+CALLBACK_INGEST_CONCURRENCY = 4
+
+# output_type → (扩展名, MIME)
+OUTPUT_FILE_TYPES = {
+    "image": (".png", "image/png"),
+    "video": (".mp4", "video/mp4"),
+}
+
+# SSE 事件类型 → 任务状态
+TASK_EVENT_STATUS = {
+    "completed": "completed",
+    "failed": "failed",
+}
+
 
 def _get_supabase():
     """延迟导入 supabase 客户端"""
@@ -97,10 +111,13 @@ KLING_STATUS_MAP = {
 # ============================================
 
 def update_ai_task(task_id: str, **updates):
-    """更新任务表"""
+    """更新任务表；进度更新同时推送 progress 事件（完成/失败由 _publish_task_sse 推送）"""
     updates["updated_at"] = datetime.utcnow().isoformat()
     try:
-        _get_supabase().table("tasks").update(updates).eq("id", task_id).execute()
+        result = _get_supabase().table("tasks").update(updates).eq("id", task_id).execute()
+        if "status" not in updates:
+            from ..services.task_event_bus import publish_task_rows_sync
+            publish_task_rows_sync(getattr(result, "data", None), "progress")
         logger.info(f"[Callback] 任务状态已更新: {task_id} -> {updates.get('status', 'N/A')}")
     except Exception as e:
         logger.error(f"[Callback] 更新任务状态失败: {e}")
@@ -119,32 +136,23 @@ def find_ai_task_by_provider_task_id(provider_task_id: str) -> Optional[Dict]:
 
 
 async def download_file(url: str, dest_path: str) -> str:
-    """下载文件到本地"""
-    async with httpx.AsyncClient(timeout=120) as client:
-        response = await client.get(url, follow_redirects=True)
-        response.raise_for_status()
-        with open(dest_path, "wb") as f:
-            f.write(response.content)
+    """流式下载文件到本地（分块写盘，中断后 Range 续传）"""
+    from ..utils.file_transfer import download_to_file
+    await download_to_file(url, dest_path, timeout=120)
     return dest_path
 
 
 def upload_to_storage(file_path: str, storage_path: str, content_type: str) -> str:
-    """上传文件到 Supabase Storage"""
+    """流式上传文件到 Supabase Storage"""
+    from ..utils.file_transfer import upload_file_to_storage
     supabase = _get_supabase()
     
-    with open(file_path, "rb") as f:
-        file_data = f.read()
-    
-    supabase.storage.from_(STORAGE_BUCKET).upload(
-        storage_path,
-        file_data,
-        file_options={"content-type": content_type, "upsert": "true"}
-    )
+    upload_file_to_storage(STORAGE_BUCKET, storage_path, file_path, content_type, storage_client=supabase)
     
     return supabase.storage.from_(STORAGE_BUCKET).get_public_url(storage_path)
 
 
-def create_ai_output(
+def build_ai_output_row(
     task_id: str,
     user_id: str,
     output_type: str,
@@ -156,23 +164,10 @@ def create_ai_output(
     height: int = None,
     duration: float = None,
     file_size: int = None,
-) -> str:
-    """
-    创建 AI 输出记录 (ai_outputs 表)
-    
-    这是正确的设计：
-    - ai_tasks: 任务状态
-    - ai_outputs: 生成结果（1个任务 → N个输出）
-    
-    与 assets 表无关，AI 模块完全独立！
-    """
-    supabase = _get_supabase()
-    
-    output_id = str(uuid4())
-    now = datetime.utcnow().isoformat()
-    
+) -> Dict[str, Any]:
+    """构建一条 ai_outputs 记录（id 在本地生成，便于批量插入前引用）"""
     output_data = {
-        "id": output_id,
+        "id": str(uuid4()),
         "task_id": task_id,
         "user_id": user_id,
         "output_type": output_type,
@@ -184,42 +179,81 @@ def create_ai_output(
         "height": height,
         "duration": duration,
         "file_size": file_size,
-        "created_at": now,
+        "created_at": datetime.utcnow().isoformat(),
     }
     
     # 移除 None 值
-    output_data = {k: v for k, v in output_data.items() if v is not None}
+    return {k: v for k, v in output_data.items() if v is not None}
+
+
+def create_ai_outputs(rows: List[Dict[str, Any]]) -> List[str]:
+    """批量创建 AI 输出记录，一次 insert 写入所有行"""
+    if not rows:
+        return []
+    _get_supabase().table("ai_outputs").insert(rows).execute()
+    logger.info(f"[Callback] 创建输出记录: task={rows[0]['task_id']}, 共 {len(rows)} 条")
+    return [row["id"] for row in rows]
+
+
+def create_ai_output(
+    task_id: str,
+    user_id: str,
+    output_type: str,
+    output_index: int,
+    original_url: str,
+    storage_path: str = None,
+    storage_url: str = None,
+    width: int = None,
+    height: int = None,
+    duration: float = None,
+    file_size: int = None,
+) -> str:
+    """
+    创建 AI 输出记录 (ai_outputs 表)
     
-    supabase.table("ai_outputs").insert(output_data).execute()
-    logger.info(f"[Callback] 创建输出记录: task={task_id}, index={output_index}, type={output_type}")
-    return output_id
+    这是正确的设计：
+    - ai_tasks: 任务状态
+    - ai_outputs: 生成结果（1个任务 → N个输出）
+    
+    与 assets 表无关，AI 模块完全独立！
+    """
+    row = build_ai_output_row(
+        task_id, user_id, output_type, output_index, original_url,
+        storage_path=storage_path, storage_url=storage_url,
+        width=width, height=height, duration=duration, file_size=file_size,
+    )
+    return create_ai_outputs([row])[0]
 
 
 # ============================================
 # 回调处理
 # ============================================
 
-async def _publish_task_sse(ai_task: Dict, event_type: str, result_url: str = None, error: str = None):
-    """发送任务完成/失败的 SSE 事件到前端"""
-    session_id = ai_task.get("session_id")
-    if not session_id:
-        logger.warning(f"[Callback] 任务 {ai_task['id']} 无 session_id，跳过 SSE 推送")
-        return
+async def _publish_task_sse(
+    ai_task: Dict,
+    event_type: str,
+    result_url: str = None,
+    error: str = None,
+    progress: int = 100,
+    message: str = None,
+):
+    """发送任务 SSE 事件到前端（completed / failed / first_result / first_result_retracted）"""
+    from ..services.task_event_bus import get_task_event_bus, task_subscriber_id
+    session_id = task_subscriber_id(ai_task)
     try:
-        from ..services.ai_capability_service import get_ai_capability_service, TaskEvent
-        service = get_ai_capability_service()
+        from ..services.ai_capability_service import TaskEvent
         event = TaskEvent(
             task_id=ai_task["id"],
             session_id=session_id,
             event_type=event_type,
-            status="completed" if event_type == "completed" else "failed",
-            progress=100,
-            message="任务完成" if event_type == "completed" else error,
+            status=TASK_EVENT_STATUS.get(event_type, "processing"),
+            progress=progress,
+            message=message or ("任务完成" if event_type == "completed" else error),
             result_url=result_url,
             error=error,
             timestamp=datetime.utcnow().isoformat(),
         )
-        await service._publish_event(event)
+        await get_task_event_bus().publish(session_id, event_type, event.to_dict())
         logger.info(f"[Callback] ✅ SSE 事件已推送: task={ai_task['id']}, type={event_type}")
     except Exception as e:
         logger.warning(f"[Callback] SSE 推送失败（不影响主流程）: {e}")
@@ -256,11 +290,11 @@ async def process_callback_result(
         
         # 处理图片结果
         if result.images:
-            await _process_image_results(ai_task_id, user_id, result.images)
+            await _process_image_results(ai_task_id, user_id, result.images, ai_task=ai_task)
         
         # 处理视频结果
         elif result.videos:
-            await _process_video_results(ai_task_id, user_id, result.videos)
+            await _process_video_results(ai_task_id, user_id, result.videos, ai_task=ai_task)
         
         else:
             update_ai_task(
@@ -294,60 +328,156 @@ async def process_callback_result(
         await _publish_task_sse(ai_task, "failed", error=str(e))
 
 
+async def _finish_despite_cancel(awaitable):
+    """
+    线程里的上传无法真正取消：被取消时先等它结束再抛出 CancelledError，
+    保证失败清理时不会有仍在写入的对象
+    """
+    future = asyncio.ensure_future(awaitable)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+def _remove_stored_outputs(storage_paths: List[str]) -> None:
+    """批量删除已转存的结果文件（失败时清理，避免孤儿对象）"""
+    try:
+        _get_supabase().storage.from_(STORAGE_BUCKET).remove(storage_paths)
+        logger.info(f"[Callback] 已清理 {len(storage_paths)} 个转存文件")
+    except Exception as e:
+        logger.warning(f"[Callback] 清理转存文件失败: {storage_paths}, error={e}")
+
+
+async def _ingest_one_output(
+    ai_task_id: str,
+    user_id: str,
+    output_type: str,
+    output_index: int,
+    source_url: str,
+    storage_path: str,
+    duration: float = None,
+) -> Dict[str, Any]:
+    """下载单个结果并转存，返回待插入的 ai_outputs 行"""
+    ext, content_type = OUTPUT_FILE_TYPES[output_type]
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+        tmp_path = tmp.name
+    
+    try:
+        await download_file(source_url, tmp_path)
+        file_size = os.path.getsize(tmp_path)
+        # Storage 上传是同步调用，放到线程里，不阻塞其他结果的下载
+        final_url = await _finish_despite_cancel(
+            asyncio.to_thread(upload_to_storage, tmp_path, storage_path, content_type)
+        )
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    
+    return build_ai_output_row(
+        task_id=ai_task_id,
+        user_id=user_id,
+        output_type=output_type,
+        output_index=output_index,
+        original_url=source_url,
+        storage_path=storage_path,
+        storage_url=final_url,
+        duration=duration,
+        file_size=file_size,
+    )
+
+
+async def _ingest_outputs(
+    ai_task_id: str,
+    user_id: str,
+    output_type: str,
+    items: List[Dict[str, Any]],
+    ai_task: Optional[Dict] = None,
+) -> List[Dict[str, Any]]:
+    """
+    并发转存一批结果（最多 CALLBACK_INGEST_CONCURRENCY 个同时进行）
+    
+    - 第 0 个结果落盘后立即推送 first_result SSE，其余结果继续转存
+    - 全部成功后一次性批量插入 ai_outputs；任一失败则取消其余转存、
+      删除已上传的文件后抛出（ai_outputs 不会引用半批结果）
+    - 失败时若已推送 first_result，先推送 first_result_retracted 撤回该 URL，再删除文件
+    
+    Args:
+        items: [{"index", "url", "storage_path", "duration"}]，按输出顺序
+        
+    Returns:
+        与 items 顺序一致的 ai_outputs 行
+    """
+    semaphore = asyncio.Semaphore(CALLBACK_INGEST_CONCURRENCY)
+    first_result_url = None
+    
+    async def _run(position: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            row = await _ingest_one_output(
+                ai_task_id, user_id, output_type,
+                item["index"], item["url"], item["storage_path"], item.get("duration"),
+            )
+        if position == 0 and ai_task is not None and len(items) > 1:
+            nonlocal first_result_url
+            # 推送前记录：推送途中被取消时同样需要撤回
+            first_result_url = row["storage_url"]
+            await _publish_task_sse(
+                ai_task, "first_result",
+                result_url=row["storage_url"],
+                progress=80,
+                message=f"第 1 个结果已就绪，其余 {len(items) - 1} 个转存中...",
+            )
+        return row
+    
+    tasks = [asyncio.create_task(_run(i, item)) for i, item in enumerate(items)]
+    try:
+        rows = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if first_result_url:
+            await _publish_task_sse(
+                ai_task, "first_result_retracted",
+                result_url=first_result_url,
+                progress=80,
+                message="结果转存失败，已撤回提前预览",
+            )
+        # 路径由任务 ID 决定，整批删除即可覆盖所有已写入的对象
+        await asyncio.to_thread(_remove_stored_outputs, [item["storage_path"] for item in items])
+        raise
+    
+    create_ai_outputs(rows)
+    return rows
+
+
 async def _process_image_results(
     ai_task_id: str,
     user_id: str,
-    images: List[ImageResultModel]
+    images: List[ImageResultModel],
+    ai_task: Optional[Dict] = None,
 ):
-    """处理图片结果 - 存入 ai_outputs 表"""
+    """处理图片结果 - 并发转存后批量存入 ai_outputs 表"""
     logger.info(f"[Callback] 处理 {len(images)} 张图片: {ai_task_id}")
     
     update_ai_task(ai_task_id, progress=70, status_message=f"下载 {len(images)} 张图片...")
     
-    output_ids = []
-    uploaded_images = []
-    first_url = None
+    rows = await _ingest_outputs(ai_task_id, user_id, "image", [
+        {
+            "index": img.index,
+            "url": img.url,
+            "storage_path": f"ai_generated/{user_id}/{ai_task_id}_{img.index}.png",
+        }
+        for img in images
+    ], ai_task=ai_task)
     
-    for img in images:
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            tmp_path = tmp.name
-        
-        try:
-            # 下载图片
-            await download_file(img.url, tmp_path)
-            
-            # 获取文件大小
-            file_size = os.path.getsize(tmp_path)
-            
-            # 上传到我们的存储
-            storage_path = f"ai_generated/{user_id}/{ai_task_id}_{img.index}.png"
-            final_url = upload_to_storage(tmp_path, storage_path, "image/png")
-            
-            # 创建 ai_outputs 记录
-            output_id = create_ai_output(
-                task_id=ai_task_id,
-                user_id=user_id,
-                output_type="image",
-                output_index=img.index,
-                original_url=img.url,
-                storage_path=storage_path,
-                storage_url=final_url,
-                file_size=file_size,
-            )
-            
-            output_ids.append(output_id)
-            uploaded_images.append({
-                "index": img.index,
-                "url": final_url,
-                "output_id": output_id,
-            })
-            
-            if first_url is None:
-                first_url = final_url
-                
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+    output_ids = [row["id"] for row in rows]
+    uploaded_images = [
+        {"index": row["output_index"], "url": row["storage_url"], "output_id": row["id"]}
+        for row in rows
+    ]
+    first_url = rows[0]["storage_url"] if rows else None
     
     # 完成 - output_url 存第一张图，metadata 存所有图片 URL（前端需要 images 数组）
     update_ai_task(
@@ -370,55 +500,27 @@ async def _process_image_results(
 async def _process_video_results(
     ai_task_id: str,
     user_id: str,
-    videos: List[VideoResultModel]
+    videos: List[VideoResultModel],
+    ai_task: Optional[Dict] = None,
 ):
-    """处理视频结果 - 存入 ai_outputs 表"""
+    """处理视频结果 - 并发转存后批量存入 ai_outputs 表"""
     logger.info(f"[Callback] 处理 {len(videos)} 个视频: {ai_task_id}")
     
     update_ai_task(ai_task_id, progress=70, status_message=f"下载 {len(videos)} 个视频...")
     
-    output_ids = []
-    first_url = None
-    
-    for idx, video in enumerate(videos):
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-            tmp_path = tmp.name
-        
-        try:
-            # 下载视频
-            await download_file(video.url, tmp_path)
-            
-            # 获取文件大小
-            file_size = os.path.getsize(tmp_path)
-            
+    rows = await _ingest_outputs(ai_task_id, user_id, "video", [
+        {
+            "index": idx,
+            "url": video.url,
+            "storage_path": f"ai_generated/{user_id}/{ai_task_id}_{idx}.mp4",
             # 解析时长
-            duration = float(video.duration) if video.duration else None
-            
-            # 上传到我们的存储
-            storage_path = f"ai_generated/{user_id}/{ai_task_id}_{idx}.mp4"
-            final_url = upload_to_storage(tmp_path, storage_path, "video/mp4")
-            
-            # 创建 ai_outputs 记录
-            output_id = create_ai_output(
-                task_id=ai_task_id,
-                user_id=user_id,
-                output_type="video",
-                output_index=idx,
-                original_url=video.url,
-                storage_path=storage_path,
-                storage_url=final_url,
-                duration=duration,
-                file_size=file_size,
-            )
-            
-            output_ids.append(output_id)
-            
-            if first_url is None:
-                first_url = final_url
-                
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+            "duration": float(video.duration) if video.duration else None,
+        }
+        for idx, video in enumerate(videos)
+    ], ai_task=ai_task)
+    
+    output_ids = [row["id"] for row in rows]
+    first_url = rows[0]["storage_url"] if rows else None
     
     # 完成
     update_ai_task(
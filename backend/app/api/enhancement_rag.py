@@ -205,14 +205,16 @@ async def analyze_reference_image(
 
     try:
         from app.services.llm.service import get_llm_service
+        from app.services.image_store import get_image_store
         import json as json_mod
 
         content = await file.read()
         image_b64 = base64.b64encode(content).decode("utf-8")
+        handle = get_image_store().put_bytes(content)
 
         llm = get_llm_service()
         raw = await llm.analyze_image(
-            image_base64=image_b64,
+            image=handle,
             prompt=REFERENCE_ANALYSIS_PROMPT,
             system_prompt=REFERENCE_ANALYSIS_SYSTEM,
         )
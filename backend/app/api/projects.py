@@ -129,8 +129,7 @@ async def list_projects(
     前端实际使用的字段: id, name, updated_at, thumbnail_url, thumbnail_asset_id, duration
     不需要返回: status, resolution, fps, created_at
     """
-    import time
-    start_time = time.time()
+    from ..services.tracing import span
     
     try:
         # 1. 查询当前用户的项目 - 只获取前端需要的字段
@@ -144,8 +143,6 @@ async def list_projects(
         result = query.range(offset, offset + limit - 1).execute()
         projects = result.data or []
         
-        logger.info(f"[Projects] 查询项目列表耗时: {(time.time() - start_time) * 1000:.1f}ms, 数量: {len(projects)}")
-        
         if not projects:
             return {
                 "items": [],
@@ -157,18 +154,15 @@ async def list_projects(
         project_ids = [p["id"] for p in projects]
         
         # 2. 并行查询 tracks 和 assets（减少串行等待）
-        parallel_start = time.time()
-        
-        tracks_result, assets_result = await asyncio.gather(
-            asyncio.to_thread(lambda: supabase.table("tracks").select("id, project_id").in_("project_id", project_ids).execute()),
-            asyncio.to_thread(lambda: supabase.table("assets").select("id, project_id, thumbnail_path, created_at").in_("project_id", project_ids).eq("file_type", "video").eq("status", "ready").order("created_at").execute())
-        )
+        with span("projects.fetch_tracks_assets", projects=len(project_ids)):
+            tracks_result, assets_result = await asyncio.gather(
+                asyncio.to_thread(lambda: supabase.table("tracks").select("id, project_id").in_("project_id", project_ids).execute()),
+                asyncio.to_thread(lambda: supabase.table("assets").select("id, project_id, thumbnail_path, created_at").in_("project_id", project_ids).eq("file_type", "video").eq("status", "ready").order("created_at").execute())
+            )
         
         tracks = tracks_result.data or []
         assets = assets_result.data or []
         
-        logger.info(f"[Projects] 并行查询 tracks+assets 耗时: {(time.time() - parallel_start) * 1000:.1f}ms")
-        
         # 3. 构建 track_id -> project_id 映射
         track_to_project = {t["id"]: t["project_id"] for t in tracks}
         track_ids = list(track_to_project.keys())
@@ -176,12 +170,9 @@ async def list_projects(
         # 4. 查询 clips（只需要 track_id 和 end_time）
         duration_map = {}
         if track_ids:
-            clips_start = time.time()
             clips_result = supabase.table("clips").select("track_id, end_time").in_("track_id", track_ids).execute()
             clips = clips_result.data or []
             
-            logger.info(f"[Projects] 查询 clips 耗时: {(time.time() - clips_start) * 1000:.1f}ms, 数量: {len(clips)}")
-            
             # 按 project_id 分组并计算最大 end_time
             for clip in clips:
                 track_id = clip["track_id"]
@@ -225,8 +216,6 @@ async def list_projects(
                     logger.warning(f"[Projects] 生成封面 URL 失败: {e}")
                     project["thumbnail_url"] = None
         
-        logger.info(f"[Projects] 列表接口总耗时: {(time.time() - start_time) * 1000:.1f}ms")
-        
         return {
             "items": projects,
             "total": len(projects),
@@ -274,11 +263,9 @@ async def get_project(
 ):
     """获取项目详情（包含 tracks, clips, assets）- 优化版"""
     import asyncio
-    import time
+    from ..services.tracing import span
     
     try:
-        start_time = time.time()
-        
         # 验证用户权限并获取项目
         project = await verify_project_access(project_id, user_id)
         
@@ -298,19 +285,17 @@ async def get_project(
             ).eq("project_id", project_id).order("order_index").execute()
         
         # 并行执行（使用 asyncio.to_thread 因为 supabase-py 是同步的）
-        assets_result, tracks_result = await asyncio.gather(
-            asyncio.to_thread(fetch_assets),
-            asyncio.to_thread(fetch_tracks)
-        )
+        with span("projects.fetch_assets_tracks"):
+            assets_result, tracks_result = await asyncio.gather(
+                asyncio.to_thread(fetch_assets),
+                asyncio.to_thread(fetch_tracks)
+            )
         
         # 解包结果
         assets = assets_result.data or []
         tracks = tracks_result.data or []
         
-        logger.info(f"[GetProject] ⏱️ 并行查询 assets+tracks: {(time.time() - start_time)*1000:.0f}ms")
-        
         # 批量生成签名 URL
-        t1 = time.time()
         if assets:
             from ..services.supabase_client import get_file_urls_batch
             
@@ -320,7 +305,8 @@ async def get_project(
             all_paths = list(set(storage_paths + thumbnail_paths))
             
             # 批量签名
-            url_map = get_file_urls_batch("clips", all_paths) if all_paths else {}
+            with span("projects.sign_urls", paths=len(all_paths)):
+                url_map = get_file_urls_batch("clips", all_paths) if all_paths else {}
             
             # 分配 URL 并映射字段
             for asset in assets:
@@ -340,23 +326,21 @@ async def get_project(
                     "channels": asset.get("channels"),
                 }
         
-        logger.info(f"[GetProject] ⏱️ 批量签名 URL: {(time.time() - t1)*1000:.0f}ms")
-        
         # ========== 查询 clips ==========
-        t2 = time.time()
         clips = []
         assets_map = {str(a["id"]): a for a in assets}
         
         if tracks:
             track_ids = [t["id"] for t in tracks]
             # 优化：只选择必要字段
-            clips_result = supabase.table("clips").select(
-                "id, track_id, asset_id, clip_type, start_time, end_time, "
-                "source_start, source_end, volume, is_muted, transform, speed, "
-                "transition_in, transition_out, content_text, text_style, "
-                "effect_type, effect_params, voice_params, sticker_id, "
-                "cached_url, name, color, metadata, parent_clip_id"
-            ).in_("track_id", track_ids).order("start_time").execute()
+            with span("projects.fetch_clips", tracks=len(track_ids)):
+                clips_result = supabase.table("clips").select(
+                    "id, track_id, asset_id, clip_type, start_time, end_time, "
+                    "source_start, source_end, volume, is_muted, transform, speed, "
+                    "transition_in, transition_out, content_text, text_style, "
+                    "effect_type, effect_params, voice_params, sticker_id, "
+                    "cached_url, name, color, metadata, parent_clip_id"
+                ).in_("track_id", track_ids).order("start_time").execute()
             
             if clips_result.data:
                 for clip in clips_result.data:
@@ -370,10 +354,6 @@ async def get_project(
                         clip["url"] = clip["cached_url"]
                         
                 clips = clips_result.data
-                
-                video_clips = [c for c in clips if c.get("clip_type") == "video"]
-                subtitle_clips = [c for c in clips if c.get("clip_type") == "subtitle"]
-                logger.info(f"[GetProject] ⏱️ clips 查询: {(time.time() - t2)*1000:.0f}ms, 视频={len(video_clips)}, 字幕={len(subtitle_clips)}")
         
         # 计算项目总时长
         duration = 0
@@ -381,15 +361,15 @@ async def get_project(
             duration = max(c.get("end_time", 0) for c in clips)
         
         # ========== 查询关键帧 ==========
-        t3 = time.time()
         keyframes = []
         if clips:
             clip_ids = [c["id"] for c in clips]
             
             # 优化：只选择必要字段，直接读取 offset（归一化值 0-1）
-            keyframes_result = supabase.table("keyframes").select(
-                "id, clip_id, property, offset, value, easing"
-            ).in_("clip_id", clip_ids).order("offset").execute()
+            with span("projects.fetch_keyframes", clips=len(clip_ids)):
+                keyframes_result = supabase.table("keyframes").select(
+                    "id, clip_id, property, offset, value, easing"
+                ).in_("clip_id", clip_ids).order("offset").execute()
             
             if keyframes_result.data:
                 for kf in keyframes_result.data:
@@ -402,8 +382,6 @@ async def get_project(
                         "value": kf["value"],
                         "easing": kf.get("easing", "linear"),
                     })
-                
-                logger.info(f"[GetProject] ⏱️ keyframes 查询: {(time.time() - t3)*1000:.0f}ms, 共 {len(keyframes)} 个")
         
         # 构建 timeline（duration 放在最外层，避免冗余）
         timeline = {
@@ -432,9 +410,7 @@ async def get_project(
                 logger.warning(f"[Projects] 生成项目封面 URL 失败: {e}")
                 project["thumbnail_url"] = None
         
-        total_time = (time.time() - start_time) * 1000
-        logger.info(f"[GetProject] ✅ 总耗时: {total_time:.0f}ms")
-        
+        # 各阶段耗时见 [Trace] 日志（GET /api/projects/{project_id}）
         # ★ 统一使用 timeline 包含 tracks/clips/keyframes，避免冗余
         return {
             **project,
@@ -1130,13 +1106,11 @@ async def save_project_state(project_id: str, request: dict):
     ★ 新增：自动重试 HTTP/2 断连错误
     """
     import asyncio
-    import time
     import httpx
+    from ..services.tracing import span
     
     MAX_RETRIES = 3  # 最大重试次数
     
-    start_time = time.time()
-    
     try:
         now = datetime.utcnow().isoformat()
         
@@ -1149,8 +1123,6 @@ async def save_project_state(project_id: str, request: dict):
         def is_valid_uuid(val):
             return bool(val and uuid_pattern.match(str(val)))
         
-        t1 = time.time()
-        
         # ★ 优化：一次性查询所有需要的数据（带重试）
         def _fetch_all():
             # 查项目（必须）
@@ -1176,19 +1148,17 @@ async def save_project_state(project_id: str, request: dict):
             return project.data, track_ids, clip_ids, kf_ids
         
         # ★ 带重试的查询
-        for attempt in range(MAX_RETRIES):
-            try:
-                project, existing_track_ids, existing_clip_ids, existing_kf_ids = await asyncio.to_thread(_fetch_all)
-                break
-            except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError) as e:
-                if attempt < MAX_RETRIES - 1:
-                    logger.warning(f"[Projects] 查询断连，重试 {attempt + 1}/{MAX_RETRIES}: {e}")
-                    await asyncio.sleep(0.5 * (attempt + 1))
-                else:
-                    raise
-        
-        t2 = time.time()
-        logger.debug(f"[Projects] 查询耗时: {(t2-t1)*1000:.0f}ms")
+        with span("projects.save.fetch"):
+            for attempt in range(MAX_RETRIES):
+                try:
+                    project, existing_track_ids, existing_clip_ids, existing_kf_ids = await asyncio.to_thread(_fetch_all)
+                    break
+                except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError) as e:
+                    if attempt < MAX_RETRIES - 1:
+                        logger.warning(f"[Projects] 查询断连，重试 {attempt + 1}/{MAX_RETRIES}: {e}")
+                        await asyncio.sleep(0.5 * (attempt + 1))
+                    else:
+                        raise
         
         if project is None:
             raise HTTPException(status_code=404, detail="项目不存在")
@@ -1306,8 +1276,6 @@ async def save_project_state(project_id: str, request: dict):
                 }
                 kf_to_upsert.append(kf_data)
         
-        t3 = time.time()
-        
         # ★ 执行批量操作（使用 upsert 一次性处理）
         def _batch_save():
             # Tracks: 使用 upsert
@@ -1343,24 +1311,17 @@ async def save_project_state(project_id: str, request: dict):
             supabase.table("projects").update({"updated_at": now}).eq("id", project_id).execute()
         
         # ★ 带重试的保存
-        for attempt in range(MAX_RETRIES):
-            try:
-                await asyncio.to_thread(_batch_save)
-                break
-            except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError) as e:
-                if attempt < MAX_RETRIES - 1:
-                    logger.warning(f"[Projects] 保存断连，重试 {attempt + 1}/{MAX_RETRIES}: {e}")
-                    await asyncio.sleep(0.5 * (attempt + 1))
-                else:
-                    raise
-        
-        t4 = time.time()
-        total_ms = (t4 - start_time) * 1000
-        query_ms = (t2 - t1) * 1000
-        prep_ms = (t3 - t2) * 1000
-        save_ms = (t4 - t3) * 1000
-        
-        logger.info(f"[Projects] state 保存完成: 总耗时={total_ms:.0f}ms (查询={query_ms:.0f}ms, 准备={prep_ms:.0f}ms, 写入={save_ms:.0f}ms)")
+        with span("projects.save.write", clips=len(clips_to_insert) + len(clips_to_update), keyframes=len(kf_to_upsert)):
+            for attempt in range(MAX_RETRIES):
+                try:
+                    await asyncio.to_thread(_batch_save)
+                    break
+                except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError) as e:
+                    if attempt < MAX_RETRIES - 1:
+                        logger.warning(f"[Projects] 保存断连，重试 {attempt + 1}/{MAX_RETRIES}: {e}")
+                        await asyncio.sleep(0.5 * (attempt + 1))
+                    else:
+                        raise
         
         return {
             "success": True,
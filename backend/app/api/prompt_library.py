@@ -19,6 +19,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 
 from app.api.auth import get_current_user_id
+from app.services.prompt_enhancer import invalidate_prompt_library_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -202,6 +203,7 @@ async def add_prompt(
         }
 
         supabase.table("prompt_library").upsert(row).execute()
+        invalidate_prompt_library_snapshot()
         logger.info(f"[PromptLibrary] 添加 prompt: {pid} ({request.capability}/{request.platform})")
 
         return {"success": True, "data": {"id": pid}}
@@ -223,6 +225,7 @@ async def delete_prompt(
         from app.services.supabase_client import supabase
 
         supabase.table("prompt_library").delete().eq("id", prompt_id).execute()
+        invalidate_prompt_library_snapshot()
 
         return {"success": True, "data": {"id": prompt_id}}
 
@@ -314,6 +317,7 @@ async def seed_prompts(
                             logger.warning(f"[PromptLibrary] seed 单条失败: {e}")
                             errors += 1
 
+        invalidate_prompt_library_snapshot()
         logger.info(f"[PromptLibrary] seed 完成: {total_inserted} 条入库, {errors} 条失败")
         return {"success": True, "data": {
             "total_inserted": total_inserted,
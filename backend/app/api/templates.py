@@ -7,6 +7,7 @@ import logging
 import os
 import tempfile
 import uuid
+from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any, Literal
 
 from fastapi import APIRouter, Query, HTTPException, Depends, Body
@@ -16,6 +17,7 @@ from app.services.supabase_client import supabase, get_file_url
 from app.services.template_ingest_service import get_template_ingest_service
 from app.services.template_render_service import get_template_render_service
 from app.services.template_candidate_service import get_template_candidate_service
+from app.services.template_catalog import get_template_catalog
 from app.api.auth import get_current_user_id
 
 logger = logging.getLogger(__name__)
@@ -271,6 +273,35 @@ def _upload_transition_frame(file_path: str, role: str) -> str:
     return supabase.storage.from_(TEMPLATE_BUCKET).get_public_url(frame_name)
 
 
+def _touch_fields() -> Dict[str, Any]:
+    """template_records 更新时附带 updated_at，模板目录据此增量刷新"""
+    return {"updated_at": datetime.now(timezone.utc).isoformat()}
+
+
+def _sync_golden_profiles(template_ids: List[str]) -> None:
+    """标注 / 发布状态变化后，增量更新数据驱动的 Golden Profile 统计"""
+    from app.services.golden_fingerprint_service import get_golden_fingerprint_service
+    service = get_golden_fingerprint_service()
+    if not service.tracks_labels:
+        return
+    for template_id in template_ids:
+        try:
+            record = (
+                supabase.table("template_records")
+                .select("template_id,status,metadata,quality_label,publish_config")
+                .eq("template_id", template_id)
+                .execute()
+                .data
+            )
+        except Exception as exc:
+            logger.warning("[GoldenFingerprint] 增量更新失败 %s: %s", template_id, exc)
+            continue
+        if record:
+            service.observe_template(record[0])
+        else:
+            service.forget_template(template_id)
+
+
 def _public_url(bucket: str, path: Optional[str]) -> str:
     if not path:
         return ""
@@ -857,13 +888,15 @@ def publish_template(
         return {"success": True, "template_id": template_id, "status": "published", "message": "已是发布状态"}
 
     try:
-        from datetime import datetime, timezone
         supabase.table("template_records").update({
             "status": "published",
             "published_at": datetime.now(timezone.utc).isoformat(),
+            **_touch_fields(),
         }).eq("template_id", template_id).execute()
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"发布失败: {exc}")
+    get_template_catalog().invalidate()
+    _sync_golden_profiles([template_id])
 
     logger.info("[TemplatePublish] 模板已发布: %s by user %s", template_id, user_id)
     return {"success": True, "template_id": template_id, "status": "published"}
@@ -886,9 +919,12 @@ def unpublish_template(
     try:
         supabase.table("template_records").update({
             "status": "draft",
+            **_touch_fields(),
         }).eq("template_id", template_id).execute()
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"下架失败: {exc}")
+    get_template_catalog().invalidate()
+    _sync_golden_profiles([template_id])
 
     logger.info("[TemplateUnpublish] 模板已下架: %s by user %s", template_id, user_id)
     return {"success": True, "template_id": template_id, "status": "draft"}
@@ -903,7 +939,6 @@ def batch_publish_templates(
     if not template_ids:
         raise HTTPException(status_code=400, detail="template_ids is required")
 
-    from datetime import datetime, timezone
     now = datetime.now(timezone.utc).isoformat()
     published = []
     failed = []
@@ -913,10 +948,13 @@ def batch_publish_templates(
             supabase.table("template_records").update({
                 "status": "published",
                 "published_at": now,
+                "updated_at": now,
             }).eq("template_id", tid).execute()
             published.append(tid)
         except Exception as exc:
             failed.append({"template_id": tid, "error": str(exc)})
+    get_template_catalog().invalidate()
+    _sync_golden_profiles(published)
 
     logger.info("[TemplateBatchPublish] 批量发布 %d 个模板 by user %s", len(published), user_id)
     return {
@@ -1182,7 +1220,7 @@ def update_preview_render(
             )
             if render_result.data and render_result.data.get("video_url"):
                 supabase.table("template_records").update(
-                    {"preview_video_url": render_result.data["video_url"]}
+                    {"preview_video_url": render_result.data["video_url"], **_touch_fields()}
                 ).eq("template_id", template_id).execute()
         except Exception:
             pass
@@ -1202,7 +1240,7 @@ def update_quality_label(
     user_id: str = Depends(get_current_user_id),
 ) -> Dict[str, Any]:
     """设置模板质量标签"""
-    update_data: Dict[str, Any] = {"quality_label": payload.quality_label}
+    update_data: Dict[str, Any] = {"quality_label": payload.quality_label, **_touch_fields()}
     if payload.admin_notes is not None:
         update_data["admin_notes"] = payload.admin_notes
 
@@ -1210,6 +1248,7 @@ def update_quality_label(
         supabase.table("template_records").update(update_data).eq("template_id", template_id).execute()
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"更新失败: {exc}")
+    _sync_golden_profiles([template_id])
 
     logger.info("[QualityLabel] %s → %s by user %s", template_id, payload.quality_label, user_id)
     return {"success": True, "template_id": template_id, "quality_label": payload.quality_label}
@@ -1236,10 +1275,11 @@ def update_publish_config(
 
     try:
         supabase.table("template_records").update(
-            {"publish_config": new_config}
+            {"publish_config": new_config, **_touch_fields()}
         ).eq("template_id", template_id).execute()
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"更新失败: {exc}")
+    _sync_golden_profiles([template_id])
 
     logger.info("[PublishConfig] 更新 %s by user %s", template_id, user_id)
     return {"success": True, "template_id": template_id, "publish_config": new_config}
@@ -1308,6 +1348,8 @@ def batch_delete_templates(
                 deleted_ids.append(tid)
             except Exception as inner_e:
                 failed.append({"template_id": tid, "error": str(inner_e)})
+    get_template_catalog().remove(deleted_ids)
+    _sync_golden_profiles(deleted_ids)
 
     return {
         "success": True,
@@ -1359,6 +1401,8 @@ def delete_template(
         supabase.table("template_records").delete().eq("template_id", template_id).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete template: {e}")
+    get_template_catalog().remove([template_id])
+    _sync_golden_profiles([template_id])
 
     return {"success": True, "template_id": template_id}
 
@@ -1389,6 +1433,26 @@ def rebuild_golden_profiles(
     return result
 
 
+@router.get("/golden-profiles/library-match")
+def match_template_library(
+    status: Optional[str] = Query("published", description="按状态过滤，传空匹配全部"),
+    user_id: str = Depends(get_current_user_id),
+) -> Dict[str, Any]:
+    """对整个模板库做一次批量 Golden Profile 匹配"""
+    from app.services.golden_fingerprint_service import get_golden_fingerprint_service
+
+    try:
+        query = supabase.table("template_records").select("template_id,metadata")
+        if status:
+            query = query.eq("status", status)
+        records = query.execute().data or []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {e}")
+
+    matches = get_golden_fingerprint_service().match_templates(records)
+    return {"matches": matches, "count": len(matches)}
+
+
 @router.post("/{template_id}/extract-fingerprint")
 def extract_template_fingerprint(
     template_id: str,
@@ -1415,6 +1479,7 @@ def extract_template_fingerprint(
 
     service = get_golden_fingerprint_service()
     fp_result = service.process_template(result.data, auto_fill=True)
+    _sync_golden_profiles([template_id])
     return fp_result
 
 
@@ -46,6 +46,7 @@ celery_app = Celery(
         "app.tasks.avatar_confirm_portraits",  # 数字人确认肖像
         "app.tasks.doubao_image",              # 豆包 Seedream 图像生成
         "app.tasks.broll_download",        # B-roll 下载
+        "app.tasks.template_ingest",       # 模板采集（爆款视频拆解）
     ]
 )
 
@@ -105,6 +106,15 @@ celery_app.conf.update(
     },
 )
 
+# ============================================
+# 耗时追踪：发布时注入 traceparent，worker 执行时接续 API 的 trace
+# ============================================
+
+from app.services.tracing import install_celery_tracing, install_httpx_tracing
+
+install_celery_tracing()
+install_httpx_tracing()
+
 # ============================================
 # 任务优先级装饰器
 # ============================================
@@ -158,6 +168,12 @@ def _get_supabase():
     return supabase
 
 
+def _publish_task_rows(result):
+    """把更新后的任务行推送到 SSE 事件总线，worker 与 API 不同进程也能收到"""
+    from app.services.task_event_bus import publish_task_rows_sync
+    publish_task_rows_sync(getattr(result, "data", None))
+
+
 def update_task_progress(task_id: str, progress: int, current_step: str = None):
     """更新任务进度"""
     update_data = {
@@ -167,7 +183,8 @@ def update_task_progress(task_id: str, progress: int, current_step: str = None):
     if current_step:
         update_data["current_step"] = current_step
     
-    _get_supabase().table("tasks").update(update_data).eq("id", task_id).execute()
+    result = _get_supabase().table("tasks").update(update_data).eq("id", task_id).execute()
+    _publish_task_rows(result)
 
 
 def update_task_status(task_id: str, status: str, result: dict = None, error: str = None):
@@ -183,4 +200,5 @@ def update_task_status(task_id: str, status: str, result: dict = None, error: st
     if status == "completed":
         update_data["progress"] = 100
     
-    _get_supabase().table("tasks").update(update_data).eq("id", task_id).execute()
+    result = _get_supabase().table("tasks").update(update_data).eq("id", task_id).execute()
+    _publish_task_rows(result)
@@ -9,12 +9,13 @@ from dotenv import load_dotenv
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(env_path)
 
+import asyncio
 import traceback
 import logging
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,7 @@ class EndpointFilter(logging.Filter):
     FILTERED_PATHS = [
         "/workspace/sessions/",  # workspace session 轮询
         "/health",               # 健康检查
+        "/metrics",              # Prometheus 抓取
         "/.well-known/",         # Chrome DevTools 等浏览器自动请求
     ]
     
@@ -60,6 +62,7 @@ logging.getLogger("httpx").addFilter(HttpxFilter())
 
 from app.config import get_settings
 from app.api import api_router
+from app.services.tracing import PROMETHEUS_CONTENT_TYPE, TracingMiddleware, render_prometheus, setup_tracing
 
 settings = get_settings()
 
@@ -78,6 +81,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求级耗时追踪（最外层，覆盖 CORS 与异常处理；同时挂钩 httpx 记录下游调用）
+setup_tracing()
+app.add_middleware(TracingMiddleware)
+
 # 全局异常处理 - 确保所有错误都返回详细信息
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -132,6 +139,21 @@ if settings.dev_mode:
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 
+@app.on_event("startup")
+async def resume_template_ingest_jobs():
+    """重新入队心跳过期的模板采集任务（worker 崩溃 / 进程内回退执行时重启遗留）"""
+    from app.services.template_ingest_service import get_template_ingest_service
+    asyncio.create_task(get_template_ingest_service().resume_interrupted_jobs())
+
+
+@app.on_event("startup")
+async def preload_segmentation_models():
+    """SEGMENTATION_PRELOAD=1 时启动即加载分割模型，首个请求不再等待模型初始化"""
+    if os.getenv("SEGMENTATION_PRELOAD") == "1":
+        from app.services.segmentation_pool import get_segmentation_pool
+        get_segmentation_pool().start()
+
+
 @app.get("/")
 async def root():
     return {
@@ -145,3 +167,9 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指标（span 耗时直方图）"""
+    return Response(content=render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
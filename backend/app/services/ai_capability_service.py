@@ -104,41 +104,18 @@ class AICapabilityService:
     def __init__(self):
         self.kling_client = KlingAIClient()
         self._tasks: Dict[str, CapabilityTask] = {}  # 内存任务存储
-        self._subscribers: Dict[str, Set[Queue]] = {}  # session_id -> queues
     
     # ==========================================
     # SSE 订阅管理
     # ==========================================
     
-    async def subscribe(self, session_id: str) -> Queue:
-        """订阅会话的任务事件"""
-        if session_id not in self._subscribers:
-            self._subscribers[session_id] = set()
-        
-        queue: Queue = Queue()
-        self._subscribers[session_id].add(queue)
-        logger.info(f"[SSE] 新订阅: session={session_id}, 当前订阅数={len(self._subscribers[session_id])}")
-        return queue
-    
-    async def unsubscribe(self, session_id: str, queue: Queue):
-        """取消订阅"""
-        if session_id in self._subscribers:
-            self._subscribers[session_id].discard(queue)
-            if not self._subscribers[session_id]:
-                del self._subscribers[session_id]
-            logger.info(f"[SSE] 取消订阅: session={session_id}")
-    
     async def _publish_event(self, event: TaskEvent):
-        """发布事件到订阅者"""
-        session_id = event.session_id
-        if session_id not in self._subscribers:
-            return
-        
-        for queue in self._subscribers[session_id]:
-            try:
-                await queue.put(event)
-            except Exception as e:
-                logger.warning(f"[SSE] 发布事件失败: {e}")
+        """发布事件到事件总线（跨进程，SSE 连接从总线读取）"""
+        from .task_event_bus import get_task_event_bus
+        try:
+            await get_task_event_bus().publish(event.session_id, event.event_type, event.to_dict())
+        except Exception as e:
+            logger.warning(f"[SSE] 发布事件失败: {e}")
     
     async def _emit_progress(self, task: CapabilityTask, progress: int, message: str):
         """发送进度更新"""
@@ -1178,10 +1155,14 @@ class AICapabilityService:
                 base_url = getattr(settings, 'BACKEND_URL', 'http://localhost:8000')
                 keyframe_url = f"{base_url.rstrip('/')}/{keyframe_url.lstrip('/')}"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(keyframe_url)
-                response.raise_for_status()
-                keyframe_image = Image.open(io.BytesIO(response.content))
+            # ★ 关键帧按内容哈希进入图片存储，后续意图分析 / Kling 输入只传句柄
+            from app.services.image_store import get_image_store
+            image_store = get_image_store()
+            if keyframe_url.startswith('data:'):
+                keyframe_handle = image_store.put_data_url(keyframe_url)
+            else:
+                keyframe_handle = await image_store.fetch(keyframe_url)
+            keyframe_image = image_store.open(keyframe_handle)
             
             original_keyframe_image = keyframe_image.copy()
             original_width, original_height = keyframe_image.size
@@ -1192,23 +1173,19 @@ class AICapabilityService:
             mask_data_url = getattr(task, 'mask_data_url', None) or task.mask_url
             has_mask = bool(mask_data_url)
             
-            mask_base64_for_analysis = None
-            original_image_base64_for_analysis = None
+            mask_handle_for_analysis = None
+            original_handle_for_analysis = None
             
             if has_mask and mask_data_url:
                 try:
                     if mask_data_url.startswith('data:'):
                         if ',' in mask_data_url:
-                            mask_base64_for_analysis = mask_data_url.split(',')[1]
+                            mask_handle_for_analysis = image_store.put_data_url(mask_data_url)
                     elif mask_data_url.startswith('http://') or mask_data_url.startswith('https://'):
-                        async with httpx.AsyncClient(timeout=30) as client:
-                            response = await client.get(mask_data_url, follow_redirects=True)
-                            response.raise_for_status()
-                            mask_img = Image.open(io.BytesIO(response.content))
-                            mask_base64_for_analysis = pil_image_to_base64(mask_img, format="PNG")
+                        mask_handle_for_analysis = await image_store.fetch(mask_data_url)
                     
-                    # ★ 同时准备原图 base64 用于上下文分析
-                    original_image_base64_for_analysis = pil_image_to_base64(keyframe_image, format="JPEG")
+                    # ★ 同时传原图句柄用于上下文分析（发送前才按 llm 变体缩放编码）
+                    original_handle_for_analysis = keyframe_handle
                     logger.info(f"[BackgroundReplace] 已准备涂鸦 + 原图用于多模态分析")
                 except Exception as e:
                     logger.warning(f"[BackgroundReplace] 准备分析图片失败: {e}")
@@ -1219,8 +1196,8 @@ class AICapabilityService:
             intent_result = await classify_edit_intent(
                 prompt=task.prompt,
                 has_mask=has_mask,
-                mask_base64=mask_base64_for_analysis,
-                original_image_base64=original_image_base64_for_analysis,
+                mask_base64=mask_handle_for_analysis,
+                original_image_base64=original_handle_for_analysis,
                 use_llm=True,
             )
             
@@ -1243,7 +1220,7 @@ class AICapabilityService:
             # Step 1: 准备 omni-image 图片输入
             processed_mask_image = None
             
-            keyframe_base64 = prepare_kling_image_input(keyframe_image)
+            keyframe_base64 = prepare_kling_image_input(keyframe_handle)
             image_list = [{"image": keyframe_base64}]
             
             await self._emit_progress(task, 20, "正在构建编辑指令...")
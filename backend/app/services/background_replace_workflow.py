@@ -15,13 +15,16 @@ import asyncio
 import logging
 import json
 import time
-from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime
-from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from datetime import datetime, timezone
+from dataclasses import dataclass, asdict, field, is_dataclass
 from enum import Enum
 from PIL import Image
 import io
 import httpx
+import numpy as np
+
+from app.utils.ffmpeg import run_ffmpeg
 
 logger = logging.getLogger(__name__)
 
@@ -184,6 +187,25 @@ async def resolve_video_download_url(clip_id: str) -> Optional[str]:
         return None
 
 
+# ==========================================
+# 媒体处理工具
+# ==========================================
+
+async def _download_segment(client: httpx.AsyncClient, url: str, dest_path: str) -> str:
+    from ..utils.file_transfer import download_to_file
+    await download_to_file(url, dest_path, client=client)
+    return dest_path
+
+
+async def _upload_temp_video(file_path: str, folder: str = "background") -> str:
+    """上传中间结果视频到 clips/temp/{folder}，返回签名 URL"""
+    from ..utils.file_transfer import upload_file_to_storage
+    from .supabase_client import get_file_url
+    storage_path = f"temp/{folder}/{uuid.uuid4().hex}.mp4"
+    await asyncio.to_thread(upload_file_to_storage, "clips", storage_path, file_path, "video/mp4")
+    return get_file_url("clips", storage_path, expires_in=86400)
+
+
 # ==========================================
 # 数据模型
 # ==========================================
@@ -354,6 +376,12 @@ class BackgroundReplaceTask:
     background_video: Optional[BackgroundVideoResult] = None
     composite: Optional[CompositeResult] = None
     qa_report: Optional[QAReport] = None
+    
+    # 持久化 / 断点续传（tasks 表需要 user_id）
+    user_id: Optional[str] = None
+    project_id: Optional[str] = None
+    stage_outputs: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # 已完成阶段 → 产出
+    stage_progresses: Dict[str, int] = field(default_factory=dict)          # 各阶段进度 0-100
 
 
 # ==========================================
@@ -523,24 +551,16 @@ class EditDetectionAgent:
         Returns:
             (mask_image, mask_url)
         """
+        from .segmentation_pool import SegmentationUnavailable, get_segmentation_pool
         try:
-            from rembg import remove
-            import numpy as np
-            
-            # 使用 rembg 获取前景
-            result = remove(frame, only_mask=True)
-            
-            # result 已经是 mask
-            if isinstance(result, Image.Image):
-                mask = result
-            else:
-                mask = Image.fromarray(result)
+            # 使用常驻分割模型池获取前景 mask
+            mask = await get_segmentation_pool().predict_mask(frame)
             
             # TODO: 上传 mask 到存储并返回 URL
             # 这里暂时返回 None 作为 URL
             return mask, None
             
-        except ImportError:
+        except SegmentationUnavailable:
             logger.warning("[EditDetection] rembg 未安装，使用空 mask")
             # 返回空 mask
             empty_mask = Image.new('L', frame.size, 0)
@@ -935,15 +955,81 @@ class VideoAnalysisAgent:
 # Stage 2: 前景分离 Agent
 # ==========================================
 
+MATTE_MAX_SIDE = int(os.getenv("MATTE_MAX_SIDE", "1280"))                  # matte 体的最长边
+MATTE_KEYFRAME_INTERVAL = int(os.getenv("MATTE_KEYFRAME_INTERVAL", "5"))    # 每 N 帧分割一次，其余帧插值传播
+MATTE_CHUNK_FRAMES = 16          # 平滑 / 编码时每次读入内存的帧数
+MATTE_SEGMENT_IN_FLIGHT = 8      # 同时等待分割的关键帧数
+TEMPORAL_KERNEL = (0.2, 0.6, 0.2)
+SPATIAL_KERNEL = (0.25, 0.5, 0.25)
+
+
+def matte_dimensions(resolution: Tuple[int, int], max_side: int = MATTE_MAX_SIDE) -> Tuple[int, int]:
+    """matte 尺寸：最长边不超过 max_side，宽高取偶数（yuv420p 编码要求）"""
+    width, height = resolution
+    scale = min(1.0, max_side / max(width, height)) if max_side > 0 else 1.0
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def open_matte_volume(path: str, frames: int, height: int, width: int) -> np.memmap:
+    """磁盘映射的 matte 体 (frames, height, width) uint8，内存占用与帧数无关"""
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(frames, height, width))
+
+
+def propagate_keyframe_mattes(volume: np.ndarray, keyframes: List[int]):
+    """关键帧之间按时间距离线性插值，最后一个关键帧之后保持不变（原地写入）"""
+    keyframes = sorted(keyframes)
+    for start, end in zip(keyframes, keyframes[1:]):
+        gap = end - start
+        if gap <= 1:
+            continue
+        weights = (np.arange(1, gap, dtype=np.float32) / gap)[:, None, None]
+        first = volume[start].astype(np.float32)
+        last = volume[end].astype(np.float32)
+        volume[start + 1:end] = np.rint(first + (last - first) * weights).astype(np.uint8)
+    if keyframes and keyframes[-1] < len(volume) - 1:
+        volume[keyframes[-1] + 1:] = volume[keyframes[-1]]
+
+
+def _filter_axis(block: np.ndarray, axis: int, kernel: Tuple[float, float, float]) -> np.ndarray:
+    """3 抽头可分离卷积，边界复制"""
+    padded = np.concatenate([np.take(block, [0], axis=axis), block, np.take(block, [-1], axis=axis)], axis=axis)
+    length = block.shape[axis]
+    return sum(
+        weight * np.take(padded, np.arange(offset, offset + length), axis=axis)
+        for offset, weight in enumerate(kernel)
+    )
+
+
+def smooth_matte_volume(src: np.ndarray, dst: np.ndarray, chunk_frames: int = MATTE_CHUNK_FRAMES):
+    """
+    时序 + 空间一次三维平滑（可分离核：时间 0.2/0.6/0.2，空间 0.25/0.5/0.25）
+    
+    按时间分块处理，每块带前后各 1 帧的邻域，内存占用只与块大小有关
+    """
+    frames = len(src)
+    for start in range(0, frames, chunk_frames):
+        end = min(frames, start + chunk_frames)
+        lo, hi = max(0, start - 1), min(frames, end + 1)
+        block = src[lo:hi].astype(np.float32)
+        if start == 0:
+            block = np.concatenate([block[:1], block])
+        if end == frames:
+            block = np.concatenate([block, block[-1:]])
+        temporal = sum(weight * block[offset:offset + end - start] for offset, weight in enumerate(TEMPORAL_KERNEL))
+        spatial = _filter_axis(_filter_axis(temporal, 1, SPATIAL_KERNEL), 2, SPATIAL_KERNEL)
+        dst[start:end] = np.clip(np.rint(spatial), 0, 255).astype(np.uint8)
+
+
 class ForegroundSeparationAgent:
     """
     前景分离 Agent
     
     职责:
-    - 高精度人物分割 (SAM2)
-    - Alpha Matting (处理头发、半透明区域)
-    - 时序一致性优化
-    - 边缘优化
+    - 人物分割：只分割关键帧（分割模型池），中间帧插值传播
+    - 时序一致性 + 边缘优化：一次三维平滑
+    - 输出 alpha matte 视频（灰度，白=前景），不在内存中保留逐帧图片
+    
+    matte 体保存为磁盘映射的 uint8 数组，30 秒 1080p 视频也只占用分块大小的内存
     """
     
     def __init__(self):
@@ -956,32 +1042,30 @@ class ForegroundSeparationAgent:
         progress_callback: Optional[callable] = None
     ) -> ForegroundResult:
         """分离前景"""
+        import shutil
+        import tempfile
+        
         logger.info(f"[ForegroundSeparation] 开始前景分离")
         
+        work_dir = tempfile.mkdtemp(prefix="matte_")
         try:
-            # 1. 逐帧分割
+            # 1. 关键帧分割 + 插值传播
             if progress_callback:
                 await progress_callback(10, "正在分割人物...")
             
-            masks = await self._segment_person_all_frames(video_url, analysis)
+            volume = await self._segment_person_all_frames(video_url, analysis, work_dir)
             
-            # 2. Alpha Matting 优化
+            # 2. 时序一致性 + 边缘优化
             if progress_callback:
-                await progress_callback(40, "正在优化边缘...")
+                await progress_callback(50, "正在确保时序一致性...")
             
-            alpha_mattes = await self._refine_alpha_matting(masks, analysis)
+            smoothed = await self._ensure_temporal_consistency(volume, work_dir)
             
-            # 3. 时序一致性
+            # 3. 输出 alpha 视频
             if progress_callback:
-                await progress_callback(70, "正在确保时序一致性...")
+                await progress_callback(75, "正在保存结果...")
             
-            consistent_mattes = await self._ensure_temporal_consistency(alpha_mattes)
-            
-            # 4. 保存结果
-            if progress_callback:
-                await progress_callback(90, "正在保存结果...")
-            
-            result = await self._save_foreground_result(consistent_mattes, video_url)
+            result = await self._save_foreground_result(smoothed, video_url, analysis.fps, work_dir)
             
             if progress_callback:
                 await progress_callback(100, "前景分离完成")
@@ -991,106 +1075,127 @@ class ForegroundSeparationAgent:
         except Exception as e:
             logger.error(f"[ForegroundSeparation] 分离失败: {e}")
             raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
     
     async def _segment_person_all_frames(
         self, 
         video_url: str,
-        analysis: VideoAnalysisReport
-    ) -> List[Image.Image]:
-        """使用 SAM2 或类似模型分割所有帧"""
-        # TODO: 集成 SAM2 进行视频分割
-        # 目前使用 rembg 作为简化实现
+        analysis: VideoAnalysisReport,
+        work_dir: str
+    ) -> np.memmap:
+        """每 MATTE_KEYFRAME_INTERVAL 帧分割一次，写入 matte 体后插值补齐中间帧"""
+        from contextlib import aclosing
+        from .segmentation_pool import SegmentationUnavailable, get_segmentation_pool
+        
+        width, height = matte_dimensions(analysis.resolution)
+        frames = max(1, int(analysis.frame_count))
+        volume = open_matte_volume(os.path.join(work_dir, "raw.npy"), frames, height, width)
+        interval = max(1, MATTE_KEYFRAME_INTERVAL)
+        pool = get_segmentation_pool()
+        in_flight = asyncio.Semaphore(MATTE_SEGMENT_IN_FLIGHT)
+        
+        async def segment(frame_index: int, rgb: np.ndarray):
+            try:
+                mask = await pool.predict_mask(Image.fromarray(rgb, "RGB"))
+                volume[frame_index] = np.asarray(mask, dtype=np.uint8)
+            finally:
+                in_flight.release()
         
+        keyframes: List[int] = []
+        jobs: List[asyncio.Task] = []
         try:
-            from rembg import remove
-        except ImportError:
+            async with aclosing(self._decode_keyframes(video_url, width, height, interval)) as decoded:
+                async for position, rgb in decoded:
+                    frame_index = position * interval
+                    if frame_index >= frames:
+                        break
+                    await in_flight.acquire()
+                    jobs.append(asyncio.create_task(segment(frame_index, rgb)))
+                    keyframes.append(frame_index)
+            await asyncio.gather(*jobs)
+        except SegmentationUnavailable:
             logger.warning("rembg not installed, using placeholder masks")
-            # 返回占位 masks
-            masks = []
-            for i in range(analysis.frame_count):
-                mask = Image.new("L", analysis.resolution, 255)
-                masks.append(mask)
-            return masks
-        
-        # 提取帧并分割
-        # 这里简化处理，实际应该对每帧进行分割
-        masks = []
-        
-        # TODO: 实际实现应该：
-        # 1. 提取所有帧
-        # 2. 使用 SAM2 进行视频级分割
-        # 3. 返回每帧的 mask
-        
-        return masks
-    
-    async def _refine_alpha_matting(
-        self, 
-        masks: List[Image.Image],
-        analysis: VideoAnalysisReport
-    ) -> List[Image.Image]:
-        """使用 Matting 模型优化 Alpha 通道"""
-        # TODO: 集成 RobustVideoMatting 或 MODNet
-        # 处理头发丝等细节
-        
-        refined = []
-        for mask in masks:
-            # 简化实现：高斯模糊边缘
-            from PIL import ImageFilter
-            refined_mask = mask.filter(ImageFilter.GaussianBlur(radius=1))
-            refined.append(refined_mask)
+            for job in jobs:
+                job.cancel()
+            volume[:] = 255
+            return volume
+        except BaseException:
+            for job in jobs:
+                job.cancel()
+            raise
         
-        return refined
+        if not keyframes:
+            raise RuntimeError("无法解码视频帧")
+        
+        await asyncio.to_thread(propagate_keyframe_mattes, volume, keyframes)
+        logger.info(f"[ForegroundSeparation] 分割 {len(keyframes)} 个关键帧，传播到 {frames} 帧")
+        return volume
+    
+    async def _decode_keyframes(self, video_url: str, width: int, height: int, interval: int):
+        """ffmpeg 流式解码关键帧（rgb24），逐帧产出 (序号, 数组)，不落盘"""
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-v", "error", "-i", video_url,
+            "-vf", f"select=not(mod(n\\,{interval})),scale={width}:{height}",
+            "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        frame_size = width * height * 3
+        position = 0
+        try:
+            while True:
+                try:
+                    data = await process.stdout.readexactly(frame_size)
+                except asyncio.IncompleteReadError:
+                    break
+                yield position, np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+                position += 1
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
     
-    async def _ensure_temporal_consistency(
-        self, 
-        mattes: List[Image.Image]
-    ) -> List[Image.Image]:
-        """确保帧间一致性，消除闪烁"""
-        # TODO: 使用光流传播或时序平滑
-        
-        if len(mattes) < 3:
-            return mattes
-        
-        import numpy as np
-        
-        consistent = []
-        for i, matte in enumerate(mattes):
-            if i == 0 or i == len(mattes) - 1:
-                consistent.append(matte)
-            else:
-                # 时序平滑：与前后帧加权平均
-                prev_arr = np.array(mattes[i - 1])
-                curr_arr = np.array(matte)
-                next_arr = np.array(mattes[i + 1])
-                
-                smoothed = (prev_arr * 0.2 + curr_arr * 0.6 + next_arr * 0.2).astype(np.uint8)
-                consistent.append(Image.fromarray(smoothed))
-        
-        return consistent
+    async def _ensure_temporal_consistency(self, volume: np.memmap, work_dir: str) -> np.memmap:
+        """确保帧间一致性，消除闪烁（同时羽化边缘）"""
+        smoothed = open_matte_volume(os.path.join(work_dir, "smoothed.npy"), *volume.shape)
+        await asyncio.to_thread(smooth_matte_volume, volume, smoothed)
+        return smoothed
     
     async def _save_foreground_result(
         self, 
-        mattes: List[Image.Image],
-        video_url: str
+        volume: np.memmap,
+        video_url: str,
+        fps: float,
+        work_dir: str
     ) -> ForegroundResult:
-        """保存分离结果"""
-        import tempfile
-        
-        # 保存到临时目录
-        cache_dir = os.path.join(os.path.dirname(__file__), "..", "cache", "foreground")
-        os.makedirs(cache_dir, exist_ok=True)
-        
-        task_id = str(uuid.uuid4())[:8]
-        mattes_dir = os.path.join(cache_dir, f"{task_id}_mattes")
-        os.makedirs(mattes_dir, exist_ok=True)
-        
-        for i, matte in enumerate(mattes):
-            matte.save(os.path.join(mattes_dir, f"matte_{i:04d}.png"))
-        
+        """分块写入 ffmpeg 编码为 alpha matte 视频并上传"""
+        frames, height, width = volume.shape
+        output_path = os.path.join(work_dir, "alpha.mp4")
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{width}x{height}", "-r", str(fps or 30), "-i", "-",
+            "-c:v", "libx264", "-crf", "12", "-pix_fmt", "yuv420p", "-movflags", "+faststart", output_path,
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            for start in range(0, frames, MATTE_CHUNK_FRAMES):
+                process.stdin.write(np.ascontiguousarray(volume[start:start + MATTE_CHUNK_FRAMES]).tobytes())
+                await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        stderr = await process.stderr.read()
+        await process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"alpha 视频编码失败: {stderr.decode(errors='ignore')[-300:]}")
+        
+        alpha_url = await _upload_temp_video(output_path, "mattes")
         return ForegroundResult(
-            foreground_frames_url=f"/cache/foreground/{task_id}_frames",
-            alpha_mattes_url=f"/cache/foreground/{task_id}_mattes",
-            frame_count=len(mattes),
+            foreground_frames_url=video_url,  # 前景颜色取自原视频，配合 alpha 使用
+            alpha_mattes_url=alpha_url,
+            frame_count=frames,
             quality_score=0.9  # TODO: 实际评估质量
         )
 
@@ -1099,6 +1204,55 @@ class ForegroundSeparationAgent:
 # Stage 3: 视频生成 Agent (支持策略A和策略B)
 # ==========================================
 
+I2V_MAX_IN_FLIGHT = int(os.getenv("KLING_I2V_CONCURRENCY", "3"))  # 同时进行的图生视频任务上限（供应商并发额度）
+CHAINED_CAMERA_MOTIONS = ("pan", "zoom", "tilt")  # 有方向的运镜：下一段须从上一段末帧继续
+
+
+class SegmentStitcher:
+    """
+    增量拼接：分段下载完成即按顺序转成 MPEG-TS 追加到中间文件（流复制），
+    乱序到达的分段先暂存，前序到齐后再追加；全部到齐后只做一次封装转换为 MP4
+    """
+    
+    def __init__(self, work_dir: str, total: int):
+        self.work_dir = work_dir
+        self.total = total
+        self.ts_path = os.path.join(work_dir, "stitched.ts")
+        self.appended = 0
+        self._ready: Dict[int, str] = {}
+        self._lock = asyncio.Lock()
+    
+    async def add(self, index: int, segment_path: str):
+        async with self._lock:
+            self._ready[index] = segment_path
+            while self.appended in self._ready:
+                await self._append(self._ready.pop(self.appended))
+                self.appended += 1
+    
+    async def _append(self, segment_path: str):
+        ts_path = f"{segment_path}.ts"
+        await run_ffmpeg([
+            "ffmpeg", "-y", "-i", segment_path,
+            "-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", ts_path
+        ], "分段转封装失败")
+        await asyncio.to_thread(self._concat_bytes, ts_path)
+    
+    def _concat_bytes(self, ts_path: str):
+        import shutil
+        with open(ts_path, "rb") as src, open(self.ts_path, "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        os.unlink(ts_path)
+    
+    async def finish(self, output_path: str) -> str:
+        if self.appended != self.total:
+            raise RuntimeError(f"分段未到齐: {self.appended}/{self.total}")
+        await run_ffmpeg([
+            "ffmpeg", "-y", "-i", self.ts_path,
+            "-c", "copy", "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart", output_path
+        ], "ffmpeg 拼接失败")
+        return output_path
+
+
 @dataclass
 class VideoGenerationResult:
     """视频生成结果"""
@@ -1190,31 +1344,26 @@ class VideoGenerationAgent:
             # 2. 构建运动提示词
             motion_prompt = self._build_motion_prompt(analysis.camera_motion)
             
-            # 3. 分段生成
-            segment_videos = []
-            for i, segment in enumerate(segments):
+            # 3. 分段生成（并发 / 末帧链式）+ 增量拼接
+            if len(segments) == 1:
                 if progress_callback:
-                    progress = int(10 + (i / len(segments)) * 70)
-                    await progress_callback(progress, f"正在生成第 {i+1}/{len(segments)} 段...")
-                
-                video_url = await self._generate_segment(
-                    image_url=background_image,  # 注意：这里变量名叫 image_url，但传给 _generate_segment 的参数也叫 image_url
-                    duration=segment["duration"],
+                    await progress_callback(10, "正在生成背景视频...")
+                final_video = await self._generate_segment(
+                    image_url=background_image,
+                    duration=segments[0]["duration"],
                     motion_prompt=motion_prompt,
-                    seed=segment.get("seed")
+                    seed=segments[0].get("seed")
                 )
-                segment_videos.append(video_url)
-            
-            # 4. 拼接
-            if progress_callback:
-                await progress_callback(85, "正在拼接视频...")
-            
-            if len(segment_videos) == 1:
-                final_video = segment_videos[0]
             else:
-                final_video = await self._stitch_segments(segment_videos)
+                final_video = await self._generate_and_stitch(
+                    segments,
+                    background_image,
+                    motion_prompt,
+                    chained=self._needs_frame_chaining(analysis.camera_motion),
+                    progress_callback=progress_callback
+                )
             
-            # 5. 精确匹配时长
+            # 4. 精确匹配时长
             if progress_callback:
                 await progress_callback(95, "正在调整时长...")
             
@@ -1419,65 +1568,99 @@ class VideoGenerationAgent:
             
             await asyncio.sleep(poll_interval)
     
-    async def _stitch_segments(self, segments: List[str]) -> str:
-        """无缝拼接多个视频段"""
-        import subprocess
+    def _needs_frame_chaining(self, camera_motion: CameraMotion) -> bool:
+        """有方向的运镜须首尾相接；静态 / 手持的环境动效各段可独立从原图生成"""
+        return camera_motion.type in CHAINED_CAMERA_MOTIONS
+    
+    async def _generate_and_stitch(
+        self,
+        segments: List[Dict[str, Any]],
+        background_image: str,
+        motion_prompt: str,
+        chained: bool = False,
+        progress_callback: Optional[callable] = None
+    ) -> str:
+        """
+        分段生成并增量拼接
+        
+        - 非链式：所有分段并发生成（最多 I2V_MAX_IN_FLIGHT 个同时进行），哪段先完成先下载
+        - 链式：下一段以上一段末帧为首帧，生成只能顺序进行；每段下载完立即抽帧启动下一段，
+          转封装追加放到后台，与下一段生成重叠
+        每段落地即追加到拼接结果，最后一段完成后只需一次封装转换
+        """
+        import shutil
         import tempfile
         
-        # 下载所有段
-        temp_files = []
-        for i, url in enumerate(segments):
-            response = await self.http_client.get(url)
-            response.raise_for_status()
-            
-            tmp = tempfile.NamedTemporaryFile(suffix=f"_{i}.mp4", delete=False)
-            tmp.write(response.content)
-            tmp.close()
-            temp_files.append(tmp.name)
+        total = len(segments)
+        work_dir = tempfile.mkdtemp(prefix="bg_i2v_")
+        stitcher = SegmentStitcher(work_dir, total)
+        semaphore = asyncio.Semaphore(max(1, I2V_MAX_IN_FLIGHT))
+        finished = 0
         
-        try:
-            # 创建文件列表
-            list_file = tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False)
-            for f in temp_files:
-                list_file.write(f"file '{f}'\n")
-            list_file.close()
-            
-            # 使用 ffmpeg 拼接
-            output_file = tempfile.NamedTemporaryFile(suffix="_stitched.mp4", delete=False)
-            output_file.close()
-            
-            cmd = [
-                "ffmpeg", "-y",
-                "-f", "concat", "-safe", "0",
-                "-i", list_file.name,
-                "-c", "copy",
-                output_file.name
-            ]
-            # 异步执行 ffmpeg
-            stitch_process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+        async def generate(index: int, image: str) -> str:
+            async with semaphore:
+                video_url = await self._generate_segment(
+                    image_url=image,
+                    duration=segments[index]["duration"],
+                    motion_prompt=motion_prompt,
+                    seed=segments[index].get("seed")
+                )
+            return await _download_segment(
+                self.http_client, video_url, os.path.join(work_dir, f"seg_{index:03d}.mp4")
             )
-            _, stitch_stderr = await stitch_process.communicate()
-            if stitch_process.returncode != 0:
-                raise RuntimeError(f"ffmpeg 拼接失败: {stitch_stderr.decode()[:200]}")
+        
+        async def stitch(index: int, segment_path: str):
+            nonlocal finished
+            await stitcher.add(index, segment_path)
+            finished += 1
+            if progress_callback:
+                await progress_callback(int(10 + finished / total * 75), f"已完成 {finished}/{total} 段")
+        
+        async def produce(index: int, image: str):
+            await stitch(index, await generate(index, image))
+        
+        async def produce_chain(jobs: List[asyncio.Task]):
+            image = background_image
+            for index in range(total):
+                segment_path = await generate(index, image)
+                jobs.append(asyncio.create_task(stitch(index, segment_path)))
+                if index + 1 < total:
+                    image = await self._extract_last_frame(segment_path)
+        
+        try:
+            if progress_callback:
+                await progress_callback(10, f"正在生成 {total} 段背景视频...")
             
-            # TODO: 上传到存储并返回 URL
-            # 目前返回本地路径
-            return output_file.name
+            jobs: List[asyncio.Task] = []
+            try:
+                if chained:
+                    await produce_chain(jobs)
+                else:
+                    jobs.extend(asyncio.create_task(produce(index, background_image)) for index in range(total))
+                await asyncio.gather(*jobs)
+            except BaseException:
+                for job in jobs:
+                    job.cancel()
+                await asyncio.gather(*jobs, return_exceptions=True)
+                raise
             
+            if progress_callback:
+                await progress_callback(88, "正在封装拼接结果...")
+            output_path = await stitcher.finish(os.path.join(work_dir, "stitched.mp4"))
+            return await _upload_temp_video(output_path)
         finally:
-            # 清理临时文件
-            for f in temp_files:
-                try:
-                    os.unlink(f)
-                except:
-                    pass
-            try:
-                os.unlink(list_file.name)
-            except:
-                pass
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    async def _extract_last_frame(self, video_path: str) -> str:
+        """提取分段末帧，返回 Base64（作为下一段图生视频的首帧）"""
+        import base64
+        frame_path = f"{video_path}.last.jpg"
+        await run_ffmpeg([
+            "ffmpeg", "-y", "-sseof", "-0.1", "-i", video_path,
+            "-frames:v", "1", "-q:v", "2", frame_path
+        ], "提取末帧失败")
+        with open(frame_path, "rb") as f:
+            return base64.b64encode(f.read()).decode()
     
     async def _match_duration(
         self, 
@@ -2012,6 +2195,86 @@ class QualityEnhancementAgent:
         )
 
 
+# ==========================================
+# 工作流 DAG（阶段依赖 + 断点续传）
+# ==========================================
+
+WORKFLOW_KIND = "background_replace_dag"   # tasks.metadata.workflow 标识
+WORKFLOW_HEARTBEAT_SEC = 60                # 执行中定期刷新 tasks.updated_at
+WORKFLOW_STALE_AFTER_SEC = 180             # 超过该时间未刷新，视为执行进程已退出，可接管续跑
+
+
+@dataclass
+class StageNode:
+    """DAG 节点：一个阶段及其依赖"""
+    key: str
+    stage: WorkflowStage
+    deps: Tuple[str, ...]
+    weight: int                   # 占总进度的百分比
+    outputs: Tuple[str, ...]      # 完成后持久化的 task 字段
+    run: Callable[[BackgroundReplaceTask, Callable], Awaitable[None]]
+
+
+def _get_supabase():
+    from app.services.supabase_client import supabase
+    return supabase
+
+
+def _to_jsonable(value: Any) -> Any:
+    """dataclass / Enum / tuple → 可写入 JSONB 的结构"""
+    if is_dataclass(value):
+        return _to_jsonable(asdict(value))
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+def _analysis_from_dict(data: Dict[str, Any]) -> VideoAnalysisReport:
+    scene = dict(data["scene"])
+    scene["depth_range"] = tuple(scene["depth_range"])
+    lighting = dict(data["lighting"])
+    lighting["direction"] = tuple(lighting["direction"])
+    lighting["shadow_direction"] = tuple(lighting["shadow_direction"])
+    camera = dict(data["camera_motion"])
+    if camera.get("direction") is not None:
+        camera["direction"] = tuple(camera["direction"])
+    if camera.get("motion_vectors") is not None:
+        camera["motion_vectors"] = [tuple(v) for v in camera["motion_vectors"]]
+    return VideoAnalysisReport(**{
+        **data,
+        "scene": SceneInfo(**scene),
+        "lighting": LightingInfo(**lighting),
+        "camera_motion": CameraMotion(**camera),
+        "resolution": tuple(data["resolution"]),
+    })
+
+
+# 阶段产出字段 → 反序列化（未列出的字段原样恢复）
+_STAGE_OUTPUT_LOADERS: Dict[str, Callable[[Any], Any]] = {
+    "detected_strategy": EditStrategy,
+    "edit_detection": lambda d: EditDetectionResult(**{**d, "strategy": EditStrategy(d["strategy"])}),
+    "analysis": _analysis_from_dict,
+    "foreground": lambda d: ForegroundResult(**d),
+    "background_video": lambda d: BackgroundVideoResult(**d),
+    "composite": lambda d: CompositeResult(**d),
+    "qa_report": lambda d: QAReport(**d),
+}
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
 # ==========================================
 # 主工作流协调器
 # ==========================================
@@ -2020,14 +2283,18 @@ class BackgroundReplaceWorkflow:
     """
     背景替换工作流协调器 (已改造支持双策略)
     
+    各阶段按依赖组成 DAG，依赖已满足的阶段并发执行；每个阶段完成后产出写入
+    tasks 表（metadata.stages），resume_task / resume_interrupted_tasks 可从最后完成的阶段继续。
+
+    注意：持久化 / 续跑只对带 user_id 创建的任务生效（tasks.user_id 非空）。
+    目前 POST /workflows 走 VideoElementReplaceService，没有 API 入口调用 create_task，
+    这里的断点续传是为调用方接入预留的基础设施（启动时不会自动续跑）；接入时必须传入 user_id。
+    
     策略A (纯背景替换):
-        Stage 0: 编辑检测 → Stage 1: 视频分析 → Stage 2: 前景分离 → 
-        Stage 3: 背景I2V → Stage 4: 智能合成 → Stage 5: 质量增强
+        解析 URL → 编辑检测 ∥ 视频分析 → 前景分离 ∥ 背景I2V → 智能合成 → 质量增强
     
     策略B (人物编辑):
-        Stage 0: 编辑检测 → Stage 1: 视频分析 → 
-        Stage 3: Motion Control → Stage 3.5: Lip Sync → 
-        Stage 4: 背景合成 → Stage 5: 质量增强
+        解析 URL → 编辑检测 ∥ 视频分析 → Motion Control + Lip Sync → 背景合成 → 质量增强
     """
     
     def __init__(self):
@@ -2055,6 +2322,7 @@ class BackgroundReplaceWorkflow:
         self._tasks: Dict[str, BackgroundReplaceTask] = {}
         self._checkpoints: Dict[str, WorkflowCheckpoint] = {}
         self._event_callbacks: Dict[str, callable] = {}
+        self._running: Dict[str, asyncio.Task] = {}
     
     async def create_task(
         self,
@@ -2067,10 +2335,13 @@ class BackgroundReplaceWorkflow:
         edit_mask_url: Optional[str] = None,
         edited_frame_url: Optional[str] = None,
         original_audio_url: Optional[str] = None,
-        force_strategy: Optional[str] = None
+        force_strategy: Optional[str] = None,
+        # 持久化（无 user_id 时只保留在内存，不支持断点续传）
+        user_id: Optional[str] = None,
+        project_id: Optional[str] = None,
     ) -> BackgroundReplaceTask:
         """创建背景替换任务"""
-        task_id = f"bg-{uuid.uuid4().hex[:12]}"
+        task_id = str(uuid.uuid4())
         now = datetime.utcnow()
         
         # 解析强制策略
@@ -2101,182 +2372,323 @@ class BackgroundReplaceWorkflow:
             edited_frame_url=edited_frame_url,
             original_audio_url=original_audio_url,
             force_strategy=_force_strategy,
+            user_id=user_id,
+            project_id=project_id,
         )
         
         self._tasks[task_id] = task
+        if user_id:
+            await self._persist_task(task)
+        else:
+            logger.warning(f"[Workflow] 任务 {task_id} 未提供 user_id，仅保存在内存，重启后无法续跑")
         
         # 异步启动工作流
-        asyncio.create_task(self._execute_workflow(task))
+        self._start_execution(task)
         
         return task
     
     async def get_task(self, task_id: str) -> Optional[BackgroundReplaceTask]:
-        """获取任务状态"""
-        return self._tasks.get(task_id)
+        """获取任务状态（内存中没有时从 tasks 表读取，不会触发续跑）"""
+        task = self._tasks.get(task_id)
+        if task:
+            return task
+        row = await self._load_task_row(task_id)
+        return self._task_from_row(row) if row else None
     
     def register_event_callback(self, session_id: str, callback: callable):
         """注册事件回调"""
         self._event_callbacks[session_id] = callback
     
+    # ==========================================
+    # 断点续传
+    # ==========================================
+    
+    async def resume_task(self, task_id: str) -> Optional[BackgroundReplaceTask]:
+        """
+        从最后完成的阶段继续执行未完成的任务
+        
+        只接管心跳已过期的任务（原执行进程已退出），并用 updated_at 做乐观锁，
+        多个实例同时续跑时只有一个能抢到。
+        
+        Returns:
+            续跑的任务；任务不存在、已结束或仍在其他进程执行时返回 None
+        """
+        if task_id in self._running:
+            return self._tasks.get(task_id)
+        
+        row = await self._load_task_row(task_id)
+        if not row or row.get("status") not in ("pending", "running"):
+            return None
+        if not self._is_stale(row):
+            logger.info(f"[Workflow] 任务仍在其他进程执行，跳过续跑: {task_id}")
+            return None
+        
+        try:
+            claimed = await asyncio.to_thread(lambda: _get_supabase().table("tasks").update({
+                "status": "running",
+                "updated_at": datetime.utcnow().isoformat(),
+            }).eq("id", task_id).eq("updated_at", row.get("updated_at")).execute())
+        except Exception as e:
+            logger.error(f"[Workflow] 接管任务失败: {task_id}, {e}")
+            return None
+        if not claimed.data:
+            logger.info(f"[Workflow] 任务已被其他实例接管: {task_id}")
+            return None
+        
+        task = self._task_from_row(row)
+        self._tasks[task.id] = task
+        logger.info(f"[Workflow] 续跑任务: {task.id}, 已完成阶段: {list(task.stage_outputs)}")
+        self._start_execution(task)
+        return task
+    
+    async def resume_interrupted_tasks(self) -> List[str]:
+        """续跑重启前中断的任务，返回续跑的任务 ID（由接入方在启动时调用）"""
+        try:
+            result = await asyncio.to_thread(lambda: _get_supabase().table("tasks").select(
+                "id, status, updated_at"
+            ).eq("task_type", "background_replace").in_(
+                "status", ["pending", "running"]
+            ).eq("metadata->>workflow", WORKFLOW_KIND).execute())
+        except Exception as e:
+            logger.error(f"[Workflow] 查询中断任务失败: {e}")
+            return []
+        
+        resumed = []
+        for row in result.data or []:
+            if not self._is_stale(row):
+                continue
+            task = await self.resume_task(row["id"])
+            if task:
+                resumed.append(task.id)
+        if resumed:
+            logger.info(f"[Workflow] 已续跑 {len(resumed)} 个中断任务")
+        return resumed
+    
+    async def cancel_task(self, task_id: str) -> Optional[BackgroundReplaceTask]:
+        """取消任务：终止正在执行的阶段，并标记为失败（不会再被续跑）"""
+        task = await self.get_task(task_id)
+        if not task:
+            return None
+        task.status = WorkflowStatus.FAILED
+        task.current_stage = WorkflowStage.FAILED
+        task.error = "用户取消"
+        task.updated_at = datetime.utcnow()
+        running = self._running.get(task_id)
+        if running:
+            running.cancel()
+        await self._persist_task(task)
+        return task
+    
+    def _start_execution(self, task: BackgroundReplaceTask):
+        self._running[task.id] = asyncio.create_task(self._execute_workflow(task))
+    
+    @staticmethod
+    def _is_stale(row: Dict[str, Any]) -> bool:
+        updated_at = _parse_timestamp(row.get("updated_at"))
+        if updated_at is None:
+            return True
+        return (datetime.now(timezone.utc) - updated_at).total_seconds() > WORKFLOW_STALE_AFTER_SEC
+    
+    # ==========================================
+    # 执行
+    # ==========================================
+    
     async def _execute_workflow(self, task: BackgroundReplaceTask):
         """
         执行完整工作流 (已改造支持双策略)
         
         流程:
-        1. 编辑检测 → 确定策略A或B
-        2. 视频分析
-        3. 根据策略执行不同的 Pipeline
+        1. 解析 URL，编辑检测与视频分析并发 → 确定策略A或B
+        2. 根据策略执行对应的阶段 DAG
+        
+        已完成的阶段（task.stage_outputs）直接跳过
         """
+        heartbeat = asyncio.create_task(self._heartbeat(task))
         try:
             task.status = WorkflowStatus.RUNNING
+            await self._persist_task(task)
             
-            # ==========================================
-            # 预处理：解析真实可访问的视频 URL（绕过 API 鉴权）
-            # ==========================================
-            resolved_video_url = await resolve_video_download_url(task.clip_id)
-            if not resolved_video_url:
-                # 如果解析失败，尝试使用原始 URL（可能是外部 URL）
-                logger.warning(f"[Workflow] 无法从 clip_id 解析视频 URL，尝试使用原始 URL")
-                resolved_video_url = task.video_url
-            task.resolved_video_url = resolved_video_url
-            logger.info(f"[Workflow] 解析视频 URL 完成: {task.resolved_video_url[:80]}...")
-            
-            # ==========================================
-            # Stage 0: 编辑检测 (0-5%) [新增]
-            # ==========================================
-            await self._update_stage(task, WorkflowStage.DETECTING, 0)
-            
-            # 如果有强制策略，则跳过检测
-            if task.force_strategy:
-                task.detected_strategy = task.force_strategy
-                task.edit_detection = EditDetectionResult(
-                    strategy=task.force_strategy,
-                    edit_on_person_ratio=0.0,
-                    person_edited_ratio=0.0,
-                    confidence=1.0,
-                    recommendation=f"用户强制使用策略: {task.force_strategy.value}"
-                )
-                logger.info(f"[Workflow] 使用强制策略: {task.force_strategy.value}")
-            elif task.edited_frame_url:
-                # 有编辑帧，执行检测（使用解析后的视频 URL）
-                task.edit_detection = await self.edit_detection_agent.detect(
-                    original_frame_url=task.resolved_video_url,  # TODO: 提取首帧
-                    edited_frame_url=task.edited_frame_url,
-                    edit_mask_url=task.edit_mask_url,
-                    progress_callback=lambda p, m: self._update_progress(task, p, m, 0, 5)
-                )
-                task.detected_strategy = task.edit_detection.strategy
-            else:
-                # 无编辑帧，默认策略A
-                task.detected_strategy = EditStrategy.BACKGROUND_ONLY
-                task.edit_detection = EditDetectionResult(
-                    strategy=EditStrategy.BACKGROUND_ONLY,
-                    edit_on_person_ratio=0.0,
-                    person_edited_ratio=0.0,
-                    confidence=1.0,
-                    recommendation="未提供编辑帧，默认使用纯背景替换"
-                )
-            
-            # 通知前端检测结果
-            await self._emit_event(task, "strategy_detected", {
-                "strategy": task.detected_strategy.value,
-                "confidence": task.edit_detection.confidence if task.edit_detection else 1.0,
-                "recommendation": task.edit_detection.recommendation if task.edit_detection else ""
-            })
-            
-            # ==========================================
-            # Stage 1: 视频分析 (5-15%)
-            # ==========================================
-            await self._update_stage(task, WorkflowStage.ANALYZING, 5)
-            
-            task.analysis = await self.analysis_agent.analyze(
-                task.resolved_video_url,
-                progress_callback=lambda p, m: self._update_progress(task, p, m, 5, 15)
-            )
-            await self._save_checkpoint(task, 1)
-            
-            # ==========================================
-            # 根据策略分流
-            # ==========================================
-            if task.detected_strategy == EditStrategy.BACKGROUND_ONLY:
-                await self._execute_strategy_a(task)
-            else:
-                await self._execute_strategy_b(task)
+            await self._run_dag(task, self._common_stages())
+            await self._run_dag(task, self._strategy_stages(task.detected_strategy))
+            await self._complete_workflow(task)
             
             logger.info(f"[Workflow] 任务完成: {task.id}")
             
+        except asyncio.CancelledError:
+            # 用户取消已由 cancel_task 落库；进程退出时保持 running，重启后续跑
+            logger.info(f"[Workflow] 任务执行中断: {task.id}")
+            raise
         except Exception as e:
             logger.error(f"[Workflow] 任务失败: {task.id}, 错误: {e}")
             task.status = WorkflowStatus.FAILED
             task.current_stage = WorkflowStage.FAILED
             task.error = str(e)
             task.updated_at = datetime.utcnow()
+            await self._persist_task(task)
             
             await self._emit_event(task, "failed", {"error": str(e)})
+        finally:
+            heartbeat.cancel()
+            self._running.pop(task.id, None)
+    
+    async def _run_dag(self, task: BackgroundReplaceTask, nodes: List[StageNode]):
+        """依赖满足即启动；任一阶段失败时取消其余并抛出"""
+        done = set(task.stage_outputs)
+        pending = {node.key: node for node in nodes if node.key not in done}
+        running: Dict[asyncio.Task, StageNode] = {}
+        try:
+            while pending or running:
+                for key, node in list(pending.items()):
+                    if all(dep in done for dep in node.deps):
+                        del pending[key]
+                        running[asyncio.create_task(self._run_stage(task, node))] = node
+                if not running:
+                    raise RuntimeError(f"阶段依赖无法满足: {sorted(pending)}")
+                
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    future.result()
+                    done.add(node.key)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
     
-    async def _execute_strategy_a(self, task: BackgroundReplaceTask):
-        """
-        执行策略A: 纯背景替换
-        
-        流程: 前景分离 → I2V生成 → 智能合成 → 质量增强
-        """
-        logger.info(f"[Workflow] 执行策略A: 纯背景替换")
-        
-        # 使用解析后的视频 URL
-        video_url = task.resolved_video_url or task.video_url
+    async def _run_stage(self, task: BackgroundReplaceTask, node: StageNode):
+        task.stage_progresses[node.key] = 0
+        await self._update_stage(task, node.stage, task.overall_progress)
+        await node.run(task, lambda p, m: self._update_progress(task, node.key, p, m))
+        task.stage_progresses[node.key] = 100
+        await self._save_checkpoint(task, node)
+    
+    async def _heartbeat(self, task: BackgroundReplaceTask):
+        """执行期间定期刷新 updated_at，避免被其他实例判定为中断"""
+        while True:
+            await asyncio.sleep(WORKFLOW_HEARTBEAT_SEC)
+            await self._persist_task(task)
+    
+    # ==========================================
+    # 阶段定义
+    # ==========================================
+    
+    def _common_stages(self) -> List[StageNode]:
+        return [
+            StageNode("resolve", WorkflowStage.CREATED, (), 0, ("resolved_video_url",), self._stage_resolve),
+            StageNode("detect", WorkflowStage.DETECTING, ("resolve",), 5,
+                      ("detected_strategy", "edit_detection"), self._stage_detect),
+            StageNode("analyze", WorkflowStage.ANALYZING, ("resolve",), 10, ("analysis",), self._stage_analyze),
+        ]
+    
+    def _strategy_stages(self, strategy: Optional[EditStrategy]) -> List[StageNode]:
+        if strategy is None:
+            return []
+        if strategy == EditStrategy.BACKGROUND_ONLY:
+            return [
+                StageNode("separate", WorkflowStage.SEPARATING, ("analyze",), 20, ("foreground",), self._stage_separate),
+                StageNode("generate", WorkflowStage.GENERATING, ("analyze",), 30,
+                          ("background_video",), self._stage_generate_background),
+                StageNode("composite", WorkflowStage.COMPOSITING, ("separate", "generate"), 20,
+                          ("composite",), self._stage_composite),
+                StageNode("enhance", WorkflowStage.ENHANCING, ("composite",), 15,
+                          ("qa_report", "result_url"), self._stage_enhance),
+            ]
+        return [
+            StageNode("motion", WorkflowStage.MOTION_CONTROL, ("analyze", "detect"), 40,
+                      ("background_video", "foreground"), self._stage_motion_control),
+            StageNode("composite", WorkflowStage.COMPOSITING, ("motion",), 25, ("composite",), self._stage_composite),
+            StageNode("enhance", WorkflowStage.ENHANCING, ("composite",), 20,
+                      ("qa_report", "result_url"), self._stage_enhance),
+        ]
+    
+    def _plan(self, task: BackgroundReplaceTask) -> List[StageNode]:
+        return self._common_stages() + self._strategy_stages(task.detected_strategy)
+    
+    async def _stage_resolve(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """预处理：解析真实可访问的视频 URL（绕过 API 鉴权）"""
+        resolved_video_url = await resolve_video_download_url(task.clip_id)
+        if not resolved_video_url:
+            # 如果解析失败，尝试使用原始 URL（可能是外部 URL）
+            logger.warning(f"[Workflow] 无法从 clip_id 解析视频 URL，尝试使用原始 URL")
+            resolved_video_url = task.video_url
+        task.resolved_video_url = resolved_video_url
+        logger.info(f"[Workflow] 解析视频 URL 完成: {task.resolved_video_url[:80]}...")
+    
+    async def _stage_detect(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 0: 编辑检测"""
+        # 如果有强制策略，则跳过检测
+        if task.force_strategy:
+            task.detected_strategy = task.force_strategy
+            task.edit_detection = EditDetectionResult(
+                strategy=task.force_strategy,
+                edit_on_person_ratio=0.0,
+                person_edited_ratio=0.0,
+                confidence=1.0,
+                recommendation=f"用户强制使用策略: {task.force_strategy.value}"
+            )
+            logger.info(f"[Workflow] 使用强制策略: {task.force_strategy.value}")
+        elif task.edited_frame_url:
+            # 有编辑帧，执行检测（使用解析后的视频 URL）
+            task.edit_detection = await self.edit_detection_agent.detect(
+                original_frame_url=task.resolved_video_url,  # TODO: 提取首帧
+                edited_frame_url=task.edited_frame_url,
+                edit_mask_url=task.edit_mask_url,
+                progress_callback=progress_callback
+            )
+            task.detected_strategy = task.edit_detection.strategy
+        else:
+            # 无编辑帧，默认策略A
+            task.detected_strategy = EditStrategy.BACKGROUND_ONLY
+            task.edit_detection = EditDetectionResult(
+                strategy=EditStrategy.BACKGROUND_ONLY,
+                edit_on_person_ratio=0.0,
+                person_edited_ratio=0.0,
+                confidence=1.0,
+                recommendation="未提供编辑帧，默认使用纯背景替换"
+            )
         
-        # Stage 2: 前景分离 (15-35%)
-        await self._update_stage(task, WorkflowStage.SEPARATING, 15)
+        # 通知前端检测结果
+        await self._emit_event(task, "strategy_detected", {
+            "strategy": task.detected_strategy.value,
+            "confidence": task.edit_detection.confidence if task.edit_detection else 1.0,
+            "recommendation": task.edit_detection.recommendation if task.edit_detection else ""
+        })
+    
+    async def _stage_analyze(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 1: 视频分析"""
+        task.analysis = await self.analysis_agent.analyze(
+            task.resolved_video_url or task.video_url,
+            progress_callback=progress_callback
+        )
+    
+    async def _stage_separate(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 2 (策略A): 前景分离，与背景生成并发"""
         task.foreground = await self.separation_agent.separate(
-            video_url,
+            task.resolved_video_url or task.video_url,
             task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, 15, 35)
+            progress_callback=progress_callback
         )
-        await self._save_checkpoint(task, 2)
-        
-        # Stage 3: 背景I2V生成 (35-65%)
-        await self._update_stage(task, WorkflowStage.GENERATING, 35)
+    
+    async def _stage_generate_background(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 3 (策略A): 背景 I2V 生成"""
         video_result = await self.video_generation_agent.generate_strategy_a(
             background_image=task.background_image_url,
             analysis=task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, 35, 65)
+            progress_callback=progress_callback
         )
         task.background_video = BackgroundVideoResult(
             video_url=video_result.video_url,
             duration=video_result.duration,
             motion_matched=video_result.motion_matched
         )
-        await self._save_checkpoint(task, 3)
-        
-        # Stage 4: 智能合成 (65-85%)
-        await self._update_stage(task, WorkflowStage.COMPOSITING, 65)
-        task.composite = await self.compositing_agent.composite(
-            video_url,
-            task.foreground,
-            task.background_video,
-            task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, 65, 85)
-        )
-        await self._save_checkpoint(task, 4)
-        
-        # Stage 5: 质量增强 (85-100%)
-        await self._finalize_workflow(task)
     
-    async def _execute_strategy_b(self, task: BackgroundReplaceTask):
-        """
-        执行策略B: 人物编辑 + 口型同步
-        
-        流程: Motion Control → Lip Sync → 背景合成 → 质量增强
-        """
-        logger.info(f"[Workflow] 执行策略B: 人物编辑 + 口型同步")
-        
-        # Stage 3: Motion Control + Lip Sync (15-55%)
-        await self._update_stage(task, WorkflowStage.MOTION_CONTROL, 15)
-        
+    async def _stage_motion_control(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 3 (策略B): Motion Control + Lip Sync"""
         video_result = await self.video_generation_agent.generate_strategy_b(
             task=task,
             analysis=task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, 15, 55)
+            progress_callback=progress_callback
         )
         
         # 策略B不需要前景分离，直接使用生成的视频
@@ -2285,12 +2697,6 @@ class BackgroundReplaceWorkflow:
             duration=video_result.duration,
             motion_matched=True
         )
-        await self._save_checkpoint(task, 3)
-        
-        # Stage 4: 背景合成 (55-80%)
-        # 策略B的合成相对简单，主要是将背景图与生成的人物视频合成
-        await self._update_stage(task, WorkflowStage.COMPOSITING, 55)
-        
         # 为策略B创建简化的前景结果（从Motion Control视频提取）
         task.foreground = ForegroundResult(
             foreground_frames_url=video_result.video_url,  # 直接使用生成的视频
@@ -2298,50 +2704,56 @@ class BackgroundReplaceWorkflow:
             frame_count=int(task.analysis.frame_count),
             quality_score=0.9
         )
-        
+    
+    async def _stage_composite(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 4: 智能合成（策略B以生成的人物视频为源）"""
+        if task.detected_strategy == EditStrategy.BACKGROUND_ONLY:
+            source_url = task.resolved_video_url or task.video_url
+        else:
+            source_url = task.background_video.video_url
         task.composite = await self.compositing_agent.composite(
-            video_result.video_url,  # 使用策略B生成的视频
+            source_url,
             task.foreground,
             task.background_video,
             task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, 55, 80)
+            progress_callback=progress_callback
         )
-        await self._save_checkpoint(task, 4)
-        
-        # Stage 5: 质量增强 (80-100%)
-        await self._finalize_workflow(task, start_progress=80)
     
-    async def _finalize_workflow(self, task: BackgroundReplaceTask, start_progress: int = 85):
-        """完成工作流的最后阶段"""
-        # Stage 5: 质量增强
-        await self._update_stage(task, WorkflowStage.ENHANCING, start_progress)
+    async def _stage_enhance(self, task: BackgroundReplaceTask, progress_callback: Callable):
+        """Stage 5: 质量增强"""
         final_url, qa_report = await self.enhancement_agent.enhance(
             task.composite,
             task.analysis,
-            progress_callback=lambda p, m: self._update_progress(task, p, m, start_progress, 100)
+            progress_callback=progress_callback
         )
         task.qa_report = qa_report
         task.result_url = final_url
-        
-        # 完成
+    
+    async def _complete_workflow(self, task: BackgroundReplaceTask):
+        """所有阶段完成"""
         task.status = WorkflowStatus.COMPLETED
         task.current_stage = WorkflowStage.COMPLETED
         task.overall_progress = 100
         task.updated_at = datetime.utcnow()
+        await self._persist_task(task)
         
         await self._emit_event(task, "completed", {
-            "result_url": final_url,
+            "result_url": task.result_url,
             "strategy_used": task.detected_strategy.value if task.detected_strategy else "unknown",
-            "qa_report": asdict(qa_report) if qa_report else None
+            "qa_report": asdict(task.qa_report) if task.qa_report else None
         })
     
+    # ==========================================
+    # 进度与事件
+    # ==========================================
+    
     async def _update_stage(
         self, 
         task: BackgroundReplaceTask, 
         stage: WorkflowStage,
         overall_progress: int
     ):
-        """更新当前阶段"""
+        """更新当前阶段（并发阶段取最近启动的一个）"""
         task.current_stage = stage
         task.stage_progress = 0
         task.overall_progress = overall_progress
@@ -2355,14 +2767,14 @@ class BackgroundReplaceWorkflow:
     async def _update_progress(
         self,
         task: BackgroundReplaceTask,
+        stage_key: str,
         stage_progress: int,
-        message: str,
-        overall_start: int,
-        overall_end: int
+        message: str
     ):
-        """更新进度"""
+        """更新进度：总体进度按各阶段权重加权，并发阶段各自计入"""
+        task.stage_progresses[stage_key] = stage_progress
         task.stage_progress = stage_progress
-        task.overall_progress = overall_start + int((overall_end - overall_start) * stage_progress / 100)
+        task.overall_progress = self._overall_progress(task)
         task.updated_at = datetime.utcnow()
         
         await self._emit_event(task, "progress", {
@@ -2372,22 +2784,24 @@ class BackgroundReplaceWorkflow:
             "message": message
         })
     
-    async def _save_checkpoint(self, task: BackgroundReplaceTask, stage: int):
-        """保存检查点"""
-        checkpoint = WorkflowCheckpoint(
+    def _overall_progress(self, task: BackgroundReplaceTask) -> int:
+        weighted = sum(node.weight * task.stage_progresses.get(node.key, 0) for node in self._plan(task))
+        return min(99, weighted // 100)
+    
+    async def _save_checkpoint(self, task: BackgroundReplaceTask, node: StageNode):
+        """保存检查点：记录阶段产出并写入 tasks 表"""
+        task.stage_outputs[node.key] = {attr: _to_jsonable(getattr(task, attr)) for attr in node.outputs}
+        now = datetime.utcnow()
+        previous = self._checkpoints.get(task.id)
+        self._checkpoints[task.id] = WorkflowCheckpoint(
             task_id=task.id,
-            stage=stage,
-            stage_name=task.current_stage,
-            data={
-                "analysis": asdict(task.analysis) if task.analysis else None,
-                "foreground": asdict(task.foreground) if task.foreground else None,
-                "background_video": asdict(task.background_video) if task.background_video else None,
-                "composite": asdict(task.composite) if task.composite else None,
-            },
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            stage=len(task.stage_outputs),
+            stage_name=node.stage,
+            data=dict(task.stage_outputs),
+            created_at=previous.created_at if previous else now,
+            updated_at=now
         )
-        self._checkpoints[task.id] = checkpoint
+        await self._persist_task(task)
     
     async def _emit_event(self, task: BackgroundReplaceTask, event_type: str, data: Dict):
         """发送事件"""
@@ -2402,6 +2816,105 @@ class BackgroundReplaceWorkflow:
                 })
             except Exception as e:
                 logger.warning(f"[Workflow] 事件发送失败: {e}")
+    
+    # ==========================================
+    # tasks 表持久化
+    # ==========================================
+    
+    async def _persist_task(self, task: BackgroundReplaceTask):
+        """写入 tasks 表（失败不影响执行；无 user_id 时跳过）；supabase-py 是同步的，在线程池中执行"""
+        if not task.user_id:
+            return
+        row = {
+            "id": task.id,
+            "user_id": task.user_id,
+            "project_id": task.project_id,
+            "clip_id": task.clip_id,
+            "task_type": "background_replace",
+            "status": task.status.value,
+            "progress": task.overall_progress,
+            "status_message": task.current_stage.value,
+            "result_url": task.result_url,
+            "error_message": task.error,
+            "metadata": {
+                "workflow": WORKFLOW_KIND,
+                "session_id": task.session_id,
+                "inputs": {
+                    "video_url": task.video_url,
+                    "background_image_url": task.background_image_url,
+                    "prompt": task.prompt,
+                    "edit_mask_url": task.edit_mask_url,
+                    "edited_frame_url": task.edited_frame_url,
+                    "original_audio_url": task.original_audio_url,
+                    "force_strategy": task.force_strategy.value if task.force_strategy else None,
+                },
+                "stages": dict(task.stage_outputs),
+            },
+            "created_at": task.created_at.isoformat(),
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        try:
+            await asyncio.to_thread(lambda: _get_supabase().table("tasks").upsert(row).execute())
+        except Exception as e:
+            logger.error(f"[Workflow] 保存任务状态失败: {task.id}, {e}")
+    
+    async def _load_task_row(self, task_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = await asyncio.to_thread(
+                lambda: _get_supabase().table("tasks").select("*").eq("id", task_id).limit(1).execute()
+            )
+        except Exception as e:
+            logger.error(f"[Workflow] 读取任务失败: {task_id}, {e}")
+            return None
+        rows = result.data or []
+        if not rows or (rows[0].get("metadata") or {}).get("workflow") != WORKFLOW_KIND:
+            return None
+        return rows[0]
+    
+    def _task_from_row(self, row: Dict[str, Any]) -> BackgroundReplaceTask:
+        """由 tasks 行重建任务，并恢复已完成阶段的产出"""
+        metadata = row.get("metadata") or {}
+        inputs = metadata.get("inputs") or {}
+        created_at = _parse_timestamp(row.get("created_at")) or datetime.now(timezone.utc)
+        updated_at = _parse_timestamp(row.get("updated_at")) or created_at
+        try:
+            status = WorkflowStatus(row.get("status"))
+        except ValueError:
+            status = WorkflowStatus.FAILED
+        try:
+            current_stage = WorkflowStage(row.get("status_message"))
+        except ValueError:
+            current_stage = WorkflowStage.CREATED
+        
+        task = BackgroundReplaceTask(
+            id=row["id"],
+            clip_id=row.get("clip_id"),
+            session_id=metadata.get("session_id"),
+            video_url=inputs.get("video_url"),
+            background_image_url=inputs.get("background_image_url"),
+            prompt=inputs.get("prompt"),
+            status=status,
+            current_stage=current_stage,
+            stage_progress=0,
+            overall_progress=row.get("progress") or 0,
+            error=row.get("error_message"),
+            result_url=row.get("result_url"),
+            created_at=created_at.replace(tzinfo=None),
+            updated_at=updated_at.replace(tzinfo=None),
+            edit_mask_url=inputs.get("edit_mask_url"),
+            edited_frame_url=inputs.get("edited_frame_url"),
+            original_audio_url=inputs.get("original_audio_url"),
+            force_strategy=EditStrategy(inputs["force_strategy"]) if inputs.get("force_strategy") else None,
+            user_id=row.get("user_id"),
+            project_id=row.get("project_id"),
+        )
+        for key, outputs in (metadata.get("stages") or {}).items():
+            for attr, value in outputs.items():
+                loader = _STAGE_OUTPUT_LOADERS.get(attr)
+                setattr(task, attr, loader(value) if loader and value is not None else value)
+            task.stage_outputs[key] = outputs
+            task.stage_progresses[key] = 100
+        return task
 
 
 # ==========================================
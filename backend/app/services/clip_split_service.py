@@ -11,15 +11,23 @@ Clip 智能拆镜头服务 v3 — 关键帧提取
 4. 对每个场景，提取最稳定帧（中间帧）
 5. 上传关键帧到 Supabase storage
 6. 创建 media_type='image' 的 canvas_nodes
+
+分析缓存：VLM 结果按 (视频内容 sha256, prompt 版本) 缓存在进程内 LRU 和 assets.metadata.scene_analysis，
+同一素材重复拆分不再上传 / 调 VLM；Ark file_id 在有效期内复用（如 VLM 失败后重试），
+超出 LRU 条数或复用窗口的 Ark 文件从远端删除。
 """
 
 import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
 import tempfile
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, List, Optional
@@ -70,6 +78,11 @@ MIN_SCENE_DURATION_SEC = 1.0   # 最小场景时长
 MIN_CLIP_DURATION_SEC = 2.0    # 可拆最短 clip
 MAX_SEGMENTS = 20              # 单次拆分最多片段数
 
+SCENE_ANALYSIS_VERSION = 1     # 修改 prompt 之外的解析逻辑时递增，使旧缓存失效
+SCENE_CACHE_SIZE = 64          # 进程内分析缓存 / Ark 文件缓存条数
+ARK_FILE_REUSE_TTL_SEC = 24 * 3600  # Ark 文件复用窗口（短于 Ark 默认保存期）
+FRAME_EXTRACT_TIMEOUT_SEC = 120     # 一次提取所有帧的超时
+
 
 # ==========================================
 # VLM 场景检测 Prompt
@@ -151,14 +164,11 @@ async def _download_video(video_url: str, temp_dir: str) -> Optional[str]:
             return None
         return local_path
 
-    # 直链 → httpx 下载
+    # 直链 → 流式下载
     if video_url.startswith("http"):
         try:
-            async with httpx.AsyncClient(timeout=120.0, follow_redirects=True) as client:
-                resp = await client.get(video_url)
-                resp.raise_for_status()
-                with open(local_path, "wb") as f:
-                    f.write(resp.content)
+            from app.utils.file_transfer import download_to_file
+            await download_to_file(video_url, local_path, timeout=120.0)
             if os.path.getsize(local_path) < 1000:
                 logger.error("[SceneSplit] 下载文件太小，可能不是有效视频")
                 return None
@@ -174,6 +184,173 @@ async def _download_video(video_url: str, temp_dir: str) -> Optional[str]:
     return None
 
 
+def _file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件 sha256（视频内容指纹）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _prompt_version(model: str) -> str:
+    """prompt 版本：prompt 文本 / 模型 / 解析版本任一变化都会得到新版本"""
+    raw = f"{SCENE_ANALYSIS_VERSION}:{model}:{SCENE_DETECTION_PROMPT}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+# 进程内 LRU: (content_hash, prompt_version) → vlm_result；content_hash → {"file_id", "expires_at"}
+_analysis_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_ark_file_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_scene_cache_lock = threading.Lock()
+
+
+def _remember_analysis(content_hash: str, prompt_version: str, vlm_result: Dict[str, Any]) -> None:
+    key = (content_hash, prompt_version)
+    with _scene_cache_lock:
+        _analysis_cache[key] = vlm_result
+        _analysis_cache.move_to_end(key)
+        while len(_analysis_cache) > SCENE_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+
+def _lookup_analysis(
+    content_hash: str,
+    prompt_version: str,
+    asset_cache: Dict[str, Any],
+) -> Optional[Dict[str, Any]]:
+    """先查进程内 LRU，再查素材 metadata 中持久化的结果"""
+    key = (content_hash, prompt_version)
+    with _scene_cache_lock:
+        if key in _analysis_cache:
+            _analysis_cache.move_to_end(key)
+            return _analysis_cache[key]
+
+    if asset_cache.get("content_hash") == content_hash:
+        result = (asset_cache.get("results") or {}).get(prompt_version)
+        if result:
+            _remember_analysis(content_hash, prompt_version, result)
+            return result
+    return None
+
+
+def _remember_ark_file(content_hash: str, file_id: str) -> List[str]:
+    """记录已上传的 Ark 文件，返回被淘汰（超出条数或已过复用窗口）的 file_id，由调用方删除远端文件"""
+    now = time.time()
+    evicted = []
+    with _scene_cache_lock:
+        previous = _ark_file_cache.pop(content_hash, None)
+        if previous and previous.get("file_id") != file_id:
+            evicted.append(previous["file_id"])
+        for key in [k for k, entry in _ark_file_cache.items() if entry.get("expires_at", 0) <= now]:
+            evicted.append(_ark_file_cache.pop(key)["file_id"])
+        _ark_file_cache[content_hash] = {"file_id": file_id, "expires_at": now + ARK_FILE_REUSE_TTL_SEC}
+        while len(_ark_file_cache) > SCENE_CACHE_SIZE:
+            evicted.append(_ark_file_cache.popitem(last=False)[1]["file_id"])
+    return evicted
+
+
+def _forget_ark_file(content_hash: str) -> None:
+    with _scene_cache_lock:
+        _ark_file_cache.pop(content_hash, None)
+
+
+def _cached_ark_file(content_hash: str) -> Optional[Dict[str, Any]]:
+    with _scene_cache_lock:
+        entry = _ark_file_cache.get(content_hash)
+        if entry:
+            _ark_file_cache.move_to_end(content_hash)
+            return dict(entry)
+    return None
+
+
+def _delete_ark_files(file_ids: List[str], api_key: str) -> None:
+    """后台删除被淘汰的 Ark 文件"""
+    for file_id in file_ids:
+        logger.info(f"[SceneSplit] 删除淘汰的 Ark 文件: file_id={file_id}")
+        asyncio.create_task(_delete_ark_file(file_id, api_key))
+
+
+def _reusable_ark_file(content_hash: str, asset_cache: Dict[str, Any]) -> Optional[str]:
+    """仍在复用窗口内的 Ark file_id"""
+    candidates = [_cached_ark_file(content_hash)]
+    if asset_cache.get("content_hash") == content_hash:
+        candidates.append(asset_cache.get("ark_file"))
+    for entry in candidates:
+        if entry and entry.get("file_id") and entry.get("expires_at", 0) > time.time():
+            return entry["file_id"]
+    return None
+
+
+def _load_asset_scene_cache(supabase_client, asset_id: Optional[str]) -> Dict[str, Any]:
+    """读取 assets.metadata.scene_analysis（最佳努力）"""
+    if not asset_id:
+        return {}
+    try:
+        res = supabase_client.table("assets").select("metadata").eq("id", asset_id).limit(1).execute()
+        rows = res.data or []
+        metadata = (rows[0].get("metadata") if rows else None) or {}
+        return metadata.get("scene_analysis") or {}
+    except Exception as e:
+        logger.debug(f"[SceneSplit] 读取分析缓存失败: {e}")
+        return {}
+
+
+def _save_asset_scene_cache(
+    supabase_client,
+    asset_id: Optional[str],
+    content_hash: str,
+    prompt_version: Optional[str] = None,
+    vlm_result: Optional[Dict[str, Any]] = None,
+) -> None:
+    """把分析结果 / Ark 文件写回 assets.metadata.scene_analysis（最佳努力，不覆盖其他 metadata 字段）"""
+    if not asset_id:
+        return
+    try:
+        res = supabase_client.table("assets").select("metadata").eq("id", asset_id).limit(1).execute()
+        rows = res.data or []
+        metadata = dict((rows[0].get("metadata") if rows else None) or {})
+        entry = metadata.get("scene_analysis") or {}
+        if entry.get("content_hash") != content_hash:
+            entry = {"content_hash": content_hash, "results": {}}
+        if prompt_version and vlm_result is not None:
+            entry.setdefault("results", {})[prompt_version] = vlm_result
+        ark_file = _cached_ark_file(content_hash)
+        if ark_file:
+            entry["ark_file"] = ark_file
+        metadata["scene_analysis"] = entry
+        supabase_client.table("assets").update({"metadata": metadata}).eq("id", asset_id).execute()
+    except Exception as e:
+        logger.debug(f"[SceneSplit] 写入分析缓存失败: {e}")
+
+
+async def _analyze_with_ark(
+    video_path: str,
+    content_hash: str,
+    api_key: str,
+    model: str,
+    asset_cache: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    上传（或复用已上传的）视频并调用 VLM
+
+    复用的 file_id 调用失败时（可能已被 Ark 清理）重新上传一次
+    """
+    file_id = _reusable_ark_file(content_hash, asset_cache)
+    if file_id:
+        logger.info(f"[SceneSplit] 复用 Ark 文件: file_id={file_id}")
+        try:
+            return await _call_vlm(file_id, api_key, model)
+        except Exception as e:
+            logger.warning(f"[SceneSplit] 复用 Ark 文件失败，重新上传: {e}")
+            _forget_ark_file(content_hash)
+            _delete_ark_files([file_id], api_key)
+
+    file_id = await _upload_to_ark(video_path, api_key)
+    _delete_ark_files(_remember_ark_file(content_hash, file_id), api_key)
+    return await _call_vlm(file_id, api_key, model)
+
+
 async def _upload_to_ark(video_path: str, api_key: str) -> str:
     """上传视频到火山方舟 File API，返回 file_id"""
     base_url = "https://ark.cn-beijing.volces.com/api/v3"
@@ -438,45 +615,50 @@ async def _probe_duration(video_path: str) -> float:
         return 0.0
 
 
-async def _capture_thumbnail(video_path: str, time_sec: float, output_path: str) -> bool:
-    """截取单帧缩略图（低分辨率，用于预览）"""
-    proc = await asyncio.create_subprocess_exec(
-        "ffmpeg", "-y",
-        "-ss", str(time_sec),
-        "-i", video_path,
-        "-vframes", "1",
-        "-vf", "scale=320:-2",
-        "-q:v", "2",
-        output_path,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    try:
-        await asyncio.wait_for(proc.communicate(), timeout=30)
-    except asyncio.TimeoutError:
-        proc.kill()
-        return False
-    return proc.returncode == 0 and os.path.exists(output_path)
+async def _extract_frames(video_path: str, frames: List[Dict[str, Any]]) -> List[bool]:
+    """
+    一次 FFmpeg 调用提取多帧
+
+    每个时间点作为一路输入做输入级 seek（只解码 seek 点附近的 GOP），
+    对应一个输出文件，避免每帧各起一个 FFmpeg 进程。
 
+    Args:
+        frames: [{"time_sec", "output_path", "width"(可选，按宽度缩放), "quality"}]
+
+    Returns:
+        与 frames 顺序一致的成功标记
+    """
+    if not frames:
+        return []
+
+    cmd = ["ffmpeg", "-y"]
+    for frame in frames:
+        cmd += ["-ss", f"{max(0.0, frame['time_sec']):.3f}", "-i", video_path]
+    for i, frame in enumerate(frames):
+        cmd += ["-map", f"{i}:v:0", "-frames:v", "1"]
+        if frame.get("width"):
+            cmd += ["-vf", f"scale={frame['width']}:-2"]
+        cmd += ["-q:v", str(frame.get("quality", 1)), frame["output_path"]]
 
-async def _extract_keyframe(video_path: str, time_sec: float, output_path: str) -> bool:
-    """提取全分辨率关键帧（高画质，作为 image node 的主内容）"""
     proc = await asyncio.create_subprocess_exec(
-        "ffmpeg", "-y",
-        "-ss", str(time_sec),
-        "-i", video_path,
-        "-vframes", "1",
-        "-q:v", "1",
-        output_path,
+        *cmd,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
     )
     try:
-        await asyncio.wait_for(proc.communicate(), timeout=30)
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout=FRAME_EXTRACT_TIMEOUT_SEC)
     except asyncio.TimeoutError:
         proc.kill()
-        return False
-    return proc.returncode == 0 and os.path.exists(output_path)
+        return [False] * len(frames)
+
+    # 个别时间点越界时 FFmpeg 返回非 0，但其余输出仍有效 → 逐个检查
+    results = [os.path.exists(f["output_path"]) and os.path.getsize(f["output_path"]) > 0 for f in frames]
+    if proc.returncode != 0:
+        logger.warning(
+            f"[SceneSplit] 批量取帧部分失败 ({sum(results)}/{len(frames)}): "
+            f"{stderr.decode(errors='ignore')[-300:]}"
+        )
+    return results
 
 
 # ==========================================
@@ -548,7 +730,6 @@ async def analyze_and_split(
 
     # --- 2. 下载视频 ---
     temp_dir = tempfile.mkdtemp(prefix="scene_split_")
-    file_id = None
 
     try:
         video_path = await _download_video(video_url, temp_dir)
@@ -568,9 +749,24 @@ async def analyze_and_split(
                 segments=[],
             )
 
-        # --- 3. 上传到 Ark + VLM 分析 ---
-        file_id = await _upload_to_ark(video_path, api_key)
-        vlm_result = await _call_vlm(file_id, api_key, model)
+        # --- 3. VLM 分析（按内容指纹 + prompt 版本命中缓存则跳过上传与调用） ---
+        node_asset_id = node.get("asset_id")
+        content_hash = await asyncio.to_thread(_file_sha256, video_path)
+        prompt_version = _prompt_version(model)
+        asset_cache = _load_asset_scene_cache(supabase_client, node_asset_id)
+
+        vlm_result = _lookup_analysis(content_hash, prompt_version, asset_cache)
+        if vlm_result is not None:
+            logger.info(f"[SceneSplit] 命中分析缓存: hash={content_hash[:12]}, prompt={prompt_version}")
+        else:
+            try:
+                vlm_result = await _analyze_with_ark(video_path, content_hash, api_key, model, asset_cache)
+            except Exception:
+                # 已上传的 Ark 文件仍写回，供重试复用
+                _save_asset_scene_cache(supabase_client, node_asset_id, content_hash)
+                raise
+            _remember_analysis(content_hash, prompt_version, vlm_result)
+            _save_asset_scene_cache(supabase_client, node_asset_id, content_hash, prompt_version, vlm_result)
 
         logger.info(
             f"[SceneSplit] VLM 检测到 {vlm_result.get('scene_count', '?')} 个场景, "
@@ -598,20 +794,31 @@ async def analyze_and_split(
         # --- 5. 为每个场景提取关键帧 → 创建 image canvas_nodes ---
         now = datetime.utcnow().isoformat()
         project_id = node.get("project_id")
-        node_asset_id = node.get("asset_id")
         orig_meta = node.get("metadata") or {}
         orig_pos = node.get("canvas_position") or {"x": 200, "y": 200}
         BUCKET = "ai-creations"
 
-        new_nodes: List[dict] = []
+        # 取场景中间帧作为最稳定的关键帧，所有场景一次 FFmpeg 提取
+        frame_jobs = []
         for seg in segments:
-            # 取场景中间帧作为最稳定的关键帧
-            mid_time = (seg.start_sec + seg.end_sec) / 2
             frame_id = str(uuid4())
             frame_name = f"keyframe_{frame_id[:12]}.jpg"
-            local_path = os.path.join(temp_dir, frame_name)
+            frame_jobs.append({
+                "frame_id": frame_id,
+                "frame_name": frame_name,
+                "time_sec": (seg.start_sec + seg.end_sec) / 2,
+                "output_path": os.path.join(temp_dir, frame_name),
+                "quality": 1,
+            })
+        extracted = await _extract_frames(video_path, frame_jobs)
+
+        new_nodes: List[dict] = []
+        for seg, job, ok in zip(segments, frame_jobs, extracted):
+            mid_time = job["time_sec"]
+            frame_id = job["frame_id"]
+            frame_name = job["frame_name"]
+            local_path = job["output_path"]
 
-            ok = await _extract_keyframe(video_path, mid_time, local_path)
             if not ok:
                 logger.warning(
                     f"[SceneSplit] 场景 {seg.index} 关键帧提取失败 "
@@ -693,7 +900,5 @@ async def analyze_and_split(
         )
 
     finally:
-        # 清理 Ark 文件
-        if file_id:
-            asyncio.create_task(_delete_ark_file(file_id, api_key))
+        # Ark 文件保留到复用窗口结束（由 Ark 按保存期清理），这里只清理本地临时目录
         shutil.rmtree(temp_dir, ignore_errors=True)
@@ -11,14 +11,29 @@
 LLM 多模态分析涂鸦内容，识别用户画了什么物体。
 """
 
+import hashlib
 import logging
+import os
 import re
-from typing import Dict, Any, Optional, Literal
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Literal, Tuple
+from dataclasses import dataclass, replace
 from enum import Enum
 
+from app.utils.aho_corasick import AhoCorasick
+
+from .image_store import ImageHandle, ImageRef, get_image_store
+
 logger = logging.getLogger(__name__)
 
+# LLM 分类结果缓存（同一 prompt + 同一涂鸦 + 同一原图）
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "512"))
+INTENT_CACHE_TTL_SEC = float(os.getenv("INTENT_CACHE_TTL_SEC", "1800"))
+# 涂鸦指纹的缩略尺寸：笔画相同但重新编码 / 轻微抖动的 mask 命中同一缓存
+MASK_FINGERPRINT_SIZE = 64
+
 
 class EditIntent(str, Enum):
     """编辑意图类型"""
@@ -89,6 +104,21 @@ FULL_REPLACE_KEYWORDS = [
 ]
 
 
+# 三组关键词编译为一个自动机，一次扫描得到各组命中数
+# （"换成/改成/变成" 同时属于两组，各自保留编号，分别计分）
+_KEYWORD_GROUPS = (ADD_ELEMENT_KEYWORDS, LOCAL_EDIT_KEYWORDS, FULL_REPLACE_KEYWORDS)
+_KEYWORD_MATCHER = AhoCorasick([kw for group in _KEYWORD_GROUPS for kw in group])
+_KEYWORD_GROUP_OF = [index for index, group in enumerate(_KEYWORD_GROUPS) for _ in group]
+
+
+def _keyword_scores(prompt: str) -> Tuple[int, int, int]:
+    """(添加, 局部修改, 换背景) 各组命中的不同关键词数"""
+    scores = [0, 0, 0]
+    for pattern_id in _KEYWORD_MATCHER.matched_ids(prompt):
+        scores[_KEYWORD_GROUP_OF[pattern_id]] += 1
+    return scores[0], scores[1], scores[2]
+
+
 def _keyword_classify(prompt: str, has_mask: bool = False) -> Optional[IntentClassificationResult]:
     """
     基于关键词的快速分类（不需要 LLM）
@@ -96,12 +126,8 @@ def _keyword_classify(prompt: str, has_mask: bool = False) -> Optional[IntentCla
     注意：有 mask 时，大部分情况应走 LLM 多模态分析，
     关键词分类只处理明确的 local_edit（"去掉/删除/擦除"）和 full_replace 场景。
     """
-    prompt_lower = prompt.lower()
-    
     # 计算各类关键词的匹配数
-    add_score = sum(1 for kw in ADD_ELEMENT_KEYWORDS if kw.lower() in prompt_lower)
-    local_score = sum(1 for kw in LOCAL_EDIT_KEYWORDS if kw.lower() in prompt_lower)
-    replace_score = sum(1 for kw in FULL_REPLACE_KEYWORDS if kw.lower() in prompt_lower)
+    add_score, local_score, replace_score = _keyword_scores(prompt)
     
     logger.info(f"[IntentClassifier] 关键词匹配分数: add={add_score}, local={local_score}, replace={replace_score}, has_mask={has_mask}")
     
@@ -149,7 +175,91 @@ def _keyword_classify(prompt: str, has_mask: bool = False) -> Optional[IntentCla
     return None  # 分数相近，需要 LLM 分析
 
 
-async def _llm_classify(prompt: str, has_mask: bool = False, mask_base64: Optional[str] = None, original_image_base64: Optional[str] = None) -> IntentClassificationResult:
+# ========================================
+# LLM 分类缓存 + 缩略图输入
+# ========================================
+
+_llm_cache: "OrderedDict[tuple, Tuple[float, IntentClassificationResult]]" = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+
+async def _to_handle(ref: ImageRef) -> ImageHandle:
+    """ImageHandle / URL / data URL / base64 → 图片存储中的句柄"""
+    store = get_image_store()
+    if isinstance(ref, ImageHandle):
+        return ref
+    if ref.startswith(("http://", "https://")):
+        return await store.fetch(ref)
+    if ref.startswith("data:"):
+        return store.put_data_url(ref)
+    return store.put_base64(ref)
+
+
+def _mask_fingerprint(handle: ImageHandle) -> str:
+    """涂鸦缩略后的像素哈希"""
+    image = get_image_store().open(handle).convert("RGBA")
+    image.thumbnail((MASK_FINGERPRINT_SIZE, MASK_FINGERPRINT_SIZE))
+    return hashlib.sha1(repr(image.size).encode() + image.tobytes()).hexdigest()
+
+
+def _llm_cache_key(prompt: str, has_mask: bool, mask: Optional[ImageHandle], original: Optional[ImageHandle]) -> tuple:
+    normalized = re.sub(r"\s+", " ", prompt.strip()).lower()
+    return (
+        normalized,
+        has_mask,
+        _mask_fingerprint(mask) if mask else None,
+        original.digest if original else None,
+    )
+
+
+def clear_llm_cache() -> None:
+    with _llm_cache_lock:
+        _llm_cache.clear()
+
+
+async def _llm_classify(prompt: str, has_mask: bool = False, mask_base64: Optional[ImageRef] = None, original_image_base64: Optional[ImageRef] = None) -> IntentClassificationResult:
+    """
+    带缓存的 LLM 分类
+
+    - 缓存键：(规范化 prompt, 是否有涂鸦, 涂鸦缩略指纹, 原图哈希)
+    - 图片以 intent 缩略变体（最长边 512）发送给多模态模型
+    - 只缓存成功的分类结果
+    """
+    mask_input: Optional[ImageRef] = mask_base64
+    original_input: Optional[ImageRef] = original_image_base64
+    cache_key = None
+    try:
+        store = get_image_store()
+        mask_handle = await _to_handle(mask_base64) if mask_base64 else None
+        original_handle = await _to_handle(original_image_base64) if original_image_base64 else None
+        cache_key = _llm_cache_key(prompt, has_mask, mask_handle, original_handle)
+        if mask_handle:
+            mask_input = store.variant_data_url(mask_handle, "intent")
+        if original_handle:
+            original_input = store.variant_data_url(original_handle, "intent")
+    except Exception as e:
+        logger.warning(f"[IntentClassifier] 准备缩略图失败，使用原图且不缓存: {e}")
+
+    if cache_key is not None:
+        with _llm_cache_lock:
+            cached = _llm_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < INTENT_CACHE_TTL_SEC:
+                _llm_cache.move_to_end(cache_key)
+                logger.info(f"[IntentClassifier] 命中 LLM 分类缓存: intent={cached[1].intent.value}")
+                return replace(cached[1])
+
+    result = await _request_llm_classification(prompt, has_mask, mask_input, original_input)
+
+    if cache_key is not None and "LLM 分类失败" not in result.reasoning:
+        with _llm_cache_lock:
+            _llm_cache[cache_key] = (time.monotonic(), replace(result))
+            _llm_cache.move_to_end(cache_key)
+            while len(_llm_cache) > INTENT_CACHE_SIZE:
+                _llm_cache.popitem(last=False)
+    return result
+
+
+async def _request_llm_classification(prompt: str, has_mask: bool = False, mask_base64: Optional[ImageRef] = None, original_image_base64: Optional[ImageRef] = None) -> IntentClassificationResult:
     """
     使用 LLM 多模态分析意图 + 涂鸦内容
     
@@ -247,7 +357,7 @@ async def _llm_classify(prompt: str, has_mask: bool = False, mask_base64: Option
                 )
             else:
                 response_text = await llm_service.analyze_image(
-                    image_base64=mask_base64,
+                    image=mask_base64,
                     prompt=user_prompt,
                     system_prompt=system_prompt,
                 )
@@ -321,8 +431,8 @@ async def _llm_classify(prompt: str, has_mask: bool = False, mask_base64: Option
 async def classify_edit_intent(
     prompt: str,
     has_mask: bool = False,
-    mask_base64: Optional[str] = None,
-    original_image_base64: Optional[str] = None,
+    mask_base64: Optional[ImageRef] = None,
+    original_image_base64: Optional[ImageRef] = None,
     use_llm: bool = True,
 ) -> IntentClassificationResult:
     """
@@ -331,8 +441,8 @@ async def classify_edit_intent(
     Args:
         prompt: 用户输入的编辑描述（可为空）
         has_mask: 是否有用户绘制的涂鸦
-        mask_base64: 涂鸦图片的 base64 编码（用于多模态识别画的内容）
-        original_image_base64: 原始照片的 base64（用于结合上下文分析）
+        mask_base64: 涂鸦图片（ImageHandle 或 base64，用于多模态识别画的内容）
+        original_image_base64: 原始照片（ImageHandle 或 base64，用于结合上下文分析）
         use_llm: 是否使用 LLM 进行分类
     
     Returns:
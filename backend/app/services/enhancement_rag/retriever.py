@@ -2,10 +2,20 @@
 分层增强 RAG 检索器
 ==================
 组合策略检索 + 参考图检索，输出可执行的增强计划。
+
+- query embedding 只算一次（有图片时多模态），策略 / 参考图两路检索并发执行
+- 计划按 (category, style_hint, 描述 hash) 缓存，批量分层增强时相同内容不重复检索
 """
 
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple
 
 from .schema import (
     EnhancementPlan,
@@ -13,10 +23,16 @@ from .schema import (
     ContentCategory,
     LayerClassification,
 )
-from .vectorstore import get_enhancement_vectorstore
+from .vectorstore import get_enhancement_vectorstore, generate_query_embedding
 
 logger = logging.getLogger(__name__)
 
+PLAN_CACHE_SIZE = int(os.getenv("ENHANCEMENT_PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL_SEC = float(os.getenv("ENHANCEMENT_PLAN_CACHE_TTL_SEC", "600"))
+
+# 两路向量检索共用的线程池（supabase-py / httpx 均为同步调用）
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="enhancement-rag")
+
 # ── 回退策略（向量库为空或检索失败时使用）──────
 
 FALLBACK_STRATEGIES: Dict[str, Dict[str, Any]] = {
@@ -62,6 +78,10 @@ class EnhancementRetriever:
 
     def __init__(self):
         self._store = None
+        # 计划缓存: key → (写入时间, plan)；_inflight: 相同 key 的并发请求只检索一次
+        self._plans: "OrderedDict[Tuple[str, str, str], Tuple[float, EnhancementPlan]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], Future] = {}
+        self._lock = threading.Lock()
 
     @property
     def store(self):
@@ -88,29 +108,93 @@ class EnhancementRetriever:
         """
         category = classification.content_category
         category_str = category.value if isinstance(category, ContentCategory) else category
+        key = _plan_cache_key(category_str, classification.style_hint, layer_description)
+
+        with self._lock:
+            cached = self._plans.get(key)
+            if cached and time.monotonic() - cached[0] < PLAN_CACHE_TTL_SEC:
+                self._plans.move_to_end(key)
+                logger.info(f"[EnhancementRetriever] 命中计划缓存: category={category_str}")
+                return cached[1].model_copy(deep=True)
+            pending = self._inflight.get(key)
+            if pending is None:
+                owner = True
+                pending = self._inflight[key] = Future()
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result().model_copy(deep=True)
+
+        try:
+            plan = self._build_plan(classification, category, category_str, layer_description, layer_image_b64)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._plans[key] = (time.monotonic(), plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        pending.set_result(plan)
+        return plan.model_copy(deep=True)
+
+    async def get_enhancement_plan_async(
+        self,
+        classification: LayerClassification,
+        layer_description: str,
+        layer_image_b64: Optional[str] = None,
+    ) -> EnhancementPlan:
+        """异步入口：embedding / 检索均为同步 IO，放到线程中执行，不阻塞事件循环"""
+        return await asyncio.to_thread(
+            self.get_enhancement_plan, classification, layer_description, layer_image_b64,
+        )
 
+    def clear_cache(self):
+        """清空计划缓存（策略库 / 参考图库更新后调用）"""
+        with self._lock:
+            self._plans.clear()
+
+    def _build_plan(
+        self,
+        classification: LayerClassification,
+        category,
+        category_str: str,
+        layer_description: str,
+        layer_image_b64: Optional[str],
+    ) -> EnhancementPlan:
         # 构造检索 query
         query = f"{category_str} {classification.style_hint} {layer_description}"
         logger.info(f"[EnhancementRetriever] 检索计划: category={category_str}, query={query[:80]}...")
 
-        # 1. 检索增强策略 (top-1)
-        strategies = self.store.search_strategies(
+        # 0. query embedding 只算一次，两路检索共用
+        query_embedding = generate_query_embedding(query, layer_image_b64)
+
+        # 1. 检索增强策略 (top-1) ∥ 2. 检索质量参考图 (top-3)
+        strategies_future = _search_executor.submit(
+            self.store.search_strategies,
             query_text=query,
             category=category_str,
             top_k=1,
             threshold=0.3,
+            query_embedding=query_embedding,
         )
-
-        strategy = strategies[0] if strategies else None
-
-        # 2. 检索质量参考图 (top-3)
-        references = self.store.search_references(
+        references_future = _search_executor.submit(
+            self.store.search_references,
             query_text=query,
             category=category_str,
             top_k=3,
             threshold=0.3,
-            query_image_b64=layer_image_b64,
+            query_embedding=query_embedding,
         )
+        strategies = strategies_future.result()
+        references = references_future.result()
+
+        strategy = strategies[0] if strategies else None
 
         # 3. 回退策略
         if strategy is None:
@@ -149,6 +233,11 @@ class EnhancementRetriever:
         return plan
 
 
+def _plan_cache_key(category: str, style_hint: str, description: str) -> Tuple[str, str, str]:
+    digest = hashlib.sha1((description or "").encode("utf-8")).hexdigest()
+    return (category, style_hint or "", digest)
+
+
 # ── 单例 ──────────────────────────────────────────
 
 _instance: Optional[EnhancementRetriever] = None
@@ -100,6 +100,13 @@ def generate_multimodal_embedding(text: str, image_base64: Optional[str] = None)
         raise
 
 
+def generate_query_embedding(text: str, image_base64: Optional[str] = None) -> List[float]:
+    """检索 query embedding：有图片时走多模态，否则纯文本（同一向量空间，可同时用于策略/参考图检索）"""
+    if image_base64:
+        return generate_multimodal_embedding(text, image_base64)
+    return generate_text_embedding(text)
+
+
 def _embedding_to_pg(embedding: List[float]) -> str:
     """转为 pgvector 字符串格式 [x,y,z]"""
     return "[" + ",".join(str(x) for x in embedding) + "]"
@@ -215,9 +222,11 @@ class EnhancementVectorStore:
         category: Optional[str] = None,
         top_k: int = 3,
         threshold: float = 0.3,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[EnhancementStrategy]:
-        """语义检索增强策略"""
-        query_embedding = generate_text_embedding(query_text)
+        """语义检索增强策略（传入 query_embedding 时不再重复计算）"""
+        if query_embedding is None:
+            query_embedding = generate_text_embedding(query_text)
         query_str = _embedding_to_pg(query_embedding)
 
         try:
@@ -256,12 +265,11 @@ class EnhancementVectorStore:
         top_k: int = 3,
         threshold: float = 0.3,
         query_image_b64: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[QualityReference]:
-        """语义检索质量参考图（支持多模态查询）"""
-        if query_image_b64:
-            query_embedding = generate_multimodal_embedding(query_text, query_image_b64)
-        else:
-            query_embedding = generate_text_embedding(query_text)
+        """语义检索质量参考图（支持多模态查询；传入 query_embedding 时不再重复计算）"""
+        if query_embedding is None:
+            query_embedding = generate_query_embedding(query_text, query_image_b64)
         query_str = _embedding_to_pg(query_embedding)
 
         try:
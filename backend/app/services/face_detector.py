@@ -2,12 +2,20 @@
 人脸检测服务
 
 使用 MediaPipe 进行轻量级人脸检测，用于 PiP B-Roll 位置计算
+
+人脸轨迹索引 (FaceTrackIndex):
+- 素材处理时后台计算一次：按采样点 seek 取帧、批量检测，结果写入 assets.metadata.face_track
+- PiP 位置计算直接按时间区间查询索引，不再解码视频
 """
 
+import bisect
 import cv2
 import numpy as np
 import logging
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import List, Optional, Tuple, Dict, Any
 from pathlib import Path
 
@@ -15,6 +23,17 @@ import mediapipe as mp
 
 logger = logging.getLogger(__name__)
 
+ALL_PIP_POSITIONS = ["top-left", "top-right", "bottom-left", "bottom-right"]
+
+# 轨迹索引配置
+FACE_TRACK_VERSION = 1
+FACE_TRACK_SAMPLE_INTERVAL_MS = 1000
+FACE_TRACK_BATCH_SIZE = 8
+# 采样间隔不小于该值时逐点 seek，否则顺序 grab（间隔太短时 seek 回关键帧反而更慢）
+SEEK_MIN_INTERVAL_MS = 500
+# 检测前把帧缩到该宽度以内（输出为归一化坐标，不受缩放影响）
+DETECT_MAX_WIDTH = 640
+
 
 # ============================================
 # 数据类
@@ -66,6 +85,91 @@ class FaceDetectionVideoResult:
     safe_pip_positions: List[str]          # 安全的 PiP 位置
 
 
+@dataclass
+class FaceTrackIndex:
+    """
+    素材级人脸轨迹索引
+    
+    timestamps 升序，faces[i] 为 timestamps[i] 采样帧上的人脸
+    """
+    sample_interval_ms: int
+    frame_width: int
+    frame_height: int
+    duration_ms: int
+    timestamps: List[int] = field(default_factory=list)
+    faces: List[List[FaceRegion]] = field(default_factory=list)
+    
+    def frames_in_range(
+        self,
+        start_ms: int = 0,
+        end_ms: Optional[int] = None,
+    ) -> List[FaceDetectionFrameResult]:
+        """
+        返回 [start_ms, end_ms] 内的采样帧
+        
+        区间内没有采样点时（短于采样间隔），返回离区间中点最近的一个采样帧
+        """
+        if not self.timestamps:
+            return []
+        if end_ms is None:
+            end_ms = self.duration_ms
+        lo = bisect.bisect_left(self.timestamps, start_ms)
+        hi = bisect.bisect_right(self.timestamps, end_ms)
+        if lo >= hi:
+            mid = (start_ms + end_ms) / 2
+            i = bisect.bisect_left(self.timestamps, mid)
+            if i == len(self.timestamps) or (
+                i > 0 and mid - self.timestamps[i - 1] <= self.timestamps[i] - mid
+            ):
+                i -= 1
+            lo, hi = i, i + 1
+        return [
+            FaceDetectionFrameResult(
+                faces=self.faces[i],
+                frame_width=self.frame_width,
+                frame_height=self.frame_height,
+                timestamp_ms=self.timestamps[i],
+            )
+            for i in range(lo, hi)
+        ]
+    
+    def faces_in_range(self, start_ms: int = 0, end_ms: Optional[int] = None) -> List[FaceRegion]:
+        """区间内所有采样帧上的人脸"""
+        return [face for frame in self.frames_in_range(start_ms, end_ms) for face in frame.faces]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": FACE_TRACK_VERSION,
+            "sample_interval_ms": self.sample_interval_ms,
+            "frame_width": self.frame_width,
+            "frame_height": self.frame_height,
+            "duration_ms": self.duration_ms,
+            # 紧凑存储: [[timestamp_ms, [[x, y, w, h, confidence], ...]], ...]
+            "samples": [
+                [ts, [[round(f.x, 4), round(f.y, 4), round(f.width, 4), round(f.height, 4),
+                       round(f.confidence, 3)] for f in faces]]
+                for ts, faces in zip(self.timestamps, self.faces)
+            ],
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["FaceTrackIndex"]:
+        if not data or data.get("version") != FACE_TRACK_VERSION:
+            return None
+        samples = sorted(data.get("samples") or [], key=lambda s: s[0])
+        return cls(
+            sample_interval_ms=data["sample_interval_ms"],
+            frame_width=data["frame_width"],
+            frame_height=data["frame_height"],
+            duration_ms=data["duration_ms"],
+            timestamps=[int(ts) for ts, _ in samples],
+            faces=[
+                [FaceRegion(x=x, y=y, width=w, height=h, confidence=c) for x, y, w, h, c in faces]
+                for _, faces in samples
+            ],
+        )
+
+
 # ============================================
 # PiP 位置定义
 # ============================================
@@ -95,6 +199,67 @@ def get_pip_position_coords(
     return positions.get(position, positions["bottom-right"])
 
 
+def _calculate_overlap(
+    x1: float, y1: float, w1: float, h1: float,
+    x2: float, y2: float, w2: float, h2: float,
+) -> float:
+    """计算两个矩形的重叠面积"""
+    inter_x1 = max(x1, x2)
+    inter_y1 = max(y1, y2)
+    inter_x2 = min(x1 + w1, x2 + w2)
+    inter_y2 = min(y1 + h1, y2 + h2)
+    
+    if inter_x2 > inter_x1 and inter_y2 > inter_y1:
+        return (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
+    return 0
+
+
+def choose_pip_position(
+    faces: List[FaceRegion],
+    pip_size: float = 0.3,
+    margin: float = 0.02,
+    preferred_position: str = "bottom-right",
+) -> Tuple[float, float, str]:
+    """
+    计算 PiP 窗口的安全位置（避开人脸），纯计算，不依赖检测模型
+    
+    Returns:
+        (x, y, position_name): PiP 左上角位置和位置名称
+    """
+    positions = {
+        name: get_pip_position_coords(name, pip_size, margin) for name in ALL_PIP_POSITIONS
+    }
+    
+    # 如果没有人脸，返回首选位置
+    if not faces:
+        pos = positions.get(preferred_position, positions["bottom-right"])
+        return pos[0], pos[1], preferred_position
+    
+    # 计算每个位置与人脸的重叠度
+    position_overlaps = []
+    for name, (px, py) in positions.items():
+        total_overlap = 0
+        for face in faces:
+            overlap = _calculate_overlap(
+                px, py, pip_size, pip_size,
+                face.x, face.y, face.width, face.height,
+            )
+            total_overlap += overlap
+        position_overlaps.append((name, px, py, total_overlap))
+    
+    # 按重叠度排序
+    position_overlaps.sort(key=lambda x: x[3])
+    
+    # 优先选择无重叠且是首选位置的
+    for name, px, py, overlap in position_overlaps:
+        if overlap == 0 and name == preferred_position:
+            return px, py, name
+    
+    # 选择重叠最少的
+    best = position_overlaps[0]
+    return best[1], best[2], best[0]
+
+
 # ============================================
 # 人脸检测器
 # ============================================
@@ -115,6 +280,8 @@ class FaceDetector:
             model_selection=0,  # 0=近距离（2米内）
             min_detection_confidence=min_confidence,
         )
+        # MediaPipe graph 不支持并发 process
+        self._lock = threading.Lock()
         logger.info("[FaceDetector] MediaPipe 人脸检测器初始化成功")
     
     def detect_from_frame(
@@ -137,7 +304,8 @@ class FaceDetector:
         
         # 使用 MediaPipe
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.detector.process(rgb_frame)
+        with self._lock:
+            results = self.detector.process(rgb_frame)
         
         if results.detections:
             for detection in results.detections:
@@ -157,83 +325,179 @@ class FaceDetector:
             timestamp_ms=timestamp_ms,
         )
     
-    def detect_from_video(
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        if width <= DETECT_MAX_WIDTH:
+            return frame
+        scale = DETECT_MAX_WIDTH / width
+        return cv2.resize(frame, (DETECT_MAX_WIDTH, int(height * scale)), interpolation=cv2.INTER_AREA)
+    
+    def _read_samples(
+        self,
+        cap: "cv2.VideoCapture",
+        timestamps: List[int],
+        fps: float,
+        seek: bool,
+        state: Dict[str, int],
+    ) -> List[Tuple[int, Optional[np.ndarray]]]:
+        """
+        读取一批采样帧
+        
+        seek=True: 逐点 seek（只解码关键帧到采样点之间的帧）
+        seek=False: 顺序 grab 跳过非采样帧（不做像素格式转换），只 retrieve 采样帧
+        """
+        samples: List[Tuple[int, Optional[np.ndarray]]] = []
+        for ts in timestamps:
+            frame = None
+            if seek:
+                cap.set(cv2.CAP_PROP_POS_MSEC, ts)
+                ret, frame = cap.read()
+                if not ret:
+                    frame = None
+            else:
+                target = int(round(ts * fps / 1000))
+                ok = True
+                while state["pos"] < target and ok:
+                    ok = cap.grab()
+                    state["pos"] += 1
+                if ok and cap.grab():
+                    state["pos"] += 1
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        frame = None
+            samples.append((ts, None if frame is None else self._downscale(frame)))
+        return samples
+    
+    def build_track_index(
         self,
         video_path: str,
-        sample_interval_ms: int = 1000,
-        max_samples: int = 30,
-    ) -> FaceDetectionVideoResult:
+        sample_interval_ms: int = FACE_TRACK_SAMPLE_INTERVAL_MS,
+        max_samples: Optional[int] = None,
+        batch_size: int = FACE_TRACK_BATCH_SIZE,
+    ) -> Optional[FaceTrackIndex]:
         """
-        从视频中采样检测人脸
+        计算视频的人脸轨迹索引
+        
+        按采样时间点取帧（seek 或 grab，不解码无关帧的像素），
+        解码下一批与检测当前批并行进行。
         
         Args:
             video_path: 视频文件路径
             sample_interval_ms: 采样间隔（毫秒）
-            max_samples: 最大采样数
+            max_samples: 最大采样数（None 为覆盖整个视频）
+            batch_size: 每批解码/检测的帧数
             
         Returns:
-            FaceDetectionVideoResult: 检测结果
+            FaceTrackIndex，视频无法打开时返回 None
         """
         if not Path(video_path).exists():
             logger.error(f"[FaceDetector] 视频文件不存在: {video_path}")
-            return FaceDetectionVideoResult(
-                frames=[],
-                dominant_region=None,
-                safe_pip_positions=["top-left", "top-right", "bottom-left", "bottom-right"],
-            )
+            return None
         
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             logger.error(f"[FaceDetector] 无法打开视频: {video_path}")
-            return FaceDetectionVideoResult(
-                frames=[],
-                dominant_region=None,
-                safe_pip_positions=["top-left", "top-right", "bottom-left", "bottom-right"],
-            )
+            return None
         
         fps = cap.get(cv2.CAP_PROP_FPS) or 30
-        frame_interval = max(1, int(fps * sample_interval_ms / 1000))
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        duration_ms = int(frame_count / fps * 1000) if frame_count > 0 else 0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
         
-        frames: List[FaceDetectionFrameResult] = []
-        frame_idx = 0
-        sample_count = 0
+        # 采样点对齐到帧边界，与原先按帧号间隔采样的时间戳一致
+        frame_interval = max(1, int(fps * sample_interval_ms / 1000))
+        last_frame = frame_count - 1 if frame_count > 0 else 0
+        sample_frames = list(range(0, last_frame + 1, frame_interval))
+        if max_samples is not None:
+            sample_frames = sample_frames[:max_samples]
+        timestamps = [int(f / fps * 1000) for f in sample_frames]
+        seek = sample_interval_ms >= SEEK_MIN_INTERVAL_MS
+        
+        logger.info(
+            f"[FaceDetector] 构建人脸轨迹: {video_path}, 采样点={len(timestamps)}, "
+            f"间隔={sample_interval_ms}ms, 模式={'seek' if seek else 'grab'}"
+        )
         
-        logger.info(f"[FaceDetector] 开始检测视频: {video_path}, 间隔={sample_interval_ms}ms, 最大采样={max_samples}")
+        index = FaceTrackIndex(
+            sample_interval_ms=sample_interval_ms,
+            frame_width=width,
+            frame_height=height,
+            duration_ms=duration_ms,
+        )
+        batches = [timestamps[i:i + batch_size] for i in range(0, len(timestamps), batch_size)]
+        state = {"pos": 0}
+        
+        try:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pending = pool.submit(self._read_samples, cap, batches[0], fps, seek, state) if batches else None
+                for i in range(len(batches)):
+                    samples = pending.result()
+                    pending = (
+                        pool.submit(self._read_samples, cap, batches[i + 1], fps, seek, state)
+                        if i + 1 < len(batches) else None
+                    )
+                    for ts, frame in samples:
+                        if frame is None:
+                            continue
+                        result = self.detect_from_frame(frame, ts)
+                        index.timestamps.append(ts)
+                        index.faces.append(result.faces)
+                        if not width:
+                            index.frame_width, index.frame_height = result.frame_width, result.frame_height
+        finally:
+            cap.release()
+        
+        logger.info(
+            f"[FaceDetector] 人脸轨迹完成: {len(index.timestamps)} 帧, "
+            f"含人脸 {sum(1 for f in index.faces if f)} 帧"
+        )
+        return index
+    
+    def detect_from_video(
+        self,
+        video_path: str,
+        sample_interval_ms: int = 1000,
+        max_samples: int = 30,
+    ) -> FaceDetectionVideoResult:
+        """
+        从视频中采样检测人脸
         
-        while cap.isOpened() and sample_count < max_samples:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_idx % frame_interval == 0:
-                timestamp_ms = int(frame_idx / fps * 1000)
-                result = self.detect_from_frame(frame, timestamp_ms)
-                frames.append(result)
-                sample_count += 1
-                
-                if result.faces:
-                    logger.debug(f"[FaceDetector] 帧 {frame_idx}: 检测到 {len(result.faces)} 个人脸")
+        Args:
+            video_path: 视频文件路径
+            sample_interval_ms: 采样间隔（毫秒）
+            max_samples: 最大采样数
             
-            frame_idx += 1
-        
-        cap.release()
-        
-        # 计算主要人脸区域
-        dominant_region = self._calculate_dominant_region(frames)
-        
-        # 计算安全的 PiP 位置
-        safe_positions = self._calculate_safe_pip_positions(dominant_region)
-        
-        logger.info(f"[FaceDetector] 检测完成: {len(frames)} 帧, 主要区域={dominant_region is not None}, 安全位置={safe_positions}")
-        
+        Returns:
+            FaceDetectionVideoResult: 检测结果
+        """
+        index = self.build_track_index(video_path, sample_interval_ms, max_samples)
+        if index is None:
+            return FaceDetectionVideoResult(
+                frames=[],
+                dominant_region=None,
+                safe_pip_positions=list(ALL_PIP_POSITIONS),
+            )
+        return self.analyze_track(index)
+    
+    @staticmethod
+    def analyze_track(
+        index: FaceTrackIndex,
+        start_ms: int = 0,
+        end_ms: Optional[int] = None,
+    ) -> FaceDetectionVideoResult:
+        """基于轨迹索引计算时间区间内的主要人脸区域与安全 PiP 位置"""
+        frames = index.frames_in_range(start_ms, end_ms)
+        dominant_region = FaceDetector._calculate_dominant_region(frames)
+        safe_positions = FaceDetector._calculate_safe_pip_positions(dominant_region)
         return FaceDetectionVideoResult(
             frames=frames,
             dominant_region=dominant_region,
             safe_pip_positions=safe_positions,
         )
     
+    @staticmethod
     def _calculate_dominant_region(
-        self, 
         frames: List[FaceDetectionFrameResult]
     ) -> Optional[FaceRegion]:
         """
@@ -270,8 +534,8 @@ class FaceDetector:
             confidence=avg_confidence,
         )
     
+    @staticmethod
     def _calculate_safe_pip_positions(
-        self, 
         dominant_region: Optional[FaceRegion],
         pip_size: float = 0.3,
         margin: float = 0.02,
@@ -281,15 +545,15 @@ class FaceDetector:
         """
         if dominant_region is None:
             # 没有检测到人脸，所有位置都安全
-            return ["top-left", "top-right", "bottom-left", "bottom-right"]
+            return list(ALL_PIP_POSITIONS)
         
         safe_positions = []
         
-        for position_name in ["top-left", "top-right", "bottom-left", "bottom-right"]:
+        for position_name in ALL_PIP_POSITIONS:
             pip_x, pip_y = get_pip_position_coords(position_name, pip_size, margin)
             
             # 检查是否与人脸区域重叠
-            overlap = self._calculate_overlap(
+            overlap = _calculate_overlap(
                 pip_x, pip_y, pip_size, pip_size,
                 dominant_region.x, dominant_region.y, 
                 dominant_region.width, dominant_region.height,
@@ -311,21 +575,17 @@ class FaceDetector:
         x2: float, y2: float, w2: float, h2: float,
     ) -> float:
         """计算两个矩形的重叠面积"""
-        inter_x1 = max(x1, x2)
-        inter_y1 = max(y1, y2)
-        inter_x2 = min(x1 + w1, x2 + w2)
-        inter_y2 = min(y1 + h1, y2 + h2)
-        
-        if inter_x2 > inter_x1 and inter_y2 > inter_y1:
-            return (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
-        return 0
+        return _calculate_overlap(x1, y1, w1, h1, x2, y2, w2, h2)
     
     def get_safe_pip_position(
         self,
-        faces: List[FaceRegion],
+        faces: Optional[List[FaceRegion]] = None,
         pip_size: float = 0.3,
         margin: float = 0.02,
         preferred_position: str = "bottom-right",
+        track: Optional[FaceTrackIndex] = None,
+        start_ms: int = 0,
+        end_ms: Optional[int] = None,
     ) -> Tuple[float, float, str]:
         """
         计算 PiP 窗口的安全位置（避开人脸）
@@ -335,45 +595,16 @@ class FaceDetector:
             pip_size: PiP 窗口大小
             margin: 边距
             preferred_position: 首选位置
+            track: 素材人脸轨迹索引；提供时按 [start_ms, end_ms] 查询人脸，忽略 faces
+            start_ms: 区间开始（毫秒）
+            end_ms: 区间结束（毫秒，None 为视频结尾）
             
         Returns:
             (x, y, position_name): PiP 左上角位置和位置名称
         """
-        positions = {
-            "top-left": get_pip_position_coords("top-left", pip_size, margin),
-            "top-right": get_pip_position_coords("top-right", pip_size, margin),
-            "bottom-left": get_pip_position_coords("bottom-left", pip_size, margin),
-            "bottom-right": get_pip_position_coords("bottom-right", pip_size, margin),
-        }
-        
-        # 如果没有人脸，返回首选位置
-        if not faces:
-            pos = positions.get(preferred_position, positions["bottom-right"])
-            return pos[0], pos[1], preferred_position
-        
-        # 计算每个位置与人脸的重叠度
-        position_overlaps = []
-        for name, (px, py) in positions.items():
-            total_overlap = 0
-            for face in faces:
-                overlap = self._calculate_overlap(
-                    px, py, pip_size, pip_size,
-                    face.x, face.y, face.width, face.height,
-                )
-                total_overlap += overlap
-            position_overlaps.append((name, px, py, total_overlap))
-        
-        # 按重叠度排序
-        position_overlaps.sort(key=lambda x: x[3])
-        
-        # 优先选择无重叠且是首选位置的
-        for name, px, py, overlap in position_overlaps:
-            if overlap == 0 and name == preferred_position:
-                return px, py, name
-        
-        # 选择重叠最少的
-        best = position_overlaps[0]
-        return best[1], best[2], best[0]
+        if track is not None:
+            faces = track.faces_in_range(start_ms, end_ms)
+        return choose_pip_position(faces or [], pip_size, margin, preferred_position)
     
     def close(self):
         """释放资源"""
@@ -394,3 +625,56 @@ def get_face_detector() -> FaceDetector:
     if _detector_instance is None:
         _detector_instance = FaceDetector()
     return _detector_instance
+
+
+# ============================================
+# 素材人脸轨迹（持久化在 assets.metadata.face_track）
+# ============================================
+
+_FACE_TRACK_CACHE_SIZE = 128
+_face_track_cache: "OrderedDict[str, FaceTrackIndex]" = OrderedDict()
+_face_track_lock = threading.Lock()
+
+
+def _remember_face_track(asset_id: str, index: FaceTrackIndex) -> None:
+    with _face_track_lock:
+        _face_track_cache[asset_id] = index
+        _face_track_cache.move_to_end(asset_id)
+        while len(_face_track_cache) > _FACE_TRACK_CACHE_SIZE:
+            _face_track_cache.popitem(last=False)
+
+
+def get_face_track(asset_id: str) -> Optional[FaceTrackIndex]:
+    """读取素材的人脸轨迹索引（进程内 LRU 缓存），未计算过返回 None"""
+    with _face_track_lock:
+        index = _face_track_cache.get(asset_id)
+        if index is not None:
+            _face_track_cache.move_to_end(asset_id)
+            return index
+    
+    from .supabase_client import supabase
+    
+    rows = supabase.table("assets").select("metadata").eq("id", asset_id).limit(1).execute().data or []
+    metadata = (rows[0].get("metadata") if rows else None) or {}
+    index = FaceTrackIndex.from_dict(metadata.get("face_track") or {})
+    if index is not None:
+        _remember_face_track(asset_id, index)
+    return index
+
+
+def get_safe_pip_position_for_asset(
+    asset_id: str,
+    start_ms: int = 0,
+    end_ms: Optional[int] = None,
+    pip_size: float = 0.3,
+    margin: float = 0.02,
+    preferred_position: str = "bottom-right",
+) -> Tuple[float, float, str]:
+    """
+    按素材时间区间计算 PiP 安全位置（只查索引，不解码视频、不加载检测模型）
+    
+    素材尚无轨迹索引时按无人脸处理，返回首选位置。
+    """
+    index = get_face_track(asset_id)
+    faces = index.faces_in_range(start_ms, end_ms) if index else []
+    return choose_pip_position(faces, pip_size, margin, preferred_position)
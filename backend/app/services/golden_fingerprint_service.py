@@ -14,16 +14,37 @@ Golden Profile: 手动定义 + 数据驱动重建
     - match_criteria: 各字段的匹配条件
     - recommended_config:  对应的最佳 publish_config
     - 权重打分算法计算匹配度 (0-1)
+
+匹配实现：所有 profile 预编译为 ProfileMatrix（类别字段 one-hot + 关键词自动机），
+一批指纹对全部 profile 的打分是一次 NumPy 矩阵运算。
+数据驱动 profile 的统计量按 family 增量维护，模板被标注时只更新所属 family。
+多个 API worker 之间通过 Redis 中的 profile 版本号同步：任一进程重建 / 增量更新后递增版本，
+其他进程发现版本变化时从 DB 全量重载统计。
 """
 
 import logging
+import os
+import time
+from collections import Counter
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
 
 from app.services.supabase_client import supabase
+from app.utils.aho_corasick import AhoCorasick
 
 logger = logging.getLogger(__name__)
 
+# ============================================================
+# 多进程同步
+# ============================================================
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PROFILE_VERSION_KEY = "lepus:golden_profiles:version"
+PROFILE_SYNC_INTERVAL_SECONDS = float(os.getenv("GOLDEN_PROFILE_SYNC_SECONDS", "5"))
+REDIS_RETRY_AFTER_SECONDS = 30  # 连接失败后暂停使用 Redis 的时间
+
 # ============================================================
 # 指纹字段权重（用于匹配打分）
 # ============================================================
@@ -130,6 +151,274 @@ GOLDEN_PROFILES: Dict[str, Dict[str, Any]] = {
 }
 
 
+# 参与数据驱动重建的质量标签
+PROFILE_SOURCE_LABELS = ("golden", "good")
+
+# 数据驱动重建的最小样本数（全库 / 单 family）
+MIN_REBUILD_SAMPLES = 5
+MIN_FAMILY_SAMPLES = 2
+
+
+def _match_level(score: float) -> str:
+    return "high" if score >= 0.8 else "medium" if score >= 0.5 else "low"
+
+
+# ============================================================
+# ProfileMatrix：预编译的 profile 打分矩阵
+# ============================================================
+
+class ProfileMatrix:
+    """
+    将 profile 的 match_criteria 编译为矩阵，批量打分：
+
+    - transition_category / family / camera_movement：
+      词表 one-hot，allowed[P, V]，指纹按词表下标 gather
+    - motion_pattern_keywords：所有 profile 关键词合并为一个 Aho-Corasick 自动机，
+      指纹命中向量 hits[N, K] @ membership[P, K].T 得到每个 profile 的命中数
+    - duration_range：min/max 向量化比较
+    - dimension_match：dims[N, D] @ (recommended_for one-hot / 个数)[P, D].T
+
+    每个 profile 的得分为各维度加权之和（权重见 FINGERPRINT_WEIGHTS）。
+    """
+
+    CATEGORICAL_FIELDS = (
+        ("transition_category", "transition_category"),
+        ("family", "family"),
+        ("camera_movement", "camera_movement"),
+    )
+
+    def __init__(self, profiles: Dict[str, Dict[str, Any]]):
+        self.names: List[str] = list(profiles.keys())
+        self.profiles = profiles
+        criteria_list = [profiles[name].get("match_criteria", {}) for name in self.names]
+        n_profiles = len(self.names)
+
+        # 类别字段
+        self._vocab: Dict[str, Dict[str, int]] = {}
+        self._allowed: Dict[str, np.ndarray] = {}
+        for field, _ in self.CATEGORICAL_FIELDS:
+            vocab: Dict[str, int] = {}
+            for criteria in criteria_list:
+                for value in criteria.get(field, []) or []:
+                    vocab.setdefault(value, len(vocab))
+            # 最后一列留给"词表外"取值，恒为 0
+            allowed = np.zeros((n_profiles, len(vocab) + 1), dtype=np.float64)
+            for p, criteria in enumerate(criteria_list):
+                for value in criteria.get(field, []) or []:
+                    allowed[p, vocab[value]] = 1.0
+            self._vocab[field] = vocab
+            self._allowed[field] = allowed
+
+        # 关键词自动机
+        keyword_ids: Dict[str, int] = {}
+        for criteria in criteria_list:
+            for kw in criteria.get("motion_pattern_keywords", []) or []:
+                keyword_ids.setdefault(kw.lower(), len(keyword_ids))
+        self._keyword_matcher = AhoCorasick(list(keyword_ids.keys()))
+        self._keyword_membership = np.zeros((n_profiles, len(keyword_ids)), dtype=np.float64)
+        self._keyword_counts = np.zeros(n_profiles, dtype=np.float64)
+        for p, criteria in enumerate(criteria_list):
+            keywords = criteria.get("motion_pattern_keywords", []) or []
+            # 与逐个匹配一致：重复关键词各算一次
+            for kw in keywords:
+                self._keyword_membership[p, keyword_ids[kw.lower()]] += 1.0
+            self._keyword_counts[p] = len(keywords)
+
+        # 时长范围
+        self._has_range = np.zeros(n_profiles, dtype=bool)
+        self._min_dur = np.zeros(n_profiles, dtype=np.float64)
+        self._max_dur = np.zeros(n_profiles, dtype=np.float64)
+        for p, criteria in enumerate(criteria_list):
+            duration_range = criteria.get("duration_range", []) or []
+            if len(duration_range) == 2:
+                self._has_range[p] = True
+                self._min_dur[p], self._max_dur[p] = duration_range
+
+        # 多维度评分
+        dim_ids: Dict[str, int] = {}
+        for criteria in criteria_list:
+            for dim in criteria.get("recommended_for", []) or []:
+                dim_ids.setdefault(dim, len(dim_ids))
+        self._dim_ids = dim_ids
+        self._dim_weights = np.zeros((n_profiles, len(dim_ids)), dtype=np.float64)
+        for p, criteria in enumerate(criteria_list):
+            dims = criteria.get("recommended_for", []) or []
+            for dim in dims:
+                self._dim_weights[p, dim_ids[dim]] += 1.0 / len(dims)
+
+    def score(self, fingerprints: List[Dict[str, Any]]) -> np.ndarray:
+        """返回打分矩阵 [N, P]"""
+        n = len(fingerprints)
+        scores = np.zeros((n, len(self.names)), dtype=np.float64)
+        if n == 0 or not self.names:
+            return scores
+
+        # 1-3) 类别字段：按词表下标取 allowed 的列
+        for field, weight_key in self.CATEGORICAL_FIELDS:
+            vocab = self._vocab[field]
+            unknown = len(vocab)
+            idx = np.fromiter(
+                (vocab.get(fp.get(field, ""), unknown) for fp in fingerprints),
+                dtype=np.intp, count=n,
+            )
+            scores += FINGERPRINT_WEIGHTS[weight_key] * self._allowed[field][:, idx].T
+
+        # 4) motion_pattern 关键词
+        if len(self._keyword_matcher):
+            hits = np.zeros((n, len(self._keyword_matcher)), dtype=np.float64)
+            for i, fp in enumerate(fingerprints):
+                motion = fp.get("motion_pattern", "") or ""
+                for kid in self._keyword_matcher.matched_ids(motion):
+                    hits[i, kid] = 1.0
+            matched = hits @ self._keyword_membership.T
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = np.where(
+                    self._keyword_counts > 0,
+                    np.minimum(matched / np.maximum(self._keyword_counts, 1.0), 1.0),
+                    0.0,
+                )
+            scores += FINGERPRINT_WEIGHTS["motion_pattern"] * ratio
+
+        # 5) duration_range
+        durations = np.array(
+            [float(fp.get("duration_ms", 0) or 0) for fp in fingerprints], dtype=np.float64
+        )[:, None]
+        inside = (durations >= self._min_dur) & (durations <= self._max_dur)
+        below = np.clip(1 - (self._min_dur - durations) / 500, 0, None)
+        above = np.clip(1 - (durations - self._max_dur) / 500, 0, None)
+        partial = np.where(durations < self._min_dur, below, above) * 0.5
+        duration_score = np.where(inside, 1.0, partial)
+        duration_score = np.where(self._has_range & (durations != 0), duration_score, 0.0)
+        scores += FINGERPRINT_WEIGHTS["duration_range"] * duration_score
+
+        # 6) dimension_match
+        if self._dim_ids:
+            dims = np.zeros((n, len(self._dim_ids)), dtype=np.float64)
+            for i, fp in enumerate(fingerprints):
+                for dim, value in (fp.get("dimension_scores") or {}).items():
+                    j = self._dim_ids.get(dim)
+                    if j is not None:
+                        dims[i, j] = float(value or 0.0)
+            scores += FINGERPRINT_WEIGHTS["dimension_match"] * (dims @ self._dim_weights.T)
+
+        return scores
+
+    def best(self, scores: np.ndarray) -> List[Tuple[Optional[str], float, Optional[Dict[str, Any]]]]:
+        """每行取最高分 profile；全 0 时返回 (None, 0, None)，同分取靠前的 profile"""
+        results: List[Tuple[Optional[str], float, Optional[Dict[str, Any]]]] = []
+        if not self.names:
+            return [(None, 0.0, None)] * scores.shape[0]
+        best_idx = np.argmax(scores, axis=1)
+        for row, p in enumerate(best_idx):
+            score = float(scores[row, p])
+            if score <= 0:
+                results.append((None, 0.0, None))
+                continue
+            name = self.names[p]
+            results.append((name, round(score, 3), self.profiles[name].get("recommended_config")))
+        return results
+
+
+# ============================================================
+# 数据驱动 profile 的增量统计
+# ============================================================
+
+class _FamilyStats:
+    """
+    单个 family 的样本统计，支持按 template_id 增删
+
+    每次变更只需重算本 family 的 profile（O(组内样本数)），不再全库重读。
+    """
+
+    def __init__(self, family: str) -> None:
+        self.family = family
+        self.samples: Dict[str, Dict[str, Any]] = {}
+        self.categories: Counter = Counter()
+        self.cameras: Counter = Counter()
+        self.motion_words: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @staticmethod
+    def _words(fingerprint: Dict[str, Any]) -> List[str]:
+        motion = (fingerprint.get("motion_pattern") or "").lower()
+        return list(dict.fromkeys(w for w in motion.replace("_", " ").split() if len(w) > 2))
+
+    def add(self, template_id: str, sample: Dict[str, Any]) -> None:
+        self.remove(template_id)
+        fp = sample["fingerprint"]
+        self.samples[template_id] = sample
+        if fp.get("transition_category"):
+            self.categories[fp["transition_category"]] += 1
+        if fp.get("camera_movement"):
+            self.cameras[fp["camera_movement"]] += 1
+        self.motion_words.update(self._words(fp))
+
+    def remove(self, template_id: str) -> None:
+        sample = self.samples.pop(template_id, None)
+        if sample is None:
+            return
+        fp = sample["fingerprint"]
+        if fp.get("transition_category"):
+            self.categories[fp["transition_category"]] -= 1
+        if fp.get("camera_movement"):
+            self.cameras[fp["camera_movement"]] -= 1
+        self.motion_words.subtract(self._words(fp))
+        for counter in (self.categories, self.cameras, self.motion_words):
+            for key in [k for k, v in counter.items() if v <= 0]:
+                del counter[key]
+
+    def to_profile(self) -> Dict[str, Any]:
+        group = list(self.samples.values())
+
+        durations = [g["fingerprint"].get("duration_ms", 500) for g in group]
+        min_dur = max(200, min(durations) - 100)
+        max_dur = min(2000, max(durations) + 100)
+
+        # publish_config 众数
+        config_sample: Dict[str, List[Any]] = {}
+        for g in group:
+            pc = g["publish_config"]
+            if pc and isinstance(pc, dict):
+                for key, val in pc.items():
+                    if key.startswith("default_") and val is not None:
+                        config_sample.setdefault(key, []).append(val)
+
+        recommended_config: Dict[str, Any] = {}
+        for key, values in config_sample.items():
+            if isinstance(values[0], (int, float)):
+                # 取中位数
+                sorted_vals = sorted(values)
+                recommended_config[key] = sorted_vals[len(sorted_vals) // 2]
+            elif isinstance(values[0], list):
+                # 取并集
+                merged = []
+                for v in values:
+                    for item in v:
+                        if item not in merged:
+                            merged.append(item)
+                recommended_config[key] = merged
+            else:
+                # 取众数
+                recommended_config[key] = Counter(values).most_common(1)[0][0]
+
+        return {
+            "name": f"{self.family} (数据驱动)",
+            "description": f"从 {len(group)} 个标注模板自动重建",
+            "match_criteria": {
+                "transition_category": [k for k, _ in self.categories.most_common()],
+                "family": [self.family],
+                "camera_movement": [k for k, _ in self.cameras.most_common(6)],
+                "motion_pattern_keywords": [k for k, _ in self.motion_words.most_common(8)],
+                "duration_range": [min_dur, max_dur],
+            },
+            "recommended_config": recommended_config,
+            "sample_count": len(group),
+            "source": "data_driven",
+        }
+
+
 # ============================================================
 # GoldenFingerprintService
 # ============================================================
@@ -137,8 +426,115 @@ GOLDEN_PROFILES: Dict[str, Dict[str, Any]] = {
 class GoldenFingerprintService:
     """模板指纹提取 + Golden Profile 匹配 + 自动预填 publish_config"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        redis_url: Optional[str] = REDIS_URL,
+        version_store=None,
+        sync_interval: float = PROFILE_SYNC_INTERVAL_SECONDS,
+    ) -> None:
+        self._manual_profiles = dict(GOLDEN_PROFILES)
         self._profiles = dict(GOLDEN_PROFILES)
+        self._matrix: Optional[ProfileMatrix] = None
+        # 数据驱动 profile 的增量统计：family → 样本
+        self._family_stats: Dict[str, _FamilyStats] = {}
+        self._family_of: Dict[str, str] = {}
+        self._stats_seeded = False
+        # 共享版本号：version_store 需提供 get / incr（默认 Redis）
+        self.redis_url = redis_url
+        self._version_store = version_store
+        self._store_down_until = 0.0
+        self._synced_version = 0
+        self._sync_interval = sync_interval
+        self._next_sync_at = 0.0
+
+    @property
+    def tracks_labels(self) -> bool:
+        """增量统计是否已初始化（任一进程 rebuild_profiles 之后才会跟踪标注变化）"""
+        self.sync()
+        return self._stats_seeded
+
+    # ─── 多进程同步 ─────────────────────────────────────────
+
+    def _get_version_store(self):
+        if self._version_store is None:
+            if not self.redis_url or time.monotonic() < self._store_down_until:
+                return None
+            try:
+                import redis
+            except ImportError as exc:
+                self._mark_store_down(exc)
+                return None
+            self._version_store = redis.Redis.from_url(
+                self.redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1,
+            )
+        return self._version_store
+
+    def _mark_store_down(self, error: Exception) -> None:
+        self._store_down_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        logger.warning(
+            f"[GoldenFingerprint] Redis 不可用，{REDIS_RETRY_AFTER_SECONDS}s 内 profile 仅在本进程维护: {error}"
+        )
+
+    def _read_shared_version(self) -> Optional[int]:
+        store = self._get_version_store()
+        if store is None:
+            return None
+        try:
+            return int(store.get(PROFILE_VERSION_KEY) or 0)
+        except Exception as exc:
+            self._mark_store_down(exc)
+            return None
+
+    def _bump_shared_version(self) -> None:
+        """本进程改变了统计：递增共享版本，通知其他进程重载"""
+        store = self._get_version_store()
+        if store is None:
+            return
+        try:
+            version = int(store.incr(PROFILE_VERSION_KEY))
+        except Exception as exc:
+            self._mark_store_down(exc)
+            return
+        if version == self._synced_version + 1:
+            self._synced_version = version
+        else:
+            # 期间其他进程也有更新，本地增量结果不完整，下次访问时全量重载
+            self._next_sync_at = 0.0
+
+    def sync(self, force: bool = False) -> bool:
+        """
+        共享版本号变化时从 DB 全量重载增量统计（按 sync_interval 节流）
+
+        标注变化频率很低，全量重载只是一次 golden/good 已发布模板的查询。
+        返回是否发生了重载。
+        """
+        now = time.monotonic()
+        if not force and now < self._next_sync_at:
+            return False
+        self._next_sync_at = now + self._sync_interval
+        version = self._read_shared_version()
+        if version is None or version == self._synced_version:
+            return False
+        if version == 0:
+            # Redis 被清空：没有其他进程的状态可对齐，保留本地统计
+            self._synced_version = 0
+            return False
+        try:
+            records = self._fetch_source_records()
+        except Exception as exc:
+            logger.warning(f"[GoldenFingerprint] 同步 profile 失败: {exc}")
+            return False
+        self._seed_stats(records)
+        self._synced_version = version
+        logger.info(f"[GoldenFingerprint] 已同步 profile 版本 {version}（{len(records)} 个样本）")
+        return True
+
+    @property
+    def matrix(self) -> ProfileMatrix:
+        """当前 profile 集合的编译矩阵（profile 变化时重新编译）"""
+        if self._matrix is None:
+            self._matrix = ProfileMatrix(self._profiles)
+        return self._matrix
 
     # ─── 指纹提取 ───────────────────────────────────────────
 
@@ -192,101 +588,56 @@ class GoldenFingerprintService:
         将指纹与所有 Golden Profile 进行匹配。
         返回: (profile_name, best_score, recommended_config) 或 (None, 0, None)
         """
-        best_name: Optional[str] = None
-        best_score = 0.0
-        best_config: Optional[Dict[str, Any]] = None
+        return self.match_profiles([fingerprint])[0]
 
-        for profile_name, profile in self._profiles.items():
-            score = self._compute_match_score(fingerprint, profile.get("match_criteria", {}))
-            if score > best_score:
-                best_score = score
-                best_name = profile_name
-                best_config = profile.get("recommended_config")
+    def match_profiles(
+        self, fingerprints: List[Dict[str, Any]]
+    ) -> List[Tuple[Optional[str], float, Optional[Dict[str, Any]]]]:
+        """批量匹配：一次矩阵运算给出每个指纹的最佳 profile"""
+        self.sync()
+        matrix = self.matrix
+        return matrix.best(matrix.score(fingerprints))
 
-        return (best_name, round(best_score, 3), best_config)
+    def match_templates(self, template_records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        对整个模板库打分（一次调用）
+
+        优先使用 metadata 中已保存的 golden_fingerprint，没有的现场提取。
+        """
+        fingerprints = [self._stored_or_extract(record) for record in template_records]
+        results = []
+        for record, (name, score, config) in zip(template_records, self.match_profiles(fingerprints)):
+            results.append({
+                "template_id": record.get("template_id"),
+                "profile_name": name,
+                "score": score,
+                "match_level": _match_level(score),
+                "recommended_config": config,
+            })
+        return results
 
     def match_all_profiles(
         self, fingerprint: Dict[str, Any]
     ) -> List[Dict[str, Any]]:
         """返回所有 profile 的匹配详情（降序排列）"""
+        self.sync()
+        matrix = self.matrix
+        row = matrix.score([fingerprint])[0]
         results = []
-        for profile_name, profile in self._profiles.items():
-            score = self._compute_match_score(fingerprint, profile.get("match_criteria", {}))
+        for p, profile_name in enumerate(matrix.names):
+            profile = self._profiles[profile_name]
+            score = float(row[p])
             results.append({
                 "profile_name": profile_name,
                 "display_name": profile.get("name", profile_name),
                 "description": profile.get("description", ""),
                 "score": round(score, 3),
-                "match_level": (
-                    "high" if score >= 0.8 else
-                    "medium" if score >= 0.5 else
-                    "low"
-                ),
+                "match_level": _match_level(score),
                 "recommended_config": profile.get("recommended_config"),
             })
         results.sort(key=lambda x: x["score"], reverse=True)
         return results
 
-    def _compute_match_score(
-        self, fingerprint: Dict[str, Any], criteria: Dict[str, Any]
-    ) -> float:
-        """基于加权多维度打分"""
-        score = 0.0
-
-        # 1) transition_category
-        fp_category = fingerprint.get("transition_category", "")
-        allowed_categories = criteria.get("transition_category", [])
-        if allowed_categories and fp_category in allowed_categories:
-            score += FINGERPRINT_WEIGHTS["transition_category"]
-
-        # 2) family
-        fp_family = fingerprint.get("family", "")
-        allowed_families = criteria.get("family", [])
-        if allowed_families and fp_family in allowed_families:
-            score += FINGERPRINT_WEIGHTS["family"]
-
-        # 3) camera_movement
-        fp_camera = fingerprint.get("camera_movement", "")
-        allowed_cameras = criteria.get("camera_movement", [])
-        if allowed_cameras and fp_camera in allowed_cameras:
-            score += FINGERPRINT_WEIGHTS["camera_movement"]
-
-        # 4) motion_pattern (关键词模糊匹配)
-        fp_motion = (fingerprint.get("motion_pattern", "") or "").lower()
-        keywords = criteria.get("motion_pattern_keywords", [])
-        if keywords and fp_motion:
-            matched_keywords = sum(1 for kw in keywords if kw.lower() in fp_motion)
-            if matched_keywords > 0:
-                keyword_ratio = min(matched_keywords / len(keywords), 1.0)
-                score += FINGERPRINT_WEIGHTS["motion_pattern"] * keyword_ratio
-
-        # 5) duration_range
-        fp_duration = fingerprint.get("duration_ms", 0)
-        duration_range = criteria.get("duration_range", [])
-        if len(duration_range) == 2 and fp_duration:
-            min_dur, max_dur = duration_range
-            if min_dur <= fp_duration <= max_dur:
-                score += FINGERPRINT_WEIGHTS["duration_range"]
-            else:
-                # 部分分：距离越近扣分越少
-                if fp_duration < min_dur:
-                    distance_ratio = max(0, 1 - (min_dur - fp_duration) / 500)
-                else:
-                    distance_ratio = max(0, 1 - (fp_duration - max_dur) / 500)
-                score += FINGERPRINT_WEIGHTS["duration_range"] * distance_ratio * 0.5
-
-        # 6) dimension_match: LLM 多维度评分与 profile.recommended_for 的吻合度
-        fp_dim_scores = fingerprint.get("dimension_scores") or {}
-        recommended_for = criteria.get("recommended_for", [])
-        if recommended_for and fp_dim_scores:
-            # 计算 profile 关心的维度的平均得分
-            relevant_scores = [fp_dim_scores.get(dim, 0.0) for dim in recommended_for]
-            if relevant_scores:
-                avg_relevance = sum(relevant_scores) / len(relevant_scores)
-                score += FINGERPRINT_WEIGHTS["dimension_match"] * avg_relevance
-
-        return score
-
     # ─── 自动预填 ──────────────────────────────────────────
 
     def auto_fill_publish_config(
@@ -373,7 +724,10 @@ class GoldenFingerprintService:
 
         # 写入 DB
         try:
-            update_data: Dict[str, Any] = {"publish_config": new_config}
+            update_data: Dict[str, Any] = {
+                "publish_config": new_config,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
 
             # 高匹配度时自动预标注质量标签
             if score >= 0.8:
@@ -413,9 +767,10 @@ class GoldenFingerprintService:
             if match_result:
                 metadata["golden_match"] = match_result
 
-            supabase.table("template_records").update(
-                {"metadata": metadata}
-            ).eq("template_id", template_id).execute()
+            supabase.table("template_records").update({
+                "metadata": metadata,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }).eq("template_id", template_id).execute()
             return True
         except Exception as exc:
             logger.error("[GoldenFingerprint] 保存指纹失败 %s: %s", template_id, exc)
@@ -492,134 +847,142 @@ class GoldenFingerprintService:
         """
         从已标注 golden/good 的已发布模板中重建 Golden Profile。
         统计各指纹维度的分布 + 高评分渲染的参数众数。
+
+        全量读取只用于初始化增量统计；之后模板标注变化通过
+        observe_template / forget_template 增量维护，并递增共享版本通知其他进程。
         """
         try:
-            result = (
-                supabase.table("template_records")
-                .select("template_id,metadata,quality_label,publish_config")
-                .in_("quality_label", ["golden", "good"])
-                .eq("status", "published")
-                .execute()
-            )
+            records = self._fetch_source_records()
         except Exception as exc:
             return {"success": False, "error": str(exc), "sample_count": 0}
 
-        records = result.data or []
-        if len(records) < 5:
+        if len(records) < MIN_REBUILD_SAMPLES:
             return {
                 "success": False,
-                "error": f"标注数据不足（需要至少 5 个 golden/good 模板，当前 {len(records)} 个）",
+                "error": f"标注数据不足（需要至少 {MIN_REBUILD_SAMPLES} 个 golden/good 模板，当前 {len(records)} 个）",
                 "sample_count": len(records),
             }
 
-        # 按 family 分组统计
-        family_groups: Dict[str, List[Dict]] = {}
-        for record in records:
-            metadata = record.get("metadata") or {}
-            if not isinstance(metadata, dict):
-                continue
-            fp = metadata.get("golden_fingerprint") or {}
-            ts = metadata.get("transition_spec") or {}
-            family = fp.get("family") or ts.get("family") or "unknown"
-            if family == "unknown":
-                continue
-            family_groups.setdefault(family, []).append({
-                "fingerprint": fp or self.extract_fingerprint(record),
-                "publish_config": record.get("publish_config") or {},
-                "quality_label": record.get("quality_label"),
-            })
-
-        rebuilt_profiles: Dict[str, Dict] = {}
-        for family, group in family_groups.items():
-            if len(group) < 2:
-                continue
-
-            # 统计 transition_category 众数
-            categories = [g["fingerprint"].get("transition_category") for g in group if g["fingerprint"].get("transition_category")]
-            category_set = list(set(categories)) if categories else []
-
-            # 统计 camera_movement 众数
-            cameras = [g["fingerprint"].get("camera_movement") for g in group if g["fingerprint"].get("camera_movement")]
-            camera_set = list(set(cameras)) if cameras else []
-
-            # motion_pattern 关键词提取
-            motion_words: List[str] = []
-            for g in group:
-                mp = (g["fingerprint"].get("motion_pattern") or "").lower()
-                for word in mp.replace("_", " ").split():
-                    if len(word) > 2 and word not in motion_words:
-                        motion_words.append(word)
-
-            # duration 范围
-            durations = [g["fingerprint"].get("duration_ms", 500) for g in group]
-            min_dur = max(200, min(durations) - 100)
-            max_dur = min(2000, max(durations) + 100)
-
-            # publish_config 众数
-            config_sample = {}
-            for g in group:
-                pc = g["publish_config"]
-                if pc and isinstance(pc, dict):
-                    for key, val in pc.items():
-                        if key.startswith("default_") and val is not None:
-                            config_sample.setdefault(key, []).append(val)
-
-            recommended_config: Dict[str, Any] = {}
-            for key, values in config_sample.items():
-                if isinstance(values[0], (int, float)):
-                    # 取中位数
-                    sorted_vals = sorted(values)
-                    recommended_config[key] = sorted_vals[len(sorted_vals) // 2]
-                elif isinstance(values[0], list):
-                    # 取并集
-                    merged = []
-                    for v in values:
-                        for item in v:
-                            if item not in merged:
-                                merged.append(item)
-                    recommended_config[key] = merged
-                else:
-                    # 取众数
-                    from collections import Counter
-                    recommended_config[key] = Counter(values).most_common(1)[0][0]
-
-            profile_key = f"{family}_rebuilt"
-            rebuilt_profiles[profile_key] = {
-                "name": f"{family} (数据驱动)",
-                "description": f"从 {len(group)} 个标注模板自动重建",
-                "match_criteria": {
-                    "transition_category": category_set,
-                    "family": [family],
-                    "camera_movement": camera_set[:6],
-                    "motion_pattern_keywords": motion_words[:8],
-                    "duration_range": [min_dur, max_dur],
-                },
-                "recommended_config": recommended_config,
-                "sample_count": len(group),
-                "source": "data_driven",
-            }
-
-        # 合并：数据驱动 profile 补充手动 profile（不覆盖）
-        merged = dict(self._profiles)
-        for key, profile in rebuilt_profiles.items():
-            if key not in merged:
-                merged[key] = profile
-
-        self._profiles = merged
+        self._seed_stats(records)
+        self._bump_shared_version()
 
+        rebuilt = [k for k, v in self._profiles.items() if v.get("source") == "data_driven"]
         return {
             "success": True,
             "sample_count": len(records),
-            "family_groups": {k: len(v) for k, v in family_groups.items()},
-            "rebuilt_count": len(rebuilt_profiles),
+            "family_groups": {k: len(v) for k, v in self._family_stats.items()},
+            "rebuilt_count": len(rebuilt),
             "total_profiles": len(self._profiles),
             "profile_names": list(self._profiles.keys()),
         }
 
+    def _fetch_source_records(self) -> List[Dict[str, Any]]:
+        result = (
+            supabase.table("template_records")
+            .select("template_id,status,metadata,quality_label,publish_config")
+            .in_("quality_label", list(PROFILE_SOURCE_LABELS))
+            .eq("status", "published")
+            .execute()
+        )
+        return result.data or []
+
+    def _seed_stats(self, records: List[Dict[str, Any]]) -> None:
+        self._family_stats = {}
+        self._family_of = {}
+        for record in records:
+            self._add_sample(record)
+        self._stats_seeded = True
+        self._refresh_profiles()
+
+    def observe_template(self, template_record: Dict[str, Any]) -> bool:
+        """
+        模板标注 / 发布状态变化时增量更新统计
+
+        记录需包含 template_id / status / quality_label / metadata / publish_config。
+        只重算受影响 family 的 profile。返回 profile 集合是否变化。
+        """
+        self.sync()
+        if not self._stats_seeded:
+            return False
+        template_id = template_record.get("template_id")
+        if not template_id:
+            return False
+
+        before = self._family_of.get(template_id)
+        self._remove_sample(template_id)
+        eligible = (
+            template_record.get("status") == "published"
+            and template_record.get("quality_label") in PROFILE_SOURCE_LABELS
+        )
+        after = self._add_sample(template_record) if eligible else None
+        if before is None and after is None:
+            return False
+        self._refresh_profiles()
+        self._bump_shared_version()
+        return True
+
+    def forget_template(self, template_id: str) -> bool:
+        """模板删除时从统计中移除"""
+        self.sync()
+        if template_id not in self._family_of:
+            return False
+        self._remove_sample(template_id)
+        self._refresh_profiles()
+        self._bump_shared_version()
+        return True
+
+    def _stored_or_extract(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = record.get("metadata") or {}
+        fp = metadata.get("golden_fingerprint") if isinstance(metadata, dict) else None
+        return fp or self.extract_fingerprint(record)
+
+    def _add_sample(self, record: Dict[str, Any]) -> Optional[str]:
+        metadata = record.get("metadata") or {}
+        if not isinstance(metadata, dict):
+            return None
+        fp = metadata.get("golden_fingerprint") or {}
+        ts = metadata.get("transition_spec") or {}
+        family = fp.get("family") or ts.get("family") or "unknown"
+        if family == "unknown":
+            return None
+        template_id = record.get("template_id") or ""
+        self._family_stats.setdefault(family, _FamilyStats(family)).add(template_id, {
+            "fingerprint": fp or self.extract_fingerprint(record),
+            "publish_config": record.get("publish_config") or {},
+            "quality_label": record.get("quality_label"),
+        })
+        self._family_of[template_id] = family
+        return family
+
+    def _remove_sample(self, template_id: str) -> None:
+        family = self._family_of.pop(template_id, None)
+        if family is None:
+            return
+        stats = self._family_stats.get(family)
+        if stats is not None:
+            stats.remove(template_id)
+            if not len(stats):
+                del self._family_stats[family]
+
+    def _refresh_profiles(self) -> None:
+        """合并：数据驱动 profile 补充手动 profile（不覆盖），并使打分矩阵失效"""
+        merged = dict(self._manual_profiles)
+        total = sum(len(stats) for stats in self._family_stats.values())
+        if total >= MIN_REBUILD_SAMPLES:
+            for family, stats in self._family_stats.items():
+                if len(stats) < MIN_FAMILY_SAMPLES:
+                    continue
+                profile_key = f"{family}_rebuilt"
+                if profile_key not in merged:
+                    merged[profile_key] = stats.to_profile()
+        self._profiles = merged
+        self._matrix = None
+
     # ─── 查看 profiles ─────────────────────────────────────
 
     def get_profiles(self) -> List[Dict[str, Any]]:
         """返回所有 Golden Profile（含手动 + 数据驱动）"""
+        self.sync()
         profiles = []
         for name, profile in self._profiles.items():
             profiles.append({
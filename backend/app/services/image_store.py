@@ -0,0 +1,297 @@
+"""
+图片句柄存储
+============
+AI 管线内部以 ImageHandle（内容 sha256）传递图片，不再逐跳传 base64 / data URL：
+  - 原始字节按内容哈希只存一份（同一张图多次写入去重）
+  - 解码后的 PIL 图、按用途缩放后的变体（LLM 分析 / Kling 输入）各缓存一份
+  - 只在调用外部服务（LLM / Kling / Embedding）时才编码为 base64 / data URL
+
+进程内 LRU，按字节预算淘汰（IMAGE_STORE_MAX_BYTES）。句柄本身持有原始字节，
+管线持有句柄期间即使缓存条目被其他请求挤出，读取时也会用句柄里的字节补回，不会中途失效；
+预算只约束缓存（解码图 / 变体 / 无人引用的原图），句柄释放后原图随之回收。
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_STORE_MAX_DECODED = int(os.getenv("IMAGE_STORE_MAX_DECODED", "8"))
+
+# 按用途的缩放变体
+IMAGE_VARIANTS: Dict[str, Dict[str, Any]] = {
+    # 视觉 LLM / 多模态 embedding：模型内部会再缩放，1024 足够
+    "llm": {"max_side": int(os.getenv("IMAGE_VARIANT_LLM_MAX_SIDE", "1024")), "quality": 85, "keep_alpha": True},
+    # 编辑意图分类：只需看清涂鸦形状和整体构图，缩略图即可（延迟 / token 更低）
+    "intent": {"max_side": int(os.getenv("IMAGE_VARIANT_INTENT_MAX_SIDE", "512")), "quality": 80, "keep_alpha": True},
+    # Kling 输入：与 prepare_kling_image_input 一致（2048 / JPEG 90 / 透明区域铺白底）
+    "kling": {"max_side": 2048, "quality": 90, "keep_alpha": False},
+}
+
+
+class ImageNotFound(KeyError):
+    """句柄对应的图片已被淘汰且句柄未携带原始字节"""
+
+
+@dataclass(frozen=True)
+class ImageHandle:
+    """图片句柄：内容哈希 + 基本信息，可安全跨协程 / 线程传递"""
+    digest: str
+    mime_type: str
+    width: int
+    height: int
+    # 原始字节（与缓存共享同一对象，不额外占内存）：句柄存活期间缓存被淘汰也能补回
+    data: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+    @property
+    def ref(self) -> str:
+        return f"sha256:{self.digest}"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return (self.width, self.height)
+
+
+ImageRef = Union[ImageHandle, str]
+
+
+def render_jpeg(image: Image.Image, max_side: int, quality: int) -> bytes:
+    """最长边缩到 max_side 以内，透明区域铺白底后编码为 JPEG"""
+    if max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        image = image.resize(
+            (max(1, int(image.size[0] * ratio)), max(1, int(image.size[1] * ratio))),
+            Image.Resampling.LANCZOS,
+        )
+    if image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class ImageStore:
+    """按内容寻址的图片存储（原图 + 解码缓存 + 用途变体）"""
+
+    def __init__(self, max_bytes: int = IMAGE_STORE_MAX_BYTES, max_decoded: int = IMAGE_STORE_MAX_DECODED):
+        self.max_bytes = max_bytes
+        self.max_decoded = max_decoded
+        # key: ("blob", digest) / ("variant", digest, purpose) → (bytes, mime)
+        self._entries: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+        self._decoded: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._handles: Dict[str, ImageHandle] = {}
+        self._urls: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    # ==========================================
+    # 写入
+    # ==========================================
+
+    def put_bytes(self, data: bytes) -> ImageHandle:
+        """写入图片字节（已存在则直接返回句柄）"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            handle = self._handles.get(digest)
+            if handle is not None and ("blob", digest) in self._entries:
+                self._entries.move_to_end(("blob", digest))
+                return handle
+
+        with Image.open(io.BytesIO(data)) as probe:
+            mime_type = Image.MIME.get(probe.format or "", "image/png")
+            handle = ImageHandle(
+                digest=digest, mime_type=mime_type, width=probe.width, height=probe.height, data=data,
+            )
+
+        with self._lock:
+            self._handles[digest] = handle
+            self._store(("blob", digest), data, mime_type)
+        return handle
+
+    def put_base64(self, image_base64: str) -> ImageHandle:
+        return self.put_bytes(base64.b64decode(image_base64))
+
+    def put_data_url(self, data_url: str) -> ImageHandle:
+        if not data_url.startswith("data:") or "," not in data_url:
+            raise ValueError("不是有效的 Data URL")
+        return self.put_base64(data_url.split(",", 1)[1])
+
+    def put_image(self, image: Image.Image, format: str = "PNG") -> ImageHandle:
+        """写入 PIL 图（编码一次），解码缓存直接复用传入的图"""
+        buffer = io.BytesIO()
+        image.save(buffer, format=format)
+        handle = self.put_bytes(buffer.getvalue())
+        with self._lock:
+            self._remember_decoded(handle.digest, image.copy())
+        return handle
+
+    async def fetch(self, url: str, client=None) -> ImageHandle:
+        """下载远程图片（同一 URL 只下载一次）"""
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is not None and ("blob", digest) in self._entries:
+                self._urls.move_to_end(url)
+                return self._handles[digest]
+
+        import httpx
+
+        if client is None:
+            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as own_client:
+                response = await own_client.get(url)
+        else:
+            response = await client.get(url)
+        response.raise_for_status()
+        handle = self.put_bytes(response.content)
+
+        with self._lock:
+            self._urls[url] = handle.digest
+            while len(self._urls) > 4096:
+                self._urls.popitem(last=False)
+        return handle
+
+    # ==========================================
+    # 读取
+    # ==========================================
+
+    def get_bytes(self, handle: ImageHandle) -> bytes:
+        try:
+            return self._get(("blob", handle.digest))[0]
+        except ImageNotFound:
+            if handle.data is None:
+                raise
+        # 管线仍持有句柄但缓存已被挤出：用句柄携带的原始字节写回
+        logger.debug(f"[ImageStore] 原图已淘汰，使用句柄字节补回: {handle.digest[:12]}")
+        with self._lock:
+            self._handles[handle.digest] = handle
+            self._store(("blob", handle.digest), handle.data, handle.mime_type)
+        return handle.data
+
+    def open(self, handle: ImageHandle) -> Image.Image:
+        """解码后的图片（返回副本，调用方可自由修改）"""
+        with self._lock:
+            image = self._decoded.get(handle.digest)
+            if image is not None:
+                self._decoded.move_to_end(handle.digest)
+                return image.copy()
+
+        image = Image.open(io.BytesIO(self.get_bytes(handle)))
+        image.load()
+        with self._lock:
+            self._remember_decoded(handle.digest, image)
+        return image.copy()
+
+    def variant(self, handle: ImageHandle, purpose: str) -> Tuple[bytes, str]:
+        """按用途缩放后的图片字节和 MIME（首次生成后缓存）"""
+        key = ("variant", handle.digest, purpose)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+
+        spec = IMAGE_VARIANTS[purpose]
+        data, mime_type = self._render_variant(handle, spec)
+        with self._lock:
+            self._store(key, data, mime_type)
+        return data, mime_type
+
+    def variant_base64(self, handle: ImageHandle, purpose: str) -> str:
+        return base64.b64encode(self.variant(handle, purpose)[0]).decode("utf-8")
+
+    def variant_data_url(self, handle: ImageHandle, purpose: str) -> str:
+        data, mime_type = self.variant(handle, purpose)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    # ==========================================
+    # 内部
+    # ==========================================
+
+    def _render_variant(self, handle: ImageHandle, spec: Dict[str, Any]) -> Tuple[bytes, str]:
+        max_side = spec["max_side"]
+        fits = max(handle.size) <= max_side
+        # 尺寸已达标且格式可直接使用：复用原始字节，不重新编码
+        if fits and handle.mime_type == "image/jpeg":
+            return self.get_bytes(handle), handle.mime_type
+
+        image = self.open(handle)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha and spec["keep_alpha"]:
+            # 涂鸦 / 抠图层：透明通道本身携带信息，保留为 PNG
+            if fits and handle.mime_type == "image/png":
+                return self.get_bytes(handle), handle.mime_type
+            image = image.convert("RGBA")
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+            return buffer.getvalue(), "image/png"
+
+        if has_alpha:
+            image = image.convert("RGBA")
+        return render_jpeg(image, max_side, spec["quality"]), "image/jpeg"
+
+    def _get(self, key: tuple) -> Tuple[bytes, str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise ImageNotFound(key[1])
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: tuple, data: bytes, mime_type: str) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[0])
+        self._entries[key] = (data, mime_type)
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_key, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            if evicted_key[0] == "blob":
+                self._decoded.pop(evicted_key[1], None)
+                # 不再由存储持有原图：句柄（及其字节）随管线释放
+                self._handles.pop(evicted_key[1], None)
+
+    def _remember_decoded(self, digest: str, image: Image.Image) -> None:
+        self._decoded[digest] = image
+        self._decoded.move_to_end(digest)
+        while len(self._decoded) > self.max_decoded:
+            self._decoded.popitem(last=False)
+
+
+def image_ref_to_url(ref: ImageRef, purpose: str = "llm", default_mime: str = "image/png") -> str:
+    """
+    外部服务边界：把图片引用转为请求里的 image_url。
+
+    ImageHandle → 对应用途变体的 data URL；http(s) / data URL 原样透传；
+    其余字符串按裸 base64 处理（兼容旧调用）。
+    """
+    if isinstance(ref, ImageHandle):
+        return get_image_store().variant_data_url(ref, purpose)
+    if ref.startswith(("http://", "https://", "data:")):
+        return ref
+    return f"data:{default_mime};base64,{ref}"
+
+
+# 单例
+_image_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore()
+    return _image_store
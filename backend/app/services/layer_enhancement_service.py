@@ -15,6 +15,8 @@ import json
 import asyncio
 from typing import Optional, Dict, Any, List
 
+from .image_store import ImageHandle, ImageRef, get_image_store
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,14 +48,14 @@ LAYER_CLASSIFICATION_PROMPT = """请分析这张抠图后的分层图片，返
 
 
 async def classify_layer(
-    image_base64: str,
+    image: ImageRef,
     semantic_labels: Optional[Dict[str, str]] = None,
 ) -> Dict[str, Any]:
     """
     LLM 视觉分类：识别分层内容的类别和特征
 
     Args:
-        image_base64: 分层图片 base64
+        image: 分层图片（ImageHandle / URL / base64）
         semantic_labels: 已有的语义标签（来自分离阶段）
 
     Returns:
@@ -72,7 +74,7 @@ async def classify_layer(
 
     try:
         raw = await llm.analyze_image(
-            image_base64=image_base64,
+            image=image,
             prompt=prompt,
             system_prompt=LAYER_CLASSIFICATION_SYSTEM,
         )
@@ -295,12 +297,11 @@ async def enhance_layer(
 
     logger.info(f"[LayerEnhance] 开始增强 task={task_id}")
 
-    # 1. 如果没有 base64，从 URL 下载
-    if not layer_image_b64:
-        layer_image_b64 = await _download_image_as_b64(layer_image_url)
+    # 1. 图片进入句柄存储（同一 URL 只下载一次），分类与检索共用同一份 llm 变体
+    layer_image = await _load_layer_image(layer_image_url, layer_image_b64)
 
     # 2. LLM 视觉分类
-    classification_dict = await classify_layer(layer_image_b64, semantic_labels)
+    classification_dict = await classify_layer(layer_image, semantic_labels)
     classification = LayerClassification(
         content_category=classification_dict.get("content_category", "generic"),
         style_hint=classification_dict.get("style_hint", ""),
@@ -319,10 +320,10 @@ async def enhance_layer(
     if not layer_description:
         layer_description = classification.style_hint
 
-    plan = retriever.get_enhancement_plan(
+    plan = await retriever.get_enhancement_plan_async(
         classification=classification,
         layer_description=layer_description,
-        layer_image_b64=layer_image_b64,
+        layer_image_b64=get_image_store().variant_base64(layer_image, "llm"),
     )
 
     if not plan.strategy:
@@ -389,15 +390,12 @@ async def enhance_layer(
 
 # ── 辅助函数 ──────────────────────────────────────
 
-async def _download_image_as_b64(url: str) -> str:
-    """下载图片并转为 base64"""
-    import base64
-    import httpx
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        return base64.b64encode(resp.content).decode("utf-8")
+async def _load_layer_image(url: str, image_b64: Optional[str] = None) -> ImageHandle:
+    """分层图片写入句柄存储：有 base64 直接解码，否则按 URL 下载"""
+    store = get_image_store()
+    if image_b64:
+        return store.put_base64(image_b64)
+    return await store.fetch(url)
 
 
 async def _auto_ingest_reference(
@@ -386,9 +386,10 @@ class LLMService:
     
     async def analyze_image(
         self,
-        image_base64: str,
-        prompt: str,
+        image_base64: Optional[str] = None,
+        prompt: str = "",
         system_prompt: Optional[str] = None,
+        image=None,
     ) -> str:
         """
         多模态分析：图片 + 文字
@@ -396,14 +397,17 @@ class LLMService:
         使用 doubao-seed-1-8 模型分析图片内容
         
         Args:
-            image_base64: 图片的 base64 编码（不含 data:image/xxx;base64, 前缀）
+            image_base64: 图片的 base64 编码（不含 data:image/xxx;base64, 前缀，兼容旧调用）
             prompt: 分析提示词
             system_prompt: 系统提示（可选）
+            image: 图片引用（ImageHandle / URL），优先于 image_base64；
+                   句柄在此处才按 llm 变体编码
             
         Returns:
             分析结果文本
         """
         import httpx
+        from app.services.image_store import image_ref_to_url
         
         api_key = settings.volcengine_ark_api_key
         model = settings.doubao_seed_1_8_endpoint
@@ -416,7 +420,7 @@ class LLMService:
         content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{image_base64}"
+                "url": image_ref_to_url(image if image is not None else image_base64)
             }
         })
         
@@ -464,22 +468,23 @@ class LLMService:
         多图多模态分析：多张图片 + 文字
         
         Args:
-            images: 图片 base64 编码列表（不含 data:image/xxx;base64, 前缀）
+            images: 图片引用列表（ImageHandle / URL / 不含前缀的 base64）
             prompt: 分析提示词
             system_prompt: 系统提示（可选）
         """
         import httpx
+        from app.services.image_store import image_ref_to_url
         
         api_key = settings.volcengine_ark_api_key
         model = settings.doubao_seed_1_8_endpoint
         base_url = "https://ark.cn-beijing.volces.com/api/v3"
         
         content = []
-        for img_base64 in images:
+        for image_ref in images:
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{img_base64}"
+                    "url": image_ref_to_url(image_ref)
                 }
             })
         content.append({"type": "text", "text": prompt})
@@ -1,17 +1,40 @@
 """
 Prompt Enhancement Service (L2 + L3)
 
-L2: Library fallback + negative_prompt 补全（无 LLM 调用，纯 DB 查询）
+L2: Library fallback + negative_prompt 补全（无 LLM 调用，读 prompt_library 内存快照）
 L3: LLM 融会贯通改写（保持用户意图不变，补充专业技法描述）
 
+L2 / L3 并发执行，L3 受延迟预算约束：超时直接用原 prompt 提交，
+改写在后台继续完成并写入缓存，下次同一 prompt 直接命中。
+
 底线：永远不曲解用户意思和大方向
 """
+import asyncio
 import logging
-from typing import Optional
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# prompt_library 快照过期时间（过期后先返回旧快照，后台刷新）
+PROMPT_LIBRARY_SNAPSHOT_TTL_SEC = float(os.getenv("PROMPT_LIBRARY_SNAPSHOT_TTL_SEC", "300"))
+PROMPT_LIBRARY_PAGE_SIZE = 1000
+# 多进程失效：写入方递增 Redis 版本号，各进程按间隔检查，版本变化时后台重载快照
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PROMPT_LIBRARY_VERSION_KEY = "lepus:prompt_library:version"
+PROMPT_LIBRARY_SYNC_INTERVAL_SEC = float(os.getenv("PROMPT_LIBRARY_SYNC_SECONDS", "5"))
+REDIS_RETRY_AFTER_SECONDS = 30  # 连接失败后暂停使用 Redis 的时间
+# L3 改写缓存
+PROMPT_L3_CACHE_SIZE = int(os.getenv("PROMPT_L3_CACHE_SIZE", "512"))
+PROMPT_L3_CACHE_TTL_SEC = float(os.getenv("PROMPT_L3_CACHE_TTL_SEC", "3600"))
+# L3 延迟预算（从 enhance 开始计时）
+PROMPT_ENHANCE_BUDGET_SEC = float(os.getenv("PROMPT_ENHANCE_BUDGET_SEC", "3.0"))
+
 
 @dataclass
 class EnhancedPrompt:
@@ -35,17 +58,101 @@ DEFAULT_NEGATIVES = {
 }
 
 
+class PromptLibrarySnapshot:
+    """
+    prompt_library 内存快照，按 (capability, platform, input_type) 建索引
+
+    platform / input_type 为 None 表示不限（与原 DB 查询一致：未指定或 universal 时不加过滤）。
+    """
+
+    def __init__(self, rows: List[dict]):
+        self.loaded_at = time.monotonic()
+        self.row_count = len(rows)
+        self._fallback: Dict[Tuple[str, Optional[str], Optional[str]], dict] = {}
+        self._negative: Dict[Tuple[str, Optional[str]], str] = {}
+        self._negative_score: Dict[Tuple[str, Optional[str]], float] = {}
+
+        for row in rows:
+            capability = row.get("capability")
+            if not capability or not row.get("prompt"):
+                continue
+            platform = row.get("platform")
+            input_type = row.get("input_type")
+            score = float(row.get("quality_score") or 0.0)
+            entry = {
+                "prompt": row["prompt"],
+                "negative_prompt": row.get("negative_prompt") or "",
+                "quality_score": score,
+            }
+            for key in (
+                (capability, platform, input_type),
+                (capability, platform, None),
+                (capability, None, input_type),
+                (capability, None, None),
+            ):
+                best = self._fallback.get(key)
+                if best is None or score > best["quality_score"]:
+                    self._fallback[key] = entry
+
+            if entry["negative_prompt"]:
+                for key in ((capability, platform), (capability, None)):
+                    if key not in self._negative or score > self._negative_score[key]:
+                        self._negative[key] = entry["negative_prompt"]
+                        self._negative_score[key] = score
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at >= PROMPT_LIBRARY_SNAPSHOT_TTL_SEC
+
+    def fallback(self, capability: str, platform: Optional[str], input_type: Optional[str]) -> Optional[dict]:
+        entry = self._fallback.get((capability, _dimension(platform), _dimension(input_type)))
+        return dict(entry) if entry else None
+
+    def negative(self, capability: str, platform: Optional[str]) -> str:
+        return self._negative.get((capability, _dimension(platform)), "")
+
+
+def _dimension(value: Optional[str]) -> Optional[str]:
+    return value if value and value != "universal" else None
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt.strip()).lower()
+
+
 class PromptEnhancer:
     """Prompt 增强器 — L2 兜底 + L3 LLM 改写"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        redis_url: Optional[str] = REDIS_URL,
+        version_store=None,
+        sync_interval: float = PROMPT_LIBRARY_SYNC_INTERVAL_SEC,
+    ):
         self._supabase = None
+        self._snapshot: Optional[PromptLibrarySnapshot] = None
+        # 锁只保护快照指针与加载状态，加载本身在锁外进行
+        self._snapshot_lock = threading.Lock()
+        self._loading: Optional[threading.Event] = None
+        self._generation = 0  # 每次失效递增，加载期间失效的结果只作为过期快照使用
+        self._refreshing = False
+        # 共享版本号：version_store 需提供 get / incr（默认 Redis）
+        self.redis_url = redis_url
+        self._version_store = version_store
+        self._store_down_until = 0.0
+        self._synced_version = 0
+        self._sync_interval = sync_interval
+        self._next_sync_at = 0.0
+        self._syncing = False
+        # L3: (能力, 平台, 输入类型, 规范化 prompt) → (写入时间, 改写结果)
+        self._l3_cache: "OrderedDict[Tuple[str, str, str, str], Tuple[float, str]]" = OrderedDict()
+        self._l3_inflight: Dict[Tuple[str, str, str, str], asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
 
     @property
     def supabase(self):
         if not self._supabase:
-            from app.services.supabase_client import get_supabase_client
-            self._supabase = get_supabase_client()
+            from app.services.supabase_client import get_supabase
+            self._supabase = get_supabase()
         return self._supabase
 
     async def enhance(
@@ -60,14 +167,21 @@ class PromptEnhancer:
         """
         主入口
 
-        - 用户写了 prompt → 保留原样，L3 增强（如果开启）
-        - 用户没写 prompt → L2 从库中取 fallback
+        - 用户写了 prompt → 保留原样，L3 增强（如果开启），与 L2 并发
+        - 用户没写 prompt → L2 从库中取 fallback，再对 fallback 做 L3
         - 用户没给 negative_prompt → L2 从库/默认值补全
+        - L3 超出延迟预算 → 保留原 prompt，改写在后台完成后进缓存
         """
+        started = time.monotonic()
         result_prompt = prompt.strip()
         result_negative = negative_prompt.strip()
         source = "original"
 
+        # ── L3（投机）: 用户已写 prompt，不必等 L2 ──
+        l3_task = None
+        if auto_enhance and result_prompt:
+            l3_task = self._start_llm_enhance(result_prompt, capability, platform, input_type)
+
         # ── L2: 空 prompt → 从库取 fallback ──
         if not result_prompt:
             fallback = await self._get_library_fallback(capability, platform, input_type)
@@ -77,20 +191,25 @@ class PromptEnhancer:
                     result_negative = fallback["negative_prompt"]
                 source = "library_fallback"
                 logger.info(f"[PromptEnhancer] L2 fallback: cap={capability}, prompt={result_prompt[:50]}...")
+            if auto_enhance and result_prompt:
+                l3_task = self._start_llm_enhance(result_prompt, capability, platform, input_type)
 
         # ── L2: negative_prompt 补全 ──
         if not result_negative:
             lib_neg = await self._get_library_negative(capability, platform, input_type)
             result_negative = lib_neg or DEFAULT_NEGATIVES.get(capability, "")
 
-        # ── L3: LLM 融会贯通改写 ──
-        if auto_enhance and result_prompt:
+        # ── L3: 在剩余预算内等待改写 ──
+        if l3_task is not None:
+            remaining = PROMPT_ENHANCE_BUDGET_SEC - (time.monotonic() - started)
             try:
-                enhanced = await self._llm_enhance(result_prompt, capability, platform, input_type)
+                enhanced = await asyncio.wait_for(asyncio.shield(l3_task), timeout=max(remaining, 0.0))
                 if enhanced:
                     result_prompt = enhanced
                     if source == "original":
                         source = "llm_enhanced"
+            except asyncio.TimeoutError:
+                logger.info(f"[PromptEnhancer] L3 超出延迟预算 {PROMPT_ENHANCE_BUDGET_SEC}s，保留原始（后台继续并缓存）")
             except Exception as e:
                 logger.warning(f"[PromptEnhancer] L3 失败，保留原始: {e}")
 
@@ -101,55 +220,212 @@ class PromptEnhancer:
             source=source,
         )
 
+    def invalidate_library(self) -> None:
+        """prompt_library 有写入时调用：下次读取重新加载快照，并通知其他进程"""
+        self._drop_snapshot()
+        self._bump_shared_version()
+
+    def clear_cache(self) -> None:
+        self._drop_snapshot()
+        self._l3_cache.clear()
+
+    def _drop_snapshot(self) -> None:
+        with self._snapshot_lock:
+            self._snapshot = None
+            self._generation += 1
+
     # ── L2 Private Methods ──
 
     async def _get_library_fallback(
         self, capability: str, platform: Optional[str], input_type: Optional[str]
     ) -> Optional[dict]:
-        """从 prompt_library 取 quality_score 最高的一条作为 fallback"""
-        try:
-            query = (
-                self.supabase.table("prompt_library")
-                .select("prompt, negative_prompt, quality_score")
-                .eq("capability", capability)
-                .order("quality_score", desc=True)
-                .limit(1)
-            )
-            if platform and platform != "universal":
-                query = query.eq("platform", platform)
-            if input_type and input_type != "universal":
-                query = query.eq("input_type", input_type)
-            result = query.execute()
-            if result.data:
-                return result.data[0]
-        except Exception as e:
-            logger.warning(f"[PromptEnhancer] fallback 查询失败: {e}")
-        return None
+        """从 prompt_library 快照取 quality_score 最高的一条作为 fallback"""
+        snapshot = await self._library_snapshot()
+        return snapshot.fallback(capability, platform, input_type) if snapshot else None
 
     async def _get_library_negative(
         self, capability: str, platform: Optional[str], input_type: Optional[str]
     ) -> str:
-        """从 prompt_library 取 negative_prompt 补全"""
+        """从 prompt_library 快照取 negative_prompt 补全"""
+        snapshot = await self._library_snapshot()
+        return snapshot.negative(capability, platform) if snapshot else ""
+
+    async def _library_snapshot(self) -> Optional[PromptLibrarySnapshot]:
+        """
+        当前快照：首次加载时等待；过期或共享版本变化后先返回旧快照，后台刷新
+        """
+        shared = self._version_store is not None or self.redis_url
+        if shared and time.monotonic() >= self._next_sync_at and not self._syncing:
+            self._syncing = True
+            self._spawn(asyncio.to_thread(self._sync_shared_version))
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await asyncio.to_thread(self._refresh_snapshot, False)
+        if snapshot.is_stale() and not self._refreshing:
+            self._refreshing = True
+            self._spawn(asyncio.to_thread(self._refresh_snapshot, True))
+        return snapshot
+
+    def _refresh_snapshot(self, force: bool) -> Optional[PromptLibrarySnapshot]:
+        """
+        加载 prompt_library 全表（不含 embedding）；并发调用只加载一次
+
+        网络加载在锁外进行，完成后在锁内替换快照；同时到达的调用方等待同一次加载。
+        """
+        with self._snapshot_lock:
+            if self._snapshot is not None and not force:
+                return self._snapshot
+            loading = self._loading
+            leader = loading is None
+            if leader:
+                loading = self._loading = threading.Event()
+                generation = self._generation
+
+        if not leader:
+            loading.wait()
+            return self._snapshot
+
+        snapshot = None
         try:
-            query = (
+            snapshot = PromptLibrarySnapshot(self._fetch_library_rows())
+            logger.info(f"[PromptEnhancer] prompt_library 快照已加载: {snapshot.row_count} 条")
+        except Exception as e:
+            # 保留旧快照；没有旧快照时 L2 退回默认 negative
+            logger.warning(f"[PromptEnhancer] prompt_library 快照加载失败: {e}")
+        finally:
+            with self._snapshot_lock:
+                if snapshot is not None:
+                    if generation != self._generation:
+                        # 加载期间有写入：可能没读到新数据，先用但标记过期，下次读取后台重载
+                        snapshot.loaded_at = float("-inf")
+                    self._snapshot = snapshot
+                self._loading = None
+                self._refreshing = False
+            loading.set()
+        return self._snapshot
+
+    def _fetch_library_rows(self) -> List[dict]:
+        rows: List[dict] = []
+        start = 0
+        while True:
+            page = (
                 self.supabase.table("prompt_library")
-                .select("negative_prompt")
-                .eq("capability", capability)
-                .neq("negative_prompt", "")
-                .order("quality_score", desc=True)
-                .limit(1)
+                .select("capability, platform, input_type, prompt, negative_prompt, quality_score")
+                .range(start, start + PROMPT_LIBRARY_PAGE_SIZE - 1)
+                .execute()
+            ).data or []
+            rows.extend(page)
+            if len(page) < PROMPT_LIBRARY_PAGE_SIZE:
+                return rows
+            start += PROMPT_LIBRARY_PAGE_SIZE
+
+    # ── 多进程同步 ──
+
+    def _get_version_store(self):
+        if self._version_store is None:
+            if not self.redis_url or time.monotonic() < self._store_down_until:
+                return None
+            try:
+                import redis
+            except ImportError as exc:
+                self._mark_store_down(exc)
+                return None
+            self._version_store = redis.Redis.from_url(
+                self.redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1,
             )
-            if platform and platform != "universal":
-                query = query.eq("platform", platform)
-            result = query.execute()
-            if result.data and result.data[0].get("negative_prompt"):
-                return result.data[0]["negative_prompt"]
-        except Exception as e:
-            logger.warning(f"[PromptEnhancer] negative 查询失败: {e}")
-        return ""
+        return self._version_store
+
+    def _mark_store_down(self, error: Exception) -> None:
+        self._version_store = None
+        self._store_down_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        logger.warning(
+            f"[PromptEnhancer] Redis 不可用，{REDIS_RETRY_AFTER_SECONDS}s 内快照失效仅在本进程生效: {error}"
+        )
+
+    def _bump_shared_version(self) -> None:
+        """本进程写入了 prompt_library：递增共享版本，通知其他进程重载"""
+        store = self._get_version_store()
+        if store is None:
+            return
+        try:
+            # 本进程的快照已丢弃，下次全量加载会包含此前所有写入
+            self._synced_version = int(store.incr(PROMPT_LIBRARY_VERSION_KEY))
+        except Exception as exc:
+            self._mark_store_down(exc)
+
+    def _sync_shared_version(self) -> bool:
+        """共享版本号变化时重载快照（按 sync_interval 节流，在线程池中执行），返回是否发生了重载"""
+        try:
+            self._next_sync_at = time.monotonic() + self._sync_interval
+            store = self._get_version_store()
+            if store is None:
+                return False
+            try:
+                version = int(store.get(PROMPT_LIBRARY_VERSION_KEY) or 0)
+            except Exception as exc:
+                self._mark_store_down(exc)
+                return False
+            if version == self._synced_version:
+                return False
+            self._synced_version = version
+            with self._snapshot_lock:
+                self._generation += 1
+                loaded = self._snapshot is not None
+            if loaded:
+                self._refresh_snapshot(True)
+            logger.info(f"[PromptEnhancer] prompt_library 版本变化为 {version}，已重载快照")
+            return True
+        finally:
+            self._syncing = False
 
     # ── L3 Private Methods ──
 
+    def _start_llm_enhance(
+        self,
+        prompt: str,
+        capability: str,
+        platform: Optional[str],
+        input_type: Optional[str],
+    ) -> asyncio.Future:
+        """启动（或复用进行中的）L3 改写任务；结果写入缓存"""
+        key = (capability, platform or "", input_type or "", _normalize_prompt(prompt))
+        loop = asyncio.get_running_loop()
+
+        cached = self._l3_cache.get(key)
+        if cached and time.monotonic() - cached[0] < PROMPT_L3_CACHE_TTL_SEC:
+            self._l3_cache.move_to_end(key)
+            logger.info(f"[PromptEnhancer] L3 命中缓存: '{prompt[:30]}...'")
+            future = loop.create_future()
+            future.set_result(cached[1])
+            return future
+
+        task = self._l3_inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return task
+
+        async def _run() -> Optional[str]:
+            try:
+                enhanced = await self._llm_enhance(prompt, capability, platform, input_type)
+                if enhanced:
+                    self._l3_cache[key] = (time.monotonic(), enhanced)
+                    self._l3_cache.move_to_end(key)
+                    while len(self._l3_cache) > PROMPT_L3_CACHE_SIZE:
+                        self._l3_cache.popitem(last=False)
+                return enhanced
+            finally:
+                self._l3_inflight.pop(key, None)
+
+        task = self._spawn(_run())
+        self._l3_inflight[key] = task
+        return task
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """后台任务保持引用，超出预算后仍可跑完"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
     async def _llm_enhance(
         self,
         prompt: str,
@@ -251,3 +527,8 @@ def get_prompt_enhancer() -> PromptEnhancer:
     if not _instance:
         _instance = PromptEnhancer()
     return _instance
+
+
+def invalidate_prompt_library_snapshot() -> None:
+    """prompt_library 写入后调用（新增 / 删除 / 种子入库）：丢弃本进程快照并通知其他进程"""
+    get_prompt_enhancer().invalidate_library()
@@ -10,14 +10,23 @@ B-Roll 触发检测
 4. product_mention: 产品/品牌提及 (具体产品名、品牌名)
 5. process_desc: 流程描述 (首先、然后、最后、第一步)
 6. concept_visual: 概念可视化 (就像、好比、类似于)
+
+检测流程:
+- 每条规则声明 keywords（任何匹配都必然包含其中之一的字面量）
+- 所有 keywords 合并成一个 Aho-Corasick 自动机，一次扫描得到可能命中的规则
+- 只对候选规则跑正则；整段口播拼接后一次扫描，再按片段偏移切回各片段
 """
 
 import re
-from typing import List, Optional, Dict, Any
+import bisect
+import hashlib
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field
 from enum import Enum
 from dataclasses import dataclass
 
+from app.utils.aho_corasick import AhoCorasick
+
 
 class BrollTriggerType(str, Enum):
     """B-Roll 触发类型"""
@@ -51,6 +60,8 @@ class TriggerRule:
     pattern: str  # 正则表达式
     importance: str  # high/medium/low
     broll_suggestion_template: str  # B-Roll 建议模版
+    # 必含字面量（不区分大小写）；为空表示无法预筛，总是执行正则
+    keywords: Tuple[str, ...] = ()
 
 
 # 数据引用触发规则
@@ -60,30 +71,35 @@ DATA_CITE_RULES = [
         pattern=r'(\d+(?:\.\d+)?)\s*[%％]',  # 百分比: 50%, 3.5%
         importance="high",
         broll_suggestion_template="数据图表展示 {matched}",
+        keywords=("%", "％"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.DATA_CITE,
         pattern=r'(\d+(?:\.\d+)?)\s*[亿万千百]',  # 大数字: 5亿, 100万
         importance="high",
         broll_suggestion_template="数字动画展示 {matched}",
+        keywords=("亿", "万", "千", "百"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.DATA_CITE,
         pattern=r'增长了?\s*(\d+(?:\.\d+)?)\s*倍',  # 增长倍数
         importance="high",
         broll_suggestion_template="增长趋势图 {matched}",
+        keywords=("增长",),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.DATA_CITE,
         pattern=r'(?:根据|据|来自).*?(?:数据|报告|统计|调查)',  # 引用来源
         importance="medium",
         broll_suggestion_template="数据来源展示",
+        keywords=("据", "来自"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.DATA_CITE,
         pattern=r'(?:超过|达到|突破|接近)\s*(\d+)',  # 里程碑数字
         importance="high",
         broll_suggestion_template="里程碑数字展示 {matched}",
+        keywords=("超过", "达到", "突破", "接近"),
     ),
 ]
 
@@ -94,18 +110,21 @@ EXAMPLE_MENTION_RULES = [
         pattern=r'(?:比如说?|例如|举个例子|像是|譬如)\s*[，,]?\s*(.{2,20})',
         importance="high",
         broll_suggestion_template="示例图片: {matched}",
+        keywords=("比如", "例如", "举个例子", "像是", "譬如"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.EXAMPLE_MENTION,
         pattern=r'(?:以|拿)\s*(.{2,15})\s*(?:为例|来说|举例)',
         importance="high",
         broll_suggestion_template="案例展示: {matched}",
+        keywords=("为例", "来说", "举例"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.EXAMPLE_MENTION,
         pattern=r'(?:最典型的|最常见的|最明显的).*?(?:就是|是)',
         importance="medium",
         broll_suggestion_template="典型案例展示",
+        keywords=("最典型的", "最常见的", "最明显的"),
     ),
 ]
 
@@ -116,24 +135,28 @@ COMPARISON_RULES = [
         pattern=r'(?:和|与|跟)\s*(.{2,15})\s*(?:相比|对比|比较)',
         importance="high",
         broll_suggestion_template="对比图: {matched}",
+        keywords=("相比", "对比", "比较"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.COMPARISON,
         pattern=r'(.{2,10})\s*(?:vs|VS|versus|对比)\s*(.{2,10})',
         importance="high",
         broll_suggestion_template="对比展示: {matched}",
+        keywords=("vs", "versus", "对比"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.COMPARISON,
         pattern=r'(?:从|由)\s*(.{2,10})\s*(?:到|变成|升级为)\s*(.{2,10})',
         importance="medium",
         broll_suggestion_template="变化对比: {matched}",
+        keywords=("到", "变成", "升级为"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.COMPARISON,
         pattern=r'(?:前者|后者|前一个|后一个|两者)',
         importance="low",
         broll_suggestion_template="对比说明",
+        keywords=("前者", "后者", "前一个", "后一个", "两者"),
     ),
 ]
 
@@ -144,36 +167,42 @@ PRODUCT_MENTION_RULES = [
         pattern=r'(?:iPhone|iPad|Mac|Apple|苹果)\s*\d*\s*(?:Pro|Max|Plus|mini)?',
         importance="high",
         broll_suggestion_template="Apple产品图: {matched}",
+        keywords=("iphone", "ipad", "mac", "apple", "苹果"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PRODUCT_MENTION,
         pattern=r'(?:华为|HUAWEI|Mate|P\d{2}|荣耀)',
         importance="high",
         broll_suggestion_template="华为产品图: {matched}",
+        keywords=("华为", "huawei", "mate", "p", "荣耀"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PRODUCT_MENTION,
         pattern=r'(?:小米|Xiaomi|红米|Redmi)\s*\d*',
         importance="high",
         broll_suggestion_template="小米产品图: {matched}",
+        keywords=("小米", "xiaomi", "红米", "redmi"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PRODUCT_MENTION,
         pattern=r'(?:特斯拉|Tesla|Model\s*[SXY3])',
         importance="high",
         broll_suggestion_template="特斯拉产品图: {matched}",
+        keywords=("特斯拉", "tesla", "model"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PRODUCT_MENTION,
         pattern=r'(?:ChatGPT|GPT-\d|Claude|Gemini|文心一言|通义千问)',
         importance="high",
         broll_suggestion_template="AI产品界面: {matched}",
+        keywords=("gpt", "claude", "gemini", "文心一言", "通义千问"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PRODUCT_MENTION,
         pattern=r'(?:抖音|TikTok|微信|微博|小红书|B站|bilibili)',
         importance="medium",
         broll_suggestion_template="平台界面: {matched}",
+        keywords=("抖音", "tiktok", "微信", "微博", "小红书", "b站", "bilibili"),
     ),
     # 通用产品模式
     TriggerRule(
@@ -181,6 +210,7 @@ PRODUCT_MENTION_RULES = [
         pattern=r'这款?\s*(?:产品|软件|工具|APP|应用)',
         importance="medium",
         broll_suggestion_template="产品展示",
+        keywords=("这",),
     ),
 ]
 
@@ -191,30 +221,35 @@ PROCESS_DESC_RULES = [
         pattern=r'第\s*[一二三四五六七八九十\d]\s*[步个点]',
         importance="high",
         broll_suggestion_template="步骤演示: {matched}",
+        keywords=("第",),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PROCESS_DESC,
         pattern=r'(?:首先|第一)[，,]?\s*(.{2,30}?)[，,。]',
         importance="high",
         broll_suggestion_template="流程起始: {matched}",
+        keywords=("首先", "第一"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PROCESS_DESC,
         pattern=r'(?:然后|接着|其次|第二)[，,]?\s*(.{2,30}?)[，,。]',
         importance="medium",
         broll_suggestion_template="流程中间: {matched}",
+        keywords=("然后", "接着", "其次", "第二"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PROCESS_DESC,
         pattern=r'(?:最后|最终|第三)[，,]?\s*(.{2,30}?)[，,。]',
         importance="high",
         broll_suggestion_template="流程结束: {matched}",
+        keywords=("最后", "最终", "第三"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.PROCESS_DESC,
         pattern=r'(?:先|再|后).*?(?:先|再|后).*?(?:最后)?',
         importance="medium",
         broll_suggestion_template="流程演示",
+        keywords=("先", "再", "后"),
     ),
 ]
 
@@ -225,18 +260,21 @@ CONCEPT_VISUAL_RULES = [
         pattern=r'(?:就像|好比|类似于|相当于|好像)\s*(.{2,20})',
         importance="high",
         broll_suggestion_template="比喻图示: {matched}",
+        keywords=("就像", "好比", "类似于", "相当于", "好像"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.CONCEPT_VISUAL,
         pattern=r'(?:你可以理解为|简单来说就是|本质上是|理解为|把它?[当看]作?)\s*(.{2,30})',
         importance="medium",
         broll_suggestion_template="概念图解: {matched}",
+        keywords=("理解为", "简单来说就是", "本质上是", "把"),
     ),
     TriggerRule(
         trigger_type=BrollTriggerType.CONCEPT_VISUAL,
         pattern=r'(?:想象一下|假设|如果把.+比作)',
         importance="medium",
         broll_suggestion_template="场景想象图",
+        keywords=("想象一下", "假设", "如果把"),
     ),
 ]
 
@@ -258,6 +296,9 @@ ALL_TRIGGER_RULES: Dict[BrollTriggerType, List[TriggerRule]] = {
 class BrollTriggerDetector:
     """B-Roll 触发检测器"""
     
+    # 拼接整段口播时的片段分隔符（"." 不匹配换行，规则不会跨片段）
+    SEGMENT_SEPARATOR = "\n"
+    
     def __init__(self, custom_rules: Optional[Dict[BrollTriggerType, List[TriggerRule]]] = None):
         """
         初始化检测器
@@ -266,13 +307,58 @@ class BrollTriggerDetector:
             custom_rules: 自定义规则 (可选)
         """
         self.rules = custom_rules or ALL_TRIGGER_RULES
-        # 预编译正则表达式
-        self._compiled_rules: Dict[BrollTriggerType, List[tuple]] = {}
+        # 预编译正则表达式（按类型 → 规则的顺序展平，顺序决定同位置触发点的先后）
+        self._compiled_rules: List[Tuple[BrollTriggerType, re.Pattern, TriggerRule]] = []
         for trigger_type, rules in self.rules.items():
-            self._compiled_rules[trigger_type] = [
-                (re.compile(rule.pattern, re.IGNORECASE), rule)
-                for rule in rules
-            ]
+            for rule in rules:
+                self._compiled_rules.append(
+                    (trigger_type, re.compile(rule.pattern, re.IGNORECASE), rule)
+                )
+        
+        # 关键词自动机：keyword → 规则下标
+        keywords: List[str] = []
+        self._keyword_rules: List[int] = []
+        self._always_run: List[int] = []
+        for rule_idx, (_, _, rule) in enumerate(self._compiled_rules):
+            if not rule.keywords:
+                self._always_run.append(rule_idx)
+                continue
+            for keyword in rule.keywords:
+                keywords.append(keyword)
+                self._keyword_rules.append(rule_idx)
+        self._keyword_matcher = AhoCorasick(keywords)
+    
+    def _candidate_rules(self, text: str) -> List[int]:
+        """一次自动机扫描，返回可能命中的规则下标（升序）"""
+        candidates = set(self._always_run)
+        for keyword_id in self._keyword_matcher.matched_ids(text):
+            candidates.add(self._keyword_rules[keyword_id])
+        return sorted(candidates)
+    
+    def _build_triggers(self, hits: List[Tuple[int, int, int, str]]) -> List[BrollTrigger]:
+        """
+        hits: [(start, rule_idx, end, matched_text)]
+        
+        按 (位置, 规则顺序) 排序后生成触发点并去重，
+        与"逐规则 finditer → 按位置稳定排序"的结果一致。
+        """
+        hits.sort(key=lambda h: (h[0], h[1]))
+        triggers = []
+        for start, rule_idx, end, matched_text in hits:
+            trigger_type, _, rule = self._compiled_rules[rule_idx]
+            # 生成 B-Roll 建议
+            suggestion = rule.broll_suggestion_template.format(matched=matched_text)
+            triggers.append(BrollTrigger(
+                trigger_type=trigger_type,
+                matched_text=matched_text,
+                start_index=start,
+                end_index=end,
+                confidence=1.0,
+                suggested_broll=suggestion,
+                importance=rule.importance,
+            ))
+        # 去重 (重叠的触发点保留重要性高的)
+        return self._deduplicate_triggers(triggers)
     
     def detect(self, text: str) -> List[BrollTrigger]:
         """
@@ -284,36 +370,59 @@ class BrollTriggerDetector:
         Returns:
             触发点列表
         """
-        triggers = []
+        hits: List[Tuple[int, int, int, str]] = []
+        for rule_idx in self._candidate_rules(text):
+            pattern = self._compiled_rules[rule_idx][1]
+            for match in pattern.finditer(text):
+                hits.append((match.start(), rule_idx, match.end(), match.group(0)))
+        return self._build_triggers(hits)
+    
+    def detect_segments(self, texts: List[str]) -> List[List[BrollTrigger]]:
+        """
+        批量检测整段口播（一次扫描）
         
-        for trigger_type, compiled_rules in self._compiled_rules.items():
-            for pattern, rule in compiled_rules:
-                for match in pattern.finditer(text):
-                    matched_text = match.group(0)
-                    
-                    # 生成 B-Roll 建议
-                    suggestion = rule.broll_suggestion_template.format(
-                        matched=matched_text
-                    )
-                    
-                    trigger = BrollTrigger(
-                        trigger_type=trigger_type,
-                        matched_text=matched_text,
-                        start_index=match.start(),
-                        end_index=match.end(),
-                        confidence=1.0,
-                        suggested_broll=suggestion,
-                        importance=rule.importance,
-                    )
-                    triggers.append(trigger)
+        所有片段以换行拼接后，自动机和每条候选正则都只跑一遍，
+        再按片段偏移把命中切回各片段（start/end 为片段内偏移）。
+        跨越片段边界的匹配（如 \\s 吃掉换行）会让该规则在受影响的片段上单独重跑，
+        结果与逐片段调用 detect() 完全一致。
         
-        # 按位置排序
-        triggers.sort(key=lambda t: t.start_index)
+        Returns:
+            与 texts 等长的触发点列表
+        """
+        if not texts:
+            return []
         
-        # 去重 (重叠的触发点保留重要性高的)
-        triggers = self._deduplicate_triggers(triggers)
+        sep = self.SEGMENT_SEPARATOR
+        starts: List[int] = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + len(sep)
+        joined = sep.join(texts)
+        
+        seg_hits: List[List[Tuple[int, int, int, str]]] = [[] for _ in texts]
+        for rule_idx in self._candidate_rules(joined):
+            pattern = self._compiled_rules[rule_idx][1]
+            crossed: set = set()
+            for match in pattern.finditer(joined):
+                m_start, m_end = match.start(), match.end()
+                seg = bisect.bisect_right(starts, m_start) - 1
+                seg_end = starts[seg] + len(texts[seg])
+                if m_end <= seg_end and (m_start < seg_end or m_start == m_end):
+                    seg_hits[seg].append(
+                        (m_start - starts[seg], rule_idx, m_end - starts[seg], match.group(0))
+                    )
+                    continue
+                # 跨片段：记录所有被覆盖的片段
+                last = bisect.bisect_right(starts, max(m_end - 1, m_start)) - 1
+                crossed.update(range(seg, last + 1))
+            
+            for seg in crossed:
+                seg_hits[seg] = [h for h in seg_hits[seg] if h[1] != rule_idx]
+                for match in pattern.finditer(texts[seg]):
+                    seg_hits[seg].append((match.start(), rule_idx, match.end(), match.group(0)))
         
-        return triggers
+        return [self._build_triggers(hits) for hits in seg_hits]
     
     def detect_primary(self, text: str) -> Optional[BrollTrigger]:
         """
@@ -322,7 +431,11 @@ class BrollTriggerDetector:
         Returns:
             最重要的触发点，如果没有则返回 None
         """
-        triggers = self.detect(text)
+        return self.pick_primary(self.detect(text))
+    
+    @staticmethod
+    def pick_primary(triggers: List[BrollTrigger]) -> Optional[BrollTrigger]:
+        """从触发点列表中选出最重要的一个"""
         if not triggers:
             return None
         
@@ -393,10 +506,19 @@ _CACHE_MAX_SIZE = 200
 
 def _get_cache_key(text: str) -> str:
     """生成缓存键"""
-    import hashlib
     return hashlib.md5(text.encode()).hexdigest()[:16]
 
 
+def _cache_put(cache: Dict[str, Any], cache_key: str, value: Any) -> None:
+    # 限制缓存大小
+    if len(cache) >= _CACHE_MAX_SIZE:
+        # 简单清理: 删除一半
+        keys = list(cache.keys())[:_CACHE_MAX_SIZE // 2]
+        for k in keys:
+            del cache[k]
+    cache[cache_key] = value
+
+
 def detect_broll_triggers(text: str) -> List[BrollTrigger]:
     """检测 B-Roll 触发点 (带缓存)"""
     cache_key = _get_cache_key(text)
@@ -405,16 +527,36 @@ def detect_broll_triggers(text: str) -> List[BrollTrigger]:
         return _trigger_cache[cache_key]
     
     result = get_detector().detect(text)
+    _cache_put(_trigger_cache, cache_key, result)
+    return result
+
+
+def detect_broll_triggers_batch(texts: List[str]) -> List[List[BrollTrigger]]:
+    """
+    批量检测整段口播的 B-Roll 触发点 (带缓存)
     
-    # 限制缓存大小
-    if len(_trigger_cache) >= _CACHE_MAX_SIZE:
-        # 简单清理: 删除一半
-        keys = list(_trigger_cache.keys())[:_CACHE_MAX_SIZE // 2]
-        for k in keys:
-            del _trigger_cache[k]
+    未命中缓存的片段拼接后一次扫描，结果按片段返回并逐条写入缓存。
     
-    _trigger_cache[cache_key] = result
-    return result
+    Returns:
+        与 texts 等长，每个元素是对应片段的触发点列表（片段内偏移）
+    """
+    keys = [_get_cache_key(text) for text in texts]
+    results: Dict[str, List[BrollTrigger]] = {}
+    pending: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key in _trigger_cache:
+            results[key] = _trigger_cache[key]
+        else:
+            pending.setdefault(key, text)
+    
+    if pending:
+        pending_keys = list(pending.keys())
+        detected = get_detector().detect_segments([pending[k] for k in pending_keys])
+        for key, triggers in zip(pending_keys, detected):
+            results[key] = triggers
+            _cache_put(_trigger_cache, key, triggers)
+    
+    return [results[key] for key in keys]
 
 
 def detect_primary_trigger(text: str) -> Optional[BrollTrigger]:
@@ -425,17 +567,18 @@ def detect_primary_trigger(text: str) -> Optional[BrollTrigger]:
         return _primary_cache[cache_key]
     
     result = get_detector().detect_primary(text)
-    
-    # 限制缓存大小
-    if len(_primary_cache) >= _CACHE_MAX_SIZE:
-        keys = list(_primary_cache.keys())[:_CACHE_MAX_SIZE // 2]
-        for k in keys:
-            del _primary_cache[k]
-    
-    _primary_cache[cache_key] = result
+    _cache_put(_primary_cache, cache_key, result)
     return result
 
 
+def detect_primary_triggers_batch(texts: List[str]) -> List[Optional[BrollTrigger]]:
+    """批量检测每个片段的主要触发点（整段一次扫描）"""
+    return [
+        BrollTriggerDetector.pick_primary(triggers)
+        for triggers in detect_broll_triggers_batch(texts)
+    ]
+
+
 def has_broll_trigger(text: str) -> bool:
     """检查是否有触发点"""
     return get_detector().has_trigger(text)
@@ -36,7 +36,13 @@ from .models import (
     StructureAnalysisResult,
 )
 from .prompts.structure import STRUCTURE_ANALYSIS_PROMPT
-from .broll_trigger import detect_broll_triggers, detect_primary_trigger, BrollTriggerType
+from .broll_trigger import (
+    BrollTrigger,
+    BrollTriggerType,
+    detect_broll_triggers,
+    detect_primary_trigger,
+    detect_primary_triggers_batch,
+)
 from .layout_modes import LayoutMode, LayoutModeSelector
 
 logger = logging.getLogger(__name__)
@@ -183,13 +189,20 @@ def _parse_llm_response(
     structured_segments = []
     llm_segments = data.get('segments', [])
     
-    for llm_seg in llm_segments:
+    original_texts = [
+        seg_map.get(llm_seg.get('id', ''), {}).get('text', '') for llm_seg in llm_segments
+    ]
+    # 整段口播一次扫描 B-Roll 触发点
+    primary_triggers = detect_primary_triggers_batch(original_texts)
+    
+    for llm_seg, original_text, primary_trigger in zip(llm_segments, original_texts, primary_triggers):
         seg_id = llm_seg.get('id', '')
         original = seg_map.get(seg_id, {})
-        original_text = original.get('text', '')
         
         # 解析结构数据 (传入原文用于 B-Roll 触发检测)
-        structure = _parse_segment_structure(llm_seg, text=original_text)
+        structure = _parse_segment_structure(
+            llm_seg, text=original_text, primary_trigger=primary_trigger
+        )
         
         structured_segments.append(StructuredSegment(
             id=seg_id,
@@ -220,8 +233,16 @@ def _parse_llm_response(
     )
 
 
-def _parse_segment_structure(llm_seg: Dict[str, Any], text: str = "") -> SegmentStructure:
-    """解析单个片段的结构"""
+def _parse_segment_structure(
+    llm_seg: Dict[str, Any],
+    text: str = "",
+    primary_trigger: Optional[BrollTrigger] = None,
+) -> SegmentStructure:
+    """
+    解析单个片段的结构
+    
+    primary_trigger 为批量预检测结果；未提供时按 text 单独检测（命中缓存）
+    """
     # 角色
     role_str = llm_seg.get('role', 'filler')
     try:
@@ -364,7 +385,8 @@ def _parse_segment_structure(llm_seg: Dict[str, Any], text: str = "") -> Segment
     
     # 使用规则引擎检测触发点
     if text:
-        primary_trigger = detect_primary_trigger(text)
+        if primary_trigger is None:
+            primary_trigger = detect_primary_trigger(text)
         if primary_trigger:
             needs_broll = True
             broll_trigger_type = primary_trigger.trigger_type.value
@@ -417,6 +439,8 @@ def _fallback_analysis(segments: List[Dict[str, Any]]) -> StructureAnalysisResul
     has_list = False
     list_items = []
     
+    primary_triggers = detect_primary_triggers_batch([seg.get('text', '') for seg in segments])
+    
     for i, seg in enumerate(segments):
         seg_id = seg.get('id', f'seg_{i}')
         text = seg.get('text', '')
@@ -435,7 +459,7 @@ def _fallback_analysis(segments: List[Dict[str, Any]]) -> StructureAnalysisResul
         broll_suggested_content = None
         broll_importance = "medium"
         
-        primary_trigger = detect_primary_trigger(text)
+        primary_trigger = primary_triggers[i]
         if primary_trigger:
             needs_broll = True
             broll_trigger_type = primary_trigger.trigger_type.value
@@ -0,0 +1,192 @@
+"""
+人物分割模型池
+==============
+进程内常驻的 rembg（U²-Net ONNX）推理 worker：
+  - 每个 worker 线程启动时加载一次 session，之后的请求不再初始化模型
+  - 请求进入队列，每个空闲 worker 一次只取一个（u2net 按单张推理，批量取出只会让
+    其他 worker 空等），并发请求排队等待空闲 worker，而不是各自占用默认线程池
+  - onnxruntime intra-op 线程数可配置，避免多个 worker 争抢全部 CPU
+  - 输入先缩放到最长边不超过 SEGMENTATION_MAX_SIDE（模型内部只用 320px），mask 再放大回原尺寸
+
+调用方：
+  - visual_separation_service.generate_person_mask / generate_person_mask_async
+  - background_replace_workflow.EditDetectionAgent._generate_person_mask
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SEGMENTATION_MODEL = os.getenv("SEGMENTATION_MODEL", "u2net")
+SEGMENTATION_WORKERS = int(os.getenv("SEGMENTATION_WORKERS", "2"))
+SEGMENTATION_INTRA_OP_THREADS = int(os.getenv("SEGMENTATION_INTRA_OP_THREADS", "0"))  # 0 = CPU 核数 / worker 数
+SEGMENTATION_MAX_SIDE = int(os.getenv("SEGMENTATION_MAX_SIDE", "1024"))
+
+
+class SegmentationUnavailable(RuntimeError):
+    """rembg / onnxruntime 未安装"""
+
+
+def bound_resolution(image: Image.Image, max_side: int = SEGMENTATION_MAX_SIDE) -> Image.Image:
+    """最长边超过 max_side 时等比缩小"""
+    width, height = image.size
+    longest = max(width, height)
+    if max_side <= 0 or longest <= max_side:
+        return image
+    scale = max_side / longest
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.BILINEAR)
+
+
+def _intra_op_threads(workers: int) -> int:
+    if SEGMENTATION_INTRA_OP_THREADS > 0:
+        return SEGMENTATION_INTRA_OP_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _new_session(model_name: str, intra_op_threads: int):
+    """创建 rembg session，并限制 onnxruntime 线程数"""
+    try:
+        import onnxruntime as ort
+        import rembg  # noqa: F401
+    except ImportError as e:
+        raise SegmentationUnavailable("rembg 未安装，请运行: pip install rembg[gpu]") from e
+
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = intra_op_threads
+    sess_opts.inter_op_num_threads = 1
+    try:
+        from rembg.sessions import sessions_class
+    except ImportError as e:
+        # 旧版 rembg 无法传入 SessionOptions，线程数会失控，直接报错而不是静默退化
+        raise SegmentationUnavailable("rembg 版本过旧，无法限制推理线程数，请升级: pip install -U rembg") from e
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, sess_opts)
+    raise SegmentationUnavailable(f"rembg 不支持分割模型: {model_name}")
+
+
+def _default_infer(session, image: Image.Image) -> Image.Image:
+    from rembg import remove
+    return remove(image, session=session, only_mask=True)
+
+
+class SegmentationPool:
+    """常驻分割 worker 池（线程 + 队列，与调用方事件循环无关）"""
+
+    def __init__(
+        self,
+        workers: int = SEGMENTATION_WORKERS,
+        model_name: str = SEGMENTATION_MODEL,
+        max_side: int = SEGMENTATION_MAX_SIDE,
+        session_factory=None,
+        infer=None,
+    ):
+        self.workers = max(1, workers)
+        self.model_name = model_name
+        self.max_side = max_side
+        self._session_factory = session_factory or (
+            lambda: _new_session(model_name, _intra_op_threads(self.workers))
+        )
+        self._infer = infer or _default_infer
+        self._queue: "queue.Queue[Tuple[Image.Image, Future]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._ready: List[Future] = []
+        self._lock = threading.Lock()
+
+    # ==========================================
+    # 生命周期
+    # ==========================================
+
+    def start(self) -> List[Future]:
+        """启动 worker 并加载 session（幂等），返回各 worker 的就绪 Future"""
+        with self._lock:
+            if not self._threads:
+                for index in range(self.workers):
+                    ready: Future = Future()
+                    thread = threading.Thread(
+                        target=self._worker, args=(ready,), name=f"segmentation-{index}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+                    self._ready.append(ready)
+                logger.info(f"[Segmentation] 启动 {self.workers} 个分割 worker, model={self.model_name}")
+        return self._ready
+
+    def warmup(self, timeout: Optional[float] = None):
+        """阻塞等待所有 worker 加载完 session（加载失败时抛出）"""
+        for ready in self.start():
+            ready.result(timeout)
+
+    # ==========================================
+    # 请求
+    # ==========================================
+
+    def submit(self, image: Image.Image) -> Future:
+        """提交分割请求，返回 concurrent Future（结果为与原图同尺寸的 L 模式 mask）"""
+        self.start()
+        future: Future = Future()
+        self._queue.put((image, future))
+        return future
+
+    async def predict_mask(self, image: Image.Image) -> Image.Image:
+        """异步获取人物 mask（白=前景）"""
+        return await asyncio.wrap_future(self.submit(image))
+
+    def predict_mask_sync(self, image: Image.Image, timeout: Optional[float] = None) -> Image.Image:
+        """同步获取人物 mask（线程 / Celery 等非事件循环环境）"""
+        return self.submit(image).result(timeout)
+
+    # ==========================================
+    # worker
+    # ==========================================
+
+    def _worker(self, ready: Future):
+        try:
+            session = self._session_factory()
+        except Exception as e:
+            logger.error(f"[Segmentation] 加载分割模型失败: {e}")
+            ready.set_exception(e)
+            # 模型不可用：后续请求直接失败，调用方按原有逻辑降级
+            while True:
+                _, future = self._queue.get()
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+        ready.set_result(True)
+
+        while True:
+            image, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._predict(session, image))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _predict(self, session, image: Image.Image) -> Image.Image:
+        original_size = image.size
+        mask = self._infer(session, bound_resolution(image.convert("RGB"), self.max_side))
+        if not isinstance(mask, Image.Image):
+            mask = Image.fromarray(mask)
+        mask = mask.convert("L")
+        if mask.size != original_size:
+            mask = mask.resize(original_size, Image.Resampling.BILINEAR)
+        return mask
+
+
+# 单例
+_segmentation_pool: Optional[SegmentationPool] = None
+
+
+def get_segmentation_pool() -> SegmentationPool:
+    global _segmentation_pool
+    if _segmentation_pool is None:
+        _segmentation_pool = SegmentationPool()
+    return _segmentation_pool
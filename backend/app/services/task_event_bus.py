@@ -0,0 +1,305 @@
+"""
+任务事件总线 (SSE)
+
+每个会话一条 Redis Stream（sse:events:{session_id}），发布方与 SSE 连接可在不同进程：
+- API 进程（AICapabilityService、可灵回调）异步发布
+- Celery worker（ai_task_base、celery_config 的进度写入）同步发布
+- SSE 连接用 XREAD BLOCK 读取；断线重连时带 Last-Event-ID，从该 id 之后补发
+
+Redis 不可用（未安装 / 连接失败）时降级为进程内环形缓冲，行为等同原先的内存队列，
+同样支持 Last-Event-ID 补发，但只在同一进程内可见。没有 SSE 读取方的进程（Celery worker）
+不做降级：事件写进自己的内存谁也读不到，直接丢弃并告警，任务状态以 tasks 表为准，
+前端的状态轮询会补上。
+
+订阅标识: session_id / project_id（前端以 projectId 订阅），两者都没有的任务以 task id 作为订阅标识。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STREAM_KEY_PREFIX = "sse:events:"
+STREAM_MAXLEN = 500          # 每个会话保留的最近事件数（补发窗口）
+STREAM_TTL_SECONDS = 3600    # 会话无新事件 1 小时后过期
+REDIS_RETRY_AFTER_SECONDS = 30  # 连接失败后暂停使用 Redis 的时间
+
+_EVENT_ID_RE = re.compile(r"^\d+-\d+$")
+
+# (event_id, event_type, data)
+BusEvent = Tuple[str, str, Dict[str, Any]]
+
+
+def _parse_event_id(event_id: str) -> Tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def is_valid_event_id(event_id: Optional[str]) -> bool:
+    """Stream 事件 id 格式: <毫秒>-<序号>"""
+    return bool(event_id) and bool(_EVENT_ID_RE.match(event_id))
+
+
+class _MemoryBackend:
+    """进程内降级实现：每会话一个环形缓冲 + Condition"""
+
+    def __init__(self, maxlen: int = STREAM_MAXLEN):
+        self._events: Dict[str, Deque[BusEvent]] = defaultdict(lambda: deque(maxlen=maxlen))
+        self._conditions: Dict[str, asyncio.Condition] = {}
+        self._last_ms = 0
+        self._seq = 0
+
+    def _next_id(self) -> str:
+        ms = int(time.time() * 1000)
+        if ms <= self._last_ms:
+            self._seq += 1
+        else:
+            self._last_ms, self._seq = ms, 0
+        return f"{self._last_ms}-{self._seq}"
+
+    def _condition(self, session_id: str) -> asyncio.Condition:
+        if session_id not in self._conditions:
+            self._conditions[session_id] = asyncio.Condition()
+        return self._conditions[session_id]
+
+    def append(self, session_id: str, event_type: str, data: Dict[str, Any]) -> str:
+        event_id = self._next_id()
+        self._events[session_id].append((event_id, event_type, data))
+        return event_id
+
+    async def notify(self, session_id: str):
+        condition = self._conditions.get(session_id)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
+
+    def last_id(self, session_id: str) -> str:
+        events = self._events.get(session_id)
+        return events[-1][0] if events else "0-0"
+
+    def after(self, session_id: str, last_id: str) -> List[BusEvent]:
+        cursor = _parse_event_id(last_id)
+        return [e for e in self._events.get(session_id, ()) if _parse_event_id(e[0]) > cursor]
+
+    async def read(self, session_id: str, last_id: str, timeout: float) -> List[BusEvent]:
+        events = self.after(session_id, last_id)
+        if events:
+            return events
+        condition = self._condition(session_id)
+        try:
+            async with condition:
+                await asyncio.wait_for(condition.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        return self.after(session_id, last_id)
+
+
+class TaskEventBus:
+    """跨进程任务事件总线"""
+
+    def __init__(self, redis_url: Optional[str] = REDIS_URL):
+        self.redis_url = redis_url
+        self._memory = _MemoryBackend()
+        self._sync_redis = None
+        self._async_redis = None
+        self._redis_down_until = 0.0
+        # 本进程是否有 SSE 读取方（只有这样进程内降级才有意义）
+        self._has_local_readers = False
+        self._drop_warned = False
+
+    # ==========================================
+    # Redis 连接
+    # ==========================================
+
+    def _redis_available(self) -> bool:
+        return bool(self.redis_url) and time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception):
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        self._drop_warned = False
+        logger.warning(f"[EventBus] Redis 不可用，{REDIS_RETRY_AFTER_SECONDS}s 内使用进程内事件: {error}")
+
+    def _drop(self, session_id: str, event_type: str) -> None:
+        """无法送达的事件：每个 Redis 不可用窗口告警一次，其余记 debug"""
+        message = f"[EventBus] Redis 不可用且本进程无 SSE 连接，事件未送达: {session_id} {event_type}"
+        if self._drop_warned:
+            logger.debug(message)
+        else:
+            self._drop_warned = True
+            logger.warning(message + "（前端将通过任务状态轮询获取）")
+
+    def _get_sync_redis(self):
+        if self._sync_redis is None:
+            import redis
+            self._sync_redis = redis.Redis.from_url(self.redis_url, decode_responses=True)
+        return self._sync_redis
+
+    def _get_async_redis(self):
+        if self._async_redis is None:
+            import redis.asyncio as aioredis
+            self._async_redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._async_redis
+
+    @staticmethod
+    def _stream_key(session_id: str) -> str:
+        return f"{STREAM_KEY_PREFIX}{session_id}"
+
+    @staticmethod
+    def _encode(event_type: str, data: Dict[str, Any]) -> Dict[str, str]:
+        return {"event": event_type, "data": json.dumps(data, ensure_ascii=False, default=str)}
+
+    @staticmethod
+    def _decode(entries) -> List[BusEvent]:
+        return [(event_id, fields.get("event", "message"), json.loads(fields.get("data") or "{}"))
+                for event_id, fields in entries]
+
+    # ==========================================
+    # 发布
+    # ==========================================
+
+    async def publish(self, session_id: str, event_type: str, data: Dict[str, Any]) -> Optional[str]:
+        """发布事件（异步，API 进程内使用），返回事件 id"""
+        if not session_id:
+            return None
+        if self._redis_available():
+            try:
+                client = self._get_async_redis()
+                key = self._stream_key(session_id)
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.xadd(key, self._encode(event_type, data), maxlen=STREAM_MAXLEN, approximate=True)
+                    pipe.expire(key, STREAM_TTL_SECONDS)
+                    event_id, _ = await pipe.execute()
+                return event_id
+            except Exception as e:
+                self._mark_redis_down(e)
+        if not self._has_local_readers:
+            self._drop(session_id, event_type)
+            return None
+        event_id = self._memory.append(session_id, event_type, data)
+        await self._memory.notify(session_id)
+        return event_id
+
+    def publish_sync(self, session_id: str, event_type: str, data: Dict[str, Any]) -> Optional[str]:
+        """发布事件（同步，Celery worker 等非事件循环环境使用），返回事件 id"""
+        if not session_id:
+            return None
+        if self._redis_available():
+            try:
+                client = self._get_sync_redis()
+                key = self._stream_key(session_id)
+                pipe = client.pipeline(transaction=False)
+                pipe.xadd(key, self._encode(event_type, data), maxlen=STREAM_MAXLEN, approximate=True)
+                pipe.expire(key, STREAM_TTL_SECONDS)
+                event_id, _ = pipe.execute()
+                return event_id
+            except Exception as e:
+                self._mark_redis_down(e)
+        if not self._has_local_readers:
+            # Celery worker 等进程：写入本进程内存没有任何读取方能看到
+            self._drop(session_id, event_type)
+            return None
+        # 进程内降级（API 进程内的同步调用）：无法唤醒等待者，同进程的读取方会在下次超时轮询时拿到
+        return self._memory.append(session_id, event_type, data)
+
+    # ==========================================
+    # 订阅
+    # ==========================================
+
+    async def latest_id(self, session_id: str) -> str:
+        """当前最新事件 id（新连接从这里开始读，只接收之后的事件）"""
+        self._has_local_readers = True
+        if self._redis_available():
+            try:
+                entries = await self._get_async_redis().xrevrange(self._stream_key(session_id), count=1)
+                return entries[0][0] if entries else "0-0"
+            except Exception as e:
+                self._mark_redis_down(e)
+        return self._memory.last_id(session_id)
+
+    async def read(self, session_id: str, last_id: str, timeout: float = 30.0) -> List[BusEvent]:
+        """
+        读取 last_id 之后的事件，没有新事件时最多阻塞 timeout 秒
+
+        Returns:
+            [(event_id, event_type, data)]，超时返回空列表
+        """
+        self._has_local_readers = True
+        if self._redis_available():
+            try:
+                result = await self._get_async_redis().xread(
+                    {self._stream_key(session_id): last_id},
+                    block=int(timeout * 1000),
+                    count=100,
+                )
+                return self._decode(result[0][1]) if result else []
+            except Exception as e:
+                self._mark_redis_down(e)
+        return await self._memory.read(session_id, last_id, timeout)
+
+
+# ==========================================
+# 任务行 → 事件
+# ==========================================
+
+def task_subscriber_id(task: Dict[str, Any]) -> Optional[str]:
+    """任务事件的订阅标识：优先 session_id，其次 project_id，都没有时用 task id"""
+    return task.get("session_id") or task.get("project_id") or task.get("id")
+
+
+def build_task_row_event(row: Dict[str, Any], event_type: Optional[str] = None) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """
+    由 tasks 表的一行构造 SSE 事件（字段与 TaskEvent.to_dict 一致）
+
+    Returns:
+        (订阅标识, event_type, data)，行中既无 project_id 也无 id 时返回 None
+    """
+    session_id = task_subscriber_id(row)
+    if not session_id:
+        return None
+    status = row.get("status") or "processing"
+    if event_type is None:
+        event_type = status if status in ("completed", "failed") else "progress"
+    error = row.get("error_message") or row.get("error")
+    data = {
+        "task_id": row.get("id"),
+        "session_id": session_id,
+        "event_type": event_type,
+        "status": status,
+        "progress": row.get("progress") or 0,
+        "message": row.get("status_message") or row.get("current_step") or (error if status == "failed" else None),
+        "result_url": row.get("output_url"),
+        "output_asset_id": row.get("output_asset_id"),
+        "error": error if status == "failed" else None,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    return session_id, event_type, {k: v for k, v in data.items() if v is not None}
+
+
+def publish_task_rows_sync(rows: Optional[List[Dict[str, Any]]], event_type: Optional[str] = None):
+    """把 update(...).execute() 返回的任务行同步发布到事件总线（失败不影响主流程）"""
+    for row in rows or []:
+        try:
+            built = build_task_row_event(row, event_type)
+            if built:
+                get_task_event_bus().publish_sync(*built)
+        except Exception as e:
+            logger.warning(f"[EventBus] 任务事件发布失败（不影响主流程）: {e}")
+
+
+# 单例
+_task_event_bus: Optional[TaskEventBus] = None
+
+
+def get_task_event_bus() -> TaskEventBus:
+    global _task_event_bus
+    if _task_event_bus is None:
+        _task_event_bus = TaskEventBus()
+    return _task_event_bus
@@ -8,8 +8,8 @@ import logging
 import os
 from typing import Any, Dict, List, Optional, Tuple
 
-from app.services.supabase_client import get_supabase
 from app.services.llm.service import LLMService
+from app.services.template_catalog import get_template_catalog
 from app.services.template_render_service import TemplateRenderService
 
 logger = logging.getLogger(__name__)
@@ -28,13 +28,16 @@ class TemplateCandidateService:
         limit: int,
         pack_id: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        templates = self._load_templates(category, template_kind, scope, pack_id)
-        if not templates:
+        catalog = get_template_catalog()
+        ranked = catalog.lookup(category, template_kind, scope, pack_id, prompt or "")
+        if not ranked:
             return []
 
-        scored = self._score_templates(templates, prompt or "")
-        scored.sort(key=lambda item: item[1], reverse=True)
-        top = scored[: max(limit * 3, limit)]
+        # 只为 top-N 补全完整记录（workflow / metadata），其余候选不出内存
+        top_ranked = ranked[: max(limit * 3, limit)]
+        records = catalog.get_records([template_id for template_id, _ in top_ranked])
+        score_by_id = dict(top_ranked)
+        top = [(record, score_by_id.get(record.get("template_id"), 0.0)) for record in records]
 
         ranked_templates = await self._rank_with_llm(top, prompt, limit)
         return ranked_templates
@@ -73,66 +76,6 @@ class TemplateCandidateService:
             })
         return specs
 
-    def _load_templates(
-        self,
-        category: Optional[str],
-        template_kind: Optional[str],
-        scope: Optional[str],
-        pack_id: Optional[str] = None,
-    ) -> List[Dict[str, Any]]:
-        supabase = get_supabase()
-        query = supabase.table("template_records").select(
-            "template_id,name,category,type,tags,workflow,metadata,url,thumbnail_url,storage_path,bucket,publish_config,preview_video_url,quality_label,created_at"
-        )
-        # 只查询已发布的模板
-        query = query.eq("status", "published")
-        if category:
-            query = query.eq("category", category)
-        if template_kind:
-            query = query.eq("type", template_kind)
-        result = query.order("created_at", desc=True).execute()
-        templates = result.data or []
-
-        if scope or pack_id:
-            filtered = []
-            for item in templates:
-                metadata_raw = item.get("metadata") or {}
-                metadata = metadata_raw if isinstance(metadata_raw, dict) else {}
-                scopes = metadata.get("scopes") or []
-                if scope and scopes and scope not in scopes:
-                    continue
-                if pack_id:
-                    template_pack_id = ((metadata.get("transition_pack") or {}).get("pack_id"))
-                    if template_pack_id != pack_id:
-                        continue
-                filtered.append(item)
-            return filtered
-        return templates
-
-    def _score_templates(self, templates: List[Dict[str, Any]], prompt: str) -> List[Tuple[Dict[str, Any], float]]:
-        prompt_lower = prompt.lower()
-        scored: List[Tuple[Dict[str, Any], float]] = []
-        for template in templates:
-            score = 0.0
-            tags = template.get("tags") or []
-            for tag in tags:
-                if not tag:
-                    continue
-                tag_lower = str(tag).lower()
-                if tag_lower in prompt_lower:
-                    score += 2.0
-                elif prompt and tag in prompt:
-                    score += 2.0
-            name = template.get("name") or ""
-            if name and name.lower() in prompt_lower:
-                score += 1.0
-            workflow = template.get("workflow") or {}
-            pacing = workflow.get("pacing")
-            if pacing and str(pacing).lower() in prompt_lower:
-                score += 0.5
-            scored.append((template, score))
-        return scored
-
     async def _rank_with_llm(
         self,
         scored: List[Tuple[Dict[str, Any], float]],
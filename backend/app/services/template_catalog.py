@@ -0,0 +1,340 @@
+"""
+Template Catalog
+进程内模板目录：只加载精简投影，按 category/type/scope/pack/tag 建倒排索引
+
+- 首次访问全量加载精简字段（不含 workflow / metadata 大 JSON）
+- 之后按 updated_at 水位线增量轮询，只拉变更行
+- 候选查找完全在内存中完成，不访问数据库
+- 完整记录（render spec 需要 workflow/metadata）只对 top-N 候选按需补全，
+  并按 updated_at 做校验缓存
+
+跨进程的硬删除无法通过 updated_at 感知，依靠 remove() 本地剔除
++ 定期全量重载兜底。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services.supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# 精简投影：JSON 字段只取索引需要的路径
+LEAN_FIELDS = (
+    "template_id,name,category,type,tags,status,created_at,updated_at,"
+    "pacing:workflow->>pacing,"
+    "scopes:metadata->scopes,"
+    "pack_id:metadata->transition_pack->>pack_id"
+)
+
+# 补全字段：与 TemplateCandidateService 原查询一致
+FULL_FIELDS = (
+    "template_id,name,category,type,tags,workflow,metadata,url,thumbnail_url,"
+    "storage_path,bucket,publish_config,preview_video_url,quality_label,created_at,updated_at"
+)
+
+REFRESH_INTERVAL_SECONDS = float(os.getenv("TEMPLATE_CATALOG_REFRESH_SECONDS", "30"))
+FULL_RELOAD_INTERVAL_SECONDS = float(os.getenv("TEMPLATE_CATALOG_FULL_RELOAD_SECONDS", "900"))
+RECORD_CACHE_SIZE = 512
+
+
+@dataclass
+class CatalogEntry:
+    """模板在目录中的精简表示"""
+    template_id: str
+    name_lower: str
+    category: Optional[str]
+    type: Optional[str]
+    tags_lower: Tuple[str, ...]
+    pacing_lower: Optional[str]
+    scopes: Tuple[str, ...]
+    pack_id: Optional[str]
+    created_at: str
+    updated_at: str
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "CatalogEntry":
+        scopes_raw = row.get("scopes") or []
+        scopes = tuple(str(s) for s in scopes_raw) if isinstance(scopes_raw, list) else ()
+        tags = tuple(
+            dict.fromkeys(str(tag).lower() for tag in (row.get("tags") or []) if tag)
+        )
+        pacing = row.get("pacing")
+        return cls(
+            template_id=row["template_id"],
+            name_lower=(row.get("name") or "").lower(),
+            category=row.get("category"),
+            type=row.get("type"),
+            tags_lower=tags,
+            pacing_lower=str(pacing).lower() if pacing else None,
+            scopes=scopes,
+            pack_id=row.get("pack_id"),
+            created_at=row.get("created_at") or "",
+            updated_at=row.get("updated_at") or "",
+        )
+
+
+@dataclass
+class _Indexes:
+    by_category: Dict[str, Set[str]] = field(default_factory=dict)
+    by_type: Dict[str, Set[str]] = field(default_factory=dict)
+    by_scope: Dict[str, Set[str]] = field(default_factory=dict)
+    unscoped: Set[str] = field(default_factory=set)
+    by_pack: Dict[str, Set[str]] = field(default_factory=dict)
+    by_tag: Dict[str, Set[str]] = field(default_factory=dict)
+    by_name: Dict[str, Set[str]] = field(default_factory=dict)
+    by_pacing: Dict[str, Set[str]] = field(default_factory=dict)
+    # 索引中出现过的字符串长度，用于只枚举 prompt 中这些长度的子串
+    tag_lengths: Set[int] = field(default_factory=set)
+    name_lengths: Set[int] = field(default_factory=set)
+
+
+class TemplateCatalog:
+    """已发布模板的进程内目录 + 倒排索引"""
+
+    def __init__(
+        self,
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+        full_reload_interval: float = FULL_RELOAD_INTERVAL_SECONDS,
+    ) -> None:
+        self._refresh_interval = refresh_interval
+        self._full_reload_interval = full_reload_interval
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._indexes = _Indexes()
+        # created_at 倒序的 template_id，作为同分时的稳定次序
+        self._order: Dict[str, int] = {}
+        self._watermark: str = ""
+        self._loaded = False
+        self._stale = False
+        self._last_refresh = 0.0
+        self._last_full_reload = 0.0
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # 同步
+    # ------------------------------------------------------------------
+
+    def ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded and not self._stale and now - self._last_refresh < self._refresh_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not self._loaded or now - self._last_full_reload >= self._full_reload_interval:
+                self._full_reload()
+            elif self._stale or now - self._last_refresh >= self._refresh_interval:
+                self._incremental_refresh()
+
+    def invalidate(self) -> None:
+        """标记过期，下次查询前立刻增量刷新（本进程写入模板后调用）"""
+        self._stale = True
+
+    def remove(self, template_ids: Iterable[str]) -> None:
+        """从目录中剔除模板（硬删除时调用）"""
+        with self._lock:
+            for template_id in template_ids:
+                self._entries.pop(template_id, None)
+                self._records.pop(template_id, None)
+            self._rebuild_indexes()
+
+    def _full_reload(self) -> None:
+        rows = (
+            get_supabase()
+            .table("template_records")
+            .select(LEAN_FIELDS)
+            .eq("status", "published")
+            .execute()
+        ).data or []
+        self._entries = {row["template_id"]: CatalogEntry.from_row(row) for row in rows}
+        self._watermark = max((e.updated_at for e in self._entries.values()), default="")
+        self._records = OrderedDict(
+            (tid, rec) for tid, rec in self._records.items()
+            if tid in self._entries and rec.get("updated_at") == self._entries[tid].updated_at
+        )
+        self._rebuild_indexes()
+        now = time.monotonic()
+        self._loaded = True
+        self._stale = False
+        self._last_refresh = now
+        self._last_full_reload = now
+        logger.info("[TemplateCatalog] 全量加载 %d 个已发布模板", len(self._entries))
+
+    def _incremental_refresh(self) -> None:
+        query = get_supabase().table("template_records").select(LEAN_FIELDS)
+        if self._watermark:
+            query = query.gt("updated_at", self._watermark)
+        rows = query.execute().data or []
+        self._stale = False
+        self._last_refresh = time.monotonic()
+        if not rows:
+            return
+        for row in rows:
+            template_id = row["template_id"]
+            self._records.pop(template_id, None)
+            if row.get("status") == "published":
+                self._entries[template_id] = CatalogEntry.from_row(row)
+            else:
+                # 下架 / 归档
+                self._entries.pop(template_id, None)
+            if (row.get("updated_at") or "") > self._watermark:
+                self._watermark = row["updated_at"]
+        self._rebuild_indexes()
+        logger.info("[TemplateCatalog] 增量刷新 %d 行，当前 %d 个模板", len(rows), len(self._entries))
+
+    def _rebuild_indexes(self) -> None:
+        indexes = _Indexes()
+        for entry in self._entries.values():
+            tid = entry.template_id
+            if entry.category:
+                indexes.by_category.setdefault(entry.category, set()).add(tid)
+            if entry.type:
+                indexes.by_type.setdefault(entry.type, set()).add(tid)
+            if entry.scopes:
+                for scope in entry.scopes:
+                    indexes.by_scope.setdefault(scope, set()).add(tid)
+            else:
+                indexes.unscoped.add(tid)
+            if entry.pack_id:
+                indexes.by_pack.setdefault(entry.pack_id, set()).add(tid)
+            for tag in entry.tags_lower:
+                indexes.by_tag.setdefault(tag, set()).add(tid)
+                indexes.tag_lengths.add(len(tag))
+            if entry.name_lower:
+                indexes.by_name.setdefault(entry.name_lower, set()).add(tid)
+                indexes.name_lengths.add(len(entry.name_lower))
+            if entry.pacing_lower:
+                indexes.by_pacing.setdefault(entry.pacing_lower, set()).add(tid)
+
+        ordered = sorted(self._entries.values(), key=lambda e: e.created_at, reverse=True)
+        self._order = {entry.template_id: i for i, entry in enumerate(ordered)}
+        self._indexes = indexes
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def lookup(
+        self,
+        category: Optional[str],
+        template_kind: Optional[str],
+        scope: Optional[str],
+        pack_id: Optional[str],
+        prompt: str,
+    ) -> List[Tuple[str, float]]:
+        """
+        过滤 + 打分，全部在内存中完成
+
+        Returns:
+            [(template_id, score)]，按分数降序、created_at 降序
+        """
+        self.ensure_fresh()
+        indexes = self._indexes
+        order = self._order
+
+        candidates: Optional[Set[str]] = None
+        filters: List[Set[str]] = []
+        if category:
+            filters.append(indexes.by_category.get(category, set()))
+        if template_kind:
+            filters.append(indexes.by_type.get(template_kind, set()))
+        if scope:
+            # 未声明 scopes 的模板视为适用于所有 scope
+            filters.append(indexes.by_scope.get(scope, set()) | indexes.unscoped)
+        if pack_id:
+            filters.append(indexes.by_pack.get(pack_id, set()))
+        if filters:
+            filters.sort(key=len)
+            candidates = set(filters[0]).intersection(*filters[1:])
+        else:
+            candidates = set(order)
+
+        scores = self._score(candidates, (prompt or "").lower(), indexes)
+        return sorted(
+            ((tid, scores.get(tid, 0.0)) for tid in candidates),
+            key=lambda item: (-item[1], order.get(item[0], 0)),
+        )
+
+    @staticmethod
+    def _windows(text: str, lengths: Iterable[int]) -> Set[str]:
+        """枚举 text 中指定长度的所有子串，O(len(text) * len(lengths))"""
+        n = len(text)
+        return {text[i:i + size] for size in lengths if size <= n for i in range(n - size + 1)}
+
+    def _score(self, candidates: Set[str], prompt_lower: str, indexes: _Indexes) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        if not prompt_lower or not candidates:
+            return scores
+
+        for text in self._windows(prompt_lower, indexes.tag_lengths):
+            for tid in indexes.by_tag.get(text, ()):
+                if tid in candidates:
+                    scores[tid] = scores.get(tid, 0.0) + 2.0
+        for text in self._windows(prompt_lower, indexes.name_lengths):
+            for tid in indexes.by_name.get(text, ()):
+                if tid in candidates:
+                    scores[tid] = scores.get(tid, 0.0) + 1.0
+
+        # pacing 取值只有少数几种，直接扫描
+        for pacing, tids in indexes.by_pacing.items():
+            if pacing in prompt_lower:
+                for tid in tids & candidates:
+                    scores[tid] = scores.get(tid, 0.0) + 0.5
+        return scores
+
+    def get_records(self, template_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        按顺序返回完整模板记录
+
+        命中缓存且 updated_at 未变化的直接返回，其余一次 in_ 查询补全。
+        """
+        missing: List[str] = []
+        with self._lock:
+            for template_id in template_ids:
+                record = self._records.get(template_id)
+                entry = self._entries.get(template_id)
+                if record is None or entry is None or record.get("updated_at") != entry.updated_at:
+                    missing.append(template_id)
+
+        if missing:
+            rows = (
+                get_supabase()
+                .table("template_records")
+                .select(FULL_FIELDS)
+                .in_("template_id", missing)
+                .execute()
+            ).data or []
+            with self._lock:
+                for row in rows:
+                    self._records[row["template_id"]] = row
+                    self._records.move_to_end(row["template_id"])
+                while len(self._records) > RECORD_CACHE_SIZE:
+                    self._records.popitem(last=False)
+
+        with self._lock:
+            return [self._records[tid] for tid in template_ids if tid in self._records]
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self._entries),
+            "tags": len(self._indexes.by_tag),
+            "cached_records": len(self._records),
+            "watermark": self._watermark,
+        }
+
+
+_template_catalog: Optional[TemplateCatalog] = None
+
+
+def get_template_catalog() -> TemplateCatalog:
+    global _template_catalog
+    if _template_catalog is None:
+        _template_catalog = TemplateCatalog()
+    return _template_catalog
@@ -11,11 +11,12 @@ import os
 import re
 import tempfile
 import uuid
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple, Union
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import httpx
+import numpy as np
 from PIL import Image
 
 from app.services.supabase_client import get_supabase
@@ -26,6 +27,151 @@ TEMPLATE_BUCKET = "templates"
 TEMPLATE_PREFIX = "visual-backgrounds/"
 DEFAULT_THUMB_MAX = 512
 
+# 任务心跳 / 接管：心跳超过 INGEST_STALE_AFTER_SEC 未更新视为 worker 已崩溃
+INGEST_HEARTBEAT_SEC = 60
+INGEST_STALE_AFTER_SEC = int(os.getenv("TEMPLATE_INGEST_STALE_AFTER_SEC", "300"))
+TERMINAL_INGEST_STATUSES = ("succeeded", "failed", "cancelled")
+
+# 各阶段并发上限（单个任务内）
+INGEST_FRAME_CONCURRENCY = int(os.getenv("TEMPLATE_INGEST_FRAME_CONCURRENCY", "4"))
+INGEST_ANALYSIS_CONCURRENCY = int(os.getenv("TEMPLATE_INGEST_ANALYSIS_CONCURRENCY", "3"))
+INGEST_PUBLISH_CONCURRENCY = int(os.getenv("TEMPLATE_INGEST_PUBLISH_CONCURRENCY", "2"))
+
+
+def _is_stale(row: Dict[str, Any]) -> bool:
+    """任务行心跳是否已过期"""
+    value = row.get("updated_at")
+    if not value:
+        return True
+    try:
+        updated_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return True
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - updated_at).total_seconds() > INGEST_STALE_AFTER_SEC
+
+
+# 转场检测信号：一次低分辨率灰度解码（原生帧率，不重采样），逐帧差分在 NumPy 中计算。
+# 重采样会插入重复帧（mafd≈0），下一真实帧的 |Δmafd| 随之变大，平移镜头被误判为硬切
+SCENE_SIGNAL_SIZE = (128, 72)
+SCENE_SIGNAL_CHUNK_FRAMES = 256
+SCENE_EVENT_THRESHOLD = 0.02
+
+
+class _SceneSignal:
+    """
+    按块喂入 rawvideo 灰度帧，增量计算场景变化分数。
+
+    分数与 ffmpeg select 的 scene 一致：mafd 为相邻帧平均绝对差，
+    score = clip(min(mafd, |mafd - prev_mafd|) / 100, 0, 1)，第 i 个分数对应第 i+1 帧。
+    内存只保留未凑满一帧的字节和上一帧。pts 为解码端给出的每帧展示时间（秒）。
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.frame_bytes = width * height
+        self.shape = (height, width)
+        self.frame_count = 0
+        self._pending = bytearray()
+        self._last_frame: Optional[np.ndarray] = None
+        self._mafd: List[np.ndarray] = []
+        self.pts: List[float] = []
+
+    def feed(self, data: bytes) -> None:
+        self._pending.extend(data)
+        usable = len(self._pending) // self.frame_bytes * self.frame_bytes
+        if not usable:
+            return
+        frames = np.frombuffer(bytes(self._pending[:usable]), dtype=np.uint8).reshape(-1, *self.shape)
+        del self._pending[:usable]
+        self.frame_count += len(frames)
+
+        frames = frames.astype(np.int16)
+        if self._last_frame is not None:
+            frames = np.concatenate((self._last_frame[None], frames))
+        if len(frames) > 1:
+            self._mafd.append(np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2)))
+        self._last_frame = frames[-1]
+
+    def frame_times(self, duration_sec: Optional[float] = None) -> np.ndarray:
+        """每帧时间戳：优先用解码得到的 pts；数量对不上时按 duration_sec 均匀分布"""
+        if len(self.pts) == self.frame_count:
+            return np.asarray(self.pts, dtype=np.float64)
+        if not duration_sec or not self.frame_count:
+            raise ValueError("缺少帧时间戳，且未提供视频时长")
+        return np.arange(self.frame_count, dtype=np.float64) * (duration_sec / self.frame_count)
+
+    def duration(self) -> Optional[float]:
+        """末帧 pts + 帧间隔中位数；没有完整 pts 时返回 None"""
+        if self.frame_count < 2 or len(self.pts) != self.frame_count:
+            return None
+        times = np.asarray(self.pts, dtype=np.float64)
+        return float(times[-1] + np.median(np.diff(times)))
+
+    def scores(self) -> np.ndarray:
+        if not self._mafd:
+            return np.zeros(0, dtype=np.float64)
+        mafd = np.concatenate(self._mafd)
+        diff = np.abs(np.diff(mafd, prepend=0.0))
+        return np.clip(np.minimum(mafd, diff) / 100.0, 0.0, 1.0)
+
+
+def _scene_events_from_scores(
+    scores: np.ndarray,
+    frame_times: np.ndarray,
+    total_duration_sec: float,
+    threshold: float = SCENE_EVENT_THRESHOLD,
+) -> List[Tuple[float, float]]:
+    """超过阈值的帧 → [(ts, score)]，与 _extract_scene_events 输出格式一致（分数 i 对应帧 i+1）"""
+    indices = np.flatnonzero(scores > threshold)
+    timestamps = np.round(frame_times[indices + 1], 3)
+    keep = (timestamps > 0) & (timestamps <= total_duration_sec)
+    return list(zip(timestamps[keep].tolist(), scores[indices[keep]].tolist()))
+
+
+def _split_event_clusters(
+    timestamps: np.ndarray,
+    scores: np.ndarray,
+    gap_sec: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按时间排序后，相邻事件间隔 > gap_sec 处切分簇（O(n log n)）。
+
+    返回排序后的 (timestamps, scores, 簇起始下标, 簇结束下标(不含), 每簇首个最高分下标)。
+    """
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    scores = scores[order]
+    breaks = np.flatnonzero(np.diff(timestamps) > gap_sec) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(timestamps)]))
+    peak_scores = np.maximum.reduceat(scores, starts)
+    positions = np.arange(len(timestamps))
+    is_peak = scores == np.repeat(peak_scores, ends - starts)
+    peak_idx = np.minimum.reduceat(np.where(is_peak, positions, len(timestamps)), starts)
+    return timestamps, scores, starts, ends, peak_idx
+
+
+def _events_to_arrays(scene_events: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    events = np.asarray(scene_events, dtype=np.float64).reshape(-1, 2)
+    return events[:, 0], events[:, 1]
+
+
+_SHOWINFO_PTS_RE = re.compile(rb"Parsed_showinfo.*?\bpts_time:\s*(-?[0-9.]+)")
+
+
+def _scene_signal_command(video_path: str, width: int, height: int) -> List[str]:
+    """原生帧率解码为灰度 rawvideo（stdout），showinfo 在 stderr 打印每帧 pts"""
+    return [
+        "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "info",
+        "-i", video_path,
+        "-an",
+        "-vf", f"scale={width}:{height},format=gray,showinfo",
+        "-vsync", "passthrough",
+        "-f", "rawvideo",
+        "-",
+    ]
+
 
 @dataclass
 class TemplateAsset:
@@ -39,31 +185,135 @@ class TemplateAsset:
     thumbnail_url: str
 
 
+class IngestJobBusy(RuntimeError):
+    """任务正被其他 worker 处理（心跳未过期），稍后重试"""
+
+
 class TemplateIngestService:
+    """
+    模板采集任务：由 Celery worker 执行（broker 不可用时回退为进程内执行）。
+
+    每个阶段的产出写入 template_ingest_jobs.checkpoint：
+      - detect:  转场检测结果（pack_id / ranges / 调试信息）
+      - analyze: {转场序号: 视频理解结果}
+      - publish: {序号: 已入库的模板}
+    worker 崩溃后任务被重新投递（或由启动时的扫描重新入队），从最后完成的阶段继续。
+    """
+
     def __init__(self) -> None:
         self._tasks: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
 
     def enqueue(self, job_id: str) -> None:
-        """异步处理模板采集任务"""
+        """投递模板采集任务到 worker 队列"""
+        try:
+            from app.tasks.template_ingest import process_template_ingest
+            process_template_ingest.delay(job_id)
+            return
+        except Exception as exc:
+            logger.warning("[TemplateIngest] Celery 分发失败，回退为进程内执行: %s", exc)
+
         if job_id in self._tasks and not self._tasks[job_id].done():
             return
-        self._tasks[job_id] = asyncio.create_task(self._process_job(job_id))
+        self._tasks[job_id] = asyncio.create_task(self._run_in_process(job_id))
+
+    async def _run_in_process(self, job_id: str) -> None:
+        try:
+            await self.process_job(job_id)
+        except IngestJobBusy:
+            logger.info("[TemplateIngest] 任务正在其他 worker 执行: %s", job_id)
+
+    async def resume_interrupted_jobs(self) -> List[str]:
+        """重新入队心跳过期的 queued / processing 任务（进程重启或 worker 崩溃遗留）"""
+        try:
+            rows = get_supabase().table("template_ingest_jobs").select("id, status, updated_at").in_(
+                "status", ["queued", "processing"]
+            ).execute().data or []
+        except Exception as exc:
+            logger.warning("[TemplateIngest] 查询中断任务失败: %s", exc)
+            return []
+
+        job_ids = [row["id"] for row in rows if _is_stale(row)]
+        for job_id in job_ids:
+            logger.info("[TemplateIngest] 重新入队中断任务: %s", job_id)
+            self.enqueue(job_id)
+        return job_ids
 
-    async def _process_job(self, job_id: str) -> None:
+    def _claim_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        抢占任务：已结束返回 None；其他 worker 正在执行（心跳未过期）抛 IngestJobBusy。
+        以 updated_at 做乐观锁，同一任务只会被一个 worker 接管。
+        """
         supabase = get_supabase()
+        job = supabase.table("template_ingest_jobs").select("*").eq("id", job_id).single().execute().data
+        if not job:
+            raise RuntimeError("Ingest job not found")
+        if job.get("status") in TERMINAL_INGEST_STATUSES:
+            return None
+        if job.get("status") == "processing" and not _is_stale(job):
+            raise IngestJobBusy(job_id)
+
         now = datetime.utcnow().isoformat()
-        supabase.table("template_ingest_jobs").update({
-            "status": "processing",
-            "progress": 0.05,
-            "started_at": now,
-            "updated_at": now,
-        }).eq("id", job_id).execute()
+        update: Dict[str, Any] = {"status": "processing", "updated_at": now}
+        if not job.get("started_at"):
+            update["started_at"] = now
+            update["progress"] = 0.05
+        claimed = supabase.table("template_ingest_jobs").update(update).eq("id", job_id).eq(
+            "updated_at", job.get("updated_at")
+        ).execute().data
+        if not claimed:
+            raise IngestJobBusy(job_id)
+
+        job.update(update)
+        job["checkpoint"] = job.get("checkpoint") or {}
+        if job["checkpoint"]:
+            logger.info("[TemplateIngest] 从检查点续跑: job_id=%s, stages=%s", job_id, list(job["checkpoint"]))
+        return job
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(INGEST_HEARTBEAT_SEC)
+            try:
+                get_supabase().table("template_ingest_jobs").update({
+                    "updated_at": datetime.utcnow().isoformat(),
+                }).eq("id", job_id).execute()
+            except Exception as exc:
+                logger.warning("[TemplateIngest] 心跳更新失败: %s", exc)
 
-        try:
-            job = supabase.table("template_ingest_jobs").select("*").eq("id", job_id).single().execute().data
-            if not job:
-                raise RuntimeError("Ingest job not found")
+    def _save_checkpoint(
+        self,
+        job: Dict[str, Any],
+        stage: str,
+        value: Any,
+        key: Optional[str] = None,
+        progress: Optional[float] = None,
+    ) -> None:
+        """写入阶段产出（key 不为空时写入阶段内的单个子项）"""
+        checkpoint = job.setdefault("checkpoint", {})
+        if key is None:
+            checkpoint[stage] = value
+        else:
+            checkpoint.setdefault(stage, {})[key] = value
+        update: Dict[str, Any] = {"checkpoint": checkpoint, "updated_at": datetime.utcnow().isoformat()}
+        if progress is not None:
+            update["progress"] = round(progress, 3)
+        get_supabase().table("template_ingest_jobs").update(update).eq("id", job["id"]).execute()
+
+    def _spawn_background(self, coro) -> None:
+        """后台清理任务：任务结束前统一等待，避免 worker 事件循环关闭时被丢弃"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def process_job(self, job_id: str) -> None:
+        supabase = get_supabase()
+        job = self._claim_job(job_id)
+        if job is None:
+            logger.info("[TemplateIngest] 任务已结束，跳过: %s", job_id)
+            return
 
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
             source_type = job.get("source_type", "video")
             ingest_output: Union[List[TemplateAsset], Tuple[List[TemplateAsset], Dict[str, Any]]]
 
@@ -81,19 +331,7 @@ class TemplateIngestService:
                 templates = ingest_output
 
             result_payload: Dict[str, Any] = {
-                "templates": [
-                    {
-                        "template_id": t.template_id,
-                        "name": t.name,
-                        "category": t.category,
-                        "type": t.type,
-                        "storage_path": t.storage_path,
-                        "thumbnail_path": t.thumbnail_path,
-                        "url": t.url,
-                        "thumbnail_url": t.thumbnail_url,
-                    }
-                    for t in templates
-                ]
+                "templates": [asdict(t) for t in templates]
             }
             if pack_summary:
                 result_payload.update(pack_summary)
@@ -115,25 +353,68 @@ class TemplateIngestService:
                 "completed_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat(),
             }).eq("id", job_id).execute()
+        finally:
+            heartbeat.cancel()
+            if self._background:
+                await asyncio.gather(*self._background, return_exceptions=True)
+
+    async def _publish_template(
+        self,
+        job: Dict[str, Any],
+        index: int,
+        image: Image.Image,
+        progress: Optional[float] = None,
+        **kwargs: Any,
+    ) -> TemplateAsset:
+        """入库单个模板并写入 publish 检查点"""
+        template = await self._create_template_from_image(image, job, index=index, **kwargs)
+        self._save_checkpoint(job, "publish", asdict(template), key=str(index), progress=progress)
+        return template
+
+    @staticmethod
+    def _published_templates(job: Dict[str, Any]) -> Dict[int, TemplateAsset]:
+        """检查点中已入库的模板（续跑时跳过）"""
+        published = (job.get("checkpoint") or {}).get("publish") or {}
+        return {int(index): TemplateAsset(**data) for index, data in published.items()}
 
     async def _ingest_image(self, job: Dict[str, Any]) -> List[TemplateAsset]:
+        published = self._published_templates(job)
+        if 0 in published:
+            return [published[0]]
         image_bytes = await self._download_bytes(job["source_url"])
         image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        return [await self._create_template_from_image(image, job, index=0)]
+        return [await self._publish_template(job, 0, image)]
 
     async def _ingest_zip(self, job: Dict[str, Any]) -> List[TemplateAsset]:
         import zipfile
 
         data = await self._download_bytes(job["source_url"])
-        templates: List[TemplateAsset] = []
+        published = self._published_templates(job)
+        semaphore = asyncio.Semaphore(INGEST_PUBLISH_CONCURRENCY)
 
         with zipfile.ZipFile(io.BytesIO(data)) as archive:
             image_files = [f for f in archive.namelist() if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))]
-            for idx, file_name in enumerate(image_files):
-                with archive.open(file_name) as file_obj:
-                    image = Image.open(file_obj).convert("RGB")
-                templates.append(await self._create_template_from_image(image, job, index=idx))
+            total = max(len(image_files), 1)
+
+            async def publish(idx: int, file_name: str) -> TemplateAsset:
+                if idx in published:
+                    return published[idx]
+                async with semaphore:
+                    with archive.open(file_name) as file_obj:
+                        image = Image.open(file_obj).convert("RGB")
+                    done = len((job.get("checkpoint") or {}).get("publish") or {}) + 1
+                    return await self._publish_template(job, idx, image, progress=0.05 + 0.9 * done / total)
+
+            results = await asyncio.gather(
+                *(publish(idx, file_name) for idx, file_name in enumerate(image_files)),
+                return_exceptions=True,
+            )
 
+        # 全部结束后再抛错：已成功的模板都写入了检查点，续跑时不重复入库
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        templates: List[TemplateAsset] = list(results)
         if not templates:
             raise RuntimeError("Zip 中未找到图片文件")
         return templates
@@ -150,48 +431,37 @@ class TemplateIngestService:
 
     async def _ingest_transition_video(self, job: Dict[str, Any]) -> Tuple[List[TemplateAsset], Dict[str, Any]]:
         job_id = job.get("id", "unknown")
-        # 转场模式：不用 extract_frames 硬编码数量，由 scene detection 自动决定
-        # extract_frames 仅作为安全上限（防止生成过多模板）
-        max_cap = max(1, min(int(job.get("extract_frames") or 32), 64))
-        transition_duration_ms = self._parse_transition_duration_ms(job)
-        clip_ranges = job.get("clip_ranges") or []
         video_url = str(job.get("source_url") or "")
         if not video_url:
             raise RuntimeError("缺少 source_url")
-        
-        logger.info(f"[TemplateIngest] === 开始转场视频入库(智能检测) === job_id={job_id}, max_cap={max_cap}, duration_ms={transition_duration_ms}")
-        logger.info(f"[TemplateIngest] 转场视频URL: {video_url}")
-
-        pack_id = f"pack-{uuid.uuid4().hex[:10]}"
-        # 用一个大上限让 scene detection 充分检测所有转场
-        detected_ranges, detection_debug = await self._detect_transition_ranges(
-            video_url=video_url,
-            max_ranges=max_cap,
-            clip_ranges=clip_ranges,
-            transition_duration_ms=transition_duration_ms,
-        )
-        detected_segments = len(detected_ranges)
-        logger.info(f"[TemplateIngest] 检测到 {detected_segments} 个转场范围: {detected_ranges[:5]}...")
 
-        deduped_ranges = self._dedupe_transition_ranges(detected_ranges)
-        deduped_templates = max(detected_segments - len(deduped_ranges), 0)
-        # 不再硬截断到 extract_frames，而是取去重后的全部有效转场（最多 max_cap 个）
-        selected_ranges = deduped_ranges[:max_cap] if len(deduped_ranges) > max_cap else deduped_ranges
-        auto_detected_count = len(selected_ranges)
-        logger.info(f"[TemplateIngest] 智能检测: 去重后 {len(deduped_ranges)} 个转场，选取 {auto_detected_count} 个")
-        detection_debug["deduped_range_count"] = len(deduped_ranges)
-        detection_debug["auto_detected_count"] = auto_detected_count
-        detection_debug["published_ranges"] = [
-            {"start": round(start, 3), "end": round(end, 3)} for start, end in selected_ranges
-        ]
+        # ---------- 阶段一: 转场检测（检查点: detect） ----------
+        detect = (job.get("checkpoint") or {}).get("detect")
+        if detect is None:
+            detect = await self._detect_transition_stage(job, video_url)
+            self._save_checkpoint(job, "detect", detect, progress=0.2)
+        else:
+            logger.info(f"[TemplateIngest] 复用检测检查点: job_id={job_id}, ranges={len(detect['ranges'])}")
+
+        pack_id = detect["pack_id"]
+        detected_segments = detect["detected_segments"]
+        detection_debug = detect["detection_debug"]
+        selected_ranges: List[Tuple[float, float]] = [(float(start), float(end)) for start, end in detect["ranges"]]
+        published = self._published_templates(job)
+        # 绑定检查点里的同一个 dict：_save_checkpoint 写入后 len(analyzed) 随之增长，进度才会前进
+        job["checkpoint"] = job.get("checkpoint") or {}
+        analyzed: Dict[str, Any] = job["checkpoint"].setdefault("analyze", {})
 
         # 动态计算每个转场的 A/B 帧偏移量：
         #   A帧: 转场区域前的清晰静态帧（偏移量根据到前一个转场的间距动态计算）
         #   Mid帧: 转场中心（仅用于 LLM 分析，不用于展示）
         #   B帧: 转场区域后的清晰静态帧
+        # 已入库的转场不再提取帧
         total_dur = detection_debug.get("duration_sec", 999)
+        pending_indices = [i for i in range(len(selected_ranges)) if i not in published]
         all_timestamps: List[float] = []
-        for i, (start, end) in enumerate(selected_ranges):
+        for i in pending_indices:
+            start, end = selected_ranges[i]
             # 计算到前后邻居转场的间距
             gap_before = start if i == 0 else start - selected_ranges[i - 1][1]
             gap_after = (total_dur - end) if i == len(selected_ranges) - 1 else selected_ranges[i + 1][0] - end
@@ -202,14 +472,17 @@ class TemplateIngestService:
             ts_mid = (start + end) / 2.0
             ts_b = min(total_dur, end + offset_b)
             all_timestamps.extend([ts_a, ts_mid, ts_b])
-        logger.info(f"[TemplateIngest] 提取帧时间戳 (A/Mid/B x{len(selected_ranges)}): {[round(t,3) for t in all_timestamps]}")
-        all_frames = await self._extract_frames_at_timestamps(video_url=video_url, timestamps=all_timestamps)
-        logger.info(f"[TemplateIngest] 成功提取 {len(all_frames)} 帧")
+        all_frames: List[Image.Image] = []
+        if all_timestamps:
+            logger.info(f"[TemplateIngest] 提取帧时间戳 (A/Mid/B x{len(pending_indices)}): {[round(t,3) for t in all_timestamps]}")
+            all_frames = await self._extract_frames_at_timestamps(video_url=video_url, timestamps=all_timestamps)
+            logger.info(f"[TemplateIngest] 成功提取 {len(all_frames)} 帧")
 
         # ---------- 准备每个转场的帧数据 ----------
         transition_items: List[Dict[str, Any]] = []
-        for idx, (start, end) in enumerate(selected_ranges):
-            base = idx * 3
+        for position, idx in enumerate(pending_indices):
+            start, end = selected_ranges[idx]
+            base = position * 3
             frame_a = all_frames[base] if base < len(all_frames) else None
             frame_mid = all_frames[base + 1] if base + 1 < len(all_frames) else None
             frame_b = all_frames[base + 2] if base + 2 < len(all_frames) else None
@@ -225,22 +498,36 @@ class TemplateIngestService:
                 "display_frame": display_frame,
             })
 
-        # ---------- 并发视频理解分析（不降级） ----------
-        import asyncio
-        logger.info(f"[TemplateIngest] 启动 {len(transition_items)} 个转场的并发视频理解分析...")
-        analysis_tasks = [
-            self._analyze_transition_frames(
-                frame_a=item["frame_a"],
-                frame_mid=item["frame_mid"],
-                frame_b=item["frame_b"],
-                index=item["idx"],
-                video_url=video_url,
-                start_sec=item["start"],
-                end_sec=item["end"],
-            )
-            for item in transition_items
-        ]
-        analysis_results = await asyncio.gather(*analysis_tasks, return_exceptions=True)
+        # ---------- 阶段二: 并发视频理解分析（检查点: analyze，逐个转场写入） ----------
+        analysis_semaphore = asyncio.Semaphore(INGEST_ANALYSIS_CONCURRENCY)
+        total_items = max(len(selected_ranges), 1)
+
+        async def analyze(item: Dict[str, Any]) -> Dict[str, Any]:
+            key = str(item["idx"])
+            if key in analyzed:
+                return analyzed[key]
+            async with analysis_semaphore:
+                analysis = await self._analyze_transition_frames(
+                    frame_a=item["frame_a"],
+                    frame_mid=item["frame_mid"],
+                    frame_b=item["frame_b"],
+                    index=item["idx"],
+                    video_url=video_url,
+                    start_sec=item["start"],
+                    end_sec=item["end"],
+                )
+            done = len(analyzed) + 1
+            self._save_checkpoint(job, "analyze", analysis, key=key, progress=0.2 + 0.5 * done / total_items)
+            return analysis
+
+        cached = sum(1 for item in transition_items if str(item["idx"]) in analyzed)
+        logger.info(
+            f"[TemplateIngest] 启动 {len(transition_items) - cached} 个转场的并发视频理解分析"
+            f"（检查点复用 {cached} 个，并发上限 {INGEST_ANALYSIS_CONCURRENCY}）..."
+        )
+        analysis_results = await asyncio.gather(
+            *(analyze(item) for item in transition_items), return_exceptions=True,
+        )
 
         # ---------- 检查分析错误（不再静默降级） ----------
         for item, analysis in zip(transition_items, analysis_results):
@@ -250,9 +537,10 @@ class TemplateIngestService:
                     f"转场 {idx} 视频分析失败: {analysis}"
                 ) from analysis
 
-        # ---------- 组装模板 ----------
-        templates: List[TemplateAsset] = []
-        for item, analysis in zip(transition_items, analysis_results):
+        # ---------- 阶段三: 组装模板（检查点: publish） ----------
+        publish_semaphore = asyncio.Semaphore(INGEST_PUBLISH_CONCURRENCY)
+
+        async def publish(item: Dict[str, Any], analysis: Dict[str, Any]) -> TemplateAsset:
             idx = item["idx"]
             logger.info(f"[TemplateIngest] 转场 {idx} 分析结果: {analysis}")
             transition_spec = self._build_transition_spec(
@@ -272,15 +560,28 @@ class TemplateIngestService:
                 },
             }
             source_timecode = f"{item['start']:.3f}-{item['end']:.3f}"
-            templates.append(
-                await self._create_template_from_image(
-                    item["display_frame"],
+            async with publish_semaphore:
+                done = len((job.get("checkpoint") or {}).get("publish") or {}) + 1
+                return await self._publish_template(
                     job,
-                    index=idx,
+                    idx,
+                    item["display_frame"],
+                    progress=0.7 + 0.25 * min(done, total_items) / total_items,
                     source_timecode=source_timecode,
                     metadata_extra=metadata_extra,
                 )
-            )
+
+        publish_results = await asyncio.gather(
+            *(publish(item, analysis) for item, analysis in zip(transition_items, analysis_results)),
+            return_exceptions=True,
+        )
+        for result in publish_results:
+            if isinstance(result, Exception):
+                raise result
+
+        # 检查点中已入库的 + 本次入库的，按转场顺序排列
+        published.update({item["idx"]: template for item, template in zip(transition_items, publish_results)})
+        templates: List[TemplateAsset] = [published[idx] for idx in sorted(published)]
 
         if not templates:
             raise RuntimeError("转场视频未提取到有效模板")
@@ -289,13 +590,56 @@ class TemplateIngestService:
         summary = {
             "pack_id": pack_id,
             "detected_segments": detected_segments,
-            "auto_detected_count": auto_detected_count,
+            "auto_detected_count": detect["auto_detected_count"],
             "published_templates": published_templates,
-            "deduped_templates": deduped_templates,
+            "deduped_templates": detect["deduped_templates"],
             "detection_debug": detection_debug,
         }
         return templates, summary
 
+    async def _detect_transition_stage(self, job: Dict[str, Any], video_url: str) -> Dict[str, Any]:
+        """转场检测 + 去重 + 截断，产出可序列化的 detect 检查点"""
+        job_id = job.get("id", "unknown")
+        # 转场模式：不用 extract_frames 硬编码数量，由 scene detection 自动决定
+        # extract_frames 仅作为安全上限（防止生成过多模板）
+        max_cap = max(1, min(int(job.get("extract_frames") or 32), 64))
+        transition_duration_ms = self._parse_transition_duration_ms(job)
+        clip_ranges = job.get("clip_ranges") or []
+
+        logger.info(f"[TemplateIngest] === 开始转场视频入库(智能检测) === job_id={job_id}, max_cap={max_cap}, duration_ms={transition_duration_ms}")
+        logger.info(f"[TemplateIngest] 转场视频URL: {video_url}")
+
+        pack_id = f"pack-{uuid.uuid4().hex[:10]}"
+        # 用一个大上限让 scene detection 充分检测所有转场
+        detected_ranges, detection_debug = await self._detect_transition_ranges(
+            video_url=video_url,
+            max_ranges=max_cap,
+            clip_ranges=clip_ranges,
+            transition_duration_ms=transition_duration_ms,
+        )
+        detected_segments = len(detected_ranges)
+        logger.info(f"[TemplateIngest] 检测到 {detected_segments} 个转场范围: {detected_ranges[:5]}...")
+
+        deduped_ranges = self._dedupe_transition_ranges(detected_ranges)
+        deduped_templates = max(detected_segments - len(deduped_ranges), 0)
+        # 不再硬截断到 extract_frames，而是取去重后的全部有效转场（最多 max_cap 个）
+        selected_ranges = deduped_ranges[:max_cap] if len(deduped_ranges) > max_cap else deduped_ranges
+        auto_detected_count = len(selected_ranges)
+        logger.info(f"[TemplateIngest] 智能检测: 去重后 {len(deduped_ranges)} 个转场，选取 {auto_detected_count} 个")
+        detection_debug["deduped_range_count"] = len(deduped_ranges)
+        detection_debug["auto_detected_count"] = auto_detected_count
+        detection_debug["published_ranges"] = [
+            {"start": round(start, 3), "end": round(end, 3)} for start, end in selected_ranges
+        ]
+        return {
+            "pack_id": pack_id,
+            "ranges": [[start, end] for start, end in selected_ranges],
+            "detected_segments": detected_segments,
+            "deduped_templates": deduped_templates,
+            "auto_detected_count": auto_detected_count,
+            "detection_debug": detection_debug,
+        }
+
     @staticmethod
     def _parse_transition_duration_ms(job: Dict[str, Any]) -> int:
         params = job.get("params") or {}
@@ -317,7 +661,11 @@ class TemplateIngestService:
         transition_duration_ms: int,
     ) -> Tuple[List[Tuple[float, float]], Dict[str, Any]]:
         tmp_path = await self._ensure_local_video(video_url)
-        total_duration_sec = await self._probe_video_duration(tmp_path)
+        # 一次低分辨率解码同时得到场景信号和时长（按每帧 pts，兼容任意 / 可变帧率）
+        signal = await self._decode_scene_signal(tmp_path)
+        total_duration_sec = signal.duration()
+        if total_duration_sec is None:
+            total_duration_sec = await self._probe_video_duration(tmp_path)
         logger.info(f"[TemplateIngest] 视频总时长: {total_duration_sec}s")
 
         detection_debug: Dict[str, Any] = {
@@ -340,34 +688,24 @@ class TemplateIngestService:
             return selected_ranges, detection_debug
 
         # 极低阈值收集所有场景变化，让后续聚类来分离噪声
-        detect_cmd = [
-            "ffmpeg",
-            "-hide_banner",
-            "-i",
-            tmp_path,
-            "-filter_complex",
-            "select=gt(scene\,0.02),metadata=print",
-            "-an",
-            "-f",
-            "null",
-            "-",
-        ]
-        process = await asyncio.create_subprocess_exec(
-            *detect_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
-        if process.returncode != 0:
-            logger.warning("[TemplateIngest] 场景检测命令执行失败，返回码=%s", process.returncode)
-
-        scene_output = (stdout or b"").decode(errors="ignore") + "\n" + (stderr or b"").decode(errors="ignore")
-        scene_events = self._extract_scene_events(scene_output, total_duration_sec)
+        if signal.frame_count >= 2:
+            scene_events = _scene_events_from_scores(
+                signal.scores(), signal.frame_times(total_duration_sec), total_duration_sec,
+            )
+            detection_debug["scene_signal"] = "numpy_mafd"
+        else:
+            logger.warning("[TemplateIngest] 低分辨率解码无有效帧，回退到 ffmpeg select 场景检测")
+            scene_events = await self._scene_events_via_select(tmp_path, total_duration_sec)
+            detection_debug["scene_signal"] = "ffmpeg_select"
         detection_debug["scene_event_count"] = len(scene_events)
-        detection_debug["top_scene_events"] = [
-            {"ts": round(ts, 3), "score": round(score, 4)}
-            for ts, score in sorted(scene_events, key=lambda item: item[1], reverse=True)[:20]
-        ]
+        if scene_events:
+            event_ts, event_scores = _events_to_arrays(scene_events)
+            top = np.argsort(-event_scores, kind="stable")[:20]
+            detection_debug["top_scene_events"] = [
+                {"ts": round(float(event_ts[i]), 3), "score": round(float(event_scores[i]), 4)} for i in top
+            ]
+        else:
+            detection_debug["top_scene_events"] = []
 
         # ========== 动态转场区域检测（替代固定窗口） ==========
         min_zone_width = max(0.1, float(transition_duration_ms) / 4000.0)  # 最小区域宽度
@@ -411,6 +749,71 @@ class TemplateIngestService:
 
         return ranges, detection_debug
 
+    async def _decode_scene_signal(self, video_path: str) -> _SceneSignal:
+        """
+        ffmpeg 按原生帧率输出低分辨率灰度 rawvideo，边读边计算逐帧差分
+
+        不做帧率转换（-vsync passthrough），每帧 pts 由 showinfo 打到 stderr 并行读取
+        """
+        width, height = SCENE_SIGNAL_SIZE
+        signal = _SceneSignal(width, height)
+        process = await asyncio.create_subprocess_exec(
+            *_scene_signal_command(video_path, width, height),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        assert process.stdout is not None and process.stderr is not None
+
+        async def read_pts() -> None:
+            async for line in process.stderr:
+                match = _SHOWINFO_PTS_RE.search(line)
+                if match:
+                    signal.pts.append(float(match.group(1)))
+
+        pts_reader = asyncio.create_task(read_pts())
+        while True:
+            data = await process.stdout.read(signal.frame_bytes * SCENE_SIGNAL_CHUNK_FRAMES)
+            if not data:
+                break
+            signal.feed(data)
+        await pts_reader
+        await process.wait()
+        if process.returncode != 0:
+            logger.warning("[TemplateIngest] 场景信号解码失败，返回码=%s", process.returncode)
+        if len(signal.pts) != signal.frame_count:
+            logger.warning(
+                "[TemplateIngest] 帧时间戳数量不一致: pts=%s, frames=%s，改用时长均分",
+                len(signal.pts), signal.frame_count,
+            )
+        logger.info("[TemplateIngest] 场景信号: %s 帧, 时长 %ss", signal.frame_count, signal.duration())
+        return signal
+
+    async def _scene_events_via_select(self, video_path: str, total_duration_sec: float) -> List[Tuple[float, float]]:
+        """回退：ffmpeg select=scene 逐帧打印分数后解析"""
+        detect_cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-i",
+            video_path,
+            "-filter_complex",
+            f"select=gt(scene\\,{SCENE_EVENT_THRESHOLD}),metadata=print",
+            "-an",
+            "-f",
+            "null",
+            "-",
+        ]
+        process = await asyncio.create_subprocess_exec(
+            *detect_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            logger.warning("[TemplateIngest] 场景检测命令执行失败，返回码=%s", process.returncode)
+
+        scene_output = (stdout or b"").decode(errors="ignore") + "\n" + (stderr or b"").decode(errors="ignore")
+        return self._extract_scene_events(scene_output, total_duration_sec)
+
     @staticmethod
     def _cluster_into_transition_zones(
         scene_events: List[Tuple[float, float]],
@@ -432,48 +835,33 @@ class TemplateIngestService:
         if not scene_events:
             return []
 
-        sorted_events = sorted(scene_events, key=lambda x: x[0])
-
-        zones: List[Dict[str, Any]] = []
-        cluster: List[Tuple[float, float]] = [sorted_events[0]]
-
-        for event in sorted_events[1:]:
-            if event[0] - cluster[-1][0] <= gap_threshold_sec:
-                cluster.append(event)
-            else:
-                zones.append(TemplateIngestService._finalize_transition_zone(
-                    cluster, total_duration_sec, min_zone_width_sec,
-                ))
-                cluster = [event]
-
-        if cluster:
-            zones.append(TemplateIngestService._finalize_transition_zone(
-                cluster, total_duration_sec, min_zone_width_sec,
-            ))
-
-        return zones
-
-    @staticmethod
-    def _finalize_transition_zone(
-        cluster: List[Tuple[float, float]],
-        total_duration_sec: float,
-        min_zone_width_sec: float,
-    ) -> Dict[str, Any]:
-        """ 将一类事件聚合为一个转场区域，确保最小宽度 """
-        peak = max(cluster, key=lambda x: x[1])
-        start = cluster[0][0]
-        end = cluster[-1][0]
-        if end - start < min_zone_width_sec:
-            center = (start + end) / 2.0
-            start = max(0.0, center - min_zone_width_sec / 2.0)
-            end = min(total_duration_sec, center + min_zone_width_sec / 2.0)
-        return {
-            "start": round(start, 3),
-            "end": round(end, 3),
-            "peak_ts": round(peak[0], 3),
-            "peak_score": round(peak[1], 4),
-            "event_count": len(cluster),
-        }
+        timestamps, scores = _events_to_arrays(scene_events)
+        timestamps, scores, starts, ends, peak_idx = _split_event_clusters(timestamps, scores, gap_threshold_sec)
+
+        # 区域宽度不足 min_zone_width_sec 的，以中心向两侧扩展
+        zone_start = timestamps[starts]
+        zone_end = timestamps[ends - 1]
+        narrow = zone_end - zone_start < min_zone_width_sec
+        center = (zone_start + zone_end) / 2.0
+        zone_start = np.where(narrow, np.maximum(0.0, center - min_zone_width_sec / 2.0), zone_start)
+        zone_end = np.where(narrow, np.minimum(total_duration_sec, center + min_zone_width_sec / 2.0), zone_end)
+
+        return [
+            {
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "peak_ts": round(peak_ts, 3),
+                "peak_score": round(peak_score, 4),
+                "event_count": count,
+            }
+            for start, end, peak_ts, peak_score, count in zip(
+                zone_start.tolist(),
+                zone_end.tolist(),
+                timestamps[peak_idx].tolist(),
+                scores[peak_idx].tolist(),
+                (ends - starts).tolist(),
+            )
+        ]
 
     @staticmethod
     def _extract_scene_events(
@@ -537,12 +925,15 @@ class TemplateIngestService:
         fallback_peaks: List[Tuple[float, float]] = []
         fallback_level = 0.0
 
+        timestamps, scores = _events_to_arrays(scene_events)
         for level in score_levels:
-            candidates = [item for item in scene_events if item[1] >= level]
-            if not candidates:
+            mask = scores >= level
+            if not mask.any():
                 continue
 
-            peaks = TemplateIngestService._collapse_scene_events(candidates, min_peak_spacing_sec)
+            peaks = TemplateIngestService._collapse_scene_events(
+                list(zip(timestamps[mask].tolist(), scores[mask].tolist())), min_peak_spacing_sec,
+            )
             if len(peaks) > peak_cap:
                 peaks = sorted(peaks, key=lambda item: item[1], reverse=True)[:peak_cap]
                 peaks = sorted(peaks, key=lambda item: item[0])
@@ -564,23 +955,9 @@ class TemplateIngestService:
         if not scene_events:
             return []
 
-        sorted_events = sorted(scene_events, key=lambda item: item[0])
-        peaks: List[Tuple[float, float]] = []
-        cluster: List[Tuple[float, float]] = [sorted_events[0]]
-
-        for event in sorted_events[1:]:
-            prev_ts = cluster[-1][0]
-            if event[0] - prev_ts <= min_spacing_sec:
-                cluster.append(event)
-                continue
-
-            peaks.append(max(cluster, key=lambda item: item[1]))
-            cluster = [event]
-
-        if cluster:
-            peaks.append(max(cluster, key=lambda item: item[1]))
-
-        return sorted(peaks, key=lambda item: item[0])
+        timestamps, scores = _events_to_arrays(scene_events)
+        timestamps, scores, _, _, peak_idx = _split_event_clusters(timestamps, scores, min_spacing_sec)
+        return list(zip(timestamps[peak_idx].tolist(), scores[peak_idx].tolist()))
 
     @staticmethod
     def _build_ranges_from_peaks(
@@ -928,7 +1305,7 @@ class TemplateIngestService:
                 video_result["_stage1_observation"] = observation
 
             # 异步清理上传的文件
-            asyncio.create_task(self._cleanup_ark_file(file_id))
+            self._spawn_background(self._cleanup_ark_file(file_id))
         finally:
             # 无论成功失败都清理本地临时片段
             try:
@@ -2175,38 +2552,43 @@ class TemplateIngestService:
         if not timestamps:
             return []
 
-        frames: List[Image.Image] = []
         frames_dir = tempfile.mkdtemp(prefix="tmpl_ingest_frames_at_ts_")
-        try:
-            for idx, ts in enumerate(timestamps):
-                frame_path = os.path.join(frames_dir, f"frame_{idx:03d}.jpg")
-                extract_cmd = [
-                    "ffmpeg", "-y",
-                    "-ss", str(max(0.0, ts)),
-                    "-i", tmp_path,
-                    "-vframes", "1",
-                    "-q:v", "2",
-                    frame_path,
-                ]
+        semaphore = asyncio.Semaphore(INGEST_FRAME_CONCURRENCY)
+
+        async def extract(idx: int, ts: float) -> Optional[Image.Image]:
+            frame_path = os.path.join(frames_dir, f"frame_{idx:03d}.jpg")
+            extract_cmd = [
+                "ffmpeg", "-y",
+                "-ss", str(max(0.0, ts)),
+                "-i", tmp_path,
+                "-vframes", "1",
+                "-q:v", "2",
+                frame_path,
+            ]
+            async with semaphore:
                 extract_process = await asyncio.create_subprocess_exec(
                     *extract_cmd,
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE,
                 )
                 await extract_process.communicate()
-                if os.path.exists(frame_path):
-                    frame_img = Image.open(frame_path).convert("RGB")
-                    logger.info(f"[TemplateIngest] 转场帧 {idx}: ts={ts}s, size={frame_img.size}")
-                    frames.append(frame_img)
-                else:
-                    logger.warning(f"[TemplateIngest] ⚠️ 转场帧 {idx} 提取失败")
+            if os.path.exists(frame_path):
+                frame_img = Image.open(frame_path).convert("RGB")
+                logger.info(f"[TemplateIngest] 转场帧 {idx}: ts={ts}s, size={frame_img.size}")
+                return frame_img
+            logger.warning(f"[TemplateIngest] ⚠️ 转场帧 {idx} 提取失败")
+            return None
+
+        try:
+            # 各时间戳相互独立，并发 seek 提取（按时间戳顺序返回）
+            results = await asyncio.gather(*(extract(idx, ts) for idx, ts in enumerate(timestamps)))
         finally:
             try:
                 import shutil
                 shutil.rmtree(frames_dir)
             except Exception:
                 pass
-        return frames
+        return [frame for frame in results if frame is not None]
 
     async def _extract_frames(
         self,
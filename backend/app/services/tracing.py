@@ -0,0 +1,630 @@
+"""
+请求级耗时追踪
+
+一个请求 / 任务对应一条 trace，内部的 Supabase / Kling / Ark / Fish Audio 调用、
+FFmpeg 子进程、业务步骤各是一个 span：
+- API：TracingMiddleware（ASGI）读取 / 生成 W3C traceparent，响应头回写 X-Trace-Id
+- Celery：发布时把 traceparent 写入消息头，worker 执行任务时沿用同一 trace id
+- httpx：在 HTTPTransport / AsyncHTTPTransport 上挂钩，散落各处临时创建的客户端也能覆盖，
+  按 host 归类到 provider
+- FFmpeg：subprocess_span / traced_run 包住子进程调用
+
+导出：
+- Prometheus：span 耗时直方图 lepus_span_duration_seconds{kind,name,status}，
+  API 进程挂在 /metrics；worker 子进程设置 TRACE_METRICS_PORT 后各自起一个端口
+  （从该端口起向后找空闲端口），p50 / p99 用 histogram_quantile 计算
+- OTLP：设置 OTEL_EXPORTER_OTLP_ENDPOINT 且安装了 opentelemetry-sdk /
+  opentelemetry-exporter-otlp-proto-http 时，span 原样（保留 trace / span id）导出
+- 日志：根 span 结束时输出一行按 span 名汇总的耗时分解，超过 TRACE_SLOW_MS 记 INFO
+"""
+
+import logging
+import os
+import re
+import secrets
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_METRICS_PORT = int(os.getenv("TRACE_METRICS_PORT", "0") or 0)
+TRACE_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "lepus-backend")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+# 不追踪的路径（探活 / 指标抓取）
+TRACE_EXCLUDED_PATHS = ("/health", "/metrics")
+
+# 直方图桶（秒）：覆盖从单次 PostgREST 往返到长视频渲染
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0,
+)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+# ============================================
+# Span
+# ============================================
+
+class Span:
+    """一次计时区间；根 span 额外汇总整条 trace 的耗时分解"""
+
+    __slots__ = (
+        "name", "kind", "trace_id", "span_id", "parent_id", "attributes", "status",
+        "start_ns", "end_ns", "_start", "duration", "root", "_breakdown", "_lock",
+    )
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str],
+                 root: Optional["Span"], attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.root = root or self
+        self._breakdown: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_root(self) -> bool:
+        return self.root is self
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+
+    def _finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+    def _add_to_breakdown(self, span: "Span") -> None:
+        with self._lock:
+            entry = self._breakdown.setdefault(span.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += span.duration
+
+    def breakdown(self) -> Dict[str, Tuple[int, float]]:
+        """{span 名: (次数, 总耗时秒)}，仅根 span 有数据"""
+        with self._lock:
+            return {name: (int(count), total) for name, (count, total) in self._breakdown.items()}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("lepus_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def parse_traceparent(value: Optional[Any]) -> Optional[Tuple[str, str]]:
+    """W3C traceparent → (trace_id, parent_span_id)，格式不对返回 None"""
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[Tuple[str, str]] = None,
+               attributes: Optional[Dict[str, Any]] = None) -> Tuple[Span, Token]:
+    """
+    开始 span 并设为当前 span；必须与 end_span 成对调用（同一 context 内）
+
+    parent 为远端上下文 (trace_id, span_id)，用于接续上游 traceparent；
+    不传时挂在当前 span 下，没有当前 span 则开启新 trace。
+    """
+    current = _current_span.get()
+    if parent is not None:
+        span = Span(name, kind, parent[0], parent[1], None, attributes)
+    elif current is not None:
+        span = Span(name, kind, current.trace_id, current.span_id, current.root, attributes)
+    else:
+        span = Span(name, kind, secrets.token_hex(16), None, None, attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(
+    span: Span,
+    token: Optional[Token] = None,
+    error: Optional[BaseException] = None,
+    record: bool = True,
+) -> None:
+    """结束 span；record=False 时只恢复上下文，不计入指标 / 慢日志 / 导出"""
+    if error is not None:
+        span.status = "error"
+        span.attributes.setdefault("error.type", type(error).__name__)
+    span._finish()
+    if token is not None:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # token 来自其他 context（例如信号在不同线程里收尾），只能退回父级
+            _current_span.set(None)
+    if not record:
+        return
+    if not span.is_root:
+        span.root._add_to_breakdown(span)
+    _on_span_end(span)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Span]:
+    """
+    with span("export.render", clips=12) as s:
+        ...
+        s.set_attribute("output_bytes", size)
+    """
+    current, token = start_span(name, kind, attributes=attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, token, e)
+        raise
+    else:
+        end_span(current, token)
+
+
+# ============================================
+# Span 处理：指标 / 日志 / 导出
+# ============================================
+
+_processors: List[Callable[[Span], None]] = []
+
+
+def register_span_processor(processor: Callable[[Span], None]) -> None:
+    """注册 span 结束回调（OTLP 导出、测试观察等）"""
+    _processors.append(processor)
+
+
+def unregister_span_processor(processor: Callable[[Span], None]) -> None:
+    if processor in _processors:
+        _processors.remove(processor)
+
+
+def _on_span_end(span: Span) -> None:
+    _metrics.observe(span.kind, span.name, span.status, span.duration)
+    if span.is_root:
+        _log_trace(span)
+    for processor in list(_processors):
+        try:
+            processor(span)
+        except Exception as e:
+            logger.warning(f"[Trace] span 处理失败: {e}")
+
+
+def _log_trace(root: Span) -> None:
+    ms = root.duration * 1000
+    level = logging.INFO if ms >= TRACE_SLOW_MS else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+    parts = [
+        f"{name} {count}×{total * 1000:.0f}ms"
+        for name, (count, total) in sorted(root.breakdown().items(), key=lambda item: -item[1][1])
+    ]
+    detail = f" | {', '.join(parts)}" if parts else ""
+    logger.log(level, f"[Trace] {root.name} {ms:.0f}ms status={root.status} trace={root.trace_id}{detail}")
+
+
+class _DurationHistogram:
+    """lepus_span_duration_seconds{kind,name,status}"""
+
+    def __init__(self, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, name: str, status: str, seconds: float) -> None:
+        key = (kind, name, status)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [各桶计数..., +Inf 计数, 总和]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP lepus_span_duration_seconds Span duration by kind (server/consumer/client/subprocess/internal).",
+            "# TYPE lepus_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._series.items())
+            for (kind, name, status), series in items:
+                labels = f'kind="{_escape_label(kind)}",name="{_escape_label(name)}",status="{_escape_label(status)}"'
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f'lepus_span_duration_seconds_bucket{{{labels},le="{bound:g}"}} {series[i]}')
+                count = series[len(self.buckets)]
+                lines.append(f'lepus_span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"lepus_span_duration_seconds_sum{{{labels}}} {series[-1]:.6f}")
+                lines.append(f"lepus_span_duration_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics = _DurationHistogram()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_prometheus() -> str:
+    return _metrics.render()
+
+
+def reset_metrics() -> None:
+    _metrics.reset()
+
+
+def status_for_http(status_code: int) -> str:
+    if status_code >= 500:
+        return "5xx"
+    if status_code >= 400:
+        return "4xx"
+    return "ok"
+
+
+# ============================================
+# OTLP 导出（可选依赖）
+# ============================================
+
+_otlp_installed = False
+
+
+def _install_otlp_exporter() -> None:
+    global _otlp_installed
+    if _otlp_installed or not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    _otlp_installed = True
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import ReadableSpan
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.trace import SpanContext, SpanKind, Status, StatusCode, TraceFlags
+    except ImportError as e:
+        logger.warning(f"[Trace] 已设置 OTEL_EXPORTER_OTLP_ENDPOINT 但未安装 opentelemetry-sdk / otlp exporter: {e}")
+        return
+
+    resource = Resource.create({"service.name": TRACE_SERVICE_NAME})
+    # 端点 / 头部等由 exporter 按 OTEL_EXPORTER_OTLP_* 环境变量自行读取
+    processor = BatchSpanProcessor(OTLPSpanExporter())
+    kinds = {
+        "server": SpanKind.SERVER, "client": SpanKind.CLIENT, "consumer": SpanKind.CONSUMER,
+        "producer": SpanKind.PRODUCER,
+    }
+    flags = TraceFlags(TraceFlags.SAMPLED)
+
+    def export(span: Span) -> None:
+        trace_id = int(span.trace_id, 16)
+        parent = SpanContext(trace_id, int(span.parent_id, 16), is_remote=True, trace_flags=flags) if span.parent_id else None
+        processor.on_end(ReadableSpan(
+            name=span.name,
+            context=SpanContext(trace_id, int(span.span_id, 16), is_remote=False, trace_flags=flags),
+            parent=parent,
+            resource=resource,
+            attributes={k: v for k, v in span.attributes.items() if isinstance(v, (str, bool, int, float))},
+            kind=kinds.get(span.kind, SpanKind.INTERNAL),
+            status=Status(StatusCode.OK if span.status == "ok" else StatusCode.ERROR),
+            start_time=span.start_ns,
+            end_time=span.end_ns,
+        ))
+
+    register_span_processor(export)
+    logger.info(f"[Trace] OTLP 导出已启用: {OTEL_EXPORTER_OTLP_ENDPOINT}")
+
+
+# ============================================
+# FastAPI / ASGI
+# ============================================
+
+class TracingMiddleware:
+    """
+    纯 ASGI 中间件（不用 BaseHTTPMiddleware，SSE 流式响应不被缓冲）
+
+    span 名取路由模板（GET /api/projects/{project_id}），未匹配的路由归为 <unmatched>，
+    避免路径参数撑爆指标标签。SSE（text/event-stream）连接时长等于订阅时长，
+    不计入请求耗时指标和慢请求日志。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED or scope.get("path") in TRACE_EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        parent = None
+        for key, value in scope.get("headers") or []:
+            if key == b"traceparent":
+                parent = parse_traceparent(value)
+                break
+
+        current, token = start_span(f"{method} {scope.get('path', '')}", "server", parent=parent,
+                                    attributes={"http.method": method, "http.target": scope.get("path", "")})
+        status_code = 500
+        streaming = False
+
+        async def send_with_trace(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers") or [])
+                streaming = any(
+                    key.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for key, value in headers
+                )
+                headers.append((b"x-trace-id", current.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            route = scope.get("route")
+            current.name = f"{method} {getattr(route, 'path', None) or '<unmatched>'}"
+            current.set_attribute("http.status_code", status_code)
+            current.set_status(status_for_http(status_code))
+            end_span(current, token, error, record=not streaming)
+
+
+# ============================================
+# Celery
+# ============================================
+
+_celery_spans: Dict[str, Tuple[Span, Token]] = {}
+_celery_installed = False
+
+
+def _on_before_task_publish(headers=None, **kwargs):
+    traceparent = current_traceparent()
+    if traceparent and headers is not None:
+        headers.setdefault("traceparent", traceparent)
+
+
+def _task_traceparent(task) -> Optional[str]:
+    request = getattr(task, "request", None)
+    if request is None:
+        return None
+    value = getattr(request, "traceparent", None)
+    if value:
+        return value
+    headers = getattr(request, "headers", None) or {}
+    return headers.get("traceparent") if isinstance(headers, dict) else None
+
+
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    parent = parse_traceparent(_task_traceparent(task))
+    name = getattr(task, "name", None) or "celery.task"
+    _celery_spans[task_id] = start_span(name, "consumer", parent=parent, attributes={"celery.task_id": task_id})
+
+
+def _on_task_postrun(task_id=None, state=None, **kwargs):
+    entry = _celery_spans.pop(task_id, None)
+    if entry is None:
+        return
+    current, token = entry
+    current.set_attribute("celery.state", state)
+    if state and state != "SUCCESS":
+        current.set_status("retry" if state == "RETRY" else "error")
+    end_span(current, token)
+
+
+def _on_worker_process_init(**kwargs):
+    if TRACE_METRICS_PORT:
+        start_metrics_server(TRACE_METRICS_PORT)
+
+
+def install_celery_tracing() -> None:
+    """连接 Celery 信号：发布时注入 traceparent，执行时开启 consumer span"""
+    global _celery_installed
+    if _celery_installed or not TRACING_ENABLED:
+        return
+    from celery import signals
+
+    signals.before_task_publish.connect(_on_before_task_publish, weak=False)
+    signals.task_prerun.connect(_on_task_prerun, weak=False)
+    signals.task_postrun.connect(_on_task_postrun, weak=False)
+    signals.worker_process_init.connect(_on_worker_process_init, weak=False)
+    _celery_installed = True
+    _install_otlp_exporter()
+
+
+def start_metrics_server(port: int, attempts: int = 16) -> Optional[int]:
+    """独立进程（worker 子进程）暴露 /metrics；端口被占用时依次后移"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    for candidate in range(port, port + attempts):
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", candidate), _Handler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="trace-metrics", daemon=True).start()
+        logger.info(f"[Trace] 指标端口: {candidate} (pid={os.getpid()})")
+        return candidate
+    logger.warning(f"[Trace] {port}-{port + attempts - 1} 均被占用，指标端口未启动")
+    return None
+
+
+# ============================================
+# httpx
+# ============================================
+
+# host 后缀 → provider
+PROVIDER_HOST_SUFFIXES = (
+    (".supabase.co", "supabase"),
+    ("klingai.com", "kling"),
+    ("volces.com", "ark"),
+    ("fish.audio", "fish_audio"),
+)
+
+_provider_hosts: Dict[str, str] = {}
+_provider_hosts_loaded = False
+_httpx_installed = False
+
+
+def register_provider_host(url_or_host: str, provider: str) -> None:
+    """自定义域名 / 本地代理归类（SUPABASE_URL、KLING_API_BASE_URL 会自动注册）"""
+    host = urlsplit(url_or_host).netloc if "://" in url_or_host else url_or_host
+    if host:
+        _provider_hosts[host.lower()] = provider
+
+
+def provider_for_host(host: str) -> str:
+    global _provider_hosts_loaded
+    if not _provider_hosts_loaded:
+        _provider_hosts_loaded = True
+        for env_key, provider in (("SUPABASE_URL", "supabase"), ("KLING_API_BASE_URL", "kling")):
+            if os.getenv(env_key):
+                _provider_hosts.setdefault(urlsplit(os.getenv(env_key)).netloc.lower(), provider)
+    host = (host or "").lower()
+    if host in _provider_hosts:
+        return _provider_hosts[host]
+    for suffix, provider in PROVIDER_HOST_SUFFIXES:
+        if host.endswith(suffix):
+            return provider
+    return "other"
+
+
+def _client_span(request) -> Tuple[Span, Token]:
+    url = request.url
+    netloc = url.netloc.decode("ascii", "ignore") if isinstance(url.netloc, bytes) else str(url.netloc)
+    return start_span(provider_for_host(netloc), "client", attributes={
+        "http.method": request.method, "http.host": netloc, "http.path": url.path,
+    })
+
+
+def _finish_client_span(current: Span, token: Token, response=None, error: Optional[BaseException] = None) -> None:
+    if response is not None:
+        current.set_attribute("http.status_code", response.status_code)
+        current.set_status(status_for_http(response.status_code))
+    end_span(current, token, error)
+
+
+def install_httpx_tracing() -> None:
+    """
+    包装 httpx 传输层：supabase-py、各 AI 客户端和临时 AsyncClient 都走这里
+
+    span 覆盖到响应头返回为止（流式下载的读取体时间不计入）。
+    """
+    global _httpx_installed
+    if _httpx_installed or not TRACING_ENABLED:
+        return
+    import httpx
+
+    sync_handle = httpx.HTTPTransport.handle_request
+    async_handle = httpx.AsyncHTTPTransport.handle_async_request
+
+    def handle_request(self, request):
+        current, token = _client_span(request)
+        try:
+            response = sync_handle(self, request)
+        except BaseException as e:
+            _finish_client_span(current, token, error=e)
+            raise
+        _finish_client_span(current, token, response)
+        return response
+
+    async def handle_async_request(self, request):
+        current, token = _client_span(request)
+        try:
+            response = await async_handle(self, request)
+        except BaseException as e:
+            _finish_client_span(current, token, error=e)
+            raise
+        _finish_client_span(current, token, response)
+        return response
+
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+    _httpx_installed = True
+
+
+# ============================================
+# 子进程（FFmpeg / ffprobe）
+# ============================================
+
+@contextmanager
+def subprocess_span(cmd: Sequence[str], op: str, **attributes) -> Iterator[Span]:
+    """span 名为 <程序>.<操作>，如 ffmpeg.render / ffprobe.metadata"""
+    program = os.path.basename(str(cmd[0])) if cmd else "subprocess"
+    with span(f"{program}.{op}", "subprocess", **attributes) as current:
+        yield current
+
+
+def traced_run(cmd: Sequence[str], op: str, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run 的追踪版本；非零退出码记为 error（不抛异常，行为与 subprocess.run 相同）"""
+    with subprocess_span(cmd, op) as current:
+        result = subprocess.run(cmd, **kwargs)
+        current.set_attribute("returncode", result.returncode)
+        if result.returncode != 0:
+            current.set_status("error")
+        return result
+
+
+def setup_tracing() -> None:
+    """API 进程启动时调用：httpx 挂钩 + OTLP 导出"""
+    if not TRACING_ENABLED:
+        return
+    install_httpx_tracing()
+    _install_otlp_exporter()
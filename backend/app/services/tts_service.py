@@ -6,12 +6,25 @@ Lepus AI - TTS 语音合成服务
 1. 文本转语音 (TTS) - 使用预设音色
 2. 声音克隆 - 上传音频样本克隆声音
 3. 音色列表 - 获取可用预设音色
+
+TTS 按句切分合成:
+- 每句独立请求 Fish Audio（WAV/PCM），信号量限制并发
+- 句级结果落盘缓存，key = (text, model_id, speed, format)；总大小受 TTS_CACHE_MAX_BYTES 约束，按最近使用淘汰
+- PCM 帧直接拼接（无编码器 padding，真正无缝），最后一次性编码为目标格式
+- 时长由 PCM 帧数精确计算，不再按字数估算
+修改一句文案后重新生成，只有被改的那一句会重新请求 API。
 """
 import os
+import io
+import re
+import json
+import wave
+import uuid
 import httpx
+import asyncio
+import hashlib
 import logging
-import tempfile
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -23,6 +36,28 @@ logger = logging.getLogger(__name__)
 FISH_AUDIO_API_KEY = os.getenv("FISH_AUDIO_API_KEY", "")
 FISH_AUDIO_BASE_URL = "https://api.fish.audio"
 
+# 合成结果上传的 Storage bucket
+STORAGE_BUCKET = "ai-creations"
+
+# 句级并发上限（Fish Audio 对单 key 有并发限制）
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+
+# 单句最大长度，超长句按逗号再切
+TTS_MAX_SENTENCE_CHARS = 200
+
+# 短于此长度的碎片并入前一句（避免 "嗯。" 这类碎句单独请求）
+TTS_MIN_SENTENCE_CHARS = 4
+
+# 句级中间格式：PCM WAV 才能无缝拼接 + 精确计算时长
+TTS_CHUNK_FORMAT = "wav"
+
+# 本地缓存总大小上限（字节），超出后按最近使用时间淘汰到上限的 90%
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# 句尾标点（中英文）
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)')
+_CLAUSE_END_RE = re.compile(r'(?<=[，,、：:])')
+
 # 预设音色配置 (Fish Audio 公开模型)
 # 实际使用时需要替换为真实的 model_id
 PRESET_VOICES = [
@@ -89,6 +124,217 @@ PRESET_VOICES = [
 ]
 
 
+# ============================================
+# 分句 & 缓存
+# ============================================
+
+def split_sentences(text: str) -> List[str]:
+    """
+    按句切分文本
+
+    - 按中英文句尾标点切分，标点保留在句尾
+    - 超长句按逗号再切，仍超长则硬切
+    - 过短碎片并入前一句
+
+    切分结果只依赖文本本身，同一句在不同版本文案中切出的结果一致，
+    这样句级缓存才能命中。
+    """
+    pieces: List[str] = []
+    for raw in _SENTENCE_END_RE.split(text or ""):
+        sentence = raw.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= TTS_MAX_SENTENCE_CHARS:
+            pieces.append(sentence)
+            continue
+        # 超长句：先按逗号切，再按最大长度硬切
+        buf = ""
+        for clause in _CLAUSE_END_RE.split(sentence):
+            if buf and len(buf) + len(clause) > TTS_MAX_SENTENCE_CHARS:
+                pieces.append(buf)
+                buf = ""
+            buf += clause
+            while len(buf) > TTS_MAX_SENTENCE_CHARS:
+                pieces.append(buf[:TTS_MAX_SENTENCE_CHARS])
+                buf = buf[TTS_MAX_SENTENCE_CHARS:]
+        if buf.strip():
+            pieces.append(buf.strip())
+
+    sentences: List[str] = []
+    for piece in pieces:
+        if sentences and len(piece) < TTS_MIN_SENTENCE_CHARS:
+            # 英文之间补回被切掉的空格
+            sep = " " if sentences[-1][-1].isascii() and piece[0].isascii() else ""
+            sentences[-1] += sep + piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+def tts_cache_key(text: str, model_id: str, speed: float, output_format: str) -> str:
+    """
+    缓存 key: (text, model_id, speed, format) 的 sha256
+
+    只包含真正发给 Fish Audio 的参数；pitch 不被 API 支持，放进 key 只会产生内容相同的重复条目。
+    """
+    payload = json.dumps(
+        [text, model_id, round(float(speed), 3), output_format],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def wav_duration(wav_bytes: bytes) -> float:
+    """由 WAV 头和帧数计算精确时长（秒）"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        rate = wf.getframerate()
+        return wf.getnframes() / float(rate) if rate else 0.0
+
+
+def concat_wav(chunks: List[bytes]) -> bytes:
+    """
+    无缝拼接多段 WAV
+
+    直接拼接 PCM 帧，不经过有损编码器，句与句之间没有 padding 间隙。
+    所有分段必须是相同的采样率/声道/位深（同一模型输出天然一致）。
+    """
+    out = io.BytesIO()
+    writer: Optional[wave.Wave_write] = None
+    params = None
+    for chunk in chunks:
+        with wave.open(io.BytesIO(chunk), "rb") as wf:
+            chunk_params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate())
+            if writer is None:
+                params = chunk_params
+                writer = wave.open(out, "wb")
+                writer.setnchannels(params[0])
+                writer.setsampwidth(params[1])
+                writer.setframerate(params[2])
+            elif chunk_params != params:
+                raise ValueError(f"WAV 参数不一致，无法拼接: {chunk_params} != {params}")
+            writer.writeframes(wf.readframes(wf.getnframes()))
+    if writer is None:
+        raise ValueError("没有可拼接的音频")
+    writer.close()
+    return out.getvalue()
+
+
+class TTSCache:
+    """
+    TTS 本地持久化缓存
+
+    目录结构（位于 settings.cache_dir/tts 下）:
+        chunks/<key[:2]>/<key>.wav     句级音频（PCM WAV）
+        results/<key[:2]>/<key>.json   整段合成结果（audio_url + duration）
+
+    写入先落临时文件再 os.replace，多进程并发写入也不会读到半个文件。
+    命中时刷新文件 mtime；写入后总大小超过 max_bytes 则按 mtime 从旧到新删除（LRU）。
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self._root = root
+        self.max_bytes = max_bytes or TTS_CACHE_MAX_BYTES
+        # 本进程估算的缓存总大小（首次写入时扫描目录初始化，淘汰时按实际扫描结果校正）
+        self._size: Optional[int] = None
+
+    @property
+    def root(self) -> str:
+        """缓存根目录（延迟读取配置）"""
+        if self._root is None:
+            from ..config import get_settings
+            self._root = os.path.join(get_settings().cache_dir or "/tmp/lepus_cache", "tts")
+        return self._root
+
+    def _path(self, kind: str, key: str, ext: str) -> str:
+        return os.path.join(self.root, kind, key[:2], f"{key}.{ext}")
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """刷新 mtime，作为最近使用时间"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """列出缓存文件 (mtime, size, path)，忽略写入中的临时文件"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _account(self, added: int) -> None:
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += added
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        """按 mtime 从旧到新删除，直到总大小降到上限的 90%"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        logger.info(f"[TTS] 缓存淘汰 {removed} 个文件，当前 {total / 1024 / 1024:.1f}MB")
+
+    def get_chunk(self, key: str) -> Optional[bytes]:
+        path = self._path("chunks", key, TTS_CHUNK_FORMAT)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return audio
+
+    def put_chunk(self, key: str, audio: bytes) -> None:
+        self._atomic_write(self._path("chunks", key, TTS_CHUNK_FORMAT), audio)
+        self._account(len(audio))
+
+    def get_result(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path("results", key, "json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._touch(path)
+        return result
+
+    def put_result(self, key: str, result: Dict[str, Any]) -> None:
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self._atomic_write(self._path("results", key, "json"), data)
+        self._account(len(data))
+
+
 # ============================================
 # TTS 服务类
 # ============================================
@@ -96,9 +342,36 @@ PRESET_VOICES = [
 class TTSService:
     """文本转语音服务"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        cache: TTSCache = None,
+        max_concurrency: int = None,
+        storage_client=None,
+    ):
         self.api_key = api_key or FISH_AUDIO_API_KEY
         self.base_url = FISH_AUDIO_BASE_URL
+        self.cache = cache or TTSCache()
+        self.max_concurrency = max_concurrency or TTS_MAX_CONCURRENCY
+        self._storage_client = storage_client
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """延迟初始化 HTTP 客户端（连接复用，句级并发请求共享连接池）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=60.0,
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2),
+            )
+        return self._client
+    
+    async def close(self):
+        """关闭 HTTP 客户端"""
+        if self._client and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
     
     def _get_headers(self) -> Dict[str, str]:
         """获取请求头"""
@@ -160,7 +433,7 @@ class TTSService:
             voice_id: 预设音色 ID（与 model_id 二选一）
             model_id: Fish Audio 模型 ID（与 voice_id 二选一）
             speed: 语速 (0.5 - 2.0)
-            pitch: 音调 (-12 - 12)
+            pitch: 音调 (-12 - 12)，Fish Audio 暂不支持，不参与合成与缓存
             output_format: 输出格式 ('mp3', 'wav', 'opus')
         
         Returns:
@@ -190,77 +463,148 @@ class TTSService:
                 "mock": True,
             }
         
-        # 调用 Fish Audio API
+        # 整段结果缓存：文案和参数完全一致时直接复用已上传的音频
+        result_key = tts_cache_key(text, model_id, speed, output_format)
+        cached = self.cache.get_result(result_key)
+        if cached:
+            logger.info(f"[TTS] 整段缓存命中: {result_key[:12]}, 时长 {cached['duration']:.2f}s")
+            return {**cached, "text": text, "cached": True}
+        
+        sentences = split_sentences(text)
+        if not sentences:
+            raise ValueError("文本为空，无法合成语音")
+        
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/v1/tts",
-                    headers=self._get_headers(),
-                    json={
-                        "text": text,
-                        "reference_id": model_id,
-                        "format": output_format,
-                        "latency": "normal",  # 'normal' | 'balanced' | 'low'
-                        # Fish Audio 特定参数
-                        "chunk_length": 200,
-                        "normalize": True,
-                    }
-                )
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"[TTS] API 错误: {response.status_code} - {error_text}")
-                    raise Exception(f"TTS API 错误: {error_text}")
-                
-                # Fish Audio 直接返回音频流
-                audio_content = response.content
-                
-                # 保存到临时文件并上传到存储
-                audio_url = await self._save_audio(audio_content, output_format)
-                
-                # 估算时长（实际应该解析音频文件）
-                duration = len(text) * 0.15
-                
-                logger.info(f"[TTS] 语音生成成功: {len(audio_content)} bytes, 预估时长 {duration:.1f}s")
-                
-                return {
-                    "audio_url": audio_url,
-                    "duration": duration,
-                    "text": text,
-                }
-                
+            chunks, cached_count = await self._synthesize_sentences(sentences, model_id, speed)
         except httpx.TimeoutException:
             raise Exception("TTS 服务超时，请稍后重试")
         except Exception as e:
             logger.error(f"[TTS] 语音生成失败: {e}")
             raise
+        
+        # 无缝拼接 PCM，时长由帧数精确计算
+        wav_bytes = concat_wav(chunks)
+        duration = wav_duration(wav_bytes)
+        audio_content = await self._encode_audio(wav_bytes, output_format)
+        audio_url = await self._save_audio(audio_content, output_format)
+        
+        logger.info(
+            f"[TTS] 语音生成成功: {len(sentences)} 句 (缓存命中 {cached_count}), "
+            f"{len(audio_content)} bytes, 时长 {duration:.2f}s"
+        )
+        
+        result = {
+            "audio_url": audio_url,
+            "duration": duration,
+            "sentences": len(sentences),
+        }
+        self.cache.put_result(result_key, result)
+        
+        return {**result, "text": text, "cached_sentences": cached_count}
     
-    async def _save_audio(self, audio_content: bytes, format: str) -> str:
+    async def _synthesize_sentences(
+        self,
+        sentences: List[str],
+        model_id: str,
+        speed: float,
+    ) -> Tuple[List[bytes], int]:
         """
-        保存音频内容到存储
+        并发合成所有句子（命中缓存的句子不请求 API）
         
-        TODO: 实现上传到 Supabase Storage
+        Returns:
+            (按原顺序排列的 WAV 分段, 缓存命中句数)
         """
-        # 临时实现：保存到临时文件
-        import uuid
-        from ..tasks.ai_task_base import upload_to_storage
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        cached_count = 0
         
-        filename = f"tts_{uuid.uuid4().hex}.{format}"
+        async def _one(sentence: str) -> bytes:
+            nonlocal cached_count
+            key = tts_cache_key(sentence, model_id, speed, TTS_CHUNK_FORMAT)
+            audio = self.cache.get_chunk(key)
+            if audio is not None:
+                cached_count += 1
+                return audio
+            async with semaphore:
+                audio = await self._request_tts(sentence, model_id, speed)
+            self.cache.put_chunk(key, audio)
+            return audio
         
-        with tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False) as tmp:
-            tmp.write(audio_content)
-            tmp_path = tmp.name
+        chunks = await asyncio.gather(*[_one(s) for s in sentences])
+        return list(chunks), cached_count
+    
+    async def _request_tts(self, text: str, model_id: str, speed: float) -> bytes:
+        """请求 Fish Audio 合成单句，返回 WAV 字节"""
+        payload = {
+            "text": text,
+            "reference_id": model_id,
+            "format": TTS_CHUNK_FORMAT,
+            "latency": "normal",  # 'normal' | 'balanced' | 'low'
+            # Fish Audio 特定参数
+            "chunk_length": 200,
+            "normalize": True,
+        }
+        if speed and abs(speed - 1.0) > 1e-3:
+            payload["prosody"] = {"speed": speed}
         
-        try:
-            # 上传到 Supabase Storage
-            storage_path = f"tts_audio/{filename}"
-            url = upload_to_storage(tmp_path, storage_path)
-            return url
-        finally:
-            # 清理临时文件
-            import os
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+        response = await self.client.post("/v1/tts", headers=self._get_headers(), json=payload)
+        
+        if response.status_code != 200:
+            error_text = response.text
+            logger.error(f"[TTS] API 错误: {response.status_code} - {error_text}")
+            raise Exception(f"TTS API 错误: {error_text}")
+        
+        # Fish Audio 直接返回音频流
+        return response.content
+    
+    async def _encode_audio(self, wav_bytes: bytes, output_format: str) -> bytes:
+        """把拼接好的 WAV 一次性编码为目标格式（wav 直接返回）"""
+        if output_format == "wav":
+            return wav_bytes
+        
+        codec_args = {
+            "mp3": ["-c:a", "libmp3lame", "-b:a", "192k", "-f", "mp3"],
+            "opus": ["-c:a", "libopus", "-b:a", "96k", "-f", "ogg"],
+        }.get(output_format)
+        if codec_args is None:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "wav", "-i", "pipe:0",
+            *codec_args, "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate(wav_bytes)
+        if proc.returncode != 0:
+            raise Exception(f"TTS 音频编码失败: {stderr.decode(errors='ignore')[:300]}")
+        return stdout
+    
+    async def _save_audio(self, audio_content: bytes, format: str) -> str:
+        """
+        上传合成音频到 Supabase Storage，返回公开 URL
+        
+        音频已经完整在内存中，直接以字节上传，不再落临时文件。
+        """
+        storage = self._storage_client
+        if storage is None:
+            from .supabase_client import supabase as storage
+        
+        storage_path = f"tts_audio/tts_{uuid.uuid4().hex}.{format}"
+        content_type = {
+            "mp3": "audio/mpeg",
+            "wav": "audio/wav",
+            "opus": "audio/ogg",
+        }.get(format, "application/octet-stream")
+        bucket = storage.storage.from_(STORAGE_BUCKET)
+        await asyncio.to_thread(
+            bucket.upload,
+            storage_path,
+            audio_content,
+            {"content-type": content_type, "upsert": "true"},
+        )
+        return bucket.get_public_url(storage_path)
     
     # ========================================
     # 声音克隆
@@ -24,11 +24,14 @@ API 流程：
 """
 
 import os
+import json
 import uuid
+import shutil
 import asyncio
+import bisect
 import logging
 import tempfile
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from datetime import datetime
 from dataclasses import dataclass
 from enum import Enum
@@ -40,6 +43,145 @@ from .supabase_client import supabase
 logger = logging.getLogger(__name__)
 
 
+# 分片并发提交数（同时在 Kling 处理中的分片上限）
+SEGMENT_MAX_IN_FLIGHT = int(os.getenv("VIDEO_REPLACE_SEGMENT_CONCURRENCY", "3"))
+# 分片起点与关键帧的最大偏差（约 1 帧），在此范围内直接流复制裁剪
+KEYFRAME_SNAP_TOLERANCE_SEC = 0.05
+# 规划裁剪时分片边界向最近关键帧移动的上限（毫秒），超出则保留原边界并重编码
+KEYFRAME_SNAP_MAX_SHIFT_MS = int(os.getenv("VIDEO_REPLACE_KEYFRAME_SNAP_MS", "500"))
+# 本地并发裁剪数（ffmpeg 进程数上限）
+SEGMENT_CUT_CONCURRENCY = int(os.getenv("VIDEO_REPLACE_CUT_CONCURRENCY", str(os.cpu_count() or 2)))
+
+
+# ==========================================
+# FFmpeg 工具函数
+# ==========================================
+
+async def probe_keyframe_times(video_path: str) -> List[float]:
+    """读取视频流关键帧时间点（只读 packet 标记，不解码）"""
+    from app.utils.ffmpeg import run_ffmpeg
+    
+    stdout = await run_ffmpeg([
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ], "ffprobe 读取关键帧失败")
+    keyframes = []
+    for line in stdout.decode(errors="ignore").splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keyframes.append(float(pts))
+            except ValueError:
+                continue
+    return sorted(keyframes)
+
+
+def build_segment_cut_command(
+    input_path: str,
+    output_path: str,
+    start_sec: float,
+    duration_sec: float,
+    keyframes: List[float],
+) -> Tuple[List[str], bool]:
+    """
+    构建分片裁剪命令
+
+    起点落在关键帧上（误差 ≤ KEYFRAME_SNAP_TOLERANCE_SEC）时流复制，不重编码；
+    否则输入级 seek 后只重编码该分片。
+
+    Returns:
+        (ffmpeg 命令, 是否流复制)
+    """
+    snap = next((k for k in keyframes if abs(k - start_sec) <= KEYFRAME_SNAP_TOLERANCE_SEC), None)
+    if snap is not None:
+        return [
+            "ffmpeg", "-y",
+            "-ss", f"{snap:.3f}",
+            "-i", input_path,
+            "-t", f"{duration_sec:.3f}",
+            "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            output_path,
+        ], True
+    return [
+        "ffmpeg", "-y",
+        "-ss", f"{start_sec:.3f}",
+        "-i", input_path,
+        "-t", f"{duration_sec:.3f}",
+        "-c:v", "libx264",
+        "-c:a", "aac",
+        "-preset", "fast",
+        "-movflags", "+faststart",
+        output_path,
+    ], False
+
+
+async def probe_stream_signature(video_path: str) -> Tuple:
+    """流参数签名（编码 / 分辨率 / 帧率 / 采样率等），签名一致的文件可直接 concat 流复制"""
+    from app.utils.ffmpeg import run_ffmpeg
+    
+    stdout = await run_ffmpeg([
+        "ffprobe", "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,sample_rate,channels",
+        "-of", "json",
+        video_path,
+    ], "ffprobe 读取流信息失败")
+    streams = json.loads(stdout.decode(errors="ignore") or "{}").get("streams", [])
+    return tuple(sorted(tuple(sorted(stream.items())) for stream in streams))
+
+
+def snap_segment_boundaries(
+    bounds: List[Tuple[int, int]],
+    keyframes: List[float],
+    is_valid: Optional[Callable[[float], bool]] = None,
+    max_shift_ms: int = KEYFRAME_SNAP_MAX_SHIFT_MS,
+) -> List[Tuple[int, int]]:
+    """
+    把相邻分片的共享边界吸附到最近的关键帧，使后续分片起点可以流复制裁剪
+
+    只移动内部边界（clip 首尾不变）；移动距离超过 max_shift_ms，
+    或移动后任一侧分片时长不满足 is_valid（秒）时保留原边界。
+
+    Args:
+        bounds: 按时间顺序排列的 (start_ms, end_ms)
+        keyframes: 关键帧时间点（秒，升序）
+    """
+    snapped = [list(bound) for bound in bounds]
+    key_ms = [round(k * 1000) for k in keyframes]
+    if not key_ms:
+        return [tuple(bound) for bound in snapped]
+    for prev, current in zip(snapped, snapped[1:]):
+        boundary = current[0]
+        if prev[1] != boundary:
+            continue
+        pos = bisect.bisect_left(key_ms, boundary)
+        nearest = min(key_ms[max(0, pos - 1):pos + 1], key=lambda k: abs(k - boundary))
+        if nearest == boundary or abs(nearest - boundary) > max_shift_ms:
+            continue
+        if not prev[0] < nearest < current[1]:
+            continue
+        if is_valid and not (is_valid((nearest - prev[0]) / 1000) and is_valid((current[1] - nearest) / 1000)):
+            continue
+        prev[1] = current[0] = nearest
+    return [tuple(bound) for bound in snapped]
+
+
+def build_concat_command(list_path: str, output_path: str, stream_copy: bool) -> List[str]:
+    """concat demuxer 合并命令；编码参数一致时流复制，否则重编码"""
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if stream_copy:
+        cmd += ["-c", "copy"]
+    else:
+        cmd += ["-c:v", "libx264", "-c:a", "aac", "-preset", "fast"]
+    return cmd + ["-movflags", "+faststart", output_path]
+
+
 # ==========================================
 # 数据结构
 # ==========================================
@@ -452,13 +594,15 @@ class VideoElementReplaceService:
     async def execute_background_replace_with_split(
         self,
         task_id: str,
-        progress_callback: Optional[callable] = None
+        progress_callback: Optional[callable] = None,
+        segment_video_url: Optional[str] = None,
+        auto_merge: bool = True,
     ) -> ReplaceTask:
         """
         ★★★ 执行分片任务的背景替换 ★★★
         
-        如果任务有分片信息，会先裁剪视频片段再处理。
-        处理完成后，检查是否所有分片都已完成，如果是则自动合并。
+        如果任务有分片信息，会先裁剪视频片段再处理（已预先裁剪时传入 segment_video_url）。
+        auto_merge 时处理完成后检查是否所有分片都已完成，如果是则自动合并。
         """
         task = self._tasks.get(task_id)
         if not task:
@@ -472,13 +616,14 @@ class VideoElementReplaceService:
                 logger.info(f"[VideoReplace] 执行分片任务 {task_id}: {segment_info['segment_index']+1}/{segment_info['total_segments']}")
                 
                 # 裁剪视频片段（传入 clip_id 用于解析 localhost URL）
-                segment_video_url = await self._cut_video_segment(
-                    video_url=task.video_url,
-                    start_ms=segment_info['start_ms'],
-                    end_ms=segment_info['end_ms'],
-                    task_id=task_id,
-                    clip_id=task.clip_id
-                )
+                if not segment_video_url:
+                    segment_video_url = await self._cut_video_segment(
+                        video_url=task.video_url,
+                        start_ms=segment_info['start_ms'],
+                        end_ms=segment_info['end_ms'],
+                        task_id=task_id,
+                        clip_id=task.clip_id
+                    )
                 
                 # 临时替换 video_url 为裁剪后的片段
                 original_video_url = task.video_url
@@ -489,7 +634,7 @@ class VideoElementReplaceService:
                     result = await self.execute_background_replace(task_id, progress_callback)
                     
                     # ★★★ 检查是否所有分片都已完成，如果是则合并 ★★★
-                    if result.status == ReplaceStatus.COMPLETED:
+                    if auto_merge and result.status == ReplaceStatus.COMPLETED:
                         parent_task_id = segment_info.get('parent_task_id')
                         if parent_task_id:
                             merged_url = await self.check_and_merge_segments(
@@ -517,23 +662,83 @@ class VideoElementReplaceService:
             await self._update_task_in_db(task)
             raise
     
-    async def _cut_video_segment(
+    async def execute_segment_tasks(
         self,
-        video_url: str,
-        start_ms: int,
-        end_ms: int,
-        task_id: str,
-        clip_id: Optional[str] = None
-    ) -> str:
+        task_ids: List[str],
+        progress_callback: Optional[callable] = None,
+        max_in_flight: Optional[int] = None,
+        merge: bool = True,
+    ) -> Optional[str]:
         """
-        裁剪视频片段
+        ★★★ 批量执行同一 clip 的分片任务 ★★★
+        
+        1. 原视频只下载一次，分片边界吸附到关键帧后本地裁剪（流复制）并上传
+        2. 分片并发提交 Kling，同时处理中的分片不超过 max_in_flight
+        3. merge 时全部完成后合并一次（编码一致时 concat 流复制）
         
-        使用 ffmpeg 裁剪视频，上传到临时存储，返回 URL。
+        Args:
+            task_ids: 分片任务 ID（按 segment_index 排序前后均可）
+            progress_callback: 进度回调 (progress, message)，按完成的分片数汇总
+            max_in_flight: 并发上限，默认 SEGMENT_MAX_IN_FLIGHT
+            merge: 是否合并分片结果（分片已拆成独立 clip 时不合并）
+            
+        Returns:
+            合并后的视频 URL（merge=False 时返回 None）；有分片失败时抛出异常
         """
-        import tempfile
-        from .supabase_client import get_file_url, supabase
+        tasks = [self._tasks[task_id] for task_id in task_ids if task_id in self._tasks]
+        if len(tasks) != len(task_ids):
+            raise ValueError("部分分片任务不存在")
+        tasks.sort(key=lambda t: getattr(t, 'segment_info', {}).get('segment_index', 0))
         
-        logger.info(f"[VideoReplace] 裁剪视频: {start_ms}ms - {end_ms}ms")
+        try:
+            segment_urls = await self.cut_segments_for_tasks(tasks)
+        except Exception as e:
+            logger.error(f"[VideoReplace] 分片裁剪失败: {e}")
+            for task in tasks:
+                task.status = ReplaceStatus.FAILED
+                task.error = str(e) if str(e) else repr(e)
+                task.updated_at = datetime.utcnow()
+                await self._update_task_in_db(task)
+            raise
+        
+        semaphore = asyncio.Semaphore(max(1, max_in_flight or SEGMENT_MAX_IN_FLIGHT))
+        finished = 0
+        
+        async def _run(task: ReplaceTask) -> ReplaceTask:
+            nonlocal finished
+            async with semaphore:
+                result = await self.execute_background_replace_with_split(
+                    task.id,
+                    segment_video_url=segment_urls[task.id],
+                    auto_merge=False,
+                )
+            finished += 1
+            if progress_callback:
+                await progress_callback(
+                    int(finished / len(tasks) * 90),
+                    f"已完成 {finished}/{len(tasks)} 个分片",
+                )
+            return result
+        
+        results = await asyncio.gather(*[_run(task) for task in tasks], return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise RuntimeError(f"{len(errors)}/{len(tasks)} 个分片处理失败: {errors[0]}")
+        if not merge:
+            return None
+        
+        parent_task_id = tasks[0].segment_info.get('parent_task_id') or tasks[0].id
+        merged_url = await self.merge_segment_videos(
+            [task.result_video_url for task in results],
+            parent_task_id,
+        )
+        if progress_callback:
+            await progress_callback(100, "分片已合并")
+        return merged_url
+    
+    async def _download_source_video(self, video_url: str, dest_path: str, clip_id: Optional[str] = None) -> str:
+        """下载原视频到本地（流式写盘）"""
+        from app.utils.file_transfer import download_to_file
         
         # ★★★ 治本：解析 localhost URL 为可直接访问的 URL ★★★
         resolved_url = video_url
@@ -550,67 +755,116 @@ class VideoElementReplaceService:
             else:
                 raise ValueError(f"无法下载本地 URL {video_url}，缺少 clip_id 无法解析")
         
-        # 下载原视频
-        response = await self.http_client.get(resolved_url, follow_redirects=True)
-        response.raise_for_status()
+        await download_to_file(resolved_url, dest_path, client=self.http_client)
+        return dest_path
+    
+    async def _cut_and_upload_segment(
+        self,
+        input_path: str,
+        keyframes: List[float],
+        start_ms: int,
+        end_ms: int,
+        task_id: str,
+        work_dir: str,
+    ) -> str:
+        """从本地原视频裁剪一个分片并上传，返回分片 URL"""
+        from app.utils.file_transfer import upload_file_to_storage
+        from app.utils.ffmpeg import run_ffmpeg
+        from .supabase_client import get_file_url
+        
+        output_path = os.path.join(work_dir, f"segment_{task_id[:8]}.mp4")
+        duration_seconds = (end_ms - start_ms) / 1000
+        cmd, stream_copy = build_segment_cut_command(
+            input_path, output_path, start_ms / 1000, duration_seconds, keyframes,
+        )
+        await run_ffmpeg(cmd, "ffmpeg 裁剪失败")
+        
+        # 上传到临时存储（文件句柄流式上传，在线程池中执行避免阻塞）
+        storage_path = f"temp/segments/{task_id}.mp4"
+        await asyncio.to_thread(
+            upload_file_to_storage, "clips", storage_path, output_path, "video/mp4",
+            storage_client=supabase,
+        )
+        segment_url = get_file_url("clips", storage_path, expires_in=3600)
+        
+        logger.info(
+            f"[VideoReplace] 裁剪完成: {duration_seconds:.1f}s "
+            f"({'流复制' if stream_copy else '重编码'}), URL: {segment_url[:60]}..."
+        )
+        return segment_url
+    
+    async def cut_segments_for_tasks(self, tasks: List[ReplaceTask]) -> Dict[str, str]:
+        """
+        一次下载原视频，裁剪并上传所有分片
         
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as input_file:
-            input_file.write(response.content)
-            input_path = input_file.name
+        裁剪前把相邻分片的边界吸附到关键帧（更新 segment_info），
+        同时运行的 ffmpeg 不超过 SEGMENT_CUT_CONCURRENCY 个
         
-        output_path = input_path.replace(".mp4", f"_segment_{task_id[:8]}.mp4")
+        Returns:
+            {task_id: 分片 URL}
+        """
+        from .smart_clip_splitter import is_valid_duration
         
+        if not tasks:
+            return {}
+        tasks = sorted(tasks, key=lambda t: t.segment_info.get('segment_index', 0))
+        work_dir = tempfile.mkdtemp(prefix="replace_segments_")
         try:
-            # 使用 ffmpeg 裁剪（异步执行，不阻塞事件循环）
-            start_seconds = start_ms / 1000
-            duration_seconds = (end_ms - start_ms) / 1000
-            
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", input_path,
-                "-ss", str(start_seconds),
-                "-t", str(duration_seconds),
-                "-c:v", "libx264",
-                "-c:a", "aac",
-                "-preset", "fast",
-                output_path
-            ]
-            
-            # ★★★ 使用 asyncio.create_subprocess_exec 避免阻塞 ★★★
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            input_path = await self._download_source_video(
+                tasks[0].video_url, os.path.join(work_dir, "source.mp4"), tasks[0].clip_id,
             )
-            stdout, stderr = await process.communicate()
-            if process.returncode != 0:
-                raise RuntimeError(f"ffmpeg 裁剪失败: {stderr.decode()}")
-            
-            # 上传到临时存储（在线程池中执行，避免阻塞）
-            def _read_and_upload():
-                with open(output_path, "rb") as f:
-                    segment_data = f.read()
-                supabase.storage.from_("clips").upload(
-                    storage_path,
-                    segment_data,
-                    file_options={"content-type": "video/mp4", "upsert": "true"}
-                )
+            keyframes = await probe_keyframe_times(input_path)
             
-            storage_path = f"temp/segments/{task_id}.mp4"
-            await asyncio.get_event_loop().run_in_executor(None, _read_and_upload)
+            bounds = snap_segment_boundaries(
+                [(task.segment_info['start_ms'], task.segment_info['end_ms']) for task in tasks],
+                keyframes,
+                is_valid_duration,
+            )
+            for task, (start_ms, end_ms) in zip(tasks, bounds):
+                task.segment_info.update(start_ms=start_ms, end_ms=end_ms, duration_ms=end_ms - start_ms)
             
-            # 获取公开 URL
-            segment_url = get_file_url("clips", storage_path, expires_in=3600)
+            semaphore = asyncio.Semaphore(max(1, SEGMENT_CUT_CONCURRENCY))
             
-            logger.info(f"[VideoReplace] 裁剪完成: {duration_seconds:.1f}s, URL: {segment_url[:60]}...")
-            return segment_url
+            async def _cut(task: ReplaceTask) -> str:
+                async with semaphore:
+                    return await self._cut_and_upload_segment(
+                        input_path, keyframes,
+                        task.segment_info['start_ms'], task.segment_info['end_ms'],
+                        task.id, work_dir,
+                    )
             
+            urls = await asyncio.gather(*[_cut(task) for task in tasks])
+            return {task.id: url for task, url in zip(tasks, urls)}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    async def _cut_video_segment(
+        self,
+        video_url: str,
+        start_ms: int,
+        end_ms: int,
+        task_id: str,
+        clip_id: Optional[str] = None
+    ) -> str:
+        """
+        裁剪视频片段
+        
+        下载原视频，起点在关键帧上时流复制裁剪（否则只重编码该片段），上传到临时存储，返回 URL。
+        """
+        logger.info(f"[VideoReplace] 裁剪视频: {start_ms}ms - {end_ms}ms")
+        
+        work_dir = tempfile.mkdtemp(prefix="replace_segment_")
+        try:
+            input_path = await self._download_source_video(
+                video_url, os.path.join(work_dir, "source.mp4"), clip_id,
+            )
+            keyframes = await probe_keyframe_times(input_path)
+            return await self._cut_and_upload_segment(
+                input_path, keyframes, start_ms, end_ms, task_id, work_dir,
+            )
         finally:
             # 清理临时文件
-            if os.path.exists(input_path):
-                os.unlink(input_path)
-            if os.path.exists(output_path):
-                os.unlink(output_path)
+            shutil.rmtree(work_dir, ignore_errors=True)
 
     async def merge_segment_videos(
         self,
@@ -620,6 +874,8 @@ class VideoElementReplaceService:
         """
         合并多个分片视频
         
+        分片并发下载；所有分片编码参数一致时 concat demuxer 流复制，否则重编码。
+        
         Args:
             segment_video_urls: 按顺序排列的分片视频 URL 列表
             output_task_id: 输出任务 ID（用于命名）
@@ -627,8 +883,9 @@ class VideoElementReplaceService:
         Returns:
             合并后的视频 URL
         """
-        import tempfile
-        from .supabase_client import get_file_url, supabase
+        from app.utils.file_transfer import download_to_file, upload_file_to_storage
+        from app.utils.ffmpeg import run_ffmpeg
+        from .supabase_client import get_file_url
         
         if not segment_video_urls:
             raise ValueError("没有要合并的视频")
@@ -638,77 +895,44 @@ class VideoElementReplaceService:
         
         logger.info(f"[VideoReplace] 合并 {len(segment_video_urls)} 个分片视频")
         
-        # 下载所有分片视频
-        segment_paths = []
+        work_dir = tempfile.mkdtemp(prefix="replace_merge_")
         try:
-            for i, url in enumerate(segment_video_urls):
-                response = await self.http_client.get(url, follow_redirects=True)
-                response.raise_for_status()
-                
-                with tempfile.NamedTemporaryFile(suffix=f"_seg{i}.mp4", delete=False) as f:
-                    f.write(response.content)
-                    segment_paths.append(f.name)
+            # 并发下载所有分片视频
+            segment_paths = [os.path.join(work_dir, f"seg{i}.mp4") for i in range(len(segment_video_urls))]
+            await asyncio.gather(*[
+                download_to_file(url, path, client=self.http_client)
+                for url, path in zip(segment_video_urls, segment_paths)
+            ])
             
-            # 创建 ffmpeg 合并列表
-            list_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-            for path in segment_paths:
-                list_file.write(f"file '{path}'\n")
-            list_file.close()
-            
-            # 输出文件
-            output_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+            # 编码参数一致 → 流复制
+            signatures = await asyncio.gather(*[probe_stream_signature(path) for path in segment_paths])
+            stream_copy = len(set(signatures)) == 1
             
-            # 使用 ffmpeg concat 合并（异步执行，不阻塞事件循环）
-            cmd = [
-                "ffmpeg", "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", list_file.name,
-                "-c:v", "libx264",
-                "-c:a", "aac",
-                "-preset", "fast",
-                output_path
-            ]
+            # 创建 ffmpeg 合并列表
+            list_path = os.path.join(work_dir, "concat.txt")
+            with open(list_path, "w") as list_file:
+                for path in segment_paths:
+                    list_file.write(f"file '{path}'\n")
             
-            # ★★★ 使用 asyncio.create_subprocess_exec 避免阻塞 ★★★
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            if process.returncode != 0:
-                raise RuntimeError(f"ffmpeg 合并失败: {stderr.decode()}")
+            output_path = os.path.join(work_dir, "merged.mp4")
+            await run_ffmpeg(build_concat_command(list_path, output_path, stream_copy), "ffmpeg 合并失败")
             
-            # 上传合并后的视频（在线程池中执行，避免阻塞）
+            # 上传合并后的视频（文件句柄流式上传，在线程池中执行避免阻塞）
             storage_path = f"processed/{output_task_id}_merged.mp4"
-            
-            def _read_and_upload_merged():
-                with open(output_path, "rb") as f:
-                    merged_data = f.read()
-                supabase.storage.from_("clips").upload(
-                    storage_path,
-                    merged_data,
-                    file_options={"content-type": "video/mp4", "upsert": "true"}
-                )
-            
-            await asyncio.get_event_loop().run_in_executor(None, _read_and_upload_merged)
+            await asyncio.to_thread(
+                upload_file_to_storage, "clips", storage_path, output_path, "video/mp4",
+                storage_client=supabase,
+            )
             
             # 获取公开 URL
             merged_url = get_file_url("clips", storage_path, expires_in=86400)  # 24小时有效
             
-            logger.info(f"[VideoReplace] 合并完成: {merged_url[:60]}...")
+            logger.info(f"[VideoReplace] 合并完成 ({'流复制' if stream_copy else '重编码'}): {merged_url[:60]}...")
             return merged_url
             
         finally:
             # 清理临时文件
-            for path in segment_paths:
-                if os.path.exists(path):
-                    os.unlink(path)
-            if 'list_file' in dir() and os.path.exists(list_file.name):
-                os.unlink(list_file.name)
-            if 'output_path' in dir() and os.path.exists(output_path):
-                os.unlink(output_path)
+            shutil.rmtree(work_dir, ignore_errors=True)
 
     async def check_and_merge_segments(
         self,
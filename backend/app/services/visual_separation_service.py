@@ -69,29 +69,26 @@ async def download_image(url: str) -> Image.Image:
 def generate_person_mask(image: Image.Image) -> Image.Image:
     """
     生成人物前景 mask（白色=前景，黑色=背景）
-    使用 rembg（U²-Net）模型
+    使用 rembg（U²-Net）模型，推理由常驻的分割模型池执行
 
     Args:
         image: RGBA 格式的 PIL Image
     Returns:
         L 模式的 mask 图片
     """
-    try:
-        from rembg import remove
-    except ImportError:
-        logger.error("[VisualSeparation] rembg 未安装，请运行: pip install rembg[gpu]")
-        raise RuntimeError("rembg 未安装，无法进行视觉分离")
+    from .segmentation_pool import get_segmentation_pool
+    return _postprocess_mask(get_segmentation_pool().predict_mask_sync(image))
+
 
-    # rembg only_mask=True 直接返回 alpha mask
-    rgb_image = image.convert("RGB")
-    mask = remove(rgb_image, only_mask=True)
+async def generate_person_mask_async(image: Image.Image) -> Image.Image:
+    """generate_person_mask 的异步版本（不占用事件循环的默认线程池）"""
+    from .segmentation_pool import get_segmentation_pool
+    mask = await get_segmentation_pool().predict_mask(image)
+    return _postprocess_mask(mask)
 
-    if isinstance(mask, Image.Image):
-        mask = mask.convert("L")
-    else:
-        mask = Image.fromarray(mask).convert("L")
 
-    # 形态学后处理：平滑边缘
+def _postprocess_mask(mask: Image.Image) -> Image.Image:
+    """形态学后处理：平滑边缘"""
     # 1. 轻度膨胀填充小孔洞
     mask = mask.filter(ImageFilter.MaxFilter(3))
     # 2. 高斯模糊平滑毛边
@@ -270,13 +267,13 @@ async def _analyze_image_semantics(image: Image.Image) -> Dict[str, str]:
     import json as _json
     try:
         from app.services.llm.service import get_llm_service
-        from app.utils.image_utils import pil_image_to_base64
+        from app.services.image_store import get_image_store
 
         llm = get_llm_service()
-        image_b64 = pil_image_to_base64(image.convert("RGB"), format="JPEG")
+        handle = get_image_store().put_image(image.convert("RGB"), format="JPEG")
 
         raw = await llm.analyze_image(
-            image_base64=image_b64,
+            image=handle,
             prompt=SEMANTIC_ANALYSIS_PROMPT,
             system_prompt=SEMANTIC_ANALYSIS_SYSTEM,
         )
@@ -345,10 +342,10 @@ async def separate_person_background(
     original_width, original_height = image.size
     logger.info(f"[VisualSeparation] 源图尺寸: {original_width}x{original_height}")
 
-    # 2. 并行执行：rembg 分割 + LLM 语义分析
+    # 2. 并行执行：rembg 分割（分割模型池）+ LLM 语义分析
     loop = asyncio.get_event_loop()
 
-    mask_future = loop.run_in_executor(None, generate_person_mask, image)
+    mask_future = asyncio.ensure_future(generate_person_mask_async(image))
     semantic_future = asyncio.ensure_future(_analyze_image_semantics(image))
 
     mask = await mask_future
@@ -461,7 +458,7 @@ async def separate_layers(
     original_width, original_height = image.size
 
     loop = asyncio.get_event_loop()
-    mask = await loop.run_in_executor(None, generate_person_mask, image)
+    mask = await generate_person_mask_async(image)
 
     foreground = await loop.run_in_executor(None, extract_foreground, image, mask)
     try:
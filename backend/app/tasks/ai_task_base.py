@@ -12,7 +12,6 @@ import os
 import asyncio
 import logging
 import tempfile
-import httpx
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Callable
 from uuid import uuid4
@@ -40,7 +39,7 @@ def _get_supabase():
 
 def update_ai_task(task_id: str, **updates) -> bool:
     """
-    更新任务表
+    更新任务表，进度/状态变化同时发布到 SSE 事件总线
     
     Args:
         task_id: 任务 ID
@@ -51,7 +50,10 @@ def update_ai_task(task_id: str, **updates) -> bool:
     """
     updates["updated_at"] = datetime.utcnow().isoformat()
     try:
-        _get_supabase().table("tasks").update(updates).eq("id", task_id).execute()
+        result = _get_supabase().table("tasks").update(updates).eq("id", task_id).execute()
+        if "progress" in updates or "status" in updates:
+            from ..services.task_event_bus import publish_task_rows_sync
+            publish_task_rows_sync(getattr(result, "data", None))
         return True
     except Exception as e:
         logger.error(f"[AITask] 更新任务状态失败: task_id={task_id}, error={e}")
@@ -161,7 +163,7 @@ def mark_task_failed(task_id: str, error_message: str, error_code: str = "PROCES
 
 async def download_file(url: str, dest_path: str, timeout: int = 300) -> str:
     """
-    下载文件到本地
+    流式下载文件到本地（分块写盘，中断后 Range 续传）
     
     Args:
         url: 文件 URL
@@ -171,14 +173,10 @@ async def download_file(url: str, dest_path: str, timeout: int = 300) -> str:
     Returns:
         下载后的本地路径
     """
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.get(url, follow_redirects=True)
-        response.raise_for_status()
-        
-        with open(dest_path, "wb") as f:
-            f.write(response.content)
+    from ..utils.file_transfer import download_to_file
+    result = await download_to_file(url, dest_path, timeout=timeout)
     
-    logger.info(f"[AITask] 文件下载完成: {url[:50]}... -> {dest_path}")
+    logger.info(f"[AITask] 文件下载完成: {url[:50]}... -> {dest_path} ({result.size} bytes)")
     return dest_path
 
 
@@ -188,7 +186,7 @@ def upload_to_storage(
     content_type: str = "video/mp4"
 ) -> str:
     """
-    上传文件到 Supabase Storage
+    流式上传文件到 Supabase Storage
     
     Args:
         file_path: 本地文件路径
@@ -198,17 +196,11 @@ def upload_to_storage(
     Returns:
         公开访问 URL
     """
+    from ..utils.file_transfer import upload_file_to_storage
     supabase = _get_supabase()
     
-    with open(file_path, "rb") as f:
-        file_data = f.read()
-    
     # 上传文件 (upsert=true 避免重复报错)
-    supabase.storage.from_(STORAGE_BUCKET).upload(
-        storage_path,
-        file_data,
-        file_options={"content-type": content_type, "upsert": "true"}
-    )
+    upload_file_to_storage(STORAGE_BUCKET, storage_path, file_path, content_type, storage_client=supabase)
     
     # 获取公开 URL
     public_url = supabase.storage.from_(STORAGE_BUCKET).get_public_url(storage_path)
@@ -257,7 +249,7 @@ async def download_and_upload(
         storage_path = f"ai_generated/{user_id}/{task_id}{suffix}{ext}"
         
         # 上传
-        final_url = upload_to_storage(tmp_path, storage_path, content_type)
+        final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path, content_type)
         return storage_path, final_url
         
     finally:
@@ -6,6 +6,7 @@ Lepus AI - 资源处理任务
 - 生成缩略图
 - 提取元数据
 - ★ faststart 优化（移动 moov atom 到文件开头，支持流式播放）
+- 人脸轨迹索引（PiP 避让，写入 metadata.face_track；素材就绪后由独立任务计算，不阻塞上传）
 """
 import os
 import tempfile
@@ -42,6 +43,10 @@ THUMBNAIL_COUNT = 5
 # 波形设置
 WAVEFORM_SAMPLES = 1000
 
+# 人脸轨迹：采样间隔与覆盖时长上限（超出部分按无人脸处理）
+FACE_TRACK_SAMPLE_INTERVAL_MS = int(os.getenv("FACE_TRACK_SAMPLE_INTERVAL_MS", "1000"))
+FACE_TRACK_MAX_DURATION_SEC = float(os.getenv("FACE_TRACK_MAX_DURATION_SEC", "600"))
+
 # ============================================
 # HLS 流式播放设置
 # ============================================
@@ -144,6 +149,10 @@ async def process_asset(
         
         await update_asset_record(asset_id, results)
         
+        # 素材已就绪，人脸轨迹在独立任务中计算
+        if asset_type == "video":
+            schedule_face_track(asset_id, asset_url)
+        
         if on_progress:
             on_progress(100, "处理完成")
         
@@ -171,7 +180,8 @@ def extract_metadata(file_path: str) -> dict:
             file_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "metadata", capture_output=True, text=True, timeout=30)
         
         if result.returncode != 0:
             logger.error(f"FFprobe 错误: {result.stderr}")
@@ -302,13 +312,17 @@ async def _apply_faststart_legacy(asset_id: str, video_url: str) -> Tuple[bool,
             temp_output
         ]
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        from ..services.tracing import subprocess_span
+        with subprocess_span(cmd, "faststart") as ffmpeg_span:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await process.communicate()
+            if process.returncode != 0:
+                ffmpeg_span.set_status("error")
         
         if process.returncode != 0:
             error_msg = stderr.decode()[-500:] if stderr else "Unknown error"
@@ -546,7 +560,8 @@ async def generate_hls_stream(asset_id: str, input_path: str) -> Optional[str]:
         logger.info(f"[HLS] 执行 FFmpeg 命令...")
         start_time = datetime.now()
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)  # 30 分钟超时
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "hls", capture_output=True, text=True, timeout=1800)  # 30 分钟超时
         
         if result.returncode != 0:
             logger.error(f"[HLS] FFmpeg 失败: {result.stderr[:1000]}")
@@ -955,25 +970,30 @@ async def _generate_hls_from_url_legacy(asset_id: str, video_url: str, extract_a
         
         # 异步执行 FFmpeg
         try:
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            # 创建进度读取任务
-            stderr_task = asyncio.create_task(read_ffmpeg_progress(process.stderr))
-            
-            # 等待进程完成
-            try:
-                await asyncio.wait_for(process.wait(), timeout=1800)  # 30 分钟超时
-                stderr_text = await stderr_task
-            except asyncio.TimeoutError:
-                logger.error(f"[HLS-Stream] FFmpeg 超时")
-                process.kill()
-                monitor_task.cancel()
-                shutil.rmtree(hls_temp_dir, ignore_errors=True)
-                return None
+            from ..services.tracing import subprocess_span
+            with subprocess_span(cmd, "hls_stream") as ffmpeg_span:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                # 创建进度读取任务
+                stderr_task = asyncio.create_task(read_ffmpeg_progress(process.stderr))
+                
+                # 等待进程完成
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=1800)  # 30 分钟超时
+                    stderr_text = await stderr_task
+                except asyncio.TimeoutError:
+                    logger.error(f"[HLS-Stream] FFmpeg 超时")
+                    ffmpeg_span.set_status("error")
+                    process.kill()
+                    monitor_task.cancel()
+                    shutil.rmtree(hls_temp_dir, ignore_errors=True)
+                    return None
+                if process.returncode != 0:
+                    ffmpeg_span.set_status("error")
             
             if process.returncode != 0:
                 # 从 stderr 末尾提取真正的错误信息
@@ -1137,8 +1157,9 @@ async def _generate_proxy_video_legacy(asset_id: str, input_path: str) -> str:
         
         # ★ 使用 asyncio.to_thread 避免阻塞事件循环
         import asyncio
+        from ..services.tracing import traced_run
         result = await asyncio.to_thread(
-            subprocess.run, cmd, capture_output=True, text=True, timeout=600
+            traced_run, cmd, "proxy", capture_output=True, text=True, timeout=600
         )
         
         if result.returncode != 0:
@@ -1227,7 +1248,8 @@ async def generate_thumbnail_from_url(asset_id: str, video_url: str, timestamp:
         
         logger.info(f"[Thumbnail] 开始生成缩略图: asset_id={asset_id}, timestamp={timestamp:.2f}s")
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "thumbnail", capture_output=True, text=True, timeout=120)
         
         if result.returncode != 0:
             logger.error(f"[Thumbnail] FFmpeg 失败: {result.stderr[:500]}")
@@ -1347,7 +1369,8 @@ async def generate_thumbnail(asset_id: str, input_path: str) -> str:
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "thumbnail", capture_output=True, text=True, timeout=60)
         
         if result.returncode != 0:
             logger.error(f"缩略图生成失败: {result.stderr}")
@@ -1438,7 +1461,8 @@ async def generate_image_thumbnail(asset_id: str, input_path: str) -> str:
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "image_thumbnail", capture_output=True, text=True, timeout=60)
         
         if result.returncode != 0:
             logger.error(f"图片缩略图生成失败: {result.stderr}")
@@ -1479,7 +1503,8 @@ def extract_waveform(input_path: str, samples: int = WAVEFORM_SAMPLES) -> dict:
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "waveform", capture_output=True, text=True, timeout=120)
         
         if result.returncode != 0:
             logger.error(f"波形提取失败: {result.stderr}")
@@ -1530,6 +1555,74 @@ def extract_waveform(input_path: str, samples: int = WAVEFORM_SAMPLES) -> dict:
         return None
 
 
+# ============================================
+# 人脸轨迹
+# ============================================
+
+async def build_face_track(input_path: str) -> Optional[dict]:
+    """
+    计算视频人脸轨迹索引，失败或依赖缺失时返回 None（不影响素材处理）
+    
+    采样数受 FACE_TRACK_MAX_DURATION_SEC 限制，长视频只覆盖开头部分
+    """
+    try:
+        from ..services.face_detector import get_face_detector
+    except ImportError as e:
+        logger.info(f"[FaceTrack] 人脸检测依赖未安装，跳过: {e}")
+        return None
+    
+    max_samples = max(1, int(FACE_TRACK_MAX_DURATION_SEC * 1000 / FACE_TRACK_SAMPLE_INTERVAL_MS))
+    try:
+        index = await asyncio.to_thread(
+            get_face_detector().build_track_index,
+            input_path,
+            sample_interval_ms=FACE_TRACK_SAMPLE_INTERVAL_MS,
+            max_samples=max_samples,
+        )
+        return index.to_dict() if index else None
+    except Exception as e:
+        logger.warning(f"[FaceTrack] 人脸轨迹构建失败: {e}")
+        return None
+
+
+async def process_face_track(asset_id: str, asset_url: str) -> Optional[dict]:
+    """下载素材、计算人脸轨迹并合并写入 assets.metadata.face_track"""
+    media_path = await download_media(asset_url)
+    try:
+        face_track = await build_face_track(media_path)
+    finally:
+        if os.path.exists(media_path):
+            os.remove(media_path)
+    if not face_track:
+        return None
+    
+    from ..services.supabase_client import supabase
+    
+    def _merge():
+        rows = supabase.table("assets").select("metadata").eq("id", asset_id).limit(1).execute().data or []
+        metadata = dict((rows[0].get("metadata") if rows else None) or {})
+        metadata["face_track"] = face_track
+        supabase.table("assets").update({
+            "metadata": metadata,
+            "updated_at": datetime.utcnow().isoformat(),
+        }).eq("id", asset_id).execute()
+    
+    await asyncio.to_thread(_merge)
+    logger.info(f"[FaceTrack] 已写入人脸轨迹: asset={asset_id}, samples={len(face_track.get('samples') or [])}")
+    return face_track
+
+
+def schedule_face_track(asset_id: str, asset_url: str) -> None:
+    """投递人脸轨迹任务；Celery 不可用时跳过（PiP 位置按无人脸处理）"""
+    if face_track_task is None:
+        logger.info(f"[FaceTrack] Celery 未配置，跳过人脸轨迹: asset={asset_id}")
+        return
+    try:
+        face_track_task.delay(asset_id, asset_url)
+    except Exception as e:
+        logger.warning(f"[FaceTrack] 人脸轨迹任务投递失败: asset={asset_id}, error={e}")
+
+
 # ============================================
 # 数据库更新
 # ============================================
@@ -1673,16 +1766,20 @@ async def extract_media_metadata(file_url: str) -> dict:
         ]
         
         # 使用 asyncio 运行子进程
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await asyncio.wait_for(
-            process.communicate(),
-            timeout=30  # 30 秒超时
-        )
+        from ..services.tracing import subprocess_span
+        with subprocess_span(cmd, "metadata_url") as ffprobe_span:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(),
+                timeout=30  # 30 秒超时
+            )
+            if process.returncode != 0:
+                ffprobe_span.set_status("error")
         
         if process.returncode != 0:
             logger.error(f"FFprobe URL 分析错误: {stderr.decode()}")
@@ -1763,9 +1860,17 @@ try:
             logger.error(f"资源处理任务失败: {e}")
             update_task_status(task_id, "failed", error=str(e))
             raise
+    
+    @celery_app.task(queue="gpu", ignore_result=True)
+    def face_track_task(asset_id: str, asset_url: str):
+        """Celery 人脸轨迹任务（素材就绪后执行，失败不影响素材状态）"""
+        import asyncio
+        
+        asyncio.run(process_face_track(asset_id, asset_url))
 
 except ImportError:
     logger.info("Celery 未配置，使用同步模式")
+    face_track_task = None
 
 
 # ============================================
@@ -1807,7 +1912,8 @@ async def batch_generate_sprites(
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        from ..services.tracing import traced_run
+        result = traced_run(cmd, "sprites", capture_output=True, text=True, timeout=300)
         
         if result.returncode != 0:
             logger.error(f"雪碧图生成失败: {result.stderr}")
@@ -155,7 +155,7 @@ async def _process_doubao_image_async(
             await download_file(img_url, tmp_path)
 
             storage_path = f"ai_generated/{user_id}/{ai_task_id}_doubao_{img_index}.png"
-            final_url = upload_to_storage(tmp_path, storage_path, "image/png")
+            final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path, "image/png")
 
             os.unlink(tmp_path)
 
@@ -9,6 +9,7 @@ import asyncio
 import tempfile
 import json
 import logging
+import math
 from typing import Optional
 from datetime import datetime
 
@@ -53,6 +54,10 @@ FORMAT_CODECS = {
     # 注：已移除 MOV/ProRes，社交媒体发布不需要中间格式
 }
 
+# 时间线上相邻的同源片段，源区间与时间线间隔都不超过该值（秒）时共享一个 seek 输入，
+# 只解码一次再 split；其余片段各自 seek，跳过中间内容不解码
+INPUT_SPAN_MERGE_GAP = 1.0
+
 
 # ============================================
 # 核心导出函数
@@ -99,46 +104,41 @@ async def export_project(
     logger.info(f"[Export] 导出设置: resolution={resolution}, format={output_format}, codec={codec_config['v']}, quality={quality}, fps={fps}")
     logger.info(f"[Export] Timeline: {len(timeline.get('tracks', []))} tracks, {len(timeline.get('clips', []))} clips")
     
-    import time
-    step_times = {}
+    from ..services.tracing import span
     
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with tempfile.TemporaryDirectory() as tmpdir, span("export.project", clips=len(timeline.get("clips", []))):
         try:
             # 1. 准备资源文件
             if on_progress:
                 on_progress(5, "准备媒体资源")
             
-            t0 = time.time()
-            assets_map = await prepare_assets(timeline, tmpdir)
-            step_times['1_prepare_assets'] = time.time() - t0
-            logger.info(f"[Export] ⏱️ 步骤1 准备资源: {step_times['1_prepare_assets']:.2f}秒, 共 {len(assets_map)} 个文件")
+            with span("export.prepare_assets"):
+                assets_map = await prepare_assets(timeline, tmpdir)
+            logger.info(f"[Export] 步骤1 准备资源: 共 {len(assets_map)} 个文件")
             
             # 2. 分析时间线
             if on_progress:
                 on_progress(15, "分析时间线")
             
-            t0 = time.time()
             total_duration = calculate_timeline_duration(timeline)
-            step_times['2_analyze_timeline'] = time.time() - t0
-            logger.info(f"[Export] ⏱️ 步骤2 分析时间线: {step_times['2_analyze_timeline']:.2f}秒, 总时长 {total_duration}秒")
+            logger.info(f"[Export] 步骤2 分析时间线: 总时长 {total_duration}秒")
             
             # 3. 生成滤镜图
             if on_progress:
                 on_progress(25, "构建滤镜图")
             
-            t0 = time.time()
-            filter_graph, inputs = build_filter_graph(
-                timeline=timeline,
-                assets_map=assets_map,
-                width=int(width),
-                height=int(height),
-                fps=fps,
-                watermark=watermark,
-                burn_subtitles=burn_subtitles
-            )
-            step_times['3_build_filter'] = time.time() - t0
-            logger.info(f"[Export] ⏱️ 步骤3 构建滤镜: {step_times['3_build_filter']:.2f}秒")
-            logger.info(f"[Export] 滤镜图长度: {len(filter_graph)} 字符, 输入文件数: {len(inputs)}")
+            with span("export.build_filter_graph"):
+                filter_graph, inputs = build_filter_graph(
+                    timeline=timeline,
+                    assets_map=assets_map,
+                    width=int(width),
+                    height=int(height),
+                    fps=fps,
+                    watermark=watermark,
+                    burn_subtitles=burn_subtitles,
+                    work_dir=tmpdir,
+                )
+            logger.info(f"[Export] 步骤3 滤镜图长度: {len(filter_graph)} 字符, 输入文件数: {len(inputs)}")
             
             # 4. 执行 FFmpeg 渲染
             if on_progress:
@@ -146,7 +146,6 @@ async def export_project(
             
             output_path = os.path.join(tmpdir, f"output.{output_format}")
             
-            t0 = time.time()
             await render_video(
                 inputs=inputs,
                 filter_graph=filter_graph,
@@ -160,22 +159,19 @@ async def export_project(
                 fps=fps,
                 on_progress=lambda p, m: on_progress(int(40 + p * 0.5), m) if on_progress else None
             )
-            step_times['4_ffmpeg_render'] = time.time() - t0
             output_size = os.path.getsize(output_path)
-            logger.info(f"[Export] ⏱️ 步骤4 FFmpeg渲染: {step_times['4_ffmpeg_render']:.2f}秒, 输出 {output_size/1024/1024:.2f}MB")
+            logger.info(f"[Export] 步骤4 FFmpeg渲染完成: 输出 {output_size/1024/1024:.2f}MB")
             
             # 5. 上传到存储
             if on_progress:
                 on_progress(92, "上传导出文件")
             
-            t0 = time.time()
-            export_url = await upload_export(
-                project_id=project_id,
-                output_path=output_path,
-                output_format=output_format
-            )
-            step_times['5_upload'] = time.time() - t0
-            logger.info(f"[Export] ⏱️ 步骤5 上传: {step_times['5_upload']:.2f}秒")
+            with span("export.upload", bytes=output_size):
+                export_url = await upload_export(
+                    project_id=project_id,
+                    output_path=output_path,
+                    output_format=output_format
+                )
             
             # 6. 生成导出记录
             if on_progress:
@@ -193,15 +189,7 @@ async def export_project(
             
             await save_export_record(project_id, result)
             
-            # 打印总耗时统计
-            total_time = sum(step_times.values())
-            logger.info(f"[Export] ========== 导出耗时统计 ==========")
-            for step, duration in step_times.items():
-                pct = (duration / total_time * 100) if total_time > 0 else 0
-                logger.info(f"[Export]   {step}: {duration:.2f}秒 ({pct:.1f}%)")
-            logger.info(f"[Export]   总计: {total_time:.2f}秒")
-            logger.info(f"[Export] ====================================")
-            
+            # 各步骤耗时见 [Trace] 日志 / lepus_span_duration_seconds 指标
             if on_progress:
                 on_progress(100, "导出完成")
             
@@ -217,8 +205,9 @@ async def export_project(
 # ============================================
 
 async def prepare_assets(timeline: dict, tmpdir: str) -> dict:
-    """下载并准备所有资源文件"""
+    """下载并准备所有资源文件（流式写盘，同一 URL 只下载一次）"""
     import httpx
+    from ..utils.file_transfer import download_to_file
     
     assets_map = {}
     clips = timeline.get("clips", [])
@@ -261,14 +250,10 @@ async def prepare_assets(timeline: dict, tmpdir: str) -> dict:
                 local_path = os.path.join(tmpdir, f"{uuid.uuid4().hex}{ext}")
                 
                 logger.info(f"[Export] 下载资源: {asset_url[:80]}... -> {local_path}")
-                response = await client.get(asset_url, follow_redirects=True)
-                response.raise_for_status()
-                
-                with open(local_path, 'wb') as f:
-                    f.write(response.content)
+                result = await download_to_file(asset_url, local_path, client=client)
                 
                 assets_map[asset_url] = local_path
-                logger.info(f"[Export] 下载完成，文件大小: {os.path.getsize(local_path)} bytes")
+                logger.info(f"[Export] 下载完成，文件大小: {result.size} bytes")
     
     return assets_map
 
@@ -454,6 +439,267 @@ def get_easing_expression(easing: str, t_expr: str) -> str:
         return t_expr
 
 
+def _ease(easing: str, u: float) -> float:
+    """与 get_easing_expression 一致的缓动函数（Python 端采样用）"""
+    if easing == "ease_in":
+        return u * u
+    elif easing == "ease_out":
+        return 1 - (1 - u) ** 2
+    elif easing == "ease_in_out":
+        return 2 * u * u if u < 0.5 else 1 - (-2 * u + 2) ** 2 / 2
+    elif easing == "hold":
+        return 0.0
+    return u
+
+
+def _fmt_num(value: float) -> str:
+    return f"{float(value):.10g}"
+
+
+def _keyframe_value(kf: dict, component: Optional[str], default_value) -> float:
+    """
+    取关键帧数值
+    component 为 None 时是单值属性（复合值取 x 分量），否则取复合属性的指定分量
+    """
+    if component is None:
+        value = kf.get("value", default_value)
+        if isinstance(value, dict):
+            value = value.get("x", default_value) if default_value is not None else 0
+    else:
+        value = kf.get("value", {})
+        value = value.get(component, default_value) if isinstance(value, dict) else default_value
+    return float(value) if value is not None else 0.0
+
+
+# 数值比较容差
+KEYFRAME_EPSILON = 1e-6
+
+
+def _constant_span(start, end, value: float) -> dict:
+    return {"kind": "constant", "start": start, "end": end, "a": value, "b": 0.0}
+
+
+def _linear_span(start, end, a: float, b: float) -> dict:
+    """value = a + b * t"""
+    return {"kind": "linear", "start": start, "end": end, "a": a, "b": b}
+
+
+def _classify_segment(t1: float, t2: float, v1: float, v2: float, easing: str, fps: int) -> dict:
+    """
+    把两个关键帧之间的段归类为 constant / linear / eased
+    
+    缓动段按输出帧率采样：采样点共线（含只落在 1~2 帧上的短段）时退化为线性，
+    在所有实际输出的帧上取值不变。
+    """
+    if easing == "hold" or abs(v2 - v1) < KEYFRAME_EPSILON:
+        return _constant_span(t1, t2, v1)
+    if easing not in ("ease_in", "ease_out", "ease_in_out"):
+        b = (v2 - v1) / (t2 - t1)
+        return _linear_span(t1, t2, v1 - b * t1, b)
+    
+    frames = _frame_times(t1, t2, fps)
+    values = [v1 + (v2 - v1) * _ease(easing, (ft - t1) / (t2 - t1)) for ft in frames]
+    if not values:
+        return _constant_span(t1, t2, v1)
+    if len(values) == 1 or max(values) - min(values) < KEYFRAME_EPSILON:
+        return _constant_span(t1, t2, values[0])
+    b = (values[-1] - values[0]) / (frames[-1] - frames[0])
+    a = values[0] - b * frames[0]
+    if all(abs(a + b * ft - v) < KEYFRAME_EPSILON for ft, v in zip(frames, values)):
+        return _linear_span(t1, t2, a, b)
+    return {
+        "kind": "eased", "start": t1, "end": t2,
+        "v1": v1, "v2": v2, "easing": easing,
+    }
+
+
+def _frame_times(start: float, end: float, fps: int) -> list:
+    """[start, end) 内的输出帧时间点"""
+    first = math.ceil(start * fps - KEYFRAME_EPSILON)
+    times = []
+    k = first
+    while k / fps < end - KEYFRAME_EPSILON:
+        times.append(k / fps)
+        k += 1
+    return times
+
+
+def compile_keyframe_spans(
+    keyframes: list,
+    clip_start_sec: float,
+    clip_duration_sec: float,
+    default_value: float = None,
+    component: Optional[str] = None,
+    fps: int = 30,
+) -> list:
+    """
+    把关键帧曲线编译为按时间排序的分段
+    
+    每段 {"kind": constant|linear|eased, "start", "end", ...}，时间为时间线绝对秒数，
+    第一段 start 与最后一段 end 为 None（延伸到无穷）。相邻的等值常量段会合并，
+    零时长段被丢弃。
+    
+    Args:
+        keyframes: 该属性的关键帧列表
+        clip_start_sec: clip 在时间线上的起始时间（秒）
+        clip_duration_sec: clip 的时长（秒）
+        default_value: 关键帧缺少值时的默认值
+        component: 复合属性分量 ('x' / 'y')，单值属性为 None
+        fps: 输出帧率（缓动段采样用）
+    """
+    sorted_kf = sorted(keyframes, key=lambda k: k.get("offset", 0))
+    
+    def at(offset: float) -> float:
+        return clip_start_sec + offset * clip_duration_sec
+    
+    spans = []
+    
+    def add(span: dict):
+        prev = spans[-1] if spans else None
+        if (
+            prev and prev["kind"] == "constant" and span["kind"] == "constant"
+            and abs(prev["a"] - span["a"]) < KEYFRAME_EPSILON
+        ):
+            prev["end"] = span["end"]
+            return
+        spans.append(span)
+    
+    first = sorted_kf[0]
+    add(_constant_span(None, at(first.get("offset", 0)), _keyframe_value(first, component, default_value)))
+    
+    for kf1, kf2 in zip(sorted_kf, sorted_kf[1:]):
+        t1 = at(kf1.get("offset", 0))
+        t2 = at(kf2.get("offset", 1))
+        if t2 - t1 <= KEYFRAME_EPSILON:
+            continue
+        add(_classify_segment(
+            t1, t2,
+            _keyframe_value(kf1, component, default_value),
+            _keyframe_value(kf2, component, default_value),
+            kf2.get("easing", "linear") or "linear",  # 缓动类型应用于到达该关键帧的过渡
+            fps,
+        ))
+    
+    last = sorted_kf[-1]
+    add(_constant_span(at(last.get("offset", 1)), None, _keyframe_value(last, component, default_value)))
+    
+    # 常量段合并后，前一段的 end 以后一段的 start 为准
+    for prev, span in zip(spans, spans[1:]):
+        prev["end"] = span["start"]
+    return spans
+
+
+def span_expression(span: dict) -> str:
+    """单段的 FFmpeg 表达式（t 为时间线时间）"""
+    if span["kind"] == "constant":
+        return _fmt_num(span["a"])
+    if span["kind"] == "linear":
+        sign = "-" if span["b"] < 0 else "+"
+        return f"{_fmt_num(span['a'])}{sign}{_fmt_num(abs(span['b']))}*t"
+    t1, t2 = span["start"], span["end"]
+    u = f"((t-{_fmt_num(t1)})/{_fmt_num(t2 - t1)})"
+    v1, v2 = span["v1"], span["v2"]
+    return f"({_fmt_num(v1)}+({_fmt_num(v2 - v1)})*{get_easing_expression(span['easing'], u)})"
+
+
+def span_value(span: dict, t: float) -> float:
+    """单段在时间 t 的取值"""
+    if span["kind"] != "eased":
+        return span["a"] + span["b"] * t
+    u = (t - span["start"]) / (span["end"] - span["start"])
+    return span["v1"] + (span["v2"] - span["v1"]) * _ease(span["easing"], u)
+
+
+def _span_at_time(spans: list, t: float) -> dict:
+    """返回覆盖时间 t 的分段"""
+    for span in spans:
+        if (span["start"] is None or t >= span["start"]) and (span["end"] is None or t < span["end"]):
+            return span
+    return spans[-1]
+
+
+def spans_to_expression(spans: list) -> str:
+    """
+    把分段拼成单个内联表达式（不支持命令的滤镜使用）
+    
+    只有一段时直接返回该段表达式；否则每段用 gte/lt 门控后相加
+    """
+    if len(spans) == 1:
+        return span_expression(spans[0])
+    parts = []
+    for span in spans:
+        gates = []
+        if span["start"] is not None:
+            gates.append(f"gte(t,{_fmt_num(span['start'])})")
+        if span["end"] is not None:
+            gates.append(f"lt(t,{_fmt_num(span['end'])})")
+        parts.append("*".join(gates + [f"({span_expression(span)})"]))
+    return "+".join(parts)
+
+
+class KeyframeCommandScript:
+    """
+    sendcmd 命令脚本
+    
+    多段关键帧动画不再拼成巨大的门控表达式，而是在每段开始时
+    通过 sendcmd 把目标滤镜参数切换为该段的简单表达式；
+    只接受数值的参数（如 colorchannelmixer）按输出帧率逐帧下发采样值。
+    """
+    
+    def __init__(self, fps: int):
+        self.fps = fps
+        self._commands: dict = {}  # time -> ["target param 'arg'"]
+    
+    def __len__(self) -> int:
+        return sum(len(cmds) for cmds in self._commands.values())
+    
+    def add(self, time: float, target: str, param: str, arg: str):
+        # 向下取整到微秒，避免浮点误差导致命令晚一帧触发
+        key = math.floor(time * 1e6) / 1e6
+        self._commands.setdefault(key, []).append(f"{target} {param} '{arg}'")
+    
+    def bind_expression(self, target: str, param: str, spans: list, wrap: str = "{}") -> str:
+        """每段开始时切换表达式，返回滤镜初始参数"""
+        for span in spans[1:]:
+            self.add(span["start"], target, param, wrap.format(span_expression(span)))
+        return wrap.format(span_expression(spans[0]))
+    
+    def bind_sampled(self, target: str, param: str, spans: list) -> str:
+        """常量段下发一次，其余段按输出帧逐帧下发采样值，返回滤镜初始参数"""
+        for span in spans[1:]:
+            if span["kind"] == "constant":
+                self.add(span["start"], target, param, _fmt_num(span["a"]))
+                continue
+            for ft in _frame_times(span["start"], span["end"], self.fps):
+                self.add(ft, target, param, _fmt_num(span_value(span, ft)))
+        return _fmt_num(spans[0]["a"])
+    
+    def render(self) -> str:
+        lines = []
+        for time in sorted(self._commands):
+            lines.append(f"{time:.6f} [enter] " + ", ".join(self._commands[time]) + ";")
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        return path
+
+
+def _command_filter(kind: str, commands: KeyframeCommandScript, work_dir: str, filename: str) -> str:
+    """把命令脚本写入 work_dir，返回挂到同一条滤镜链上的 sendcmd / asendcmd"""
+    script_path = commands.write(os.path.join(work_dir, filename))
+    logger.info(f"[Export] 关键帧命令 {filename}: {len(commands)} 条")
+    return f"{kind}=f='{script_path}'"
+
+
+def _timeline_delay(position: float) -> str:
+    """音频分支平移到时间线位置（amix 按时间戳混音）"""
+    if position <= 0:
+        return ""
+    return f",adelay=delays={int(round(position * 1000))}:all=1"
+
+
 def build_keyframe_expression(keyframes: list, prop: str, clip_start_sec: float, clip_duration_sec: float, default_value: float = None) -> str:
     """
     为单个属性构建关键帧插值表达式
@@ -466,74 +712,21 @@ def build_keyframe_expression(keyframes: list, prop: str, clip_start_sec: float,
         default_value: 没有关键帧时的默认值
     
     Returns:
-        FFmpeg 表达式字符串
+        FFmpeg 表达式字符串（常量 / 线性段化简为平凡表达式）
     """
     if not keyframes:
         return str(default_value) if default_value is not None else None
     
-    # 按 offset 排序
-    sorted_kf = sorted(keyframes, key=lambda k: k.get("offset", 0))
-    
     # 如果只有一个关键帧，返回常量值
-    if len(sorted_kf) == 1:
-        value = sorted_kf[0].get("value", default_value)
+    if len(keyframes) == 1:
+        value = keyframes[0].get("value", default_value)
         if isinstance(value, dict):
             # 复合值，返回 None 表示需要单独处理
             return None
         return str(value)
     
-    # 构建分段插值表达式
-    # t 是相对于 clip 的归一化时间 (0-1)
-    # 使用 FFmpeg 的 (t-clip_start)/clip_duration 来计算
-    t_expr = f"((t-{clip_start_sec})/{clip_duration_sec})"
-    
-    # 构建嵌套的 if 表达式
-    expr_parts = []
-    
-    for i in range(len(sorted_kf) - 1):
-        kf1 = sorted_kf[i]
-        kf2 = sorted_kf[i + 1]
-        
-        offset1 = kf1.get("offset", 0)
-        offset2 = kf2.get("offset", 1)
-        value1 = kf1.get("value", default_value)
-        value2 = kf2.get("value", default_value)
-        easing = kf2.get("easing", "linear")  # 缓动类型应用于到达该关键帧的过渡
-        
-        # 处理复合值
-        if isinstance(value1, dict):
-            value1 = value1.get("x", default_value) if default_value is not None else 0
-        if isinstance(value2, dict):
-            value2 = value2.get("x", default_value) if default_value is not None else 0
-        
-        # 计算该段的归一化进度
-        segment_t = f"(({t_expr}-{offset1})/({offset2}-{offset1}))"
-        eased_t = get_easing_expression(easing, segment_t)
-        
-        # 线性插值: value1 + (value2 - value1) * eased_t
-        interpolated = f"({value1}+({value2}-{value1})*{eased_t})"
-        
-        # 条件: offset1 <= t < offset2
-        condition = f"gte({t_expr},{offset1})*lt({t_expr},{offset2})"
-        expr_parts.append(f"{condition}*{interpolated}")
-    
-    # 最后一段（t >= last_offset）
-    last_kf = sorted_kf[-1]
-    last_value = last_kf.get("value", default_value)
-    if isinstance(last_value, dict):
-        last_value = last_value.get("x", default_value) if default_value is not None else 0
-    last_offset = last_kf.get("offset", 1)
-    expr_parts.append(f"gte({t_expr},{last_offset})*{last_value}")
-    
-    # 第一段之前（t < first_offset）
-    first_kf = sorted_kf[0]
-    first_value = first_kf.get("value", default_value)
-    if isinstance(first_value, dict):
-        first_value = first_value.get("x", default_value) if default_value is not None else 0
-    first_offset = first_kf.get("offset", 0)
-    expr_parts.insert(0, f"lt({t_expr},{first_offset})*{first_value}")
-    
-    return "+".join(expr_parts)
+    spans = compile_keyframe_spans(keyframes, clip_start_sec, clip_duration_sec, default_value)
+    return spans_to_expression(spans)
 
 
 def build_compound_keyframe_expression(keyframes: list, component: str, clip_start_sec: float, clip_duration_sec: float, default_value: float = 0) -> str:
@@ -550,52 +743,14 @@ def build_compound_keyframe_expression(keyframes: list, component: str, clip_sta
     if not keyframes:
         return str(default_value)
     
-    sorted_kf = sorted(keyframes, key=lambda k: k.get("offset", 0))
-    
-    if len(sorted_kf) == 1:
-        value = sorted_kf[0].get("value", {})
+    if len(keyframes) == 1:
+        value = keyframes[0].get("value", {})
         if isinstance(value, dict):
             return str(value.get(component, default_value))
         return str(default_value)
     
-    t_expr = f"((t-{clip_start_sec})/{clip_duration_sec})"
-    expr_parts = []
-    
-    for i in range(len(sorted_kf) - 1):
-        kf1 = sorted_kf[i]
-        kf2 = sorted_kf[i + 1]
-        
-        offset1 = kf1.get("offset", 0)
-        offset2 = kf2.get("offset", 1)
-        
-        v1 = kf1.get("value", {})
-        v2 = kf2.get("value", {})
-        value1 = v1.get(component, default_value) if isinstance(v1, dict) else default_value
-        value2 = v2.get(component, default_value) if isinstance(v2, dict) else default_value
-        
-        easing = kf2.get("easing", "linear")
-        segment_t = f"(({t_expr}-{offset1})/({offset2}-{offset1}))"
-        eased_t = get_easing_expression(easing, segment_t)
-        
-        interpolated = f"({value1}+({value2}-{value1})*{eased_t})"
-        condition = f"gte({t_expr},{offset1})*lt({t_expr},{offset2})"
-        expr_parts.append(f"{condition}*{interpolated}")
-    
-    # 最后一段
-    last_kf = sorted_kf[-1]
-    last_v = last_kf.get("value", {})
-    last_value = last_v.get(component, default_value) if isinstance(last_v, dict) else default_value
-    last_offset = last_kf.get("offset", 1)
-    expr_parts.append(f"gte({t_expr},{last_offset})*{last_value}")
-    
-    # 第一段之前
-    first_kf = sorted_kf[0]
-    first_v = first_kf.get("value", {})
-    first_value = first_v.get(component, default_value) if isinstance(first_v, dict) else default_value
-    first_offset = first_kf.get("offset", 0)
-    expr_parts.insert(0, f"lt({t_expr},{first_offset})*{first_value}")
-    
-    return "+".join(expr_parts)
+    spans = compile_keyframe_spans(keyframes, clip_start_sec, clip_duration_sec, default_value, component)
+    return spans_to_expression(spans)
 
 
 def get_clip_keyframes_by_property(clip_keyframes: list) -> dict:
@@ -615,10 +770,264 @@ def get_clip_keyframes_by_property(clip_keyframes: list) -> dict:
     return result
 
 
+# ============================================
+# 文本 / 字幕 → ASS 字幕层
+# ============================================
+
+# 缓动关键帧在 ASS 中拆成若干段匀速 \move / \t，每段覆盖的输出帧数
+ASS_EASED_CHUNK_FRAMES = 3
+
+
+def _escape_ass_text(text: str) -> str:
+    """转义 ASS 覆盖块括号并转换换行"""
+    return text.replace("{", "\\{").replace("}", "\\}").replace("\n", "\\N")
+
+
+def _ass_alpha(opacity: float) -> str:
+    value = int(round((1 - max(0.0, min(1.0, opacity))) * 255))
+    return f"&H{value:02X}&"
+
+
+def _ass_num(value: float) -> str:
+    return _fmt_num(round(value, 2))
+
+
+def build_caption_track(clips: list, width: int, height: int, fps: int) -> tuple:
+    """
+    把所有 text / subtitle clips 编译为一个 ASS 字幕层
+    
+    位置与 drawtext 语义一致（x/y 为文本左上角，未指定时居中）；
+    位置 / 透明度关键帧按分段拆成多个事件：常量段用 \pos，线性段用 \move 和 \t，
+    缓动段按 ASS_EASED_CHUNK_FRAMES 帧切成匀速小段。
+    
+    Returns:
+        tuple: (subtitles, styles) 供 subtitle_burn.generate_ass_content 使用
+    """
+    subtitles = []
+    styles = {}
+    style_names = {}
+    
+    for clip in clips:
+        clip_type = clip.get("clipType") or clip.get("clip_type", "video")
+        if clip_type not in ("text", "subtitle"):
+            continue
+        
+        content_text = clip.get("content_text") or clip.get("contentText") or clip.get("text")
+        if not content_text:
+            logger.warning(f"[Export] Text/Subtitle clip {clip.get('id', 'unknown')[:8]}... 没有文本内容，跳过")
+            continue
+        
+        # 时间信息
+        start_time = clip.get("start") or clip.get("start_time", 0)
+        end_time = clip.get("end") or clip.get("end_time") or 0
+        explicit_duration = clip.get("duration", 0)
+        if end_time == 0 and explicit_duration > 0:
+            end_time = start_time + explicit_duration
+        
+        duration_ms = end_time - start_time if end_time > start_time else explicit_duration
+        if duration_ms <= 0:
+            continue
+        
+        position_sec = start_time / 1000
+        duration_sec = duration_ms / 1000
+        
+        # 样式：相同字号 / 颜色的 clip 共用一个具名样式
+        text_style = clip.get("text_style") or clip.get("textStyle") or {}
+        font_size = text_style.get("fontSize", 48 if clip_type == "text" else 24)
+        font_color = "#" + text_style.get("fontColor", "#FFFFFF").lstrip("#")
+        style_key = (clip_type, font_size, font_color.upper())
+        if style_key not in style_names:
+            name = f"{clip_type.capitalize()}{len(style_names)}"
+            style_names[style_key] = name
+            style = {
+                "fontSize": font_size,
+                "fontColor": font_color,
+                "strokeWidth": 0,
+                "verticalOffset": 0,
+            }
+            if clip_type == "subtitle":
+                # 与 drawtext 的 box=1:boxcolor=black@0.5:boxborderw=5 对应
+                style.update({"boxed": True, "strokeColor": "#000000", "strokeOpacity": 0.5, "strokeWidth": 5})
+            styles[name] = style
+        style_name = style_names[style_key]
+        
+        transform = clip.get("transform") or {}
+        clip_x = transform.get("x", 0)
+        clip_y = transform.get("y", 0)
+        clip_opacity = transform.get("opacity", 1.0)
+        
+        kf_by_prop = get_clip_keyframes_by_property(clip.get("keyframes", []))
+        position_kf = kf_by_prop.get("position", [])
+        opacity_kf = kf_by_prop.get("opacity", [])
+        
+        # 锚点（\an 小键盘方位）与静态坐标
+        x_spans = y_spans = None
+        if position_kf:
+            anchor = 7
+            x_spans = compile_keyframe_spans(position_kf, position_sec, duration_sec, clip_x or width // 2, "x", fps)
+            y_spans = compile_keyframe_spans(position_kf, position_sec, duration_sec, clip_y or height // 2, "y", fps)
+        elif clip_type == "subtitle":
+            subtitle_position = text_style.get("position", "bottom")
+            if subtitle_position == "top":
+                anchor, static_xy = 8, (width / 2, int(height * 0.1))
+            elif subtitle_position == "center":
+                anchor, static_xy = 5, (width / 2, height / 2)
+            else:
+                anchor, static_xy = 8, (width / 2, int(height * 0.85))
+        else:
+            anchor = (7 if clip_y else 4) + (0 if clip_x else 1)
+            static_xy = (int(clip_x) if clip_x else width / 2, int(clip_y) if clip_y else height / 2)
+        
+        alpha_spans = (
+            compile_keyframe_spans(opacity_kf, position_sec, duration_sec, 1.0, fps=fps)
+            if opacity_kf else [_constant_span(None, None, clip_opacity)]
+        )
+        
+        tracks = [t for t in (x_spans, y_spans, alpha_spans) if t]
+        clip_end = position_sec + duration_sec
+        
+        # 各属性分段边界的并集，切分为事件
+        boundaries = {position_sec, clip_end}
+        for spans in tracks:
+            for span in spans:
+                if span["start"] is not None and position_sec < span["start"] < clip_end:
+                    boundaries.add(span["start"])
+        boundaries = sorted(boundaries)
+        
+        text = _escape_ass_text(content_text)
+        for seg_start, seg_end in zip(boundaries, boundaries[1:]):
+            mid = (seg_start + seg_end) / 2
+            active = [_span_at_time(spans, mid) for spans in tracks]
+            if any(span["kind"] == "eased" for span in active):
+                step = ASS_EASED_CHUNK_FRAMES / fps
+                cuts = [seg_start]
+                while cuts[-1] + step < seg_end - KEYFRAME_EPSILON:
+                    cuts.append(cuts[-1] + step)
+                cuts.append(seg_end)
+            else:
+                cuts = [seg_start, seg_end]
+            
+            for c0, c1 in zip(cuts, cuts[1:]):
+                tags = f"\\an{anchor}"
+                if x_spans:
+                    x_span, y_span = _span_at_time(x_spans, mid), _span_at_time(y_spans, mid)
+                    x0, x1 = span_value(x_span, c0), span_value(x_span, c1)
+                    y0, y1 = span_value(y_span, c0), span_value(y_span, c1)
+                    if abs(x1 - x0) < KEYFRAME_EPSILON and abs(y1 - y0) < KEYFRAME_EPSILON:
+                        tags += f"\\pos({_ass_num(x0)},{_ass_num(y0)})"
+                    else:
+                        tags += f"\\move({_ass_num(x0)},{_ass_num(y0)},{_ass_num(x1)},{_ass_num(y1)})"
+                else:
+                    tags += f"\\pos({_ass_num(static_xy[0])},{_ass_num(static_xy[1])})"
+                
+                alpha_span = _span_at_time(alpha_spans, mid)
+                a0, a1 = _ass_alpha(span_value(alpha_span, c0)), _ass_alpha(span_value(alpha_span, c1))
+                if a0 != "&H00&" or a1 != "&H00&":
+                    tags += f"\\alpha{a0}"
+                    if a1 != a0:
+                        tags += f"\\t(\\alpha{a1})"
+                
+                subtitles.append({
+                    "start": c0,
+                    "end": c1,
+                    "text": text,
+                    "style": style_name,
+                    "tags": "{" + tags + "}",
+                })
+    
+    return subtitles, styles
+
+
 # ============================================
 # 滤镜图构建
 # ============================================
 
+def plan_source_inputs(sources: list) -> tuple:
+    """
+    规划 FFmpeg 输入
+    
+    默认每个片段一个输入，用输入级 `-ss/-t` 快速 seek（只解码片段覆盖的内容）。
+    只有一串能被依次消费的片段才共享一次解码（split/asplit）：按时间线顺序相邻、
+    同一源文件、原速，源区间单调递增且互不重叠，源上与时间线上的间隔都不超过
+    INPUT_SPAN_MERGE_GAP。overlay / amix 按时间线同步拉取各分支，只有这样后面的
+    分支才不需要缓冲前面分支的原始帧；乱序、重复或交错的片段各自 seek。
+    
+    Args:
+        sources: [{"path", "start", "end", "position", "duration", "speed", "video": bool}]，
+                 start/end 为源时间，position/duration 为时间线位置与时长（秒）
+    
+    Returns:
+        tuple: (inputs, split_filters, refs)
+            inputs: 每个输入的命令行参数列表 ["-ss", .., "-t", .., "-i", path]
+            split_filters: split/asplit 滤镜
+            refs: 与 sources 一一对应 {"v", "a", "trim"}，
+                  v/a 为该片段可用的流标签，trim 为 (start, end) 输入内相对时间或 None
+    """
+    spans = []
+    current = None
+    for i in sorted(range(len(sources)), key=lambda i: (sources[i]["position"], i)):
+        src = sources[i]
+        start = round(src["start"], 3)
+        end = round(max(src["end"], src["start"]), 3)
+        speed = src.get("speed", 1.0)
+        timeline_start = src["position"]
+        timeline_end = timeline_start + src["duration"] / (speed if speed > 0 else 1.0)
+        joins = (
+            current is not None
+            and current["path"] == src["path"]
+            and current["shareable"] and speed == 1.0
+            and current["end"] <= start <= current["end"] + INPUT_SPAN_MERGE_GAP
+            and current["timeline_end"] - 0.001 <= timeline_start <= current["timeline_end"] + INPUT_SPAN_MERGE_GAP
+        )
+        if joins:
+            current["end"] = end
+            current["timeline_end"] = timeline_end
+            current["members"].append(i)
+        else:
+            current = {
+                "path": src["path"], "start": start, "end": end, "members": [i],
+                "timeline_end": timeline_end, "shareable": speed == 1.0,
+            }
+            spans.append(current)
+    
+    inputs = []
+    split_filters = []
+    refs = [None] * len(sources)
+    for input_idx, span in enumerate(spans):
+        inputs.append([
+            "-ss", f"{span['start']:.3f}",
+            "-t", f"{span['end'] - span['start']:.3f}",
+            "-i", span["path"],
+        ])
+        members = sorted(span["members"])
+        if len(members) == 1:
+            refs[members[0]] = {"v": f"[{input_idx}:v]", "a": f"[{input_idx}:a]", "trim": None}
+            continue
+        
+        video_members = [i for i in members if sources[i]["video"]]
+        if len(video_members) > 1:
+            labels = [f"[in{input_idx}v{k}]" for k in range(len(video_members))]
+            split_filters.append(f"[{input_idx}:v]split={len(video_members)}{''.join(labels)}")
+        else:
+            labels = [f"[{input_idx}:v]"] * len(video_members)
+        video_labels = dict(zip(video_members, labels))
+        
+        audio_labels = [f"[in{input_idx}a{k}]" for k in range(len(members))]
+        split_filters.append(f"[{input_idx}:a]asplit={len(members)}{''.join(audio_labels)}")
+        
+        for i, a_label in zip(members, audio_labels):
+            refs[i] = {
+                "v": video_labels.get(i),
+                "a": a_label,
+                "trim": (
+                    round(sources[i]["start"] - span["start"], 3),
+                    round(sources[i]["end"] - span["start"], 3),
+                ),
+            }
+    
+    return inputs, split_filters, refs
+
+
 def build_filter_graph(
     timeline: dict,
     assets_map: dict,
@@ -626,16 +1035,26 @@ def build_filter_graph(
     height: int,
     fps: int,
     watermark: Optional[dict] = None,
-    burn_subtitles: bool = False
+    burn_subtitles: bool = False,
+    work_dir: Optional[str] = None,
 ) -> tuple:
     """
     构建 FFmpeg 复杂滤镜图
     
+    Args:
+        work_dir: 临时目录。提供时多段关键帧动画编译为 sendcmd 命令脚本写入该目录，
+                  否则回退为内联门控表达式
+    
+    片段分支内的滤镜（rotate / scale / colorchannelmixer / volume）看到的是 setpts 归零后的
+    片段本地时间，关键帧按本地时间编译，命令脚本挂在该片段自己的分支上；
+    分支末尾再把时间戳平移到时间线位置。overlay 的 x/y 按时间线时间编译，
+    命令脚本挂在该 overlay 的主输入上。
+    
     Returns:
-        tuple: (filter_complex 字符串, 输入文件列表)
+        tuple: (filter_complex 字符串, 输入列表)
+            输入列表每项为一个输入的命令行参数（含 -ss/-t seek 与 -i）
     """
     
-    inputs = []
     filter_parts = []
     video_streams = []
     audio_streams = []
@@ -661,6 +1080,8 @@ def build_filter_graph(
                 clips_by_track[track_id] = []
             clips_by_track[track_id].append(clip)
     
+    # 第一遍：解析片段时间参数，收集源区间
+    media_clips = []
     for track_idx, track in enumerate(tracks):
         track_id = track.get("id")
         track_clips = clips_by_track.get(track_id, [])
@@ -683,8 +1104,6 @@ def build_filter_graph(
             logger.info(f"[Export] 处理 clip: type={clip_type}, url={asset_url[:50]}...")
             
             local_path = assets_map[asset_url]
-            input_idx = len(inputs)
-            inputs.append(local_path)
             
             # 片段参数 - 兼容 camelCase 和 snake_case
             # timeline 上的位置
@@ -715,196 +1134,271 @@ def build_filter_graph(
             else:
                 source_end = source_start + duration
             
-            volume = clip.get("volume", 1.0)
-            opacity = clip.get("opacity", 1.0)
-            is_muted = clip.get("isMuted") or clip.get("is_muted", False)
+            media_clips.append({
+                "clip": clip,
+                "clip_type": clip_type,
+                "path": local_path,
+                "position": position,
+                "duration": duration,
+                "speed": clip.get("speed", 1.0),
+                "start": source_start,
+                "end": source_end,
+                "video": clip_type == "video",
+            })
+    
+    # 每个片段输入级 seek；只有时间线上依次消费的同源片段才 split 共享解码
+    inputs, split_filters, source_refs = plan_source_inputs(media_clips)
+    filter_parts.extend(split_filters)
+    
+    # 第二遍：逐片段生成滤镜
+    for entry, ref in zip(media_clips, source_refs):
+        clip = entry["clip"]
+        clip_type = entry["clip_type"]
+        position = entry["position"]
+        duration = entry["duration"]
+        volume = clip.get("volume", 1.0)
+        opacity = clip.get("opacity", 1.0)
+        is_muted = clip.get("isMuted") or clip.get("is_muted", False)
+        
+        # ★ 变速处理
+        speed = clip.get("speed", 1.0)
+        if speed <= 0:
+            speed = 1.0
+        
+        actual_start = entry["start"]
+        actual_end = entry["end"]
+        
+        logger.info(f"[Export] Clip timing: position={position}s, duration={duration}s, source={actual_start}-{actual_end}s, speed={speed}x")
+        
+        if clip_type == "video":
+            # 视频处理滤镜
+            v_filter = ref["v"]
             
-            # ★ 变速处理
-            speed = clip.get("speed", 1.0)
-            if speed <= 0:
-                speed = 1.0
+            # 裁剪时间（输入已 seek 到源区间；共享输入时在 span 内相对裁剪）
+            if ref["trim"]:
+                v_filter += f"trim=start={ref['trim'][0]}:end={ref['trim'][1]},"
+            v_filter += "setpts=PTS-STARTPTS,"
             
-            actual_start = source_start
-            actual_end = source_end
+            # ★ 变速处理 (setpts 调整视频速度)
+            if speed != 1.0:
+                # setpts=PTS/speed 加速, setpts=PTS*speed 减速
+                # 但由于我们已经用了 setpts=PTS-STARTPTS，需要用乘法
+                pts_factor = 1.0 / speed
+                v_filter += f"setpts={pts_factor}*PTS,"
             
-            logger.info(f"[Export] Clip timing: position={position}s, duration={duration}s, source={actual_start}-{actual_end}s, speed={speed}x")
+            # 片段本地时间的关键帧命令，sendcmd 插在此处（setpts 之后、目标滤镜之前）
+            video_commands = KeyframeCommandScript(fps) if work_dir else None
+            commands_at = len(v_filter)
             
-            if clip_type == "video":
-                # 视频处理滤镜
-                v_filter = f"[{input_idx}:v]"
-                
-                # 裁剪时间
-                v_filter += f"trim=start={actual_start}:end={actual_end},setpts=PTS-STARTPTS,"
-                
-                # ★ 变速处理 (setpts 调整视频速度)
-                if speed != 1.0:
-                    # setpts=PTS/speed 加速, setpts=PTS*speed 减速
-                    # 但由于我们已经用了 setpts=PTS-STARTPTS，需要用乘法
-                    pts_factor = 1.0 / speed
-                    v_filter += f"setpts={pts_factor}*PTS,"
-                
-                # ============ 获取关键帧 ============
-                clip_keyframes = clip.get("keyframes", [])
-                kf_by_prop = get_clip_keyframes_by_property(clip_keyframes)
-                has_keyframes = len(kf_by_prop) > 0
-                
-                if has_keyframes:
-                    logger.info(f"[Export] Clip {clip.get('id', 'unknown')[:8]}... 有关键帧: {list(kf_by_prop.keys())}")
-                
-                # ============ Transform 处理 ============
-                # 使用 `or {}` 确保即使 transform 是 None 也能正常工作
-                transform = clip.get("transform") or {}
-                
-                # 1. 画面裁剪 (cropRect) - 不支持关键帧动画
-                crop_rect = transform.get("cropRect") or transform.get("crop_rect")
-                if crop_rect:
-                    crop_x = crop_rect.get("x", 0)
-                    crop_y = crop_rect.get("y", 0)
-                    crop_w = crop_rect.get("width", 1)
-                    crop_h = crop_rect.get("height", 1)
-                    v_filter += f"crop=iw*{crop_w}:ih*{crop_h}:iw*{crop_x}:ih*{crop_y},"
-                
-                # 2. 翻转 - 不支持关键帧动画
-                if transform.get("flipH"):
-                    v_filter += "hflip,"
-                if transform.get("flipV"):
-                    v_filter += "vflip,"
-                
-                # 3. 旋转 - 支持关键帧动画
-                rotation_kf = kf_by_prop.get("rotation", [])
-                if rotation_kf:
-                    # 使用关键帧动画
-                    rotation_expr = build_keyframe_expression(rotation_kf, "rotation", position, duration, 0)
-                    if rotation_expr and rotation_expr != "0":
-                        # 转换为弧度
-                        v_filter += f"rotate='({rotation_expr})*PI/180':fillcolor=black,"
-                else:
-                    # 静态旋转
-                    rotation = transform.get("rotation", 0)
-                    if rotation:
-                        rotation = rotation % 360
-                        if rotation == 90:
-                            v_filter += "transpose=1,"
-                        elif rotation == 180:
-                            v_filter += "transpose=1,transpose=1,"
-                        elif rotation == 270:
-                            v_filter += "transpose=2,"
-                        elif rotation != 0:
-                            rad = rotation * 3.14159 / 180
-                            v_filter += f"rotate={rad}:fillcolor=black,"
-                
-                # 4. 缩放 - 支持关键帧动画
-                scale_kf = kf_by_prop.get("scale", [])
-                if scale_kf:
-                    # 复合属性 scale 有 x 和 y 分量
-                    scale_x_expr = build_compound_keyframe_expression(scale_kf, "x", position, duration, 1.0)
-                    scale_y_expr = build_compound_keyframe_expression(scale_kf, "y", position, duration, 1.0)
-                    v_filter += f"scale='iw*({scale_x_expr})':'ih*({scale_y_expr})',"
-                else:
-                    clip_scale = transform.get("scale", 1.0)
-                    if clip_scale != 1.0:
-                        v_filter += f"scale=iw*{clip_scale}:ih*{clip_scale},"
-                
-                # ============ 标准处理 ============
-                # 缩放适配目标分辨率
-                v_filter += f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
-                v_filter += f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
-                
-                # ============ 美颜滤镜处理 ============
-                beauty_filter = build_beauty_filter(clip)
-                if beauty_filter:
-                    v_filter += beauty_filter + ","
-                
-                # 5. 透明度 - 支持关键帧动画
-                opacity_kf = kf_by_prop.get("opacity", [])
-                if opacity_kf:
-                    opacity_expr = build_keyframe_expression(opacity_kf, "opacity", position, duration, 1.0)
-                    if opacity_expr and opacity_expr != "1.0":
-                        v_filter += f"format=rgba,colorchannelmixer=aa='{opacity_expr}',"
-                else:
-                    if opacity < 1.0:
-                        v_filter += f"format=rgba,colorchannelmixer=aa={opacity},"
-                
-                # 帧率
-                v_filter += f"fps={fps}"
-                
-                v_filter += f"[v{clip_index}]"
-                filter_parts.append(v_filter)
-                
-                # ★ 位置动画需要在 overlay 阶段处理
-                position_kf = kf_by_prop.get("position", [])
-                
-                video_streams.append({
-                    "stream": f"[v{clip_index}]",
-                    "position": position,
-                    "duration": duration / speed if speed != 1.0 else duration,
-                    "position_keyframes": position_kf if position_kf else None,
-                    "clip_duration": duration,
-                })
-                
-                # 音频处理（视频片段的音频）
-                a_filter = f"[{input_idx}:a]"
-                a_filter += f"atrim=start={actual_start}:end={actual_end},asetpts=PTS-STARTPTS,"
-                
-                # ★ 音频变速 (atempo 只支持 0.5-2.0 范围，需要链式处理)
-                if speed != 1.0:
-                    a_filter += build_atempo_chain(speed) + ","
-                
-                # ★ 音量关键帧动画
-                volume_kf = kf_by_prop.get("volume", [])
-                if volume_kf:
-                    volume_expr = build_keyframe_expression(volume_kf, "volume", position, duration, 1.0)
-                    if is_muted:
-                        a_filter += "volume=0"
-                    else:
-                        a_filter += f"volume='{volume_expr}'"
+            # ============ 获取关键帧 ============
+            clip_keyframes = clip.get("keyframes", [])
+            kf_by_prop = get_clip_keyframes_by_property(clip_keyframes)
+            has_keyframes = len(kf_by_prop) > 0
+            
+            if has_keyframes:
+                logger.info(f"[Export] Clip {clip.get('id', 'unknown')[:8]}... 有关键帧: {list(kf_by_prop.keys())}")
+            
+            # ============ Transform 处理 ============
+            # 使用 `or {}` 确保即使 transform 是 None 也能正常工作
+            transform = clip.get("transform") or {}
+            
+            # 1. 画面裁剪 (cropRect) - 不支持关键帧动画
+            crop_rect = transform.get("cropRect") or transform.get("crop_rect")
+            if crop_rect:
+                crop_x = crop_rect.get("x", 0)
+                crop_y = crop_rect.get("y", 0)
+                crop_w = crop_rect.get("width", 1)
+                crop_h = crop_rect.get("height", 1)
+                v_filter += f"crop=iw*{crop_w}:ih*{crop_h}:iw*{crop_x}:ih*{crop_y},"
+            
+            # 2. 翻转 - 不支持关键帧动画
+            if transform.get("flipH"):
+                v_filter += "hflip,"
+            if transform.get("flipV"):
+                v_filter += "vflip,"
+            
+            # 3. 旋转 - 支持关键帧动画
+            rotation_kf = kf_by_prop.get("rotation", [])
+            rotation_spans = compile_keyframe_spans(rotation_kf, 0, duration, 0, fps=fps) if rotation_kf else None
+            if rotation_spans and video_commands is not None and len(rotation_spans) > 1:
+                # 多段动画：sendcmd 在段边界切换 angle 表达式
+                target = f"rotate@kf{clip_index}"
+                angle = video_commands.bind_expression(target, "angle", rotation_spans, "({})*PI/180")
+                v_filter += f"{target}=a='{angle}':fillcolor=black,"
+            elif rotation_kf:
+                # 使用关键帧动画
+                rotation_expr = build_keyframe_expression(rotation_kf, "rotation", 0, duration, 0)
+                if rotation_expr and rotation_expr != "0":
+                    # 转换为弧度
+                    v_filter += f"rotate='({rotation_expr})*PI/180':fillcolor=black,"
+            else:
+                # 静态旋转
+                rotation = transform.get("rotation", 0)
+                if rotation:
+                    rotation = rotation % 360
+                    if rotation == 90:
+                        v_filter += "transpose=1,"
+                    elif rotation == 180:
+                        v_filter += "transpose=1,transpose=1,"
+                    elif rotation == 270:
+                        v_filter += "transpose=2,"
+                    elif rotation != 0:
+                        rad = rotation * 3.14159 / 180
+                        v_filter += f"rotate={rad}:fillcolor=black,"
+            
+            # 4. 缩放 - 支持关键帧动画
+            scale_kf = kf_by_prop.get("scale", [])
+            scale_spans = (
+                compile_keyframe_spans(scale_kf, 0, duration, 1.0, "x", fps),
+                compile_keyframe_spans(scale_kf, 0, duration, 1.0, "y", fps),
+            ) if scale_kf else None
+            if scale_spans and video_commands is not None and max(map(len, scale_spans)) > 1:
+                target = f"scale@kf{clip_index}"
+                scale_w = video_commands.bind_expression(target, "w", scale_spans[0], "iw*({})")
+                scale_h = video_commands.bind_expression(target, "h", scale_spans[1], "ih*({})")
+                v_filter += f"{target}=w='{scale_w}':h='{scale_h}':eval=frame,"
+            elif scale_kf:
+                # 复合属性 scale 有 x 和 y 分量
+                scale_x_expr = build_compound_keyframe_expression(scale_kf, "x", 0, duration, 1.0)
+                scale_y_expr = build_compound_keyframe_expression(scale_kf, "y", 0, duration, 1.0)
+                v_filter += f"scale='iw*({scale_x_expr})':'ih*({scale_y_expr})',"
+            else:
+                clip_scale = transform.get("scale", 1.0)
+                if clip_scale != 1.0:
+                    v_filter += f"scale=iw*{clip_scale}:ih*{clip_scale},"
+            
+            # ============ 标准处理 ============
+            # 缩放适配目标分辨率
+            v_filter += f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            v_filter += f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
+            
+            # ============ 美颜滤镜处理 ============
+            beauty_filter = build_beauty_filter(clip)
+            if beauty_filter:
+                v_filter += beauty_filter + ","
+            
+            # 5. 透明度 - 支持关键帧动画
+            opacity_kf = kf_by_prop.get("opacity", [])
+            opacity_spans = compile_keyframe_spans(opacity_kf, 0, duration, 1.0, fps=fps) if opacity_kf else None
+            if opacity_spans and video_commands is not None and len(opacity_spans) > 1:
+                # colorchannelmixer 只接受数值：按输出帧下发采样值
+                target = f"colorchannelmixer@kf{clip_index}"
+                alpha = video_commands.bind_sampled(target, "aa", opacity_spans)
+                v_filter += f"format=rgba,{target}=aa={alpha},"
+            elif opacity_kf:
+                opacity_expr = build_keyframe_expression(opacity_kf, "opacity", 0, duration, 1.0)
+                if opacity_expr and opacity_expr != "1.0":
+                    v_filter += f"format=rgba,colorchannelmixer=aa='{opacity_expr}',"
+            else:
+                if opacity < 1.0:
+                    v_filter += f"format=rgba,colorchannelmixer=aa={opacity},"
+            
+            if video_commands:
+                sendcmd = _command_filter("sendcmd", video_commands, work_dir, f"keyframes_v{clip_index}.cmd")
+                v_filter = v_filter[:commands_at] + sendcmd + "," + v_filter[commands_at:]
+            
+            # 帧率
+            v_filter += f"fps={fps}"
+            
+            # 平移到时间线位置（overlay 按时间戳对齐主画面）
+            if position > 0:
+                v_filter += f",setpts=PTS+{_fmt_num(position)}/TB"
+            
+            v_filter += f"[v{clip_index}]"
+            filter_parts.append(v_filter)
+            
+            # ★ 位置动画需要在 overlay 阶段处理
+            position_kf = kf_by_prop.get("position", [])
+            
+            video_streams.append({
+                "stream": f"[v{clip_index}]",
+                "position": position,
+                "duration": duration / speed if speed != 1.0 else duration,
+                "position_keyframes": position_kf if position_kf else None,
+                "clip_duration": duration,
+            })
+            
+            # 音频处理（视频片段的音频）
+            a_filter = ref["a"]
+            if ref["trim"]:
+                a_filter += f"atrim=start={ref['trim'][0]}:end={ref['trim'][1]},"
+            a_filter += "asetpts=PTS-STARTPTS,"
+            
+            # ★ 音频变速 (atempo 只支持 0.5-2.0 范围，需要链式处理)
+            if speed != 1.0:
+                a_filter += build_atempo_chain(speed) + ","
+            
+            # ★ 音量关键帧动画
+            volume_kf = kf_by_prop.get("volume", [])
+            volume_spans = compile_keyframe_spans(volume_kf, 0, duration, 1.0, fps=fps) if volume_kf else None
+            if volume_spans and work_dir and len(volume_spans) > 1 and not is_muted:
+                audio_commands = KeyframeCommandScript(fps)
+                target = f"volume@kf{clip_index}"
+                volume_init = audio_commands.bind_expression(target, "volume", volume_spans)
+                a_filter += _command_filter("asendcmd", audio_commands, work_dir, f"keyframes_a{clip_index}.cmd") + ","
+                a_filter += f"{target}=volume='{volume_init}':eval=frame"
+            elif volume_kf:
+                volume_expr = build_keyframe_expression(volume_kf, "volume", 0, duration, 1.0)
+                if is_muted:
+                    a_filter += "volume=0"
                 else:
-                    if is_muted:
-                        a_filter += "volume=0"
-                    else:
-                        a_filter += f"volume={volume}"
-                    
-                a_filter += f"[a{clip_index}]"
-                filter_parts.append(a_filter)
-                
-                audio_streams.append({
-                    "stream": f"[a{clip_index}]",
-                    "position": position,
-                    "duration": duration / speed if speed != 1.0 else duration
-                })
-                
-            elif clip_type == "audio":
-                # 纯音频处理
-                a_filter = f"[{input_idx}:a]"
-                a_filter += f"atrim=start={actual_start}:end={actual_end},asetpts=PTS-STARTPTS,"
-                
-                # ★ 音频变速
-                if speed != 1.0:
-                    a_filter += build_atempo_chain(speed) + ","
-                
-                # ★ 静音处理
+                    a_filter += f"volume='{volume_expr}'"
+            else:
                 if is_muted:
                     a_filter += "volume=0"
                 else:
                     a_filter += f"volume={volume}"
-                    
-                a_filter += f"[a{clip_index}]"
-                filter_parts.append(a_filter)
-                
-                audio_streams.append({
-                    "stream": f"[a{clip_index}]",
-                    "position": position,
-                    "duration": duration / speed if speed != 1.0 else duration
-                })
             
-            clip_index += 1
-    
+            a_filter += _timeline_delay(position)
+            a_filter += f"[a{clip_index}]"
+            filter_parts.append(a_filter)
+            
+            audio_streams.append({
+                "stream": f"[a{clip_index}]",
+                "position": position,
+                "duration": duration / speed if speed != 1.0 else duration
+            })
+            
+        elif clip_type == "audio":
+            # 纯音频处理
+            a_filter = ref["a"]
+            if ref["trim"]:
+                a_filter += f"atrim=start={ref['trim'][0]}:end={ref['trim'][1]},"
+            a_filter += "asetpts=PTS-STARTPTS,"
+            
+            # ★ 音频变速
+            if speed != 1.0:
+                a_filter += build_atempo_chain(speed) + ","
+            
+            # ★ 静音处理
+            if is_muted:
+                a_filter += "volume=0"
+            else:
+                a_filter += f"volume={volume}"
+            
+            a_filter += _timeline_delay(position)
+            a_filter += f"[a{clip_index}]"
+            filter_parts.append(a_filter)
+            
+            audio_streams.append({
+                "stream": f"[a{clip_index}]",
+                "position": position,
+                "duration": duration / speed if speed != 1.0 else duration
+            })
+        
+        clip_index += 1
+
     # ============================================
     # 处理文本和字幕 clips (不需要下载资源)
     # ============================================
+    # 提供 work_dir 时所有 text/subtitle 编译为单个 ASS 字幕层（一个 ass 滤镜），
+    # 否则回退为每条字幕一个 drawtext
+    caption_subtitles, caption_styles = (
+        build_caption_track(clips, width, height, fps) if work_dir else ([], {})
+    )
     text_overlays = []  # 存储文本叠加信息
     
-    for clip in clips:
+    for clip in ([] if work_dir else clips):
         clip_type = clip.get("clipType") or clip.get("clip_type", "video")
         
         if clip_type not in ("text", "subtitle"):
@@ -1010,7 +1504,24 @@ def build_filter_graph(
         
         output_label = f"[ov{i}]"
         
-        if position_kf and len(position_kf) > 0:
+        position_spans = (
+            compile_keyframe_spans(position_kf, pos, clip_duration, 0, "x", fps),
+            compile_keyframe_spans(position_kf, pos, clip_duration, 0, "y", fps),
+        ) if position_kf else None
+        
+        if position_spans and work_dir and max(map(len, position_spans)) > 1:
+            # 多段位置动画：overlay 主输入上的 sendcmd 按时间线时间切换 x/y 表达式
+            overlay_commands = KeyframeCommandScript(fps)
+            target = f"overlay@kf{i}"
+            x_expr = overlay_commands.bind_expression(target, "x", position_spans[0])
+            y_expr = overlay_commands.bind_expression(target, "y", position_spans[1])
+            sendcmd = _command_filter("sendcmd", overlay_commands, work_dir, f"keyframes_ov{i}.cmd")
+            filter_parts.append(f"{current_video}{sendcmd}[ovcmd{i}]")
+            overlay_filter = f"[ovcmd{i}]{stream}{target}="
+            overlay_filter += f"x='{x_expr}':y='{y_expr}':"
+            overlay_filter += f"enable='between(t,{pos},{pos + dur})'"
+            overlay_filter += output_label
+        elif position_kf and len(position_kf) > 0:
             # 有位置关键帧 - 使用动态 x/y 表达式
             x_expr = build_compound_keyframe_expression(position_kf, "x", pos, clip_duration, 0)
             y_expr = build_compound_keyframe_expression(position_kf, "y", pos, clip_duration, 0)
@@ -1029,6 +1540,20 @@ def build_filter_graph(
         filter_parts.append(overlay_filter)
         current_video = output_label
     
+    # ★ 文本/字幕：单个 ASS 字幕层
+    if caption_subtitles:
+        from .subtitle_burn import generate_ass_content
+        
+        ass_path = os.path.join(work_dir, "captions.ass")
+        with open(ass_path, "w", encoding="utf-8") as f:
+            f.write(generate_ass_content(
+                caption_subtitles, {}, width, height,
+                extra_styles=caption_styles, round_times=True,
+            ))
+        filter_parts.append(f"{current_video}ass=filename='{ass_path}'[captions]")
+        current_video = "[captions]"
+        logger.info(f"[Export] 字幕层: {len(caption_subtitles)} 个 ASS 事件, {len(caption_styles)} 个样式")
+    
     # ★ 添加文本/字幕叠加
     for i, txt in enumerate(text_overlays):
         output_label = f"[txt{i}]"
@@ -1154,9 +1679,12 @@ async def render_video(
     # 限制线程数，减少并行内存占用（不影响输出质量）
     cmd.extend(["-threads", "2"])
     
-    # 添加输入文件
+    # 添加输入（文件路径，或带 -ss/-t 的输入参数列表）
     for input_file in inputs:
-        cmd.extend(["-i", input_file])
+        if isinstance(input_file, (list, tuple)):
+            cmd.extend(input_file)
+        else:
+            cmd.extend(["-i", input_file])
     
     # 复杂滤镜
     cmd.extend(["-filter_complex", filter_graph])
@@ -1198,26 +1726,32 @@ async def render_video(
     
     logger.info(f"FFmpeg 命令: {' '.join(cmd)}")
     
-    # 使用 asyncio subprocess 执行，避免阻塞事件循环
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.DEVNULL,  # 不缓存 stdout，节省内存
-        stderr=asyncio.subprocess.PIPE,
-    )
-    
-    # 流式读取 stderr，避免一次性加载全部日志到内存
-    stderr_lines = []
-    max_error_lines = 100  # 只保留最后 100 行用于错误诊断
-    
-    async for line in process.stderr:
-        decoded_line = line.decode(errors='ignore').strip()
-        if decoded_line:
-            stderr_lines.append(decoded_line)
-            # 只保留最后的错误信息，避免内存堆积
-            if len(stderr_lines) > max_error_lines:
-                stderr_lines.pop(0)
+    from ..services.tracing import subprocess_span
     
-    await process.wait()
+    with subprocess_span(cmd, "render", inputs=len(inputs), codec=codec) as render_span:
+        # 使用 asyncio subprocess 执行，避免阻塞事件循环
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,  # 不缓存 stdout，节省内存
+            stderr=asyncio.subprocess.PIPE,
+        )
+        
+        # 流式读取 stderr，避免一次性加载全部日志到内存
+        stderr_lines = []
+        max_error_lines = 100  # 只保留最后 100 行用于错误诊断
+        
+        async for line in process.stderr:
+            decoded_line = line.decode(errors='ignore').strip()
+            if decoded_line:
+                stderr_lines.append(decoded_line)
+                # 只保留最后的错误信息，避免内存堆积
+                if len(stderr_lines) > max_error_lines:
+                    stderr_lines.pop(0)
+        
+        await process.wait()
+        render_span.set_attribute("returncode", process.returncode)
+        if process.returncode != 0:
+            render_span.set_status("error")
     
     if process.returncode != 0:
         error_msg = "\n".join(stderr_lines[-50:]) if stderr_lines else "Unknown error"
@@ -1237,17 +1771,22 @@ async def upload_export(
     output_path: str,
     output_format: str
 ) -> str:
-    """上传导出文件到 Supabase Storage"""
+    """流式上传导出文件到 Supabase Storage"""
     from ..services.supabase_client import supabase, get_file_url
+    from ..utils.file_transfer import upload_file_to_storage
     
     export_filename = f"exports/{project_id}/{uuid.uuid4().hex}.{output_format}"
     
-    with open(output_path, "rb") as f:
-        supabase.storage.from_("export-videos").upload(
-            export_filename,
-            f.read(),
-            {"content-type": f"video/{output_format}"}
-        )
+    # 同步上传放到线程里，避免阻塞事件循环
+    await asyncio.to_thread(
+        upload_file_to_storage,
+        "export-videos",
+        export_filename,
+        output_path,
+        f"video/{output_format}",
+        upsert=False,
+        storage_client=supabase,
+    )
     
     return get_file_url("export-videos", export_filename)
 
@@ -1324,18 +1863,12 @@ async def quick_export_segment(
     output_format: str = "mp4"
 ) -> bytes:
     """快速导出单个片段（用于预览）"""
-    import httpx
+    from ..utils.file_transfer import download_to_file
     
     with tempfile.TemporaryDirectory() as tmpdir:
-        # 下载源文件
+        # 流式下载源文件
         input_path = os.path.join(tmpdir, "input.mp4")
-        
-        async with httpx.AsyncClient(timeout=60) as client:
-            response = await client.get(asset_url, follow_redirects=True)
-            response.raise_for_status()
-            
-            with open(input_path, 'wb') as f:
-                f.write(response.content)
+        await download_to_file(asset_url, input_path, timeout=60)
         
         # 导出片段
         output_path = os.path.join(tmpdir, f"output.{output_format}")
@@ -1353,7 +1886,8 @@ async def quick_export_segment(
             output_path
         ]
         
-        subprocess.run(cmd, check=True, capture_output=True)
+        from ..services.tracing import traced_run
+        traced_run(cmd, "quick_export", check=True, capture_output=True)
         
         with open(output_path, 'rb') as f:
             return f.read()
@@ -339,7 +339,7 @@ async def _process_face_swap_async(
         await download_file(img_url, tmp_path)
 
         storage_path = f"ai_generated/{user_id}/{task_id}_face_swap.png"
-        final_url = upload_to_storage(tmp_path, storage_path, "image/png")
+        final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path, "image/png")
         os.unlink(tmp_path)
 
         asset_id = create_asset_record(
@@ -474,7 +474,7 @@ async def _generate_video_from_image(
             await download_file(video_result_url, tmp_path)
 
             storage_path = f"ai_generated/{user_id}/{task_id}_face_swap_video.mp4"
-            final_url = upload_to_storage(tmp_path, storage_path, "video/mp4")
+            final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path, "video/mp4")
             os.unlink(tmp_path)
 
             asset_id = create_asset_record(
@@ -345,7 +345,7 @@ async def _process_lip_sync_async(
         update_ai_task_progress(ai_task_id, 90, "保存到素材库")
         
         storage_path = f"ai_generated/{user_id}/{ai_task_id}.mp4"
-        final_url = upload_to_storage(tmp_path, storage_path)
+        final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path)
         
         # 清理临时文件
         os.unlink(tmp_path)
@@ -358,7 +358,7 @@ async def _process_omni_image_async(
             
             # 上传到 Supabase Storage
             storage_path = f"ai_generated/{user_id}/{ai_task_id}_omni_{img_index}.png"
-            final_url = upload_to_storage(tmp_path, storage_path, "image/png")
+            final_url = await asyncio.to_thread(upload_to_storage, tmp_path, storage_path, "image/png")
             
             # 清理临时文件
             os.unlink(tmp_path)
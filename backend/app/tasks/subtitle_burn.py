@@ -38,7 +38,10 @@ def generate_ass_style(style: dict, name: str = "Default") -> str:
     font_name = style.get("fontFamily", "Noto Sans SC")
     font_size = style.get("fontSize", 48)
     primary_color = color_to_ass(style.get("fontColor", "#FFFFFF"))
-    outline_color = color_to_ass(style.get("strokeColor", "#000000"))
+    outline_color = color_to_ass(
+        style.get("strokeColor", "#000000"),
+        style.get("strokeOpacity", 1.0)
+    )
     back_color = color_to_ass(
         style.get("backgroundColor", "#000000"),
         style.get("backgroundOpacity", 0.5)
@@ -48,6 +51,8 @@ def generate_ass_style(style: dict, name: str = "Default") -> str:
     italic = -1 if style.get("italic") else 0
     outline = style.get("strokeWidth", 2)
     shadow = 1 if style.get("shadowBlur", 0) > 0 else 0
+    # boxed: BorderStyle=3 不透明底框（底框颜色取 OutlineColour，Outline 为内边距）
+    border_style = 3 if style.get("boxed") else 1
     
     # 对齐方式映射 (ASS 使用小键盘数字)
     align_map = {
@@ -64,7 +69,7 @@ def generate_ass_style(style: dict, name: str = "Default") -> str:
     return (
         f"Style: {name},{font_name},{font_size},{primary_color},&H00FFFFFF,"
         f"{outline_color},{back_color},{bold},{italic},0,0,100,100,"
-        f"{style.get('letterSpacing', 0)},0,1,{outline},{shadow},{alignment},"
+        f"{style.get('letterSpacing', 0)},0,{border_style},{outline},{shadow},{alignment},"
         f"20,20,{margin_v},1"
     )
 
@@ -73,18 +78,42 @@ def generate_ass_content(
     subtitles: list,
     style: dict,
     video_width: int = 1920,
-    video_height: int = 1080
+    video_height: int = 1080,
+    extra_styles: Optional[dict] = None,
+    round_times: bool = False,
 ) -> str:
-    """生成完整的 ASS 字幕文件内容"""
+    """
+    生成完整的 ASS 字幕文件内容
+    
+    Args:
+        subtitles: [{"start", "end", "text", "animation"?, "style"?, "tags"?}]
+            style 为样式名（默认 Default），tags 为附加的 ASS 覆盖标签（如 \\pos / \\move）
+        style: Default 样式
+        extra_styles: 其他具名样式 {name: style}
+        round_times: 时间四舍五入到厘秒（导出拆分事件用）；默认保持截断，烧录输出不变
+    """
     
     def format_time(seconds: float) -> str:
         """转换为 ASS 时间格式 H:MM:SS.CC"""
+        if round_times:
+            # 先取整到厘秒，避免浮点误差让相邻事件出现 1cs 的缝隙
+            total_cs = int(round(seconds * 100))
+            h = total_cs // 360000
+            m = (total_cs % 360000) // 6000
+            s = (total_cs % 6000) // 100
+            cs = total_cs % 100
+            return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
         h = int(seconds // 3600)
         m = int((seconds % 3600) // 60)
         s = int(seconds % 60)
         cs = int((seconds % 1) * 100)
         return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
     
+    styles_block = "\n".join(
+        [generate_ass_style(style)]
+        + [generate_ass_style(extra, name) for name, extra in (extra_styles or {}).items()]
+    )
+    
     # ASS 文件头
     header = f"""[Script Info]
 Title: Lepus AI Subtitles
@@ -96,7 +125,7 @@ YCbCr Matrix: TV.709
 
 [V4+ Styles]
 Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-{generate_ass_style(style)}
+{styles_block}
 
 [Events]
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
@@ -120,7 +149,9 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         elif animation == "scale":
             effect = "{\\fscx0\\fscy0\\t(0,200,\\fscx100\\fscy100)}"
         
-        events.append(f"Dialogue: 0,{start},{end},Default,,0,0,0,,{effect}{text}")
+        tags = sub.get("tags", "")
+        style_name = sub.get("style", "Default")
+        events.append(f"Dialogue: 0,{start},{end},{style_name},,0,0,0,,{tags}{effect}{text}")
     
     return header + "\n".join(events)
 
@@ -0,0 +1,43 @@
+"""
+Lepus AI - 模板采集 Celery 任务
+爆款视频/图片拆解在 worker 中执行，不占用 API 进程；
+任务按阶段写检查点，worker 崩溃后重新投递时从最后完成的阶段继续。
+"""
+import asyncio
+import logging
+
+from ..celery_config import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(
+    name="app.tasks.template_ingest.process_template_ingest",
+    bind=True,
+    queue="gpu",
+    max_retries=5,
+)
+def process_template_ingest(self, job_id: str):
+    """
+    执行模板采集任务
+
+    Args:
+        job_id: template_ingest_jobs.id
+    """
+    from ..services.template_ingest_service import (
+        INGEST_STALE_AFTER_SEC,
+        IngestJobBusy,
+        get_template_ingest_service,
+    )
+
+    logger.info(f"[TemplateIngest] worker 开始处理: job_id={job_id}")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(get_template_ingest_service().process_job(job_id))
+    except IngestJobBusy as exc:
+        # 其他 worker 仍持有心跳：等心跳过期后再尝试接管
+        logger.info(f"[TemplateIngest] 任务正在其他 worker 执行，稍后重试: job_id={job_id}")
+        raise self.retry(exc=exc, countdown=INGEST_STALE_AFTER_SEC)
+    finally:
+        loop.close()
@@ -0,0 +1,103 @@
+"""
+Aho-Corasick 多模式字符串匹配
+
+一次扫描文本找出所有关键词的出现位置（含重叠），耗时 O(len(text) + 命中数)，
+与关键词数量无关。用于替代 "for kw in keywords: if kw in text" 这类逐词扫描。
+
+用法：
+    matcher = AhoCorasick(["spin", "pan", "whip"])
+    matcher.matched_ids("whip_pan_left")   # {1, 2}
+    matcher.find_all("whip_pan_left")      # [(0, 4, 2), (5, 8, 1)]
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    编译后的关键词自动机
+
+    - 模式编号即传入顺序（重复模式各自保留编号）
+    - case_insensitive=True 时模式和文本都按 str.lower() 归一化
+    """
+
+    def __init__(self, patterns: Iterable[str], case_insensitive: bool = True):
+        self.case_insensitive = case_insensitive
+        self.patterns: List[str] = [
+            p.lower() if case_insensitive else p for p in patterns
+        ]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _build(self) -> None:
+        # 1) Trie
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pattern_id)
+
+        # 2) BFS 计算 fail 指针，并把 fail 链上的输出合并到当前节点
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _iter_hits(self, text: str):
+        if self.case_insensitive:
+            text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for pattern_id in out[node]:
+                    yield i + 1, pattern_id
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """返回所有命中 [(start, end, pattern_id)]，按 end 升序，含重叠"""
+        if not text or not self.patterns:
+            return []
+        return [
+            (end - len(self.patterns[pid]), end, pid)
+            for end, pid in self._iter_hits(text)
+        ]
+
+    def matched_ids(self, text: str) -> Set[int]:
+        """返回文本中出现过的模式编号集合"""
+        if not text or not self.patterns:
+            return set()
+        return {pid for _, pid in self._iter_hits(text)}
+
+    def count(self, text: str) -> Dict[int, int]:
+        """返回每个模式的出现次数（含重叠）"""
+        counts: Dict[int, int] = {}
+        if not text or not self.patterns:
+            return counts
+        for _, pid in self._iter_hits(text):
+            counts[pid] = counts.get(pid, 0) + 1
+        return counts
@@ -0,0 +1,21 @@
+"""
+FFmpeg / ffprobe 子进程工具
+
+异步执行命令行，不阻塞事件循环；失败时把 stderr 末尾带进异常信息。
+"""
+
+import asyncio
+from typing import List
+
+
+async def run_ffmpeg(cmd: List[str], error_prefix: str) -> bytes:
+    """异步执行 ffmpeg / ffprobe，失败时抛出 RuntimeError，返回 stdout"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"{error_prefix}: {stderr.decode(errors='ignore')[-1000:]}")
+    return stdout
@@ -0,0 +1,233 @@
+"""
+流式文件传输工具
+
+下载: httpx stream + aiter_bytes 分块写盘，内存占用仅一个分块（默认 1MB）
+- 中断后按已写入字节数发送 Range 续传，服务端不支持 Range 时从头重下
+- 边写边算 sha256，可校验期望的大小 / 摘要
+- 先写 .part 临时文件，校验通过后原子替换到目标路径
+
+上传: 直接把文件句柄交给 storage3，由 httpx multipart 分块读取，不再 f.read() 整个文件
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1MB 分块
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class TransferError(Exception):
+    """传输失败（重试耗尽 / 校验不通过）"""
+    pass
+
+
+class _IncompleteBody(Exception):
+    """响应体短于声明长度，可续传"""
+    pass
+
+
+@dataclass
+class DownloadResult:
+    """下载结果"""
+    path: str
+    size: int
+    sha256: str
+    resumes: int = 0  # Range 续传次数
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (httpx.TransportError, _IncompleteBody)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _parse_content_range(value: Optional[str]) -> tuple:
+    """解析 'bytes start-end/total' → (start, total)，total 未知时为 None"""
+    if not value or not value.startswith("bytes "):
+        return None, None
+    try:
+        span, _, total = value[len("bytes "):].partition("/")
+        start = int(span.split("-", 1)[0])
+        return start, (int(total) if total and total != "*" else None)
+    except ValueError:
+        return None, None
+
+
+def _expected_total(response: httpx.Response, offset: int) -> Optional[int]:
+    """响应结束时文件应有的总字节数；有内容编码时 Content-Length 不对应解码后大小，不做判断"""
+    if response.headers.get("content-encoding", "identity") != "identity":
+        return None
+    if response.status_code == 206:
+        _, total = _parse_content_range(response.headers.get("content-range"))
+        if total is not None:
+            return total
+    length = response.headers.get("content-length")
+    if length is None or not length.isdigit():
+        return None
+    return offset + int(length)
+
+
+async def download_to_file(
+    url: str,
+    dest_path: str,
+    *,
+    client: Optional[httpx.AsyncClient] = None,
+    timeout: float = 300,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> DownloadResult:
+    """
+    流式下载文件到本地，断点续传 + 校验
+
+    Args:
+        url: 文件 URL
+        dest_path: 目标路径
+        client: 复用的 AsyncClient（批量下载时共享连接池），为空则临时创建
+        timeout: 临时 client 的超时时间（秒）
+        expected_size: 期望字节数，不一致时报错
+        expected_sha256: 期望的 sha256（hex），不一致时报错
+        max_retries: 网络错误 / 5xx / 响应截断时的最大重试次数
+        chunk_size: 分块大小
+
+    Returns:
+        DownloadResult
+
+    Raises:
+        TransferError: 重试耗尽或校验不通过
+        httpx.HTTPStatusError: 不可重试的 HTTP 错误（如 404）
+    """
+    part_path = f"{dest_path}.part"
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=timeout)
+
+    hasher = hashlib.sha256()
+    written = 0
+    resumes = 0
+    attempt = 0
+
+    try:
+        with open(part_path, "wb") as f:
+            while True:
+                headers = {"Range": f"bytes={written}-"} if written else None
+                try:
+                    async with client.stream("GET", url, headers=headers, follow_redirects=True) as response:
+                        response.raise_for_status()
+
+                        if written:
+                            start, _ = _parse_content_range(response.headers.get("content-range"))
+                            if response.status_code == 206 and start == written:
+                                resumes += 1
+                            else:
+                                # 服务端忽略了 Range → 丢弃已写内容从头开始
+                                logger.info(f"[Transfer] 服务端不支持续传，从头下载: {url[:80]}")
+                                f.seek(0)
+                                f.truncate()
+                                hasher = hashlib.sha256()
+                                written = 0
+
+                        total = _expected_total(response, written)
+                        async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            written += len(chunk)
+
+                    if total is not None and written < total:
+                        raise _IncompleteBody(f"收到 {written}/{total} bytes")
+                    break
+
+                except Exception as e:
+                    if not _is_retryable(e):
+                        raise
+                    attempt += 1
+                    if attempt > max_retries:
+                        raise TransferError(f"下载失败（已重试 {max_retries} 次）: {url[:80]}: {e}") from e
+                    logger.warning(
+                        f"[Transfer] 下载中断，{RETRY_BACKOFF_SECONDS * attempt:.0f}s 后从 {written} bytes 续传 "
+                        f"({attempt}/{max_retries}): {e}"
+                    )
+                    f.flush()
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+        digest = hasher.hexdigest()
+        if expected_size is not None and written != expected_size:
+            raise TransferError(f"文件大小不一致: 期望 {expected_size}, 实际 {written}: {url[:80]}")
+        if expected_sha256 and digest != expected_sha256.lower():
+            raise TransferError(f"sha256 校验失败: 期望 {expected_sha256}, 实际 {digest}: {url[:80]}")
+
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    return DownloadResult(path=dest_path, size=written, sha256=digest, resumes=resumes)
+
+
+def upload_file_to_storage(
+    bucket: str,
+    storage_path: str,
+    file_path: str,
+    content_type: str,
+    *,
+    upsert: bool = True,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    storage_client=None,
+) -> int:
+    """
+    流式上传本地文件到 Supabase Storage
+
+    文件句柄直接作为 multipart 的 file 字段，httpx 分块读取发送；
+    网络错误时重新打开文件整体重传（Storage 单次上传不支持续传）。
+
+    Args:
+        bucket: Storage bucket
+        storage_path: Storage 中的路径
+        file_path: 本地文件路径
+        content_type: MIME 类型
+        upsert: 是否覆盖已有文件
+        max_retries: 网络错误时的最大重试次数
+        storage_client: Supabase 客户端，为空则使用全局客户端
+
+    Returns:
+        上传的字节数
+    """
+    if storage_client is None:
+        from ..services.supabase_client import supabase as storage_client
+
+    size = os.path.getsize(file_path)
+    attempt = 0
+    while True:
+        # storage3 会原地改写 file_options，每次重试都传新的 dict
+        file_options = {"content-type": content_type}
+        if upsert:
+            file_options["upsert"] = "true"
+        try:
+            with open(file_path, "rb") as f:
+                storage_client.storage.from_(bucket).upload(storage_path, f, file_options=file_options)
+            return size
+        except httpx.TransportError as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise TransferError(f"上传失败（已重试 {max_retries} 次）: {bucket}/{storage_path}: {e}") from e
+            logger.warning(f"[Transfer] 上传中断，重试 ({attempt}/{max_retries}): {bucket}/{storage_path}: {e}")
+            # 调用方均在线程中执行（asyncio.to_thread），这里直接 sleep 不会阻塞事件循环
+            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
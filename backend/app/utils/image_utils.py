@@ -5,6 +5,9 @@
 1. 解析 Base64 Data URL 为图片数据
 2. 处理前端绘制的 mask 图片（半透明蓝色 → 黑白 mask）
 3. 将图片数据转换为 Kling AI 所需的格式
+
+管线内部传递图片请使用 app.services.image_store 的 ImageHandle，
+只在调用外部服务时编码为 base64。
 """
 
 import base64
@@ -52,18 +55,40 @@ def data_url_to_pil_image(data_url: str) -> Optional[Image.Image]:
     """
     将 Data URL 转换为 PIL Image
     
+    同一 Data URL 只解码一次（经图片句柄存储缓存），返回副本。
+    
     Args:
         data_url: Base64 Data URL
     
     Returns:
         PIL.Image 对象
     """
+    handle = data_url_to_handle(data_url)
+    if handle is None:
+        return None
+    
+    from app.services.image_store import get_image_store
+    try:
+        return get_image_store().open(handle)
+    except Exception as e:
+        logger.error(f"[ImageUtils] 图片解析失败: {e}")
+        return None
+
+
+def data_url_to_handle(data_url: str):
+    """
+    将 Data URL 写入图片句柄存储，返回 ImageHandle（解析失败返回 None）
+    
+    Args:
+        data_url: Base64 Data URL
+    """
     image_data, _ = parse_data_url(data_url)
     if not image_data:
         return None
     
+    from app.services.image_store import get_image_store
     try:
-        return Image.open(io.BytesIO(image_data))
+        return get_image_store().put_bytes(image_data)
     except Exception as e:
         logger.error(f"[ImageUtils] 图片解析失败: {e}")
         return None
@@ -215,7 +240,7 @@ def create_composite_image(
     return result
 
 
-def prepare_kling_image_input(image: Image.Image, max_size: int = 2048) -> str:
+def prepare_kling_image_input(image, max_size: int = 2048) -> str:
     """
     准备 Kling AI omni-image API 的图片输入
     
@@ -225,33 +250,21 @@ def prepare_kling_image_input(image: Image.Image, max_size: int = 2048) -> str:
     - 推荐使用 Base64 格式
     
     Args:
-        image: PIL.Image 对象
+        image: PIL.Image 对象，或 ImageHandle（使用缓存的 kling 变体，不重复编码）
         max_size: 最大边长（超过则缩放）
     
     Returns:
         Base64 编码字符串（无 data: 前缀）
     """
-    # 缩放过大的图片
+    from app.services.image_store import ImageHandle, get_image_store, render_jpeg
+
+    if isinstance(image, ImageHandle):
+        return get_image_store().variant_base64(image, "kling")
+
     if max(image.size) > max_size:
-        ratio = max_size / max(image.size)
-        new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-        image = image.resize(new_size, Image.Resampling.LANCZOS)
-        logger.info(f"[ImageUtils] 图片已缩放: {image.size}")
-    
-    # 转换为 RGB（去掉 alpha 通道）
-    if image.mode == "RGBA":
-        # 创建白色背景
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[3])
-        image = background
-    elif image.mode != "RGB":
-        image = image.convert("RGB")
-    
-    # 压缩为 JPEG 以减小体积
-    buffer = io.BytesIO()
-    image.save(buffer, format="JPEG", quality=90, optimize=True)
-    
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+        logger.info(f"[ImageUtils] 图片将缩放: {image.size} -> 最长边 {max_size}")
+    # 缩放过大的图片，透明区域铺白底，压缩为 JPEG 以减小体积
+    return base64.b64encode(render_jpeg(image, max_size, quality=90)).decode("utf-8")
 
 
 def prepare_mask_for_inpainting(
@@ -0,0 +1,14 @@
+"""
+Lepus AI - 本地性能基准
+
+在 backend/ 目录运行：
+    python -m benchmarks                 # 全部基准，写入历史并与基线比较
+    python -m benchmarks -k export       # 按名称子串过滤
+    python -m benchmarks --list          # 列出基准
+    python -m benchmarks --quick --no-save
+
+Supabase / Kling / Ark 由进程内 fake 服务代替（benchmarks/fakes），真实客户端照常发请求；
+需要 ffmpeg / celery 的基准在缺依赖时自动跳过。
+历史记录在 benchmarks/results/history.jsonl，中位数超过最近若干次基线
+BENCH_REGRESSION_THRESHOLD（默认 15%）即视为回归，进程以 1 退出。
+"""
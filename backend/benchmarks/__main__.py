@@ -0,0 +1,84 @@
+"""
+基准命令行入口：python -m benchmarks
+"""
+
+import argparse
+import importlib
+import logging
+import pkgutil
+import sys
+from pathlib import Path
+
+from .env import BenchEnv
+from .harness import (
+    HISTORY_FILE,
+    REGRESSION_THRESHOLD,
+    find_regressions,
+    format_table,
+    load_history,
+    record_run,
+    registered,
+    run_benchmark,
+)
+
+
+def _discover() -> None:
+    package_dir = Path(__file__).resolve().parent
+    for module in pkgutil.iter_modules([str(package_dir)]):
+        if module.name.startswith("bench_"):
+            importlib.import_module(f"{__package__}.{module.name}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Lepus AI 本地性能基准")
+    parser.add_argument("-k", dest="pattern", help="只运行名称包含该子串的基准")
+    parser.add_argument("--list", action="store_true", help="列出基准后退出")
+    parser.add_argument("--quick", action="store_true", help="每个基准只跑 3 次（冒烟用，不写历史）")
+    parser.add_argument("--no-save", action="store_true", help="不写入历史记录")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE, help="历史记录文件")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="回归阈值（相对基线）")
+    parser.add_argument("--baseline-runs", type=int, default=5, help="基线取最近几次运行")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示 app 日志")
+    args = parser.parse_args(argv)
+
+    # 被测代码的 info 日志量很大，会污染计时
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    _discover()
+    benches = registered(args.pattern)
+    if args.list:
+        for bench in benches:
+            print(bench.name)
+        return 0
+    if not benches:
+        print(f"没有匹配的基准: {args.pattern}")
+        return 1
+
+    results = []
+    with BenchEnv() as env:
+        for bench in benches:
+            result = run_benchmark(bench, env, repeat=3 if args.quick else None)
+            results.append(result)
+            print(f"  {bench.name}: {'skipped' if result.skipped else f'{result.median_ms:.2f}ms'}", file=sys.stderr)
+
+    print(format_table(results))
+
+    regressions = find_regressions(
+        results, load_history(args.history), threshold=args.threshold, baseline_runs=args.baseline_runs,
+    )
+    if not (args.quick or args.no_save):
+        record_run(results, args.history)
+        print(f"\n已写入 {args.history}")
+
+    if regressions:
+        print("\n性能回归:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+"""
+素材处理：波形提取（需 ffmpeg）
+"""
+
+from .env import load_module
+from .harness import benchmark
+from .media import synth_audio, synth_video
+
+
+def _assets():
+    return load_module("app.tasks.asset_processing", "app/tasks/asset_processing.py")
+
+
+@benchmark("assets.extract_waveform[60s wav]", repeat=5, warmup=1)
+def bench_waveform_audio(env):
+    assets = _assets()
+    path = synth_audio(env.work_dir, duration=60.0)
+    return lambda: assets.extract_waveform(path)
+
+
+@benchmark("assets.extract_waveform[20s mp4]", repeat=5, warmup=1)
+def bench_waveform_video(env):
+    assets = _assets()
+    path = synth_video(env.work_dir, duration=20.0)
+    return lambda: assets.extract_waveform(path)
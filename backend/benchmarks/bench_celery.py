@@ -0,0 +1,52 @@
+"""
+Celery 任务吞吐：内存 broker + 进程内 worker，任务体只做进度 / 状态回写
+
+衡量的是每个任务的固定开销（投递、调度、结果回传、tasks 表两次 PATCH、事件发布），
+真实任务的业务耗时不在此列。
+"""
+
+import uuid
+
+from .harness import SkipBenchmark, benchmark
+
+BATCH = 50
+
+
+def _build_app():
+    from celery import Celery
+
+    from app.celery_config import celery_app, update_task_progress, update_task_status
+
+    # 独立 app：复用线上序列化 / 确认配置，但不加载 include 里的全部任务模块
+    app = Celery("lepus-bench", broker="memory://", backend="cache+memory://")
+    for key in ("task_serializer", "result_serializer", "accept_content", "task_acks_late",
+                "worker_prefetch_multiplier", "task_track_started"):
+        app.conf[key] = celery_app.conf[key]
+
+    @app.task(name="bench.status_roundtrip")
+    def status_roundtrip(task_id: str):
+        update_task_progress(task_id, 50, "bench")
+        update_task_status(task_id, "completed", result={"ok": True})
+        return task_id
+
+    return app, status_roundtrip
+
+
+@benchmark(f"celery.task_throughput[{BATCH} tasks]", repeat=5, warmup=1, ops=BATCH)
+def bench_task_throughput(env):
+    try:
+        from celery.contrib.testing.worker import start_worker
+    except ImportError:
+        raise SkipBenchmark("未安装 celery")
+
+    app, task = _build_app()
+    env.stack.enter_context(start_worker(app, pool="threads", concurrency=4, perform_ping_check=False))
+
+    task_ids = [str(uuid.uuid4()) for _ in range(BATCH)]
+    env.supabase.seed("tasks", [{"id": task_id, "status": "pending", "progress": 0} for task_id in task_ids])
+
+    def run():
+        results = [task.delay(task_id) for task_id in task_ids]
+        for result in results:
+            result.get(timeout=30)
+    return run
@@ -0,0 +1,87 @@
+"""
+导出流水线：滤镜图构建（纯 CPU）与 FFmpeg 渲染（需 ffmpeg）
+"""
+
+import os
+import random
+
+from .env import load_module
+from .harness import benchmark
+from .media import synth_video
+
+
+def _export():
+    return load_module("app.tasks.export", "app/tasks/export.py")
+
+
+def make_timeline(clip_count: int, sources: int = 4, keyframed_every: int = 3, seed: int = 7):
+    """
+    多轨时间线：视频 / 音频交替，部分片段带多段关键帧（scale / opacity / position）
+    同一源素材被多个片段引用，覆盖输入共享合并路径
+    """
+    rng = random.Random(seed)
+    urls = [f"https://cdn.local/source_{i}.mp4" for i in range(sources)]
+    tracks = [{"id": "video-1"}, {"id": "video-2"}, {"id": "audio-1"}]
+    clips = []
+    cursor = {track["id"]: 0 for track in tracks}
+    for i in range(clip_count):
+        track_id = tracks[i % len(tracks)]["id"]
+        duration = rng.randint(1500, 6000)
+        start = cursor[track_id]
+        cursor[track_id] += duration
+        source_start = rng.randint(0, 60000)
+        clip = {
+            "id": f"clip-{i:04d}",
+            "track_id": track_id,
+            "clip_type": "audio" if track_id.startswith("audio") else "video",
+            "url": urls[i % sources],
+            "start": start,
+            "end": start + duration,
+            "source_start": source_start,
+            "source_end": source_start + duration,
+            "volume": 0.8,
+            "transform": {"x": rng.randint(-100, 100), "y": rng.randint(-100, 100), "scale": 1.0},
+        }
+        if clip["clip_type"] == "video" and i % keyframed_every == 0:
+            clip["keyframes"] = [
+                {"property": prop, "offset": offset, "value": rng.uniform(0.2, 1.5), "easing": easing}
+                for prop in ("scale", "opacity")
+                for offset, easing in ((0.0, "linear"), (0.3, "ease_in"), (0.7, "ease_out"), (1.0, "ease_in_out"))
+            ]
+        clips.append(clip)
+    return {"tracks": tracks, "clips": clips}, {url: f"/tmp/{os.path.basename(url)}" for url in urls}
+
+
+@benchmark("export.build_filter_graph[12 clips]", repeat=50)
+def bench_filter_graph_small(env):
+    export = _export()
+    timeline, assets_map = make_timeline(12)
+    return lambda: export.build_filter_graph(timeline, assets_map, 1920, 1080, 30, work_dir=env.work_dir)
+
+
+@benchmark("export.build_filter_graph[120 clips]", repeat=20)
+def bench_filter_graph_large(env):
+    export = _export()
+    timeline, assets_map = make_timeline(120)
+    return lambda: export.build_filter_graph(timeline, assets_map, 1920, 1080, 30, work_dir=env.work_dir)
+
+
+@benchmark("export.render_video[6 clips 480p]", repeat=3, warmup=1)
+def bench_render_video(env):
+    export = _export()
+    source = synth_video(env.work_dir, duration=20.0)
+    timeline, assets_map = make_timeline(6, sources=1, seed=11)
+    for clip in timeline["clips"]:
+        clip["source_start"] = clip["source_start"] % 10000
+        clip["source_end"] = clip["source_start"] + (clip["end"] - clip["start"])
+    assets_map = {url: source for url in assets_map}
+    filter_graph, inputs = export.build_filter_graph(timeline, assets_map, 854, 480, 30, work_dir=env.work_dir)
+    output_path = os.path.join(env.work_dir, "render.mp4")
+
+    def run():
+        return export.render_video(
+            inputs=inputs, filter_graph=filter_graph, output_path=output_path,
+            codec="libx264", audio_codec="aac", preset="ultrafast", crf="28",
+            width="854", height="480", fps=30,
+        )
+    return run
@@ -0,0 +1,105 @@
+"""
+项目接口：get_project / save_project_state 直连 fake Supabase
+
+requests_per_op 列即每次接口调用的 PostgREST / Storage 往返次数，
+新增串行查询或 N+1 会直接体现在这里。
+"""
+
+import importlib
+import uuid
+
+from .harness import benchmark
+
+USER_ID = "00000000-0000-4000-8000-00000000bench"
+
+
+def _projects():
+    # app.api 的 __init__ 会导入全部路由（含 celery），缺依赖时按跳过处理；
+    # 先导入包本身，避免包导入失败后残留的半初始化子模块被误用
+    importlib.import_module("app.api")
+    return importlib.import_module("app.api.projects")
+
+
+def _uid(prefix: str, i: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{prefix}-{i}"))
+
+
+def seed_project(server, project_id: str, tracks: int = 6, clips_per_track: int = 30, assets: int = 40,
+                 keyframes_per_clip: int = 4) -> dict:
+    """写入一个中等规模的项目，返回前端保存接口格式的 changes"""
+    server.seed("projects", [{
+        "id": project_id, "user_id": USER_ID, "name": "bench project", "status": "draft",
+        "thumbnail_url": f"{project_id}/cover.jpg", "version": 1,
+    }])
+    server.seed("assets", [{
+        "id": _uid("asset", i), "project_id": project_id, "name": f"asset {i}", "original_filename": f"{i}.mp4",
+        "file_type": "video", "mime_type": "video/mp4", "file_size": 1 << 24,
+        "storage_path": f"{project_id}/assets/{i}.mp4", "thumbnail_path": f"{project_id}/thumbs/{i}.jpg",
+        "duration": 30.0, "width": 1920, "height": 1080, "fps": 30, "status": "ready",
+        "waveform_data": {"left": [0.1] * 1000},
+    } for i in range(assets)])
+
+    track_rows, clip_rows, kf_rows = [], [], []
+    for t in range(tracks):
+        track_id = _uid(f"{project_id}-track", t)
+        track_rows.append({
+            "id": track_id, "project_id": project_id, "name": f"Track {t}", "order_index": t,
+            "is_muted": False, "is_locked": False, "is_visible": True,
+        })
+        for c in range(clips_per_track):
+            clip_id = _uid(f"{project_id}-clip", t * clips_per_track + c)
+            clip_rows.append({
+                "id": clip_id, "track_id": track_id, "asset_id": _uid("asset", (t + c) % assets),
+                "clip_type": "subtitle" if t == tracks - 1 else "video",
+                "start_time": c * 2000, "end_time": c * 2000 + 1800, "source_start": 0, "source_end": 1800,
+                "volume": 1.0, "is_muted": False, "speed": 1.0,
+                "transform": {"x": 0, "y": 0, "scale": 1.0}, "content_text": f"line {c}" if t == tracks - 1 else None,
+            })
+            for k in range(keyframes_per_clip):
+                kf_rows.append({
+                    "id": _uid(f"{clip_id}-kf", k), "clip_id": clip_id, "property": "scale",
+                    "offset": k / max(keyframes_per_clip - 1, 1), "value": 1.0 + 0.1 * k, "easing": "linear",
+                })
+    server.seed("tracks", track_rows)
+    server.seed("clips", clip_rows)
+    server.seed("keyframes", kf_rows)
+
+    return {
+        "tracks": [{
+            "id": r["id"], "name": r["name"], "orderIndex": r["order_index"],
+            "isMuted": False, "isLocked": False, "isVisible": True,
+        } for r in track_rows],
+        "clips": [{
+            "id": r["id"], "trackId": r["track_id"], "assetId": r["asset_id"], "clipType": r["clip_type"],
+            "start": r["start_time"], "duration": r["end_time"] - r["start_time"],
+            "sourceStart": r["source_start"], "source_end": r["source_end"],
+            "volume": r["volume"], "speed": r["speed"], "transform": r["transform"], "text": r["content_text"],
+        } for r in clip_rows],
+        "keyframes": [{
+            "id": r["id"], "clipId": r["clip_id"], "property": r["property"],
+            "offset": r["offset"], "value": r["value"], "easing": r["easing"],
+        } for r in kf_rows],
+    }
+
+
+@benchmark("projects.get_project[180 clips]", repeat=30)
+def bench_get_project(env):
+    projects = _projects()
+    project_id = _uid("project", 1)
+    seed_project(env.supabase, project_id)
+    return lambda: projects.get_project(project_id=project_id, user_id=USER_ID)
+
+
+@benchmark("projects.save_project_state[180 clips]", repeat=20)
+def bench_save_project_state(env):
+    projects = _projects()
+    project_id = _uid("project", 2)
+    changes = seed_project(env.supabase, project_id)
+    state = {"version": 1}
+
+    def run():
+        # 模拟一次拖动：挪动一个片段，其余保持不变
+        changes["clips"][0]["start"] = (changes["clips"][0]["start"] + 40) % 2000
+        state["version"] += 1
+        return projects.save_project_state(project_id, {"changes": changes, "version": state["version"]})
+    return run
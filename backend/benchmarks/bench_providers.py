@@ -0,0 +1,40 @@
+"""
+外部 AI 提供方客户端开销：Kling 提交 + 轮询、Ark 对话补全
+
+fake 服务默认零延迟，结果反映客户端自身开销（JWT 签名、连接建立、序列化）；
+设置 BENCH_KLING_LATENCY_MS / BENCH_ARK_LATENCY_MS 可模拟真实往返时延。
+"""
+
+from .harness import benchmark
+
+
+@benchmark("providers.kling_omni_image[submit+poll]", repeat=20)
+def bench_kling_omni_image(env):
+    from app.services.kling_ai_service import KlingAIClient
+
+    client = KlingAIClient()
+    client.base_url = env.providers.kling_base_url
+
+    async def run():
+        created = await client.create_omni_image_task(
+            prompt="将 <<<image_1>>> 中的人物放到沙滩背景中",
+            image_list=[{"image": "https://cdn.local/reference.jpg"}],
+        )
+        task_id = created["data"]["task_id"]
+        while True:
+            status = await client.get_omni_image_task(task_id)
+            if status["data"]["task_status"] in ("succeed", "failed"):
+                return status
+    return run
+
+
+@benchmark("providers.ark_chat[doubao]", repeat=20)
+def bench_ark_chat(env):
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    from app.services.llm.clients import DoubaoChat
+
+    # 其余 Ark 调用点的 base URL 写死在代码里，只有 DoubaoChat 可以指向 fake
+    chat = DoubaoChat(model_endpoint="ep-bench", api_key="bench", api_base=env.providers.ark_base_url)
+    messages = [SystemMessage(content="你是剪辑助手"), HumanMessage(content="把背景换成海边")]
+    return lambda: chat.ainvoke(messages)
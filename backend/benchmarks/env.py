@@ -0,0 +1,101 @@
+"""
+基准运行环境
+
+启动 fake Supabase / Kling / Ark 服务，并在导入 app 之前把配置指向它们：
+app.services.supabase_client 在导入时就创建单例客户端，KlingConfig 在导入时读取
+环境变量，所以 BenchEnv 必须先于任何 app 模块导入进入。
+"""
+
+import contextlib
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from .fakes import FAKE_SUPABASE_KEY, FakeHTTPServer, FakeProviderServer, FakeSupabaseServer
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# 模拟线上往返时延（毫秒）；默认 0 只测本地开销，设为真实 RTT 可观察串行请求的代价
+SUPABASE_LATENCY_MS = float(os.getenv("BENCH_SUPABASE_LATENCY_MS", "0"))
+KLING_LATENCY_MS = float(os.getenv("BENCH_KLING_LATENCY_MS", "0"))
+ARK_LATENCY_MS = float(os.getenv("BENCH_ARK_LATENCY_MS", "0"))
+
+
+class BenchEnv:
+    """
+    用法：
+        with BenchEnv() as env:
+            env.supabase.seed("projects", [...])
+            env.providers.kling_base_url
+    """
+
+    def __init__(self):
+        self.supabase = FakeSupabaseServer(latency_ms=SUPABASE_LATENCY_MS)
+        self.providers = FakeProviderServer(latency_ms={"kling": KLING_LATENCY_MS, "ark": ARK_LATENCY_MS})
+        self.work_dir: Optional[str] = None
+        # 跨多次计时存活的资源（如 celery worker），随环境一起关闭
+        self.stack = contextlib.ExitStack()
+        self._saved_env = {}
+
+    @property
+    def servers(self) -> List[FakeHTTPServer]:
+        return [self.supabase, self.providers]
+
+    def _set_env(self, key: str, value: str) -> None:
+        self._saved_env.setdefault(key, os.environ.get(key))
+        os.environ[key] = value
+
+    def __enter__(self) -> "BenchEnv":
+        for server in self.servers:
+            server.start()
+        self.work_dir = tempfile.mkdtemp(prefix="lepus-bench-")
+
+        self._set_env("SUPABASE_URL", self.supabase.url)
+        self._set_env("SUPABASE_ANON_KEY", FAKE_SUPABASE_KEY)
+        self._set_env("SUPABASE_SERVICE_KEY", FAKE_SUPABASE_KEY)
+        self._set_env("KLING_API_BASE_URL", self.providers.kling_base_url)
+        self._set_env("KLING_API_KEY", "bench-access-key")
+        self._set_env("KLING_API_SECRET", "bench-secret-key")
+        self._set_env("CELERY_BROKER_URL", "memory://")
+        self._set_env("CELERY_RESULT_BACKEND", "cache+memory://")
+        # 任务事件总线走进程内实现
+        self._set_env("REDIS_URL", "")
+
+        if str(BACKEND_DIR) not in sys.path:
+            sys.path.insert(0, str(BACKEND_DIR))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stack.close()
+        for server in self.servers:
+            server.stop()
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self._saved_env.clear()
+
+
+def load_module(module_name: str, relative_path: str):
+    """
+    按文件路径加载 app 模块，绕过包 __init__（app.tasks / app.api 的 __init__ 会导入 celery
+    及所有路由）；module_name 用真实的点分路径，模块内的相对导入照常解析
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, BACKEND_DIR / relative_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(module_name, None)
+        raise
+    return module
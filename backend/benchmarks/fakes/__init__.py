@@ -0,0 +1,16 @@
+"""
+基准测试用的本地替身服务（真实客户端直连，数据 / 结果在进程内）
+"""
+
+from .http import FakeHTTPServer, FakeRequest, FakeResponse
+from .providers import FakeProviderServer
+from .supabase import FAKE_SUPABASE_KEY, FakeSupabaseServer
+
+__all__ = [
+    "FAKE_SUPABASE_KEY",
+    "FakeHTTPServer",
+    "FakeProviderServer",
+    "FakeRequest",
+    "FakeResponse",
+    "FakeSupabaseServer",
+]
@@ -0,0 +1,158 @@
+"""
+进程内 HTTP 假服务基类
+
+- 后台线程运行 ThreadingHTTPServer（HTTP/1.1 keep-alive），每个请求一个线程
+- 可配置延迟：模拟网络 / 远端处理耗时，并发请求各自独立等待
+- 记录请求日志，基准可统计每次操作的往返次数（捕捉 N+1 回归）
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeRequest:
+    """解析后的请求"""
+
+    def __init__(self, method: str, path: str, query: list, headers, body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query  # [(key, value)]，保留重复键
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+    def param(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        for k, v in self.query:
+            if k == key:
+                return v
+        return default
+
+
+class FakeResponse:
+    def __init__(self, status: int = 200, body: Any = None, headers: Optional[Dict[str, str]] = None,
+                 raw: Optional[bytes] = None, content_type: str = "application/json"):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.raw = raw
+        self.content_type = content_type
+
+    def encode(self) -> bytes:
+        if self.raw is not None:
+            return self.raw
+        if self.body is None:
+            return b""
+        return json.dumps(self.body, ensure_ascii=False, default=str).encode("utf-8")
+
+
+class FakeHTTPServer:
+    """
+    假服务基类：子类实现 handle(request) -> FakeResponse
+
+    用法：
+        with FakeSupabaseServer(latency_ms=5) as server:
+            server.url  # http://127.0.0.1:<port>
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self._host = host
+        self._port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._log_lock = threading.Lock()
+        self.requests: Counter = Counter()
+
+    # ── 生命周期 ──
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeHTTPServer":
+        owner = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 头和体分两次写出，不关 Nagle 会与客户端延迟 ACK 叠加出每请求 ~40ms 的假延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):  # 静默
+                pass
+
+            def _dispatch(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                request = FakeRequest(
+                    self.command, parts.path, parse_qsl(parts.query, keep_blank_values=True), self.headers, body,
+                )
+                owner._record(request)
+                if owner.latency_ms:
+                    time.sleep(owner.latency_for(request) / 1000.0)
+                try:
+                    response = owner.handle(request)
+                except Exception as e:
+                    response = FakeResponse(500, {"message": f"{type(e).__name__}: {e}"})
+                payload = response.encode()
+                self.send_response(response.status)
+                self.send_header("Content-Type", response.content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _dispatch
+
+        self._server = ThreadingHTTPServer((self._host, self._port), _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.name}-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ── 请求日志 / 延迟 ──
+
+    def _record(self, request: FakeRequest) -> None:
+        with self._log_lock:
+            self.requests[self.request_key(request)] += 1
+
+    def request_key(self, request: FakeRequest) -> Tuple[str, str]:
+        return (request.method, request.path)
+
+    def latency_for(self, request: FakeRequest) -> float:
+        return self.latency_ms
+
+    def reset_requests(self) -> None:
+        with self._log_lock:
+            self.requests.clear()
+
+    def request_count(self) -> int:
+        with self._log_lock:
+            return sum(self.requests.values())
+
+    def handle(self, request: FakeRequest) -> FakeResponse:
+        raise NotImplementedError
@@ -0,0 +1,123 @@
+"""
+进程内 Kling / Ark 假服务
+
+- Kling：POST /v1/<kind>（图像 / 视频任务）创建任务，GET /v1/<kind>/<task_id> 查询，
+  查询 polls_to_complete 次后返回 succeed
+- Ark：/api/v3/chat/completions、/api/v3/embeddings/multimodal、/api/v3/images/generations
+
+latency_ms 可按提供方单独配置：FakeProviderServer(latency_ms={"kling": 80, "ark": 400})
+"""
+
+import itertools
+import threading
+import time
+from typing import Dict, Tuple, Union
+
+from .http import FakeHTTPServer, FakeRequest, FakeResponse
+
+FAKE_IMAGE_URL = "https://fake-cdn.local/result.png"
+FAKE_VIDEO_URL = "https://fake-cdn.local/result.mp4"
+
+
+class FakeProviderServer(FakeHTTPServer):
+    name = "fake-providers"
+
+    def __init__(
+        self,
+        latency_ms: Union[float, Dict[str, float]] = 0.0,
+        polls_to_complete: int = 2,
+        chat_reply: str = '{"intent": "full_replace", "confidence": 0.9, "reasoning": "fake"}',
+        embedding_dim: int = 1024,
+        **kwargs,
+    ):
+        per_provider = latency_ms if isinstance(latency_ms, dict) else {}
+        super().__init__(latency_ms=0.0 if per_provider else float(latency_ms), **kwargs)
+        self.provider_latency_ms: Dict[str, float] = dict(per_provider)
+        if per_provider:
+            self.latency_ms = max(per_provider.values(), default=0.0)
+        self.polls_to_complete = polls_to_complete
+        self.chat_reply = chat_reply
+        self.embedding_dim = embedding_dim
+        self._tasks: Dict[str, Tuple[str, int]] = {}
+        self._ids = itertools.count(1)
+        self._task_lock = threading.Lock()
+
+    @property
+    def kling_base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def ark_base_url(self) -> str:
+        return f"{self.url}/api/v3"
+
+    def provider_of(self, request: FakeRequest) -> str:
+        return "ark" if request.path.startswith("/api/v3") else "kling"
+
+    def latency_for(self, request: FakeRequest) -> float:
+        if self.provider_latency_ms:
+            return self.provider_latency_ms.get(self.provider_of(request), 0.0)
+        return self.latency_ms
+
+    def request_key(self, request: FakeRequest) -> Tuple[str, str]:
+        parts = request.path.strip("/").split("/")
+        if self.provider_of(request) == "kling" and request.method == "GET" and len(parts) >= 3:
+            parts = parts[:-1] + ["{task_id}"]
+        return (request.method, "/".join(parts))
+
+    def handle(self, request: FakeRequest) -> FakeResponse:
+        if self.provider_of(request) == "ark":
+            return self._handle_ark(request)
+        return self._handle_kling(request)
+
+    # ── Kling ──
+
+    def _handle_kling(self, request: FakeRequest) -> FakeResponse:
+        parts = request.path.strip("/").split("/")
+        if not parts or parts[0] != "v1" or len(parts) < 3:
+            return FakeResponse(404, {"code": 1203, "message": "not found"})
+        if request.method == "POST":
+            kind = "/".join(parts[1:])
+            task_id = f"fake-{next(self._ids)}"
+            with self._task_lock:
+                self._tasks[task_id] = (kind, 0)
+            return FakeResponse(200, {
+                "code": 0, "message": "SUCCEED", "request_id": task_id,
+                "data": {"task_id": task_id, "task_status": "submitted", "created_at": int(time.time() * 1000)},
+            })
+        task_id = parts[-1]
+        with self._task_lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return FakeResponse(404, {"code": 1203, "message": f"task {task_id} not found"})
+            kind, polls = entry
+            polls += 1
+            self._tasks[task_id] = (kind, polls)
+        done = polls >= self.polls_to_complete
+        data = {"task_id": task_id, "task_status": "succeed" if done else "processing"}
+        if done:
+            if kind.startswith("videos"):
+                data["task_result"] = {"videos": [{"id": task_id, "url": FAKE_VIDEO_URL, "duration": "5"}]}
+            else:
+                data["task_result"] = {"images": [{"index": 0, "url": FAKE_IMAGE_URL}]}
+        return FakeResponse(200, {"code": 0, "message": "SUCCEED", "request_id": task_id, "data": data})
+
+    # ── Ark ──
+
+    def _handle_ark(self, request: FakeRequest) -> FakeResponse:
+        endpoint = request.path[len("/api/v3"):]
+        body = request.json() or {}
+        if endpoint == "/chat/completions":
+            return FakeResponse(200, {
+                "id": f"chat-{next(self._ids)}",
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.chat_reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            })
+        if endpoint == "/embeddings/multimodal":
+            return FakeResponse(200, {
+                "data": {"embedding": [0.001 * (i % 97) for i in range(self.embedding_dim)]},
+                "usage": {"prompt_tokens": 10},
+            })
+        if endpoint == "/images/generations":
+            return FakeResponse(200, {"data": [{"url": FAKE_IMAGE_URL}], "usage": {"generated_images": 1}})
+        return FakeResponse(404, {"error": {"message": f"no route: {endpoint}"}})
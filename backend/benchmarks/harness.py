@@ -0,0 +1,257 @@
+"""
+基准注册 / 计时 / 历史记录 / 回归判定
+
+写法：
+    @benchmark("export.build_filter_graph[40 clips]", repeat=30)
+    def bench_build_filter_graph(env):
+        timeline, assets_map = ...      # 准备阶段不计时
+        return lambda: export.build_filter_graph(timeline, assets_map, 1920, 1080, 30)
+
+setup(env) 返回被计时的可调用对象（同步函数或返回协程的函数均可）。
+依赖缺失时抛 SkipBenchmark（ImportError 也按跳过处理）。
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+RESULTS_DIR = Path(os.getenv("BENCH_RESULTS_DIR", Path(__file__).resolve().parent / "results"))
+HISTORY_FILE = RESULTS_DIR / "history.jsonl"
+
+# 中位数相对基线上涨超过该比例视为回归
+REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.15"))
+# 绝对差值低于该值（毫秒）时忽略，避免亚毫秒基准的噪声误报
+REGRESSION_MIN_DELTA_MS = float(os.getenv("BENCH_REGRESSION_MIN_DELTA_MS", "1.0"))
+
+
+class SkipBenchmark(Exception):
+    """当前环境无法运行该基准（缺少 ffmpeg / celery 等）"""
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[Any], Callable[[], Any]]
+    repeat: int = 20
+    warmup: int = 2
+    ops: int = 1  # 每次调用包含的操作数（吞吐类基准）
+
+
+@dataclass
+class BenchResult:
+    name: str
+    samples_ms: List[float] = field(default_factory=list)
+    ops: int = 1
+    requests_per_op: Optional[float] = None
+    skipped: Optional[str] = None
+
+    @property
+    def median_ms(self) -> float:
+        return statistics.median(self.samples_ms)
+
+    def summary(self) -> Dict[str, Any]:
+        if self.skipped:
+            return {"name": self.name, "skipped": self.skipped}
+        samples = sorted(self.samples_ms)
+        p95_index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+        median = statistics.median(samples)
+        data = {
+            "name": self.name,
+            "runs": len(samples),
+            "min_ms": round(samples[0], 3),
+            "median_ms": round(median, 3),
+            "mean_ms": round(statistics.fmean(samples), 3),
+            "p95_ms": round(samples[p95_index], 3),
+            "ops_per_sec": round(self.ops * 1000.0 / median, 2) if median > 0 else None,
+        }
+        if self.requests_per_op is not None:
+            data["requests_per_op"] = round(self.requests_per_op, 2)
+        return data
+
+
+_REGISTRY: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, repeat: int = 20, warmup: int = 2, ops: int = 1):
+    """注册基准"""
+    def decorator(setup: Callable[[Any], Callable[[], Any]]):
+        if name in _REGISTRY:
+            raise ValueError(f"重复的基准名称: {name}")
+        _REGISTRY[name] = Benchmark(name=name, setup=setup, repeat=repeat, warmup=warmup, ops=ops)
+        return setup
+    return decorator
+
+
+def registered(pattern: Optional[str] = None) -> List[Benchmark]:
+    return [b for name, b in sorted(_REGISTRY.items()) if not pattern or pattern in name]
+
+
+# ============================================
+# 运行
+# ============================================
+
+def _invoke(fn: Callable[[], Any], loop: asyncio.AbstractEventLoop) -> None:
+    result = fn()
+    if inspect.isawaitable(result):
+        loop.run_until_complete(result)
+
+
+def run_benchmark(bench: Benchmark, env: Any = None, repeat: Optional[int] = None) -> BenchResult:
+    """运行单个基准；env 提供 fake 服务时顺带统计每次操作的请求数"""
+    result = BenchResult(name=bench.name, ops=bench.ops)
+    loop = asyncio.new_event_loop()
+    try:
+        try:
+            fn = bench.setup(env)
+        except SkipBenchmark as e:
+            result.skipped = str(e) or "skipped"
+            return result
+        except ImportError as e:
+            result.skipped = f"缺少依赖: {e}"
+            return result
+
+        for _ in range(bench.warmup):
+            _invoke(fn, loop)
+
+        servers = list(getattr(env, "servers", []) or [])
+        for server in servers:
+            server.reset_requests()
+
+        runs = repeat or bench.repeat
+        for _ in range(runs):
+            start = time.perf_counter()
+            _invoke(fn, loop)
+            result.samples_ms.append((time.perf_counter() - start) * 1000.0)
+
+        if servers:
+            total = sum(server.request_count() for server in servers)
+            result.requests_per_op = total / (runs * bench.ops)
+        return result
+    finally:
+        loop.close()
+
+
+# ============================================
+# 历史 / 回归
+# ============================================
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def record_run(results: List[BenchResult], history_file: Path = HISTORY_FILE) -> Dict[str, Any]:
+    """追加一条运行记录到 history.jsonl"""
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "results": {r.name: r.summary() for r in results if not r.skipped},
+    }
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entry
+
+
+def load_history(history_file: Path = HISTORY_FILE) -> List[Dict[str, Any]]:
+    if not history_file.exists():
+        return []
+    entries = []
+    with open(history_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+@dataclass
+class Regression:
+    name: str
+    baseline_ms: float
+    current_ms: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_ms / self.baseline_ms - 1.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.baseline_ms:.3f}ms → {self.current_ms:.3f}ms (+{self.ratio:.0%})"
+
+
+def baseline_medians(history: List[Dict[str, Any]], runs: int = 5) -> Dict[str, float]:
+    """每个基准取最近 runs 次记录的中位数的中位数作为基线（同一 host）"""
+    host = platform.node()
+    samples: Dict[str, List[float]] = {}
+    for entry in reversed(history):
+        if entry.get("host") not in (None, host):
+            continue
+        for name, summary in entry.get("results", {}).items():
+            bucket = samples.setdefault(name, [])
+            if len(bucket) < runs and summary.get("median_ms") is not None:
+                bucket.append(summary["median_ms"])
+    return {name: statistics.median(values) for name, values in samples.items() if values}
+
+
+def find_regressions(
+    results: List[BenchResult],
+    history: List[Dict[str, Any]],
+    threshold: float = REGRESSION_THRESHOLD,
+    baseline_runs: int = 5,
+    min_delta_ms: float = REGRESSION_MIN_DELTA_MS,
+) -> List[Regression]:
+    baselines = baseline_medians(history, runs=baseline_runs)
+    regressions = []
+    for result in results:
+        if result.skipped or result.name not in baselines:
+            continue
+        baseline, current = baselines[result.name], result.median_ms
+        if current - baseline > min_delta_ms and current > baseline * (1.0 + threshold):
+            regressions.append(Regression(result.name, baseline, current))
+    return regressions
+
+
+def format_table(results: List[BenchResult]) -> str:
+    header = f"{'benchmark':<52} {'median':>10} {'p95':>10} {'ops/s':>10} {'req/op':>7}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        if result.skipped:
+            lines.append(f"{result.name:<52} {'skipped: ' + result.skipped}")
+            continue
+        s = result.summary()
+        req = f"{s['requests_per_op']:.1f}" if "requests_per_op" in s else "-"
+        lines.append(
+            f"{result.name:<52} {s['median_ms']:>8.2f}ms {s['p95_ms']:>8.2f}ms "
+            f"{s['ops_per_sec'] or 0:>10.1f} {req:>7}"
+        )
+    return "\n".join(lines)
+
+
+__all__ = [
+    "BenchResult",
+    "Benchmark",
+    "Regression",
+    "SkipBenchmark",
+    "benchmark",
+    "find_regressions",
+    "format_table",
+    "load_history",
+    "record_run",
+    "registered",
+    "run_benchmark",
+]
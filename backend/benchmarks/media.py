@@ -0,0 +1,42 @@
+"""
+合成测试素材（ffmpeg lavfi：testsrc2 / sine），不依赖仓库外的媒体文件
+"""
+
+import os
+import shutil
+import subprocess
+
+from .harness import SkipBenchmark
+
+
+def require_ffmpeg() -> None:
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        raise SkipBenchmark("未安装 ffmpeg")
+
+
+def synth_video(work_dir: str, name: str = "clip.mp4", duration: float = 10.0,
+                width: int = 640, height: int = 360, fps: int = 30) -> str:
+    """生成带音轨的测试视频（缓存于 work_dir）"""
+    require_ffmpeg()
+    path = os.path.join(work_dir, name)
+    if not os.path.exists(path):
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", path,
+        ], check=True)
+    return path
+
+
+def synth_audio(work_dir: str, name: str = "tone.wav", duration: float = 60.0) -> str:
+    require_ffmpeg()
+    path = os.path.join(work_dir, name)
+    if not os.path.exists(path):
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={duration}",
+            path,
+        ], check=True)
+    return path
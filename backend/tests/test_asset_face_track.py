@@ -0,0 +1,86 @@
+"""
+素材处理中的人脸轨迹任务 单元测试
+
+覆盖:
+- process_asset: 视频素材先标记就绪，再投递人脸轨迹任务（不在上传流程内解码）
+- build_face_track: 采样间隔与覆盖时长受配置上限约束
+"""
+
+import asyncio
+import importlib.util
+import sys
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+asset_module = _load_module('app.tasks.asset_processing', 'app/tasks/asset_processing.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_video_asset_is_ready_before_face_track_is_scheduled(monkeypatch, tmp_path):
+    media = tmp_path / 'talk.mp4'
+    media.write_bytes(b'')
+    calls = []
+
+    async def fake_download(url):
+        return str(media)
+
+    async def fake_update(asset_id, results):
+        calls.append(('ready', 'face_track' in results['metadata']))
+
+    async def forbidden_face_track(path):
+        raise AssertionError('人脸轨迹不应在上传流程内计算')
+
+    async def fake_async_none(*args):
+        return None
+
+    monkeypatch.setattr(asset_module, 'download_media', fake_download)
+    monkeypatch.setattr(asset_module, 'extract_metadata', lambda path: {'duration': 12.0})
+    monkeypatch.setattr(asset_module, 'generate_hls_stream', fake_async_none)
+    monkeypatch.setattr(asset_module, 'generate_thumbnail', fake_async_none)
+    monkeypatch.setattr(asset_module, 'extract_waveform', lambda path: [])
+    monkeypatch.setattr(asset_module, 'update_asset_record', fake_update)
+    monkeypatch.setattr(asset_module, 'build_face_track', forbidden_face_track)
+    monkeypatch.setattr(asset_module, 'schedule_face_track', lambda *args: calls.append(('schedule',) + args))
+
+    run(asset_module.process_asset('asset-1', 'https://cdn/talk.mp4', 'video'))
+
+    assert calls == [('ready', False), ('schedule', 'asset-1', 'https://cdn/talk.mp4')]
+
+
+def test_build_face_track_is_bounded(monkeypatch):
+    captured = {}
+
+    class _Detector:
+        def build_track_index(self, path, sample_interval_ms, max_samples):
+            captured.update(path=path, interval=sample_interval_ms, max_samples=max_samples)
+            return None
+
+    stub = types.ModuleType('app.services.face_detector')
+    stub.get_face_detector = lambda: _Detector()
+    monkeypatch.setattr(asset_module, 'FACE_TRACK_SAMPLE_INTERVAL_MS', 500)
+    monkeypatch.setattr(asset_module, 'FACE_TRACK_MAX_DURATION_SEC', 120.0)
+
+    with patch.dict(sys.modules, {'app.services.face_detector': stub}):
+        assert run(asset_module.build_face_track('/tmp/talk.mp4')) is None
+
+    assert captured == {'path': '/tmp/talk.mp4', 'interval': 500, 'max_samples': 240}
@@ -0,0 +1,238 @@
+"""
+背景替换工作流 DAG 单元测试
+
+覆盖:
+- 策略A: 编辑检测与视频分析、前景分离与背景生成并发执行，合成等待两者完成
+- 每个阶段完成后产出写入 tasks.metadata.stages
+- 中途失败后由新实例续跑：已完成阶段不再执行，从失败阶段继续
+- tasks 表读写（同步 supabase-py）在线程池中执行，不阻塞事件循环
+"""
+
+import asyncio
+import importlib.util
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+wf_module = _load_module('background_replace_workflow_under_test', 'app/services/background_replace_workflow.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, db, calls):
+        self.db = db
+        self.calls = calls
+        self.action = None
+        self.filters = []
+
+    def upsert(self, row):
+        self.action = ('upsert', row)
+        return self
+
+    def update(self, data):
+        self.action = ('update', data)
+        return self
+
+    def select(self, *args):
+        return self
+
+    def eq(self, key, value):
+        self.filters.append((key, value))
+        return self
+
+    def in_(self, key, values):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        self.calls.append(threading.current_thread() is threading.main_thread())
+        if self.action and self.action[0] == 'upsert':
+            row = self.action[1]
+            self.db[row['id']] = dict(row)
+            return _Result([row])
+        rows = [r for r in self.db.values() if all(
+            k.startswith('metadata') or r.get(k) == v for k, v in self.filters
+        )]
+        if self.action and self.action[0] == 'update':
+            for row in rows:
+                row.update(self.action[1])
+        return _Result(rows)
+
+
+class _Supabase:
+    def __init__(self):
+        self.rows = {}
+        self.on_main_thread = []
+
+    def table(self, name):
+        return _Query(self.rows, self.on_main_thread)
+
+
+ANALYSIS = wf_module.VideoAnalysisReport(
+    scene=wf_module.SceneInfo(type='indoor', environment='studio', depth_range=(0.5, 5.0)),
+    lighting=wf_module.LightingInfo(direction=(0.5, -0.5, 0.7), color_temperature=5500, intensity=0.8,
+                                    type='natural', shadow_direction=(0.3, 0.7)),
+    camera_motion=wf_module.CameraMotion(type='static', intensity=0.1, motion_vectors=[(0.0, 0.0)]),
+    subject_bboxes=[[0, 0, 10, 10]],
+    fps=30.0, duration=5.0, resolution=(1920, 1080), frame_count=150,
+)
+
+
+class _Agents:
+    """记录阶段执行时间线的假 Agent"""
+
+    def __init__(self, composite_failures=0):
+        self.timeline = []
+        self.composite_failures = composite_failures
+
+    async def _step(self, name, delay=0.01):
+        self.timeline.append(('start', name))
+        await asyncio.sleep(delay)
+        self.timeline.append(('end', name))
+
+    async def analyze(self, video_url, progress_callback=None):
+        await self._step('analyze')
+        await progress_callback(100, '分析完成')
+        return ANALYSIS
+
+    async def separate(self, video_url, analysis, progress_callback=None):
+        await self._step('separate', 0.03)
+        return wf_module.ForegroundResult('fg', 'alpha', 150, 0.9)
+
+    async def generate_strategy_a(self, background_image, analysis, progress_callback=None):
+        await self._step('generate', 0.03)
+        return wf_module.VideoGenerationResult(
+            video_url='https://kling/bg.mp4', duration=5.0, motion_matched=True, strategy_used='background_only',
+        )
+
+    async def composite(self, video_url, foreground, background_video, analysis, progress_callback=None):
+        await self._step('composite')
+        if self.composite_failures:
+            self.composite_failures -= 1
+            raise RuntimeError('合成失败')
+        return wf_module.CompositeResult('https://storage/composite.mp4', 0.88)
+
+    async def enhance(self, composite, analysis, progress_callback=None):
+        await self._step('enhance')
+        return 'https://storage/final.mp4', wf_module.QAReport(0.9, 0.9, 0.9, 0.9, 0.9, 0.9, 0.9, True)
+
+
+def _workflow(agents):
+    workflow = wf_module.BackgroundReplaceWorkflow.__new__(wf_module.BackgroundReplaceWorkflow)
+    workflow.analysis_agent = agents
+    workflow.separation_agent = agents
+    workflow.video_generation_agent = agents
+    workflow.compositing_agent = agents
+    workflow.enhancement_agent = agents
+    workflow._tasks = {}
+    workflow._checkpoints = {}
+    workflow._event_callbacks = {}
+    workflow._running = {}
+    return workflow
+
+
+def _install(monkeypatch):
+    supabase = _Supabase()
+    monkeypatch.setattr(wf_module, '_get_supabase', lambda: supabase)
+
+    async def fake_resolve(clip_id):
+        return 'https://storage/clip.mp4'
+
+    monkeypatch.setattr(wf_module, 'resolve_video_download_url', fake_resolve)
+    return supabase
+
+
+async def _create_and_wait(workflow, **kwargs):
+    task = await workflow.create_task(
+        clip_id='clip-1', session_id='s1', video_url='https://api/clip.mp4',
+        background_image_url='https://cdn/bg.jpg', user_id='user-1', **kwargs,
+    )
+    await workflow._running[task.id]
+    return task
+
+
+def test_independent_stages_run_concurrently(monkeypatch):
+    supabase = _install(monkeypatch)
+    agents = _Agents()
+    workflow = _workflow(agents)
+
+    task = run(_create_and_wait(workflow))
+
+    assert task.status == wf_module.WorkflowStatus.COMPLETED
+    assert task.result_url == 'https://storage/final.mp4'
+    timeline = agents.timeline
+    # 前景分离与背景生成同时进行
+    assert timeline.index(('start', 'generate')) < timeline.index(('end', 'separate'))
+    # 合成在两者都完成之后
+    assert timeline.index(('start', 'composite')) > max(
+        timeline.index(('end', 'separate')), timeline.index(('end', 'generate')),
+    )
+
+    row = supabase.rows[task.id]
+    assert row['status'] == 'completed' and row['progress'] == 100
+    stages = row['metadata']['stages']
+    assert set(stages) == {'resolve', 'detect', 'analyze', 'separate', 'generate', 'composite', 'enhance'}
+    assert stages['detect']['detected_strategy'] == 'background_only'
+    assert stages['analyze']['analysis']['resolution'] == [1920, 1080]
+    # 同步 supabase 调用都在线程池中执行
+    assert supabase.on_main_thread and not any(supabase.on_main_thread)
+
+
+def test_resume_continues_from_last_completed_stage(monkeypatch):
+    supabase = _install(monkeypatch)
+    first = _Agents(composite_failures=1)
+    task = run(_create_and_wait(_workflow(first)))
+    assert task.status == wf_module.WorkflowStatus.FAILED
+
+    # 模拟进程在合成阶段崩溃：任务仍为 running，心跳已过期
+    row = supabase.rows[task.id]
+    row['status'] = 'running'
+    row['updated_at'] = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
+    assert 'composite' not in row['metadata']['stages']
+
+    second = _Agents()
+    workflow = _workflow(second)
+
+    async def resume():
+        resumed_ids = await workflow.resume_interrupted_tasks()
+        await workflow._running[task.id]
+        return resumed_ids
+
+    assert run(resume()) == [task.id]
+
+    assert [e[1] for e in second.timeline if e[0] == 'start'] == ['composite', 'enhance']
+    resumed = workflow._tasks[task.id]
+    assert resumed.analysis == ANALYSIS
+    assert resumed.background_video.video_url == 'https://kling/bg.mp4'
+    assert supabase.rows[task.id]['status'] == 'completed'
+
+    # 仍在执行（心跳未过期）的任务不会被重复接管
+    supabase.rows[task.id].update(status='running', updated_at=datetime.utcnow().isoformat())
+    assert run(_workflow(_Agents()).resume_task(task.id)) is None
@@ -0,0 +1,162 @@
+"""
+背景视频分段生成 单元测试
+
+覆盖:
+- 静态运镜：各段并发生成（受并发额度约束），乱序完成也按顺序拼接
+- 有方向的运镜：下一段以上一段末帧为首帧，顺序生成；上一段转封装与下一段生成重叠
+- SegmentStitcher: 前序分段到齐才追加，最终只做一次封装转换
+"""
+
+import asyncio
+import base64
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+wf_module = _load_module('background_video_segments_under_test', 'app/services/background_replace_workflow.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _analysis(duration, motion_type):
+    return wf_module.VideoAnalysisReport(
+        scene=wf_module.SceneInfo(type='indoor', environment='studio', depth_range=(0.5, 5.0)),
+        lighting=wf_module.LightingInfo(direction=(0.5, -0.5, 0.7), color_temperature=5500, intensity=0.8,
+                                        type='natural', shadow_direction=(0.3, 0.7)),
+        camera_motion=wf_module.CameraMotion(type=motion_type, intensity=0.3, direction=(1.0, 0.0)),
+        subject_bboxes=[],
+        fps=30.0, duration=duration, resolution=(1920, 1080), frame_count=int(duration * 30),
+    )
+
+
+class _Kling:
+    def __init__(self):
+        self.images = []
+
+    async def create_image_to_video_task(self, image, prompt, options=None):
+        self.images.append(image)
+        return {'code': 0, 'data': {'task_id': f'i2v-{len(self.images) - 1}'}}
+
+
+def _install(monkeypatch, delays, remux_delay=0.0):
+    """delays: 每段生成耗时（秒），用于制造乱序完成；remux_delay: 每段转封装耗时"""
+    state = {'active': 0, 'peak': 0, 'ffmpeg': [], 'uploaded': None, 'events': []}
+    agent = wf_module.VideoGenerationAgent.__new__(wf_module.VideoGenerationAgent)
+    agent.kling_client = _Kling()
+    agent.http_client = None
+
+    async def fake_poll(task_id, max_wait_seconds=300):
+        index = int(task_id.rsplit('-', 1)[1])
+        state['events'].append(f'generate-{index}')
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        try:
+            await asyncio.sleep(delays[index])
+        finally:
+            state['active'] -= 1
+        return f'https://kling/seg{index}.mp4'
+
+    async def fake_download(client, url, dest_path):
+        Path(dest_path).write_bytes(url.rsplit('/', 1)[1].encode())
+        return dest_path
+
+    async def fake_ffmpeg(cmd, error_prefix):
+        state['ffmpeg'].append(cmd)
+        source, output = cmd[cmd.index('-i') + 1], cmd[-1]
+        if 'mpegts' in cmd:
+            await asyncio.sleep(remux_delay)
+            state['events'].append('remuxed-' + Path(source).name)
+        if output.endswith('.jpg'):
+            Path(output).write_bytes(b'last-of-' + Path(source).read_bytes())
+        else:
+            shutil.copyfile(source, output)
+
+    async def fake_upload(file_path, folder='background'):
+        state['uploaded'] = Path(file_path).read_bytes()
+        return 'https://storage/stitched.mp4'
+
+    monkeypatch.setattr(agent, '_poll_i2v_task', fake_poll)
+    monkeypatch.setattr(wf_module, '_download_segment', fake_download)
+    monkeypatch.setattr(wf_module, 'run_ffmpeg', fake_ffmpeg)
+    monkeypatch.setattr(wf_module, '_upload_temp_video', fake_upload)
+    monkeypatch.setattr(wf_module, 'I2V_MAX_IN_FLIGHT', 2)
+    return agent, state
+
+
+def test_static_background_segments_generate_in_parallel(monkeypatch):
+    agent, state = _install(monkeypatch, delays=[0.05, 0.01, 0.03, 0.01])
+
+    result = run(agent.generate_strategy_a('https://cdn/bg.jpg', _analysis(18.0, 'static')))
+
+    assert result.video_url == 'https://storage/stitched.mp4'
+    assert state['peak'] == 2
+    # 每段都从原图生成
+    assert agent.kling_client.images == ['https://cdn/bg.jpg'] * 4
+    # 乱序完成，拼接结果仍按分段顺序
+    assert state['uploaded'] == b'seg0.mp4seg1.mp4seg2.mp4seg3.mp4'
+    remux = [cmd for cmd in state['ffmpeg'] if 'mpegts' in cmd]
+    assert len(remux) == 4 and all(cmd[cmd.index('-c') + 1] == 'copy' for cmd in state['ffmpeg'])
+
+
+def test_directional_motion_chains_last_frames(monkeypatch):
+    agent, state = _install(monkeypatch, delays=[0.01, 0.01, 0.01])
+
+    run(agent.generate_strategy_a('https://cdn/bg.jpg', _analysis(12.0, 'pan')))
+
+    images = agent.kling_client.images
+    assert images[0] == 'https://cdn/bg.jpg'
+    # 后续分段的首帧是上一段末帧（Base64）
+    assert [base64.b64decode(i) for i in images[1:]] == [b'last-of-seg0.mp4', b'last-of-seg1.mp4']
+    assert state['peak'] == 1
+    assert state['uploaded'] == b'seg0.mp4seg1.mp4seg2.mp4'
+
+
+def test_chained_remux_overlaps_next_generation(monkeypatch):
+    agent, state = _install(monkeypatch, delays=[0.01, 0.01, 0.01], remux_delay=0.05)
+
+    run(agent.generate_strategy_a('https://cdn/bg.jpg', _analysis(12.0, 'pan')))
+
+    events = state['events']
+    # 第 1 段的转封装尚未结束，第 2 段已开始生成
+    assert events.index('generate-1') < events.index('remuxed-seg_000.mp4')
+    assert state['uploaded'] == b'seg0.mp4seg1.mp4seg2.mp4'
+
+
+def test_stitcher_waits_for_preceding_segments(monkeypatch, tmp_path):
+    appended = []
+
+    async def fake_append(self, segment_path):
+        appended.append(Path(segment_path).name)
+
+    monkeypatch.setattr(wf_module.SegmentStitcher, '_append', fake_append)
+    stitcher = wf_module.SegmentStitcher(str(tmp_path), 3)
+
+    async def scenario():
+        await stitcher.add(2, str(tmp_path / 'c.mp4'))
+        assert appended == []
+        await stitcher.add(0, str(tmp_path / 'a.mp4'))
+        assert appended == ['a.mp4']
+        await stitcher.add(1, str(tmp_path / 'b.mp4'))
+
+    run(scenario())
+    assert appended == ['a.mp4', 'b.mp4', 'c.mp4']
+    assert stitcher.appended == 3
@@ -0,0 +1,114 @@
+"""
+基准工具 单元测试
+
+覆盖:
+- FakeSupabaseServer: 真实 supabase-py 客户端的查询 / upsert / 删除 / single / 批量签名语义
+- FakeProviderServer: Kling 任务轮询若干次后成功
+- harness: 同步 / 协程基准计时、依赖缺失跳过、历史基线与回归判定
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from supabase import create_client
+
+from benchmarks.fakes import FAKE_SUPABASE_KEY, FakeProviderServer, FakeSupabaseServer
+from benchmarks.harness import (
+    Benchmark,
+    BenchResult,
+    SkipBenchmark,
+    find_regressions,
+    load_history,
+    record_run,
+    run_benchmark,
+)
+
+
+@pytest.fixture
+def fake_supabase():
+    with FakeSupabaseServer() as server:
+        yield server, create_client(server.url, FAKE_SUPABASE_KEY)
+
+
+def test_fake_supabase_matches_postgrest_semantics(fake_supabase):
+    server, client = fake_supabase
+    server.seed("clips", [
+        {"id": "c1", "track_id": "t1", "start_time": 3000, "name": "a,b"},
+        {"id": "c2", "track_id": "t1", "start_time": 1000, "name": None},
+        {"id": "c3", "track_id": "t2", "start_time": 2000, "name": "c"},
+        {"id": "c4", "track_id": "t9", "start_time": 0, "name": "d"},
+    ])
+
+    rows = client.table("clips").select("id, start_time").in_("track_id", ["t1", "t2"]).order("start_time").execute()
+    assert rows.data == [{"id": "c2", "start_time": 1000}, {"id": "c3", "start_time": 2000}, {"id": "c1", "start_time": 3000}]
+
+    assert client.table("clips").select("id").in_("name", ["a,b"]).execute().data == [{"id": "c1"}]
+    assert client.table("clips").select("id").is_("name", "null").execute().data == [{"id": "c2"}]
+    desc = client.table("clips").select("id").eq("track_id", "t1").order("start_time", desc=True).limit(1).execute()
+    assert desc.data == [{"id": "c1"}]
+    assert client.table("clips").select("*").eq("id", "c3").single().execute().data["track_id"] == "t2"
+
+    client.table("clips").upsert([{"id": "c3", "start_time": 2500}, {"id": "c5", "track_id": "t2"}], on_conflict="id").execute()
+    client.table("clips").delete().in_("id", ["c4"]).execute()
+    client.table("clips").update({"name": "z"}).eq("track_id", "t2").execute()
+    assert {r["id"]: (r.get("start_time"), r.get("name")) for r in server.rows("clips")} == {
+        "c1": (3000, "a,b"), "c2": (1000, None), "c3": (2500, "z"), "c5": (None, "z"),
+    }
+
+    signed = client.storage.from_("clips").create_signed_urls(["p/a.mp4", "p/b.jpg"], 3600)
+    assert [item["path"] for item in signed] == ["p/a.mp4", "p/b.jpg"]
+    assert all(item["signedURL"].startswith(server.url + "/storage/v1/object/sign/clips/") for item in signed)
+
+    # 请求按表聚合计数
+    assert server.requests[("GET", "clips")] == 5
+    assert server.requests[("POST", "storage/object/sign")] == 1
+
+
+def test_fake_kling_task_succeeds_after_polls():
+    with FakeProviderServer(polls_to_complete=3) as server:
+        with httpx.Client(base_url=server.kling_base_url) as client:
+            task_id = client.post("/images/omni-image", json={"prompt": "x"}).json()["data"]["task_id"]
+            statuses = [client.get(f"/images/omni-image/{task_id}").json()["data"] for _ in range(3)]
+        assert [s["task_status"] for s in statuses] == ["processing", "processing", "succeed"]
+        assert statuses[-1]["task_result"]["images"][0]["url"]
+        assert server.requests[("GET", "v1/images/omni-image/{task_id}")] == 3
+
+
+def test_harness_runs_skips_and_detects_regressions(tmp_path):
+    calls = []
+
+    async def tick():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    result = run_benchmark(Benchmark("async", setup=lambda env: tick, repeat=4, warmup=1))
+    assert len(result.samples_ms) == 4 and len(calls) == 5
+
+    def missing(env):
+        raise SkipBenchmark("未安装 ffmpeg")
+
+    assert run_benchmark(Benchmark("ffmpeg", setup=missing)).skipped == "未安装 ffmpeg"
+
+    def missing_module(env):
+        import lepus_missing_module  # noqa: F401
+
+    assert run_benchmark(Benchmark("import", setup=missing_module)).skipped.startswith("缺少依赖")
+
+    history_file = tmp_path / "history.jsonl"
+    for median in (10.0, 11.0, 9.0, 10.0, 50.0):
+        record_run([BenchResult("slow", samples_ms=[median]), BenchResult("flat", samples_ms=[0.2])], history_file)
+    history = load_history(history_file)
+    assert len(history) == 5
+    assert json.loads(history_file.read_text().splitlines()[0])["results"]["slow"]["median_ms"] == 10.0
+
+    current = [
+        BenchResult("slow", samples_ms=[12.5]),   # 基线 = 近 3 次 (10, 9, 50) 的中位数 10 → +25%
+        BenchResult("flat", samples_ms=[0.5]),    # +150% 但绝对差值 < 1ms，视为噪声
+        BenchResult("new", samples_ms=[100.0]),   # 无基线
+    ]
+    regressions = find_regressions(current, history, threshold=0.15, baseline_runs=3)
+    assert [r.name for r in regressions] == ["slow"]
+    assert regressions[0].baseline_ms == 10.0
+    assert find_regressions(current, history, threshold=0.3, baseline_runs=3) == []
@@ -0,0 +1,96 @@
+"""
+B-Roll 触发检测 单元测试
+
+覆盖:
+- detect: 关键词预筛后的结果与逐规则全量扫描一致
+- detect_segments: 整段一次扫描的结果与逐片段 detect 一致
+- detect_primary_triggers_batch: 与逐条 detect_primary_trigger 一致
+"""
+
+import importlib.util
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+bt_module = _load_module('broll_trigger_under_test', 'app/services/remotion_agent/broll_trigger.py')
+
+
+SAMPLES = [
+    '今年营收增长了 35%，用户数突破 1000万',
+    '这就像一台 iPhone 和 Android 的对比',
+    '首先打开设置，然后点击保存',
+    '根据 OpenAI 的报告，GPT 的效果提升了 3.5 倍',
+    '你知道吗？这个方法非常重要',
+    '在北京和上海，房价分别是 8 万和 7 万',
+    '没有任何触发词的普通句子',
+    '',
+    '50\n%',
+    '相比之下 vs 传统方式',
+]
+
+
+def _naive_detect(detector, text):
+    """逐规则全量 finditer + 按位置稳定排序（改造前的实现）"""
+    triggers = []
+    for trigger_type, pattern, rule in detector._compiled_rules:
+        for match in pattern.finditer(text):
+            triggers.append(bt_module.BrollTrigger(
+                trigger_type=trigger_type,
+                matched_text=match.group(0),
+                start_index=match.start(),
+                end_index=match.end(),
+                confidence=1.0,
+                suggested_broll=rule.broll_suggestion_template.format(matched=match.group(0)),
+                importance=rule.importance,
+            ))
+    triggers.sort(key=lambda t: t.start_index)
+    return detector._deduplicate_triggers(triggers)
+
+
+def _random_texts(rng, count):
+    pieces = SAMPLES + ['%', ' ', '\n', '倍', '1', '2.5', '万', '和', '比']
+    return [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 4))) for _ in range(count)]
+
+
+def test_detect_matches_naive_scan():
+    detector = bt_module.BrollTriggerDetector()
+    rng = random.Random(3)
+    for text in SAMPLES + _random_texts(rng, 200):
+        assert detector.detect(text) == _naive_detect(detector, text)
+
+
+def test_detect_segments_matches_per_segment_detect():
+    detector = bt_module.BrollTriggerDetector()
+    rng = random.Random(11)
+    for _ in range(50):
+        texts = _random_texts(rng, rng.randint(1, 12))
+        assert detector.detect_segments(texts) == [detector.detect(t) for t in texts]
+    assert detector.detect_segments([]) == []
+
+
+def test_primary_batch_matches_single_and_populates_cache():
+    bt_module.clear_trigger_cache()
+    texts = SAMPLES + SAMPLES[:3]
+    batch = bt_module.detect_primary_triggers_batch(texts)
+    assert len(batch) == len(texts)
+
+    bt_module.clear_trigger_cache()
+    assert batch == [bt_module.detect_primary_trigger(t) for t in texts]
+
+    # 批量调用后单条查询直接命中缓存
+    bt_module.clear_trigger_cache()
+    bt_module.detect_broll_triggers_batch(SAMPLES)
+    key = bt_module._get_cache_key(SAMPLES[0])
+    assert bt_module._trigger_cache[key] == bt_module.get_detector().detect(SAMPLES[0])
@@ -0,0 +1,183 @@
+"""
+可灵回调结果转存 单元测试
+
+覆盖:
+- _process_image_results: 并发转存（受并发上限约束），ai_outputs 一次批量插入，顺序与输出一致
+- 第 0 个结果落盘即推送 first_result 事件，早于其余结果完成
+- 任一结果失败时取消其余转存并抛出，不写 ai_outputs，已上传的文件被删除
+- 已推送 first_result 后失败：删除文件前先推送 first_result_retracted
+"""
+
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+cb_module = _load_module('callback_under_test', 'app/api/callback.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Query:
+    def __init__(self, log, table):
+        self.log = log
+        self.table = table
+
+    def insert(self, rows):
+        self.log.append(('insert', self.table, rows))
+        return self
+
+    def update(self, data):
+        self.log.append(('update', self.table, data))
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def execute(self):
+        return None
+
+
+class _Bucket:
+    def __init__(self, log, bucket, timeline=None):
+        self.log = log
+        self.bucket = bucket
+        self.timeline = timeline
+
+    def remove(self, paths):
+        self.log.append(('remove', self.bucket, list(paths)))
+        if self.timeline is not None:
+            self.timeline.append(('removed', None))
+        return []
+
+
+class _Storage:
+    def __init__(self, log):
+        self.log = log
+        self.timeline = None
+
+    def from_(self, bucket):
+        return _Bucket(self.log, bucket, self.timeline)
+
+
+class _Supabase:
+    def __init__(self):
+        self.log = []
+        self.storage = _Storage(self.log)
+
+    def table(self, name):
+        return _Query(self.log, name)
+
+
+def _install(monkeypatch, delays, fail_index=None):
+    supabase = _Supabase()
+    timeline = []
+    supabase.storage.timeline = timeline
+    state = {'active': 0, 'peak': 0}
+
+    async def fake_download(url, dest_path):
+        index = int(url.rsplit('/', 1)[1])
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        try:
+            await asyncio.sleep(delays[index])
+            if index == fail_index:
+                raise RuntimeError('cdn 502')
+            Path(dest_path).write_bytes(b'x' * (index + 1))
+        finally:
+            state['active'] -= 1
+        timeline.append(('downloaded', index))
+        return dest_path
+
+    def fake_upload(file_path, storage_path, content_type):
+        timeline.append(('uploaded', storage_path))
+        return f'https://storage/{storage_path}'
+
+    async def fake_sse(ai_task, event_type, result_url=None, error=None, progress=100, message=None):
+        timeline.append((event_type, result_url))
+
+    monkeypatch.setattr(cb_module, '_get_supabase', lambda: supabase)
+    monkeypatch.setattr(cb_module, 'download_file', fake_download)
+    monkeypatch.setattr(cb_module, 'upload_to_storage', fake_upload)
+    monkeypatch.setattr(cb_module, '_publish_task_sse', fake_sse)
+    monkeypatch.setattr(cb_module, 'CALLBACK_INGEST_CONCURRENCY', 2)
+    return supabase, timeline, state
+
+
+def _images(count):
+    return [cb_module.ImageResultModel(index=i, url=f'https://cdn/{i}') for i in range(count)]
+
+
+def test_images_ingested_concurrently_with_single_bulk_insert(monkeypatch):
+    supabase, timeline, state = _install(monkeypatch, delays=[0.01, 0.05, 0.05, 0.05])
+    run(cb_module._process_image_results('task-1', 'user-1', _images(4), ai_task={'id': 'task-1'}))
+
+    assert state['peak'] == 2
+    inserts = [entry for entry in supabase.log if entry[0] == 'insert']
+    assert len(inserts) == 1
+    rows = inserts[0][2]
+    assert [row['output_index'] for row in rows] == [0, 1, 2, 3]
+    assert [row['file_size'] for row in rows] == [1, 2, 3, 4]
+
+    # first_result 在第 0 个结果之后、其余结果之前推送
+    first = timeline.index(('first_result', 'https://storage/ai_generated/user-1/task-1_0.png'))
+    assert timeline[first - 2:first] == [('downloaded', 0), ('uploaded', 'ai_generated/user-1/task-1_0.png')]
+    assert len([e for e in timeline[first:] if e[0] == 'downloaded']) == 3
+
+    completed = supabase.log[-1][2]
+    assert completed['status'] == 'completed'
+    assert completed['output_url'] == rows[0]['storage_url']
+    assert completed['metadata']['output_ids'] == [row['id'] for row in rows]
+    assert completed['metadata']['images'][2] == {
+        'index': 2, 'url': rows[2]['storage_url'], 'output_id': rows[2]['id'],
+    }
+
+
+def test_failed_output_cancels_remaining_and_skips_insert(monkeypatch):
+    supabase, timeline, _ = _install(monkeypatch, delays=[0.01, 0.01, 0.5], fail_index=1)
+    videos = [cb_module.VideoResultModel(id=str(i), url=f'https://cdn/{i}', duration='5') for i in range(3)]
+
+    with pytest.raises(RuntimeError):
+        run(cb_module._process_video_results('task-2', 'user-1', videos))
+
+    assert not any(entry[0] == 'insert' for entry in supabase.log)
+    assert ('downloaded', 2) not in timeline
+
+    # 已上传的第 0 个结果被清理，不留孤儿文件
+    assert ('uploaded', 'ai_generated/user-1/task-2_0.mp4') in timeline
+    removes = [entry for entry in supabase.log if entry[0] == 'remove']
+    assert len(removes) == 1 and removes[0][1] == cb_module.STORAGE_BUCKET
+    assert 'ai_generated/user-1/task-2_0.mp4' in removes[0][2]
+
+
+def test_first_result_is_retracted_before_cleanup(monkeypatch):
+    supabase, timeline, _ = _install(monkeypatch, delays=[0.01, 0.05, 0.05], fail_index=2)
+
+    with pytest.raises(RuntimeError):
+        run(cb_module._process_image_results('task-3', 'user-1', _images(3), ai_task={'id': 'task-3'}))
+
+    url = 'https://storage/ai_generated/user-1/task-3_0.png'
+    events = [entry for entry in timeline if entry[0] in ('first_result', 'first_result_retracted', 'removed')]
+    # 先撤回预览 URL，再删除其指向的文件
+    assert events == [('first_result', url), ('first_result_retracted', url), ('removed', None)]
+    assert not any(entry[0] == 'insert' for entry in supabase.log)
@@ -0,0 +1,252 @@
+"""
+拆镜头分析缓存 单元测试
+
+覆盖:
+- 同一视频内容 + 同一 prompt 版本重复拆分：不再上传 Ark / 调 VLM，结果写入 assets.metadata
+- VLM 失败后重试：复用已上传的 Ark file_id
+- Ark 文件缓存有界：超出条数或过期的条目被淘汰，远端文件随之删除
+- _extract_frames: 所有关键帧一次 FFmpeg 调用，多路输入级 seek
+"""
+
+import asyncio
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+cs_module = _load_module('clip_split_service_under_test', 'app/services/clip_split_service.py')
+
+VLM_RESULT = {
+    'total_duration_sec': 10.0,
+    'scenes': [
+        {'index': 0, 'start_sec': 0, 'end_sec': 4.0, 'description': 'a'},
+        {'index': 1, 'start_sec': 4.0, 'end_sec': 10.0, 'description': 'b'},
+    ],
+}
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Table:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.pending = None
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def single(self):
+        return self
+
+    def update(self, data):
+        self.pending = ('update', data)
+        return self
+
+    def insert(self, rows):
+        self.pending = ('insert', rows)
+        return self
+
+    def execute(self):
+        if self.pending and self.pending[0] == 'update':
+            self.db['asset']['metadata'] = self.pending[1]['metadata']
+            return _Result([self.db['asset']])
+        if self.pending and self.pending[0] == 'insert':
+            self.db['inserted'].extend(self.pending[1])
+            return _Result(self.pending[1])
+        if self.name == 'canvas_nodes':
+            return _Result(self.db['node'])
+        return _Result([self.db['asset']])
+
+
+class _Bucket:
+    def remove(self, paths):
+        pass
+
+    def upload(self, path, data, options=None):
+        pass
+
+    def get_public_url(self, path):
+        return f'https://storage/{path}'
+
+
+class _Supabase:
+    def __init__(self):
+        self.db = {
+            'node': {'id': 'clip-1', 'media_type': 'video', 'video_url': 'https://cdn/v.mp4',
+                     'asset_id': 'asset-1', 'project_id': 'p1', 'duration': 10},
+            'asset': {'id': 'asset-1', 'metadata': {'width': 1920}},
+            'inserted': [],
+        }
+        self.storage = types.SimpleNamespace(from_=lambda bucket: _Bucket())
+
+    def table(self, name):
+        return _Table(self.db, name)
+
+
+def _install(monkeypatch, vlm_failures=0):
+    calls = {'upload': 0, 'vlm': [], 'frames': 0}
+    config = types.ModuleType('app.config')
+    config.get_settings = lambda: types.SimpleNamespace(
+        volcengine_ark_api_key='key', doubao_seed_1_8_endpoint='seed-1-8',
+    )
+    monkeypatch.setitem(sys.modules, 'app.config', config)
+
+    async def fake_download(url, temp_dir):
+        path = Path(temp_dir) / 'source.mp4'
+        path.write_bytes(b'video-bytes' * 200)
+        return str(path)
+
+    async def fake_probe(path):
+        return 10.0
+
+    async def fake_upload(path, api_key):
+        calls['upload'] += 1
+        return f'file-{calls["upload"]}'
+
+    async def fake_vlm(file_id, api_key, model):
+        calls['vlm'].append(file_id)
+        if len(calls['vlm']) <= vlm_failures:
+            raise RuntimeError('Ark Responses API 失败 (HTTP 504)')
+        return VLM_RESULT
+
+    async def fake_frames(video_path, frames):
+        calls['frames'] += 1
+        for frame in frames:
+            Path(frame['output_path']).write_bytes(b'jpg')
+        return [True] * len(frames)
+
+    monkeypatch.setattr(cs_module, '_download_video', fake_download)
+    monkeypatch.setattr(cs_module, '_probe_duration', fake_probe)
+    monkeypatch.setattr(cs_module, '_upload_to_ark', fake_upload)
+    monkeypatch.setattr(cs_module, '_call_vlm', fake_vlm)
+    monkeypatch.setattr(cs_module, '_extract_frames', fake_frames)
+    monkeypatch.setattr(cs_module, '_analysis_cache', cs_module.OrderedDict())
+    monkeypatch.setattr(cs_module, '_ark_file_cache', cs_module.OrderedDict())
+    return calls
+
+
+def test_repeat_split_hits_analysis_cache(monkeypatch):
+    calls = _install(monkeypatch)
+    supabase = _Supabase()
+
+    first = run(cs_module.analyze_and_split('clip-1', supabase))
+    second = run(cs_module.analyze_and_split('clip-1', supabase))
+
+    assert first.success and second.success
+    assert calls['upload'] == 1 and calls['vlm'] == ['file-1']
+    # 每次拆分所有关键帧只调用一次取帧
+    assert calls['frames'] == 2
+    assert len(supabase.db['inserted']) == 4
+
+    # 持久化到素材 metadata，保留原有字段；进程重启后（清空 LRU）仍命中
+    metadata = supabase.db['asset']['metadata']
+    assert metadata['width'] == 1920
+    assert list(metadata['scene_analysis']['results'].values()) == [VLM_RESULT]
+    monkeypatch.setattr(cs_module, '_analysis_cache', cs_module.OrderedDict())
+    run(cs_module.analyze_and_split('clip-1', supabase))
+    assert calls['vlm'] == ['file-1']
+
+
+def test_retry_after_vlm_failure_reuses_ark_file(monkeypatch):
+    calls = _install(monkeypatch, vlm_failures=1)
+    supabase = _Supabase()
+
+    try:
+        run(cs_module.analyze_and_split('clip-1', supabase))
+    except RuntimeError:
+        pass
+    assert supabase.db['asset']['metadata']['scene_analysis']['ark_file']['file_id'] == 'file-1'
+
+    result = run(cs_module.analyze_and_split('clip-1', supabase))
+    assert result.success
+    assert calls['upload'] == 1
+    assert calls['vlm'] == ['file-1', 'file-1']
+
+
+def test_ark_file_cache_evicts_and_deletes_remote_files(monkeypatch):
+    deleted = []
+
+    async def fake_delete(file_id, api_key):
+        deleted.append(file_id)
+
+    monkeypatch.setattr(cs_module, '_ark_file_cache', cs_module.OrderedDict())
+    monkeypatch.setattr(cs_module, '_delete_ark_file', fake_delete)
+    monkeypatch.setattr(cs_module, 'SCENE_CACHE_SIZE', 2)
+
+    async def scenario():
+        cs_module._delete_ark_files(cs_module._remember_ark_file('a', 'file-a'), 'key')
+        cs_module._delete_ark_files(cs_module._remember_ark_file('b', 'file-b'), 'key')
+        # 访问 a 后，超出条数时淘汰最久未用的 b
+        assert cs_module._reusable_ark_file('a', {}) == 'file-a'
+        cs_module._delete_ark_files(cs_module._remember_ark_file('c', 'file-c'), 'key')
+        # 过期条目在下次写入时淘汰
+        cs_module._ark_file_cache['a']['expires_at'] = 0
+        cs_module._delete_ark_files(cs_module._remember_ark_file('d', 'file-d'), 'key')
+        await asyncio.sleep(0)
+
+    run(scenario())
+
+    assert list(cs_module._ark_file_cache) == ['c', 'd']
+    assert deleted == ['file-b', 'file-a']
+
+
+def test_extract_frames_single_ffmpeg_with_per_frame_seek(monkeypatch, tmp_path):
+    commands = []
+
+    class _Proc:
+        returncode = 0
+
+        async def communicate(self):
+            return b'', b''
+
+    async def fake_exec(*cmd, **kwargs):
+        commands.append(cmd)
+        for arg in cmd:
+            if str(arg).endswith('.jpg'):
+                Path(arg).write_bytes(b'jpg')
+        return _Proc()
+
+    monkeypatch.setattr(cs_module.asyncio, 'create_subprocess_exec', fake_exec)
+    frames = [
+        {'time_sec': 2.0, 'output_path': str(tmp_path / 'k0.jpg')},
+        {'time_sec': 7.5, 'output_path': str(tmp_path / 't0.jpg'), 'width': 320, 'quality': 2},
+    ]
+    assert run(cs_module._extract_frames('/tmp/v.mp4', frames)) == [True, True]
+
+    assert len(commands) == 1
+    cmd = list(commands[0])
+    assert cmd[:10] == ['ffmpeg', '-y', '-ss', '2.000', '-i', '/tmp/v.mp4', '-ss', '7.500', '-i', '/tmp/v.mp4']
+    assert cmd[10:] == [
+        '-map', '0:v:0', '-frames:v', '1', '-q:v', '1', str(tmp_path / 'k0.jpg'),
+        '-map', '1:v:0', '-frames:v', '1', '-vf', 'scale=320:-2', '-q:v', '2', str(tmp_path / 't0.jpg'),
+    ]
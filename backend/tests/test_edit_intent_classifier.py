@@ -0,0 +1,115 @@
+"""
+编辑意图分类器 单元测试
+
+覆盖:
+- 编译后的关键词自动机与逐词子串计数结果一致（含跨组重复关键词）
+- LLM 分类按 (prompt, 涂鸦缩略指纹, 原图) 缓存，重新编码的同一涂鸦命中缓存
+- 发送给多模态模型的是缩略图，失败结果不缓存
+"""
+
+import asyncio
+import base64
+import io
+import random
+
+from PIL import Image
+
+from app.services import edit_intent_classifier as classifier
+from app.services.image_store import get_image_store
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _reference_scores(prompt):
+    prompt_lower = prompt.lower()
+    return tuple(
+        sum(1 for kw in group if kw.lower() in prompt_lower)
+        for group in (classifier.ADD_ELEMENT_KEYWORDS, classifier.LOCAL_EDIT_KEYWORDS, classifier.FULL_REPLACE_KEYWORDS)
+    )
+
+
+def test_compiled_matcher_matches_substring_counts():
+    prompts = [
+        "在图中位置加个小太阳阳光打下来", "把背景改成星空", "去掉这个水印", "Add a LOGO here",
+        "换成海边背景", "让画面更亮一点", "", "REMOVE THIS and move to the beach",
+    ]
+    keywords = classifier.ADD_ELEMENT_KEYWORDS + classifier.LOCAL_EDIT_KEYWORDS + classifier.FULL_REPLACE_KEYWORDS
+    rng = random.Random(0)
+    for _ in range(200):
+        prompts.append("".join(rng.choice(keywords + ["的", " ", "x", "背"]) for _ in range(rng.randint(1, 6))))
+
+    for prompt in prompts:
+        assert classifier._keyword_scores(prompt) == _reference_scores(prompt), prompt
+
+
+def _mask_png(compress_level):
+    mask = Image.new("RGBA", (1600, 1200), (0, 0, 0, 0))
+    for x in range(600, 1000):
+        for y in range(100, 140):
+            mask.putpixel((x, y), (30, 90, 255, 200))
+    buffer = io.BytesIO()
+    mask.save(buffer, format="PNG", compress_level=compress_level)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _original_handle():
+    return get_image_store().put_image(Image.new("RGB", (2000, 1500), (120, 160, 200)), format="JPEG")
+
+
+def test_llm_result_cached_by_prompt_and_mask_fingerprint(monkeypatch):
+    classifier.clear_llm_cache()
+    calls = []
+
+    async def fake_request(prompt, has_mask, mask_input, original_input):
+        calls.append((prompt, mask_input, original_input))
+        return classifier.IntentClassificationResult(
+            intent=classifier.EditIntent.SKETCH_GUIDE, confidence=0.9, reasoning="帽子",
+            suggested_api="omni_image", detected_element="a brown leather cowboy hat",
+        )
+
+    monkeypatch.setattr(classifier, "_request_llm_classification", fake_request)
+    original = _original_handle()
+    mask_a, mask_b = _mask_png(1), _mask_png(9)
+    assert mask_a != mask_b  # 编码不同，像素相同
+
+    first = run(classifier.classify_edit_intent("加个帽子", True, mask_a, original))
+    second = run(classifier.classify_edit_intent(" 加个帽子", True, mask_b, original))
+    other_prompt = run(classifier.classify_edit_intent("加个眼镜", True, mask_a, original))
+
+    assert first.detected_element == second.detected_element == "a brown leather cowboy hat"
+    assert len(calls) == 2
+    assert [c[0] for c in calls] == ["加个帽子", "加个眼镜"]
+    assert other_prompt.intent == classifier.EditIntent.SKETCH_GUIDE
+
+    # 多模态输入是缩略图：涂鸦保留透明通道，原图转为小 JPEG
+    _, mask_input, original_input = calls[0]
+    assert mask_input.startswith("data:image/png;base64,")
+    assert original_input.startswith("data:image/jpeg;base64,")
+    for data_url, expected in ((mask_input, (512, 384)), (original_input, (512, 384))):
+        image = Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+        assert image.size == expected
+
+
+def test_failed_llm_result_not_cached(monkeypatch):
+    classifier.clear_llm_cache()
+    calls = []
+
+    async def failing_request(prompt, has_mask, mask_input, original_input):
+        calls.append(prompt)
+        return classifier.IntentClassificationResult(
+            intent=classifier.EditIntent.FULL_REPLACE, confidence=0.5,
+            reasoning="LLM 分类失败，默认换背景: timeout", suggested_api="omni_image",
+        )
+
+    monkeypatch.setattr(classifier, "_request_llm_classification", failing_request)
+
+    for _ in range(2):
+        result = run(classifier.classify_edit_intent("让画面更亮一点", False))
+        assert result.intent == classifier.EditIntent.FULL_REPLACE
+    assert calls == ["让画面更亮一点", "让画面更亮一点"]
@@ -0,0 +1,109 @@
+"""
+分层增强 RAG 检索器 单元测试
+
+覆盖:
+- query embedding 只计算一次（有图片时多模态），两路检索共用且并发执行
+- 相同 (category, style_hint, 描述) 的计划命中缓存，不再检索
+- 并发的相同请求只检索一次
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.enhancement_rag import retriever as retriever_module
+from app.services.enhancement_rag.schema import (
+    EnhancementStrategy,
+    LayerClassification,
+    PipelineConfig,
+    QualityReference,
+)
+
+
+class _Store:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.barrier = threading.Barrier(2, timeout=1)
+        self.delay = delay
+
+    def search_strategies(self, query_text, category=None, top_k=3, threshold=0.3, query_embedding=None):
+        self.calls.append(('strategies', query_embedding))
+        # 两路检索必须同时在途才能通过 barrier
+        self.barrier.wait()
+        return [EnhancementStrategy(
+            content_category=category,
+            quality_target='realistic_casual',
+            description='人像精修',
+            pipeline_config=PipelineConfig(steps=['skin_enhance'], prompt_template='精修，{original_description}'),
+        )]
+
+    def search_references(self, query_text, category=None, style=None, top_k=3, threshold=0.3,
+                          query_image_b64=None, query_embedding=None):
+        self.calls.append(('references', query_embedding))
+        self.barrier.wait()
+        return [QualityReference(category=category, style='studio', image_url='https://ref/1.jpg', description='影棚光')]
+
+
+def _retriever(monkeypatch, store):
+    embeddings = []
+
+    def fake_embedding(text, image_base64=None):
+        embeddings.append((text, image_base64))
+        return [0.1, 0.2]
+
+    monkeypatch.setattr(retriever_module, 'generate_query_embedding', fake_embedding)
+    retriever = retriever_module.EnhancementRetriever()
+    retriever._store = store
+    return retriever, embeddings
+
+
+def _classification(style_hint='柔光'):
+    return LayerClassification(content_category='face_portrait', style_hint=style_hint)
+
+
+def test_single_embedding_shared_by_concurrent_searches(monkeypatch):
+    store = _Store()
+    retriever, embeddings = _retriever(monkeypatch, store)
+
+    plan = retriever.get_enhancement_plan(_classification(), '女生半身', layer_image_b64='aW1n')
+
+    assert embeddings == [('face_portrait 柔光 女生半身', 'aW1n')]
+    assert sorted(store.calls) == [('references', [0.1, 0.2]), ('strategies', [0.1, 0.2])]
+    assert plan.final_prompt == '精修，女生半身；参考标准: 影棚光'
+
+
+def test_plans_cached_by_category_style_and_description(monkeypatch):
+    store = _Store()
+    retriever, embeddings = _retriever(monkeypatch, store)
+
+    first = retriever.get_enhancement_plan(_classification(), '女生半身')
+    second = retriever.get_enhancement_plan(_classification(), '女生半身')
+    assert len(embeddings) == 1
+    assert second == first and second is not first
+
+    store.barrier.reset()
+    retriever.get_enhancement_plan(_classification('冷色调'), '女生半身')
+    assert len(embeddings) == 2
+
+
+def test_concurrent_identical_requests_retrieve_once(monkeypatch):
+    store = _Store()
+    retriever, embeddings = _retriever(monkeypatch, store)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_embedding(text, image_base64=None):
+        embeddings.append(text)
+        started.set()
+        release.wait(1)
+        return [0.3]
+
+    monkeypatch.setattr(retriever_module, 'generate_query_embedding', slow_embedding)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(retriever.get_enhancement_plan, _classification(), '女生半身') for _ in range(3)]
+        started.wait(1)
+        release.set()
+        plans = [f.result(timeout=2) for f in futures]
+
+    assert len(embeddings) == 1
+    assert all(p.final_prompt == plans[0].final_prompt for p in plans)
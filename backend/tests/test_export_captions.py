@@ -0,0 +1,78 @@
+"""
+导出字幕层 单元测试
+
+覆盖:
+- build_filter_graph: 所有 text/subtitle clips 合并为单个 ass 滤镜
+- build_caption_track: 位置与 drawtext 语义一致，关键帧拆分为 \\pos / \\move 事件
+- ASS 时间：导出四舍五入到厘秒，烧录保持截断
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# export 通过相对导入使用 subtitle_burn，按包内名称注册，避免导入整个 app.tasks
+subtitle_module = _load_module('app.tasks.subtitle_burn', 'app/tasks/subtitle_burn.py')
+export_module = _load_module('app.tasks.export_captions_under_test', 'app/tasks/export.py')
+
+
+def _caption(clip_id, start, end, text, clip_type='subtitle', **extra):
+    return {'id': clip_id, 'clip_type': clip_type, 'start': start, 'end': end, 'content_text': text, **extra}
+
+
+def test_captions_render_through_single_ass_filter(tmp_path):
+    clips = [_caption(f's{i}', i * 2000, i * 2000 + 1800, f'第{i}句字幕') for i in range(300)]
+    clips.append(_caption('t1', 0, 5000, '标题', clip_type='text', text_style={'fontSize': 64, 'fontColor': '#FFCC00'}))
+
+    graph, _ = export_module.build_filter_graph(
+        timeline={'tracks': [], 'clips': clips}, assets_map={},
+        width=1080, height=1920, fps=30, work_dir=str(tmp_path),
+    )
+
+    assert 'drawtext' not in graph
+    assert graph.count("ass=filename=") == 1
+    assert f"[base]ass=filename='{tmp_path / 'captions.ass'}'[captions]" in graph
+
+    ass = (tmp_path / 'captions.ass').read_text(encoding='utf-8')
+    assert ass.count('Dialogue:') == 301
+    assert 'Style: Subtitle0,' in ass and 'Style: Text1,' in ass
+    # 字幕底部居中、半透明黑底框
+    assert '0:00:02.00,0:00:03.80,Subtitle0,,0,0,0,,{\\an8\\pos(540,1632)}第1句字幕' in ass
+
+
+def test_caption_keyframes_split_into_move_events():
+    keyframes = [
+        {'property': 'position', 'offset': 0, 'value': {'x': 0, 'y': 100}},
+        {'property': 'position', 'offset': 0.5, 'value': {'x': 200, 'y': 100}},
+        {'property': 'opacity', 'offset': 0.5, 'value': 1},
+        {'property': 'opacity', 'offset': 1, 'value': 0},
+    ]
+    clip = _caption('t1', 1000, 3000, 'a{b}', clip_type='text', keyframes=keyframes)
+    subtitles, styles = export_module.build_caption_track([clip], 1920, 1080, 30)
+
+    assert list(styles) == ['Text0']
+    assert [(s['start'], s['end']) for s in subtitles] == [(1.0, 2.0), (2.0, 3.0)]
+    assert subtitles[0]['tags'] == '{\\an7\\move(0,100,200,100)}'
+    assert subtitles[1]['tags'] == '{\\an7\\pos(200,100)\\alpha&H00&\\t(\\alpha&HFF&)}'
+    assert subtitles[0]['text'] == 'a\\{b\\}'
+
+
+def test_ass_time_format_rounds_only_for_export():
+    subtitles = [{'start': 0.29, 'end': 3661.999, 'text': 'x'}]
+    rounded = subtitle_module.generate_ass_content(subtitles, {}, round_times=True)
+    assert 'Dialogue: 0,0:00:00.29,1:01:02.00,Default,,0,0,0,,x' in rounded
+    # 烧录路径保持原有截断格式，输出不变
+    burned = subtitle_module.generate_ass_content(subtitles, {})
+    assert 'Dialogue: 0,0:00:00.28,1:01:01.99,Default,,0,0,0,,x' in burned
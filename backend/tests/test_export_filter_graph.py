@@ -0,0 +1,142 @@
+"""
+导出滤镜图 单元测试
+
+覆盖:
+- plan_source_inputs: 每个片段输入级 seek；只有按时间线依次消费的同源片段 split 共享解码
+- build_filter_graph: 不再对整段源文件 trim，输入数与片段数解耦
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+export_module = _load_module('export_under_test', 'app/tasks/export.py')
+
+
+def _clip(clip_id, url, start, end, source_start, clip_type='video'):
+    return {
+        'id': clip_id,
+        'track_id': 't1',
+        'clip_type': clip_type,
+        'url': url,
+        'start': start,
+        'end': end,
+        'source_start': source_start,
+        'source_end': source_start + (end - start),
+    }
+
+
+def _timeline(clips):
+    return {'tracks': [{'id': 't1'}], 'clips': clips}
+
+
+def _source(path, start, end, position, video=True, speed=1.0):
+    return {
+        'path': path, 'start': start, 'end': end, 'video': video,
+        'position': position, 'duration': end - start, 'speed': speed,
+    }
+
+
+def test_plan_merges_only_runs_consumed_in_timeline_order():
+    sources = [
+        _source('a.mp4', 10.0, 12.0, 0.0),
+        _source('a.mp4', 12.5, 14.0, 2.0),    # 时间线紧接、源上间隔 0.5s → 合并
+        _source('b.mp3', 0.0, 5.0, 3.5, video=False),
+        _source('a.mp4', 300.0, 302.0, 8.0),  # 远处 → 单独 seek
+    ]
+    inputs, split_filters, refs = export_module.plan_source_inputs(sources)
+
+    assert inputs == [
+        ['-ss', '10.000', '-t', '4.000', '-i', 'a.mp4'],
+        ['-ss', '0.000', '-t', '5.000', '-i', 'b.mp3'],
+        ['-ss', '300.000', '-t', '2.000', '-i', 'a.mp4'],
+    ]
+    assert split_filters == [
+        '[0:v]split=2[in0v0][in0v1]',
+        '[0:a]asplit=2[in0a0][in0a1]',
+    ]
+    assert refs[0] == {'v': '[in0v0]', 'a': '[in0a0]', 'trim': (0.0, 2.0)}
+    assert refs[1] == {'v': '[in0v1]', 'a': '[in0a1]', 'trim': (2.5, 4.0)}
+    assert refs[2] == {'v': '[1:v]', 'a': '[1:a]', 'trim': None}
+    assert refs[3] == {'v': '[2:v]', 'a': '[2:a]', 'trim': None}
+
+
+def test_plan_keeps_separate_inputs_when_branches_would_buffer():
+    cases = {
+        # 重复区间：第二个分支要等第一个播完才消费，期间的帧全部缓冲
+        'repeated': [_source('a.mp4', 5.0, 8.0, 0.0), _source('a.mp4', 5.0, 8.0, 3.0)],
+        # 源区间乱序
+        'out_of_order': [_source('a.mp4', 20.0, 22.0, 0.0), _source('a.mp4', 18.0, 20.0, 2.0)],
+        # 源上相接但时间线上间隔很远
+        'timeline_gap': [_source('a.mp4', 0.0, 2.0, 0.0), _source('a.mp4', 2.0, 4.0, 30.0)],
+        # 同时出现在时间线上（画中画）
+        'concurrent': [_source('a.mp4', 0.0, 2.0, 0.0), _source('a.mp4', 2.0, 4.0, 1.0)],
+        # 中间插入其他素材
+        'interleaved': [
+            _source('a.mp4', 0.0, 2.0, 0.0), _source('b.mp4', 0.0, 2.0, 2.0), _source('a.mp4', 2.0, 4.0, 4.0),
+        ],
+        # 变速片段与原速分支的消费速率不同
+        'speed': [_source('a.mp4', 0.0, 2.0, 0.0), _source('a.mp4', 2.0, 4.0, 2.0, speed=2.0)],
+    }
+    for name, sources in cases.items():
+        inputs, split_filters, refs = export_module.plan_source_inputs(sources)
+        assert len(inputs) == len(sources), name
+        assert split_filters == [], name
+        assert all(ref['trim'] is None for ref in refs), name
+
+
+def test_filter_graph_seeks_instead_of_trimming_from_zero():
+    url = 'https://cdn/interview.mp4'
+    # 长访谈切成 80 个片段，每段 2s，源上间隔 10s
+    clips = [
+        _clip(f'c{i}', url, i * 2000, i * 2000 + 2000, i * 10000)
+        for i in range(80)
+    ]
+    graph, inputs = export_module.build_filter_graph(
+        timeline=_timeline(clips),
+        assets_map={url: '/tmp/interview.mp4'},
+        width=1080, height=1920, fps=30,
+    )
+
+    assert len(inputs) == 80
+    assert inputs[40][:4] == ['-ss', '400.000', '-t', '2.000']
+    # 输入已 seek 到片段起点，不再出现从源头开始的 trim
+    assert 'trim=start=400' not in graph
+    assert '[40:v]setpts=PTS-STARTPTS' in graph
+
+
+def test_filter_graph_shares_input_for_consecutive_run():
+    url = 'https://cdn/a.mp4'
+    clips = [
+        _clip('c1', url, 0, 3000, 5000),
+        _clip('c2', url, 3000, 6000, 8000),
+        _clip('c3', url, 6000, 8000, 11500, clip_type='audio'),
+        _clip('c4', url, 8000, 10000, 5000),  # 重复前面的源区间 → 单独 seek
+    ]
+    graph, inputs = export_module.build_filter_graph(
+        timeline=_timeline(clips),
+        assets_map={url: '/tmp/a.mp4'},
+        width=720, height=720, fps=30,
+    )
+
+    assert inputs == [
+        ['-ss', '5.000', '-t', '8.500', '-i', '/tmp/a.mp4'],
+        ['-ss', '5.000', '-t', '2.000', '-i', '/tmp/a.mp4'],
+    ]
+    assert '[0:v]split=2[in0v0][in0v1]' in graph
+    assert '[0:a]asplit=3[in0a0][in0a1][in0a2]' in graph
+    assert '[in0v0]trim=start=0.0:end=3.0,setpts=PTS-STARTPTS' in graph
+    assert '[in0a2]atrim=start=6.5:end=8.5,asetpts=PTS-STARTPTS' in graph
+    assert '[1:v]setpts=PTS-STARTPTS' in graph
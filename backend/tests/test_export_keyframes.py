@@ -0,0 +1,220 @@
+"""
+导出关键帧编译 单元测试
+
+覆盖:
+- compile_keyframe_spans: 分段取值与原门控表达式语义一致，常量 / 线性段识别
+- KeyframeCommandScript: sendcmd 脚本格式
+- build_filter_graph: 提供 work_dir 时多段动画走 sendcmd，不再生成门控表达式；
+  命令挂在各片段自己的分支上（片段本地时间），片段平移到时间线位置
+"""
+
+import importlib.util
+import random
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+export_module = _load_module('export_keyframes_under_test', 'app/tasks/export.py')
+
+EASINGS = ['linear', 'ease_in', 'ease_out', 'ease_in_out', 'hold']
+
+
+def _legacy_value(keyframes, t, clip_start, clip_duration):
+    """原 gte/lt 门控表达式的取值"""
+    kfs = sorted(keyframes, key=lambda k: k['offset'])
+    u = (t - clip_start) / clip_duration
+    if u < kfs[0]['offset']:
+        return kfs[0]['value']
+    if u >= kfs[-1]['offset']:
+        return kfs[-1]['value']
+    for kf1, kf2 in zip(kfs, kfs[1:]):
+        if kf1['offset'] <= u < kf2['offset']:
+            local = (u - kf1['offset']) / (kf2['offset'] - kf1['offset'])
+            eased = export_module._ease(kf2.get('easing', 'linear'), local)
+            return kf1['value'] + (kf2['value'] - kf1['value']) * eased
+    raise AssertionError('unreachable')
+
+
+def _span_at(spans, t):
+    for span in spans:
+        if (span['start'] is None or t >= span['start']) and (span['end'] is None or t < span['end']):
+            return span
+    raise AssertionError(f'no span covers {t}')
+
+
+def test_compiled_spans_match_legacy_curve_on_output_frames():
+    rng = random.Random(5)
+    fps = 30
+    for _ in range(100):
+        count = rng.randint(2, 6)
+        offsets = sorted({round(rng.random(), 2) for _ in range(count)} | {0.0})
+        keyframes = [
+            {'offset': o, 'value': rng.choice([0.0, 0.5, 1.0, rng.uniform(-200, 200)]),
+             'easing': rng.choice(EASINGS)}
+            for o in offsets
+        ]
+        clip_start, clip_duration = rng.uniform(0, 20), rng.uniform(0.2, 8)
+        spans = export_module.compile_keyframe_spans(keyframes, clip_start, clip_duration, 0.0, fps=fps)
+
+        for frame in range(int((clip_start - 1) * fps), int((clip_start + clip_duration + 1) * fps)):
+            t = frame / fps
+            expected = _legacy_value(keyframes, t, clip_start, clip_duration)
+            actual = export_module.span_value(_span_at(spans, t), t)
+            assert abs(actual - expected) < 1e-6 * max(1.0, abs(expected))
+
+
+def test_constant_and_linear_spans_emit_trivial_expressions():
+    # 全程不变 → 单个常量
+    constant = [{'offset': 0, 'value': 0.8}, {'offset': 0.5, 'value': 0.8}, {'offset': 1, 'value': 0.8}]
+    spans = export_module.compile_keyframe_spans(constant, 2.0, 4.0, 1.0)
+    assert len(spans) == 1
+    assert export_module.spans_to_expression(spans) == '0.8'
+
+    # 线性段 → a+b*t，不含 pow / if
+    linear = [{'offset': 0, 'value': 0}, {'offset': 1, 'value': 100}]
+    spans = export_module.compile_keyframe_spans(linear, 2.0, 4.0, 0)
+    assert [span['kind'] for span in spans] == ['constant', 'linear', 'constant']
+    assert export_module.span_expression(spans[1]) == '-50+25*t'
+
+    # 缓动段只覆盖 2 帧 → 在输出帧上退化为线性
+    short = [{'offset': 0, 'value': 0}, {'offset': 1, 'value': 1, 'easing': 'ease_in'}]
+    spans = export_module.compile_keyframe_spans(short, 0.0, 0.05, 0, fps=30)
+    assert spans[1]['kind'] == 'linear'
+
+
+def test_command_script_renders_sendcmd_intervals():
+    script = export_module.KeyframeCommandScript(fps=10)
+    spans = export_module.compile_keyframe_spans(
+        [{'offset': 0, 'value': 0}, {'offset': 0.5, 'value': 1}, {'offset': 1, 'value': 1}],
+        1.0, 0.4, 0.0,
+    )
+    assert export_module.KeyframeCommandScript(fps=10).bind_expression('overlay@kf0', 'x', spans) == '0'
+
+    initial = script.bind_sampled('colorchannelmixer@kf0', 'aa', spans)
+    assert initial == '0'
+    assert script.render().splitlines() == [
+        "1.000000 [enter] colorchannelmixer@kf0 aa '0';",
+        "1.100000 [enter] colorchannelmixer@kf0 aa '0.5';",
+        "1.200000 [enter] colorchannelmixer@kf0 aa '1';",
+    ]
+
+
+def test_filter_graph_uses_sendcmd_for_animated_clips(tmp_path):
+    url = 'https://cdn/a.mp4'
+    keyframes = [
+        {'property': 'opacity', 'offset': 0, 'value': 0},
+        {'property': 'opacity', 'offset': 0.5, 'value': 1, 'easing': 'ease_in_out'},
+        {'property': 'position', 'offset': 0, 'value': {'x': 0, 'y': 0}},
+        {'property': 'position', 'offset': 1, 'value': {'x': 200, 'y': 100}, 'easing': 'ease_out'},
+        {'property': 'volume', 'offset': 0, 'value': 0},
+        {'property': 'volume', 'offset': 1, 'value': 1},
+    ]
+    timeline = {
+        'tracks': [{'id': 't1'}],
+        'clips': [{
+            'id': 'c1', 'track_id': 't1', 'clip_type': 'video', 'url': url,
+            'start': 1000, 'end': 3000, 'source_start': 0, 'keyframes': keyframes,
+        }],
+    }
+    graph, _ = export_module.build_filter_graph(
+        timeline=timeline, assets_map={url: '/tmp/a.mp4'},
+        width=720, height=720, fps=30, work_dir=str(tmp_path),
+    )
+
+    parts = graph.split(';')
+    video_chain = next(p for p in parts if p.endswith('[v0]'))
+    audio_chain = next(p for p in parts if p.endswith('[a0]'))
+
+    assert 'gte(t' not in graph
+    assert 'sendcmd' not in parts[0] and 'sendcmd' not in parts[1]
+    # 命令挂在片段分支上：setpts 归零之后、目标滤镜之前；分支末尾平移到时间线 1s
+    assert f"setpts=PTS-STARTPTS,sendcmd=f='{tmp_path / 'keyframes_v0.cmd'}'," in video_chain
+    assert video_chain.index('sendcmd') < video_chain.index('colorchannelmixer@kf0=aa=0')
+    assert video_chain.endswith('setpts=PTS+1/TB[v0]')
+    assert f"asendcmd=f='{tmp_path / 'keyframes_a0.cmd'}',volume@kf0=" in audio_chain
+    assert audio_chain.endswith('adelay=delays=1000:all=1[a0]')
+    # overlay 的命令挂在它自己的主输入上
+    assert f"[base]sendcmd=f='{tmp_path / 'keyframes_ov0.cmd'}'[ovcmd0]" in parts
+    assert any(p.startswith('[ovcmd0][v0]overlay@kf0=') for p in parts)
+
+    # 分支内命令为片段本地时间（opacity 在本地 0~1s 间逐帧变化），overlay 命令为时间线时间
+    clip_times = [float(line.split()[0]) for line in (tmp_path / 'keyframes_v0.cmd').read_text().splitlines()]
+    assert clip_times[0] < 0.1 and clip_times[-1] == 1.0
+    assert 'volume@kf0 volume' in (tmp_path / 'keyframes_a0.cmd').read_text()
+    overlay_cmds = (tmp_path / 'keyframes_ov0.cmd').read_text()
+    assert overlay_cmds.startswith('1.000000 [enter] overlay@kf0 x')
+
+    # 不提供 work_dir 时回退为内联表达式
+    inline_graph, _ = export_module.build_filter_graph(
+        timeline=timeline, assets_map={url: '/tmp/a.mp4'}, width=720, height=720, fps=30,
+    )
+    assert 'sendcmd' not in inline_graph
+    assert 'gte(t' in inline_graph
+
+
+def _ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', *args], check=True, capture_output=True)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='未安装 ffmpeg')
+def test_rendered_clip_at_timeline_offset_switches_at_clip_local_time(tmp_path):
+    """时间线 2s 处的白色片段，本地 0.5s 时透明度从 0 跳到 1 → 画面应在时间线 2.5s 变白"""
+    fps, size = 10, 32
+    source = tmp_path / 'white.mkv'
+    _ffmpeg(
+        '-f', 'lavfi', '-i', f'color=c=white:s={size}x{size}:r={fps}:d=4',
+        '-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=48000',
+        '-t', '4', '-c:v', 'ffv1', '-c:a', 'pcm_s16le', str(source),
+    )
+    url = 'https://cdn/white.mkv'
+    timeline = {
+        'tracks': [{'id': 't1'}],
+        'clips': [{
+            'id': 'c1', 'track_id': 't1', 'clip_type': 'video', 'url': url,
+            'start': 2000, 'end': 4000, 'source_start': 0,
+            'keyframes': [
+                {'property': 'opacity', 'offset': 0, 'value': 0},
+                {'property': 'opacity', 'offset': 0.25, 'value': 1, 'easing': 'hold'},
+                {'property': 'opacity', 'offset': 1, 'value': 1},
+            ],
+        }],
+    }
+    graph, inputs = export_module.build_filter_graph(
+        timeline=timeline, assets_map={url: str(source)},
+        width=size, height=size, fps=fps, work_dir=str(tmp_path),
+    )
+    assert 'sendcmd' in graph
+
+    frames_path = tmp_path / 'frames.gray'
+    _ffmpeg(
+        *[arg for spec in inputs for arg in spec],
+        '-filter_complex', graph,
+        '-map', '[outv]', '-f', 'rawvideo', '-pix_fmt', 'gray', str(frames_path),
+        '-map', '[outa]', '-f', 'null', '-',
+    )
+    data = frames_path.read_bytes()
+    frame_size = size * size
+    brightness = [sum(data[i:i + frame_size]) / frame_size for i in range(0, len(data), frame_size)]
+
+    def at(seconds):
+        return brightness[int(seconds * fps)]
+
+    assert at(1.0) < 30   # 片段之前：黑底
+    assert at(2.2) < 30   # 片段已出现，但本地 0.2s 透明度为 0
+    assert at(2.7) > 180  # 本地 0.7s 透明度为 1
+    assert at(3.5) > 180
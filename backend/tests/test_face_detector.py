@@ -0,0 +1,157 @@
+"""
+人脸检测 / 人脸轨迹索引 单元测试
+
+覆盖:
+- build_track_index: 采样时间点与原先逐帧采样一致，seek / grab 两种取帧模式
+- FaceTrackIndex: 序列化往返、按时间区间查询
+- PiP 位置: 按素材区间查询索引，不解码视频
+"""
+
+import importlib.util
+import sys
+import threading
+import types
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class _FakeCapture:
+    """按帧号返回常量帧的 VideoCapture 替身，记录解码方式"""
+
+    def __init__(self, path, fps=25.0, frame_count=250):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.pos = 0
+        self.seeks = []
+        self.decoded = 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {
+            'fps': self.fps,
+            'count': self.frame_count,
+            'width': 1920,
+            'height': 1080,
+        }[prop]
+
+    def set(self, prop, value):
+        self.seeks.append(value)
+        self.pos = int(round(value * self.fps / 1000))
+        return True
+
+    def grab(self):
+        if self.pos >= self.frame_count:
+            return False
+        self.pos += 1
+        return True
+
+    def retrieve(self):
+        self.decoded += 1
+        return True, np.full((4, 4, 3), self.pos - 1, dtype=np.uint8)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+
+def _load_module(module_name: str, relative_path: str):
+    cv2_stub = types.ModuleType('cv2')
+    cv2_stub.CAP_PROP_FPS = 'fps'
+    cv2_stub.CAP_PROP_FRAME_COUNT = 'count'
+    cv2_stub.CAP_PROP_FRAME_WIDTH = 'width'
+    cv2_stub.CAP_PROP_FRAME_HEIGHT = 'height'
+    cv2_stub.CAP_PROP_POS_MSEC = 'pos_msec'
+    cv2_stub.VideoCapture = _FakeCapture
+    sys.modules['cv2'] = cv2_stub
+    sys.modules.setdefault('mediapipe', MagicMock())
+
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+fd_module = _load_module('face_detector_under_test', 'app/services/face_detector.py')
+FaceRegion = fd_module.FaceRegion
+
+
+def _make_detector(capture):
+    """不初始化 MediaPipe：帧号 >= 100 时在左上角检测到人脸"""
+    detector = fd_module.FaceDetector.__new__(fd_module.FaceDetector)
+    detector._lock = threading.Lock()
+
+    def _detect(frame, timestamp_ms=0):
+        faces = [FaceRegion(0.05, 0.05, 0.2, 0.2, 0.9)] if frame[0, 0, 0] >= 100 else []
+        return fd_module.FaceDetectionFrameResult(faces, 4, 4, timestamp_ms)
+
+    detector.detect_from_frame = _detect
+    fd_module.cv2.VideoCapture = lambda path: capture
+    return detector
+
+
+def test_build_track_index_seeks_to_sample_points(tmp_path):
+    video = tmp_path / 'v.mp4'
+    video.write_bytes(b'')
+    capture = _FakeCapture(str(video))
+    index = _make_detector(capture).build_track_index(str(video), sample_interval_ms=1000, batch_size=3)
+
+    # 与原实现一致: 帧号间隔 int(fps * interval)，时间戳 int(frame / fps * 1000)
+    assert index.timestamps == [int(f / 25 * 1000) for f in range(0, 250, 25)]
+    assert capture.seeks == index.timestamps
+    # 每个采样点只解码一帧
+    assert capture.decoded == len(index.timestamps)
+    assert [bool(f) for f in index.faces] == [f >= 100 for f in range(0, 250, 25)]
+    assert index.duration_ms == 10000
+
+
+def test_build_track_index_grabs_for_short_intervals(tmp_path):
+    video = tmp_path / 'v.mp4'
+    video.write_bytes(b'')
+    capture = _FakeCapture(str(video), frame_count=50)
+    index = _make_detector(capture).build_track_index(str(video), sample_interval_ms=200, max_samples=4)
+
+    assert capture.seeks == []
+    assert capture.decoded == 4
+    assert index.timestamps == [0, 200, 400, 600]
+
+
+def test_track_index_round_trip_and_range_query():
+    index = fd_module.FaceTrackIndex(
+        sample_interval_ms=1000, frame_width=1920, frame_height=1080, duration_ms=5000,
+        timestamps=[0, 1000, 2000, 3000, 4000],
+        faces=[[], [], [FaceRegion(0.7, 0.7, 0.2, 0.2, 0.9)], [], []],
+    )
+    restored = fd_module.FaceTrackIndex.from_dict(index.to_dict())
+    assert restored.timestamps == index.timestamps
+    assert restored.faces == index.faces
+
+    assert [f.timestamp_ms for f in index.frames_in_range(1000, 3000)] == [1000, 2000, 3000]
+    # 区间短于采样间隔 → 最近的采样点
+    assert [f.timestamp_ms for f in index.frames_in_range(2100, 2300)] == [2000]
+    assert fd_module.FaceTrackIndex.from_dict({'version': 0}) is None
+
+
+def test_safe_pip_position_for_asset_uses_index_range():
+    index = fd_module.FaceTrackIndex(
+        sample_interval_ms=1000, frame_width=1920, frame_height=1080, duration_ms=4000,
+        timestamps=[0, 1000, 2000, 3000],
+        faces=[[], [], [FaceRegion(0.7, 0.7, 0.25, 0.25, 0.9)], []],
+    )
+    fd_module._remember_face_track('asset-1', index)
+
+    assert fd_module.get_safe_pip_position_for_asset('asset-1', 0, 1500)[2] == 'bottom-right'
+    assert fd_module.get_safe_pip_position_for_asset('asset-1', 1500, 2500)[2] != 'bottom-right'
+    result = fd_module.FaceDetector.analyze_track(index, 1500, 2500)
+    assert 'bottom-right' not in result.safe_pip_positions
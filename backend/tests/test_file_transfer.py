@@ -0,0 +1,154 @@
+"""
+流式文件传输 单元测试
+
+覆盖:
+- download_to_file: 分块写盘 + sha256，响应截断后按 Range 续传
+- 服务端忽略 Range 时从头重下；校验失败不留下目标文件
+- upload_file_to_storage: 以文件句柄上传，网络错误重试
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+ft_module = _load_module('file_transfer_under_test', 'app/utils/file_transfer.py')
+ft_module.RETRY_BACKOFF_SECONDS = 0
+
+PAYLOAD = bytes(range(256)) * 4000  # ~1MB
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _TruncatingStream(httpx.AsyncByteStream):
+    """发送一部分数据后断开连接"""
+
+    def __init__(self, data: bytes, cut: int):
+        self.data = data
+        self.cut = cut
+
+    async def __aiter__(self):
+        yield self.data[:self.cut]
+        raise httpx.ReadError('connection reset')
+
+
+def _server(support_range=True, cut_first=None):
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request.headers.get('range'))
+        range_header = request.headers.get('range')
+        if range_header and support_range:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            body = PAYLOAD[start:]
+            headers = {
+                'content-range': f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}',
+                'content-length': str(len(body)),
+            }
+            return httpx.Response(206, headers=headers, content=body)
+        if cut_first is not None and len(requests) == 1:
+            return httpx.Response(
+                200,
+                headers={'content-length': str(len(PAYLOAD))},
+                stream=_TruncatingStream(PAYLOAD, cut_first),
+            )
+        return httpx.Response(200, content=PAYLOAD)
+
+    return handler, requests
+
+
+async def _download(handler, dest, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        return await ft_module.download_to_file('https://cdn/a.mp4', str(dest), client=client, chunk_size=4096, **kwargs)
+
+
+def test_download_streams_to_disk_and_hashes(tmp_path):
+    handler, requests = _server()
+    dest = tmp_path / 'a.mp4'
+    result = run(_download(handler, dest, expected_sha256=hashlib.sha256(PAYLOAD).hexdigest()))
+
+    assert dest.read_bytes() == PAYLOAD
+    assert result.size == len(PAYLOAD)
+    assert result.resumes == 0
+    assert requests == [None]
+    assert not (tmp_path / 'a.mp4.part').exists()
+
+
+def test_download_resumes_with_range_after_disconnect(tmp_path):
+    handler, requests = _server(cut_first=204_800)
+    dest = tmp_path / 'a.mp4'
+    result = run(_download(handler, dest, expected_size=len(PAYLOAD)))
+
+    assert requests == [None, 'bytes=204800-']
+    assert result.resumes == 1
+    assert result.sha256 == hashlib.sha256(PAYLOAD).hexdigest()
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_download_restarts_when_range_ignored(tmp_path):
+    handler, requests = _server(support_range=False, cut_first=204_800)
+    dest = tmp_path / 'a.mp4'
+    result = run(_download(handler, dest))
+
+    assert requests == [None, 'bytes=204800-']
+    assert result.resumes == 0
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_download_checksum_mismatch_leaves_no_file(tmp_path):
+    handler, _ = _server()
+    dest = tmp_path / 'a.mp4'
+    with pytest.raises(ft_module.TransferError):
+        run(_download(handler, dest, expected_sha256='0' * 64))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_passes_file_handle_and_retries(tmp_path):
+    source = tmp_path / 'out.mp4'
+    source.write_bytes(PAYLOAD)
+    calls = []
+
+    class _Bucket:
+        def upload(self, path, file, file_options=None):
+            calls.append((path, type(file).__name__, dict(file_options)))
+            if len(calls) == 1:
+                file.read(1024)
+                raise httpx.WriteError('broken pipe')
+            assert file.read() == PAYLOAD
+
+    class _Storage:
+        def from_(self, bucket):
+            assert bucket == 'ai-creations'
+            return _Bucket()
+
+    class _Client:
+        storage = _Storage()
+
+    size = ft_module.upload_file_to_storage(
+        'ai-creations', 'u/1.mp4', str(source), 'video/mp4', storage_client=_Client(),
+    )
+    assert size == len(PAYLOAD)
+    assert [c[1] for c in calls] == ['BufferedReader', 'BufferedReader']
+    assert calls[1][2] == {'content-type': 'video/mp4', 'upsert': 'true'}
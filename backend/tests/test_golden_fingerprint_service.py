@@ -0,0 +1,247 @@
+"""
+Golden Fingerprint Service 单元测试
+
+覆盖:
+- ProfileMatrix 批量打分与逐个 profile 标量打分一致
+- 增量维护的数据驱动 profile 与全量重建一致
+- 多个 worker 通过共享版本号对齐 profile
+"""
+
+import importlib.util
+import random
+import sys
+import types
+from pathlib import Path
+from unittest.mock import MagicMock
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    sb_stub = types.ModuleType('app.services.supabase_client')
+    sb_stub.supabase = MagicMock()  # type: ignore[attr-defined]
+    sb_stub.get_supabase = lambda: sb_stub.supabase  # type: ignore[attr-defined]
+    sys.modules['app.services.supabase_client'] = sb_stub
+
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+gf_module = _load_module('golden_fingerprint_service_under_test', 'app/services/golden_fingerprint_service.py')
+GoldenFingerprintService = gf_module.GoldenFingerprintService
+
+
+CATEGORIES = ['occlusion', 'cinematic', 'regional', 'morphing', 'unknown']
+FAMILIES = ['spin', 'whip_pan', 'zoom_blur', 'flash_cut', 'luma_wipe', 'dolly_zoom', 'morph', 'occlusion']
+CAMERAS = ['push', 'pull', 'pan_left', 'pan_right', 'orbit', 'dolly_zoom', 'handheld', 'static']
+MOTIONS = ['subject_spin_360', 'whip_pan_left', 'zoom_warp_portal', 'luma_wipe_scene', 'Fast_Turn', '']
+
+
+def _random_fingerprint(rng: random.Random):
+    return {
+        'transition_category': rng.choice(CATEGORIES),
+        'family': rng.choice(FAMILIES),
+        'camera_movement': rng.choice(CAMERAS),
+        'motion_pattern': rng.choice(MOTIONS),
+        'duration_ms': rng.choice([0, 150, 300, 480, 900, 1400, 2600]),
+        'dimension_scores': {
+            'outfit_change': rng.random(),
+            'subject_preserve': rng.random(),
+            'scene_shift': rng.random(),
+        },
+    }
+
+
+def _reference_score(fingerprint, criteria):
+    """逐个 profile 的标量打分（矩阵化之前的实现）"""
+    weights = gf_module.FINGERPRINT_WEIGHTS
+    score = 0.0
+
+    # 1) transition_category
+    fp_category = fingerprint.get('transition_category', '')
+    allowed_categories = criteria.get('transition_category', [])
+    if allowed_categories and fp_category in allowed_categories:
+        score += weights['transition_category']
+
+    # 2) family
+    fp_family = fingerprint.get('family', '')
+    allowed_families = criteria.get('family', [])
+    if allowed_families and fp_family in allowed_families:
+        score += weights['family']
+
+    # 3) camera_movement
+    fp_camera = fingerprint.get('camera_movement', '')
+    allowed_cameras = criteria.get('camera_movement', [])
+    if allowed_cameras and fp_camera in allowed_cameras:
+        score += weights['camera_movement']
+
+    # 4) motion_pattern (关键词模糊匹配)
+    fp_motion = (fingerprint.get('motion_pattern', '') or '').lower()
+    keywords = criteria.get('motion_pattern_keywords', [])
+    if keywords and fp_motion:
+        matched_keywords = sum(1 for kw in keywords if kw.lower() in fp_motion)
+        if matched_keywords > 0:
+            keyword_ratio = min(matched_keywords / len(keywords), 1.0)
+            score += weights['motion_pattern'] * keyword_ratio
+
+    # 5) duration_range
+    fp_duration = fingerprint.get('duration_ms', 0)
+    duration_range = criteria.get('duration_range', [])
+    if len(duration_range) == 2 and fp_duration:
+        min_dur, max_dur = duration_range
+        if min_dur <= fp_duration <= max_dur:
+            score += weights['duration_range']
+        else:
+            # 部分分：距离越近扣分越少
+            if fp_duration < min_dur:
+                distance_ratio = max(0, 1 - (min_dur - fp_duration) / 500)
+            else:
+                distance_ratio = max(0, 1 - (fp_duration - max_dur) / 500)
+            score += weights['duration_range'] * distance_ratio * 0.5
+
+    # 6) dimension_match: LLM 多维度评分与 profile.recommended_for 的吻合度
+    fp_dim_scores = fingerprint.get('dimension_scores') or {}
+    recommended_for = criteria.get('recommended_for', [])
+    if recommended_for and fp_dim_scores:
+        # 计算 profile 关心的维度的平均得分
+        relevant_scores = [fp_dim_scores.get(dim, 0.0) for dim in recommended_for]
+        if relevant_scores:
+            avg_relevance = sum(relevant_scores) / len(relevant_scores)
+            score += weights["dimension_match"] * avg_relevance
+
+    return score
+
+
+def _record(template_id, family, motion, duration, label='golden', status='published', config=None):
+    return {
+        'template_id': template_id,
+        'status': status,
+        'quality_label': label,
+        'publish_config': config or {'default_cfg_scale': 0.5, 'default_mode': 'pro'},
+        'metadata': {
+            'golden_fingerprint': {
+                'transition_category': 'cinematic',
+                'family': family,
+                'camera_movement': 'push',
+                'motion_pattern': motion,
+                'duration_ms': duration,
+            },
+        },
+    }
+
+
+def _seed(service, records):
+    gf_module.supabase.table.return_value.select.return_value.in_.return_value.eq.return_value.execute.return_value = (
+        MagicMock(data=records)
+    )
+    return service.rebuild_profiles()
+
+
+def test_profile_matrix_matches_scalar_scores():
+    service = GoldenFingerprintService()
+    rng = random.Random(7)
+    fingerprints = [_random_fingerprint(rng) for _ in range(200)]
+
+    scores = service.matrix.score(fingerprints)
+    for i, fp in enumerate(fingerprints):
+        for p, name in enumerate(service.matrix.names):
+            criteria = service._profiles[name]['match_criteria']
+            assert abs(scores[i, p] - _reference_score(fp, criteria)) < 1e-9
+
+    batch = service.match_profiles(fingerprints)
+    for fp, result in zip(fingerprints, batch):
+        expected = max(
+            ((name, _reference_score(fp, profile['match_criteria']))
+             for name, profile in service._profiles.items()),
+            key=lambda item: item[1],
+        )
+        assert result[0] == expected[0]
+        assert result[1] == round(expected[1], 3)
+
+
+def test_match_profile_returns_none_when_nothing_matches():
+    service = GoldenFingerprintService()
+    assert service.match_profile({'family': 'nope', 'motion_pattern': ''}) == (None, 0.0, None)
+
+
+def test_observe_template_updates_profiles_incrementally():
+    records = [
+        _record('a1', 'glitch', 'glitch_shake_fast', 300),
+        _record('a2', 'glitch', 'glitch_rgb_split', 500),
+        _record('b1', 'swirl', 'swirl_rotate', 700),
+        _record('b2', 'swirl', 'swirl_twist', 900),
+        _record('c1', 'solo', 'solo_move', 600),
+    ]
+    service = GoldenFingerprintService()
+    result = _seed(service, records)
+    assert result['success'] is True
+    assert service.tracks_labels
+    assert {'glitch_rebuilt', 'swirl_rebuilt'} <= set(service._profiles)
+    assert 'solo_rebuilt' not in service._profiles
+
+    # 新标注一个 solo 模板 → solo 达到最小样本数
+    new_record = _record('c2', 'solo', 'solo_jump', 800)
+    assert service.observe_template(new_record) is True
+    assert service._profiles['solo_rebuilt']['match_criteria']['duration_range'] == [500, 900]
+
+    # 降级为 poor → 移除
+    assert service.observe_template({**new_record, 'quality_label': 'poor'}) is True
+    assert 'solo_rebuilt' not in service._profiles
+
+    # 增量结果与全量重建一致
+    service.observe_template(_record('b3', 'swirl', 'swirl_spin', 1000))
+    service.forget_template('a2')
+    fresh = GoldenFingerprintService()
+    _seed(fresh, [r for r in records if r['template_id'] != 'a2'] + [_record('b3', 'swirl', 'swirl_spin', 1000)])
+    assert service._profiles == fresh._profiles
+
+
+class _VersionStore:
+    """进程间共享的版本号（代替 Redis 的 get / incr）"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+
+def test_profile_changes_propagate_across_workers():
+    records = [
+        _record('a1', 'glitch', 'glitch_shake_fast', 300),
+        _record('a2', 'glitch', 'glitch_rgb_split', 500),
+        _record('b1', 'swirl', 'swirl_rotate', 700),
+        _record('b2', 'swirl', 'swirl_twist', 900),
+        _record('c1', 'solo', 'solo_move', 600),
+    ]
+    store = _VersionStore()
+    worker_a = GoldenFingerprintService(version_store=store, sync_interval=0)
+    worker_b = GoldenFingerprintService(version_store=store, sync_interval=0)
+
+    # 未重建前 B 不跟踪标注
+    assert worker_b.tracks_labels is False
+
+    _seed(worker_a, records)
+    assert worker_b.tracks_labels is True
+    assert worker_b._profiles == worker_a._profiles
+
+    # A 处理一次标注变化（DB 已写入），B 下次访问时重载
+    labelled = _record('c2', 'solo', 'solo_jump', 800)
+    rows = records + [labelled]
+    gf_module.supabase.table.return_value.select.return_value.in_.return_value.eq.return_value.execute.return_value = (
+        MagicMock(data=rows)
+    )
+    assert worker_a.observe_template(labelled) is True
+    assert 'solo_rebuilt' in {p['name'] for p in worker_b.get_profiles()}
+    assert worker_b._profiles == worker_a._profiles
+
+    # 版本未变时不重复读 DB
+    assert worker_b.sync(force=True) is False
@@ -0,0 +1,142 @@
+"""
+图片句柄存储 单元测试
+
+覆盖:
+- 同一内容多次写入只存一份，句柄相同
+- 用途变体：超尺寸缩放且只生成一次；已达标的 JPEG 直接复用原字节
+- llm 变体保留透明通道（PNG），kling 变体铺白底转 JPEG
+- 字节预算淘汰：持有句柄的管线仍可读取原图 / 解码 / 生成变体，无字节的句柄抛 ImageNotFound
+- image_ref_to_url 对 URL、data URL、裸 base64 的兼容
+"""
+
+import base64
+import dataclasses
+import importlib.util
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+store_module = _load_module('image_store_under_test', 'app/services/image_store.py')
+
+
+def _encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def _decode(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_same_content_stored_once():
+    store = store_module.ImageStore()
+    data = _encode(Image.new('RGB', (8, 6), (200, 10, 10)), 'PNG')
+
+    first = store.put_bytes(data)
+    second = store.put_base64(base64.b64encode(data).decode())
+    third = store.put_data_url('data:image/png;base64,' + base64.b64encode(data).decode())
+
+    assert first == second == third
+    assert first.size == (8, 6) and first.mime_type == 'image/png'
+    assert len(store._entries) == 1
+    # 解码结果是副本，调用方修改不影响缓存
+    opened = store.open(first)
+    opened.putpixel((0, 0), (0, 0, 0))
+    assert store.open(first).getpixel((0, 0)) == (200, 10, 10)
+
+
+def test_variants_downscale_once_and_reuse_fitting_jpeg(monkeypatch):
+    store = store_module.ImageStore()
+    large = store.put_bytes(_encode(Image.new('RGB', (3000, 1500), (10, 120, 10)), 'PNG'))
+    small_jpeg = _encode(Image.new('RGB', (64, 32), (10, 10, 120)), 'JPEG')
+    small = store.put_bytes(small_jpeg)
+
+    renders = []
+    original = store_module.render_jpeg
+
+    def counting_render(image, max_side, quality):
+        renders.append(max_side)
+        return original(image, max_side, quality)
+
+    monkeypatch.setattr(store_module, 'render_jpeg', counting_render)
+
+    data, mime = store.variant(large, 'llm')
+    assert mime == 'image/jpeg' and _decode(data).size == (1024, 512)
+    assert store.variant(large, 'llm') == (data, mime)
+    assert renders == [1024]
+
+    assert store.variant(small, 'kling') == (small_jpeg, 'image/jpeg')
+    assert renders == [1024]
+
+
+def test_alpha_kept_for_llm_and_flattened_for_kling():
+    store = store_module.ImageStore()
+    sketch = Image.new('RGBA', (20, 20), (0, 0, 0, 0))
+    sketch.putpixel((5, 5), (0, 0, 255, 255))
+    handle = store.put_image(sketch)
+
+    llm_data, llm_mime = store.variant(handle, 'llm')
+    assert llm_mime == 'image/png'
+    assert _decode(llm_data).getpixel((0, 0))[3] == 0
+
+    kling_data, kling_mime = store.variant(handle, 'kling')
+    kling = _decode(kling_data)
+    assert kling_mime == 'image/jpeg' and kling.mode == 'RGB'
+    assert all(channel > 240 for channel in kling.getpixel((0, 0)))
+
+
+def test_budget_eviction_raises_image_not_found():
+    first_bytes = _encode(Image.new('RGB', (32, 32), (1, 2, 3)), 'PNG')
+    second_bytes = _encode(Image.new('RGB', (32, 32), (4, 5, 6)), 'PNG')
+    store = store_module.ImageStore(max_bytes=len(first_bytes) + len(second_bytes) - 1)
+
+    first = store.put_bytes(first_bytes)
+    store.put_bytes(second_bytes)
+
+    assert ('blob', first.digest) not in store._entries
+    with pytest.raises(store_module.ImageNotFound):
+        store.get_bytes(dataclasses.replace(first, data=None))
+    # 重新写入后可再次读取
+    assert store.put_bytes(first_bytes) == first
+    assert store.get_bytes(first) == first_bytes
+
+
+def test_handle_survives_eviction_mid_pipeline():
+    image = Image.new('RGB', (1200, 600), (30, 60, 90))
+    store = store_module.ImageStore(max_bytes=20_000, max_decoded=1)
+    handle = store.put_image(image)
+
+    # 其他请求在 put 与 get 之间填满预算，原图和解码缓存都被挤出
+    for shade in range(8):
+        store.put_bytes(_encode(Image.effect_noise((64, 64), 40 + shade).convert('RGB'), 'PNG'))
+    assert ('blob', handle.digest) not in store._entries
+    assert handle.digest not in store._decoded
+
+    assert store.open(handle).getpixel((0, 0)) == (30, 60, 90)
+    data, mime_type = store.variant(handle, 'llm')
+    assert mime_type == 'image/jpeg' and _decode(data).size == (1024, 512)
+    assert store.get_bytes(handle) == handle.data
+
+
+def test_image_refs_pass_through_at_service_boundary():
+    assert store_module.image_ref_to_url('https://cdn/a.jpg') == 'https://cdn/a.jpg'
+    assert store_module.image_ref_to_url('data:image/jpeg;base64,QUJD') == 'data:image/jpeg;base64,QUJD'
+    assert store_module.image_ref_to_url('QUJD') == 'data:image/png;base64,QUJD'
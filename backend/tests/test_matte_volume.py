@@ -0,0 +1,65 @@
+"""
+前景 matte 体 单元测试
+
+覆盖:
+- matte_dimensions: 最长边上限 + 偶数宽高
+- propagate_keyframe_mattes: 关键帧间线性插值，末尾保持最后一个关键帧
+- smooth_matte_volume: 分块结果与整体三维滤波一致（块边界无接缝），写入磁盘映射数组
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+wf_module = _load_module('matte_volume_under_test', 'app/services/background_replace_workflow.py')
+
+
+def test_matte_dimensions_bounded_and_even():
+    assert wf_module.matte_dimensions((1920, 1080), 1280) == (1280, 720)
+    assert wf_module.matte_dimensions((641, 361), 1280) == (640, 360)
+
+
+def test_keyframe_mattes_propagate_linearly(tmp_path):
+    volume = wf_module.open_matte_volume(str(tmp_path / 'raw.npy'), 8, 2, 2)
+    volume[0] = 0
+    volume[4] = 200
+
+    wf_module.propagate_keyframe_mattes(volume, [4, 0])
+
+    assert [int(volume[i, 0, 0]) for i in range(8)] == [0, 50, 100, 150, 200, 200, 200, 200]
+    assert isinstance(volume, np.memmap)
+
+
+def _reference_smooth(volume):
+    """整体（不分块）计算的参考结果"""
+    v = np.pad(volume.astype(np.float32), 1, mode='edge')
+    t = 0.2 * v[:-2] + 0.6 * v[1:-1] + 0.2 * v[2:]
+    y = 0.25 * t[:, :-2] + 0.5 * t[:, 1:-1] + 0.25 * t[:, 2:]
+    x = 0.25 * y[:, :, :-2] + 0.5 * y[:, :, 1:-1] + 0.25 * y[:, :, 2:]
+    return np.clip(np.rint(x), 0, 255).astype(np.uint8)
+
+
+def test_chunked_smoothing_matches_whole_volume(tmp_path):
+    rng = np.random.default_rng(0)
+    src = wf_module.open_matte_volume(str(tmp_path / 'raw.npy'), 11, 6, 5)
+    src[:] = rng.integers(0, 256, size=src.shape, dtype=np.uint8)
+    expected = _reference_smooth(np.asarray(src))
+
+    for chunk in (1, 3, 16):
+        dst = wf_module.open_matte_volume(str(tmp_path / f'smoothed_{chunk}.npy'), *src.shape)
+        wf_module.smooth_matte_volume(src, dst, chunk_frames=chunk)
+        assert np.array_equal(np.asarray(dst), expected)
@@ -0,0 +1,257 @@
+"""
+Prompt 增强器 单元测试
+
+覆盖:
+- prompt_library 快照：分页全量加载一次，fallback / negative 与原 DB 查询的过滤语义一致
+- 快照失效后重新加载；加载在锁外进行，并发读取只加载一次
+- 多进程失效：写入方递增共享版本号，其他进程检测到变化后重载
+- L3 改写按规范化 prompt 缓存
+- L3 超出延迟预算时保留原 prompt，后台完成后写入缓存
+"""
+
+import asyncio
+import importlib.util
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+enhancer_module = _load_module('prompt_enhancer_under_test', 'app/services/prompt_enhancer.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.log = log
+        self.bounds = None
+
+    def select(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        self.log.append(self.bounds)
+        start, end = self.bounds
+        return _Result(self.rows[start:end + 1])
+
+
+class _Supabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.log = []
+
+    def table(self, name):
+        assert name == 'prompt_library'
+        return _Query(self.rows, self.log)
+
+
+ROWS = [
+    {'capability': 'omni_image', 'platform': 'universal', 'input_type': 'universal',
+     'prompt': 'universal best', 'negative_prompt': '', 'quality_score': 0.9},
+    {'capability': 'omni_image', 'platform': 'douyin', 'input_type': 'selfie',
+     'prompt': 'douyin selfie', 'negative_prompt': 'neg douyin selfie', 'quality_score': 0.7},
+    {'capability': 'omni_image', 'platform': 'douyin', 'input_type': 'ecommerce',
+     'prompt': 'douyin ecommerce', 'negative_prompt': 'neg douyin ecommerce', 'quality_score': 0.8},
+    {'capability': 'relight', 'platform': 'universal', 'input_type': 'universal',
+     'prompt': 'relight', 'negative_prompt': 'neg relight', 'quality_score': 0.5},
+]
+
+
+class _VersionStore:
+    """Redis get / incr 替身（多个进程共享）"""
+
+    def __init__(self):
+        self.value = 0
+
+    def get(self, key):
+        return str(self.value)
+
+    def incr(self, key):
+        self.value += 1
+        return self.value
+
+
+def _enhancer(monkeypatch, rows=ROWS, page_size=2, version_store=None, supabase=None):
+    monkeypatch.setattr(enhancer_module, 'PROMPT_LIBRARY_PAGE_SIZE', page_size)
+    enhancer = enhancer_module.PromptEnhancer(redis_url=None, version_store=version_store)
+    enhancer._supabase = supabase or _Supabase(list(rows))
+    return enhancer
+
+
+def test_snapshot_matches_query_semantics_and_loads_once(monkeypatch):
+    enhancer = _enhancer(monkeypatch)
+
+    async def scenario():
+        return [
+            await enhancer._get_library_fallback('omni_image', None, None),
+            await enhancer._get_library_fallback('omni_image', 'douyin', None),
+            await enhancer._get_library_fallback('omni_image', 'douyin', 'selfie'),
+            await enhancer._get_library_fallback('omni_image', 'universal', 'selfie'),
+            await enhancer._get_library_fallback('omni_image', 'weibo', None),
+            await enhancer._get_library_negative('omni_image', None, None),
+            await enhancer._get_library_negative('omni_image', 'douyin', 'selfie'),
+            await enhancer._get_library_negative('face_swap', None, None),
+        ]
+
+    results = run(scenario())
+
+    assert [r['prompt'] if r else None for r in results[:5]] == [
+        'universal best', 'douyin ecommerce', 'douyin selfie', 'douyin selfie', None,
+    ]
+    # negative 只按平台过滤（不区分输入类型），取非空中分数最高者
+    assert results[5:] == ['neg douyin ecommerce', 'neg douyin ecommerce', '']
+    # 4 行、每页 2 行：分页 3 次，之后所有查询都走内存
+    assert enhancer._supabase.log == [(0, 1), (2, 3), (4, 5)]
+
+
+def test_invalidation_reloads_snapshot(monkeypatch):
+    enhancer = _enhancer(monkeypatch, page_size=10)
+
+    async def scenario():
+        first = await enhancer._get_library_fallback('relight', None, None)
+        enhancer._supabase.rows.append({
+            'capability': 'relight', 'platform': 'universal', 'input_type': 'universal',
+            'prompt': 'relight v2', 'negative_prompt': '', 'quality_score': 0.95,
+        })
+        cached = await enhancer._get_library_fallback('relight', None, None)
+        enhancer.invalidate_library()
+        reloaded = await enhancer._get_library_fallback('relight', None, None)
+        return first, cached, reloaded
+
+    first, cached, reloaded = run(scenario())
+
+    assert (first['prompt'], cached['prompt'], reloaded['prompt']) == ('relight', 'relight', 'relight v2')
+    assert len(enhancer._supabase.log) == 2
+
+
+def test_load_runs_outside_lock_and_is_shared(monkeypatch):
+    enhancer = _enhancer(monkeypatch, page_size=10)
+    started, release = threading.Event(), threading.Event()
+    original_fetch = enhancer._fetch_library_rows
+
+    def slow_fetch():
+        started.set()
+        # 加载期间锁可用：失效 / 读取快照指针不会被网络请求阻塞
+        assert enhancer._snapshot_lock.acquire(timeout=1)
+        enhancer._snapshot_lock.release()
+        release.wait(1)
+        return original_fetch()
+
+    monkeypatch.setattr(enhancer, '_fetch_library_rows', slow_fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(enhancer._refresh_snapshot(False))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(1)
+    release.set()
+    for thread in threads:
+        thread.join(1)
+
+    assert len(results) == 3 and len({id(r) for r in results}) == 1
+    assert len(enhancer._supabase.log) == 1
+
+
+def test_invalidation_propagates_across_processes(monkeypatch):
+    store = _VersionStore()
+    supabase = _Supabase(list(ROWS))
+    writer = _enhancer(monkeypatch, page_size=10, version_store=store, supabase=supabase)
+    reader = _enhancer(monkeypatch, page_size=10, version_store=store, supabase=supabase)
+
+    async def scenario():
+        assert (await reader._get_library_fallback('relight', None, None))['prompt'] == 'relight'
+        await asyncio.gather(*reader._background)  # 首次读取触发的版本检查（版本未变）
+        supabase.rows.append({
+            'capability': 'relight', 'platform': 'universal', 'input_type': 'universal',
+            'prompt': 'relight v2', 'negative_prompt': '', 'quality_score': 0.95,
+        })
+        writer.invalidate_library()
+        assert store.value == 1
+        # 读取方到达检查间隔后同步版本号并重载
+        reader._next_sync_at = 0.0
+        assert await asyncio.to_thread(reader._sync_shared_version)
+        return await reader._get_library_fallback('relight', None, None)
+
+    assert run(scenario())['prompt'] == 'relight v2'
+    # 写入方自己的版本号已对齐，不会重复重载
+    assert not writer._sync_shared_version()
+
+
+def test_llm_rewrite_cached_by_normalized_prompt(monkeypatch):
+    enhancer = _enhancer(monkeypatch)
+    calls = []
+
+    async def fake_llm(prompt, capability, platform, input_type):
+        calls.append(prompt)
+        return f'professional photo, {prompt}'
+
+    monkeypatch.setattr(enhancer, '_llm_enhance', fake_llm)
+
+    async def scenario():
+        first = await enhancer.enhance('omni_image', '加个  眼镜 ')
+        second = await enhancer.enhance('omni_image', '加个 眼镜')
+        other_platform = await enhancer.enhance('omni_image', '加个 眼镜', platform='weibo')
+        return first, second, other_platform
+
+    first, second, other_platform = run(scenario())
+
+    assert first.prompt == second.prompt == 'professional photo, 加个  眼镜'
+    assert second.source == 'llm_enhanced'
+    assert first.negative_prompt == 'neg douyin ecommerce'
+    # 平台不同 → 改写上下文不同，不复用缓存；库中无该平台 negative 时用默认值
+    assert other_platform.negative_prompt == enhancer_module.DEFAULT_NEGATIVES['omni_image']
+    assert calls == ['加个  眼镜', '加个 眼镜']
+
+
+def test_budget_exceeded_keeps_original_and_caches_in_background(monkeypatch):
+    enhancer = _enhancer(monkeypatch)
+    monkeypatch.setattr(enhancer_module, 'PROMPT_ENHANCE_BUDGET_SEC', 0.05)
+    calls = []
+
+    async def slow_llm(prompt, capability, platform, input_type):
+        calls.append(prompt)
+        await asyncio.sleep(0.2)
+        return 'cinematic sunset over the sea'
+
+    monkeypatch.setattr(enhancer, '_llm_enhance', slow_llm)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        first = await enhancer.enhance('omni_image', '海边日落')
+        elapsed = asyncio.get_running_loop().time() - started
+        await asyncio.sleep(0.3)
+        second = await enhancer.enhance('omni_image', '海边日落')
+        return first, elapsed, second
+
+    first, elapsed, second = run(scenario())
+
+    assert first.prompt == '海边日落' and first.source == 'original'
+    assert elapsed < 0.2
+    assert second.prompt == 'cinematic sunset over the sea'
+    assert calls == ['海边日落']
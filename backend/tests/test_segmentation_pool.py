@@ -0,0 +1,122 @@
+"""
+人物分割模型池 单元测试
+
+覆盖:
+- 每个 worker 只加载一次 session，并发请求复用
+- 每个 worker 一次只取一个请求，并发请求分散到多个 worker 同时推理
+- 输入缩放到最长边上限，mask 放大回原尺寸
+- 模型加载失败时请求直接失败（调用方降级）
+- 旧版 rembg 无法传入线程配置时显式报错
+"""
+
+import asyncio
+import importlib.util
+import sys
+import threading
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+pool_module = _load_module('segmentation_pool_under_test', 'app/services/segmentation_pool.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_sessions_loaded_once_and_reused_across_requests():
+    sessions = []
+    batches = []
+    gate = threading.Event()
+
+    def factory():
+        sessions.append(object())
+        return sessions[-1]
+
+    def infer(session, image):
+        gate.wait(1)
+        batches.append((session, image.size))
+        return Image.new('L', image.size, 255)
+
+    pool = pool_module.SegmentationPool(
+        workers=1, max_side=64, session_factory=factory, infer=infer,
+    )
+    pool.warmup(timeout=1)
+
+    async def scenario():
+        jobs = [pool.predict_mask(Image.new('RGB', (200, 100))) for _ in range(5)]
+        gather = asyncio.gather(*jobs)
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await gather
+
+    masks = run(scenario())
+
+    assert len(sessions) == 1
+    assert {s for s, _ in batches} == {sessions[0]}
+    # 推理输入按最长边 64 缩放，返回的 mask 恢复原尺寸
+    assert {size for _, size in batches} == {(64, 32)}
+    assert all(m.size == (200, 100) and m.mode == 'L' for m in masks)
+
+
+def test_concurrent_requests_spread_across_workers():
+    # 两个请求必须在不同 worker 上同时推理，否则 barrier 超时
+    barrier = threading.Barrier(2, timeout=1)
+    workers_seen = set()
+
+    def infer(session, image):
+        barrier.wait()
+        workers_seen.add(threading.current_thread().name)
+        return Image.new('L', image.size, 255)
+
+    pool = pool_module.SegmentationPool(workers=2, session_factory=object, infer=infer)
+    pool.warmup(timeout=1)
+    futures = [pool.submit(Image.new('RGB', (10, 10))) for _ in range(2)]
+
+    assert all(f.result(timeout=2).size == (10, 10) for f in futures)
+    assert len(workers_seen) == 2
+
+
+def test_bound_resolution_keeps_small_images():
+    image = Image.new('RGB', (640, 480))
+    assert pool_module.bound_resolution(image, 1024) is image
+    assert pool_module.bound_resolution(Image.new('RGB', (4000, 3000)), 1024).size == (1024, 768)
+
+
+def test_unavailable_model_fails_requests():
+    def factory():
+        raise pool_module.SegmentationUnavailable('rembg 未安装')
+
+    pool = pool_module.SegmentationPool(workers=1, session_factory=factory)
+    with pytest.raises(pool_module.SegmentationUnavailable):
+        pool.predict_mask_sync(Image.new('RGB', (10, 10)), timeout=1)
+
+
+def test_old_rembg_without_session_options_fails_loudly():
+    fake_ort = types.ModuleType('onnxruntime')
+    fake_ort.SessionOptions = lambda: types.SimpleNamespace()
+    fake_rembg = types.ModuleType('rembg')
+    fake_rembg.new_session = lambda name: pytest.fail('不应回退到不带线程配置的 new_session')
+
+    with patch.dict(sys.modules, {'onnxruntime': fake_ort, 'rembg': fake_rembg, 'rembg.sessions': None}):
+        with pytest.raises(pool_module.SegmentationUnavailable):
+            pool_module._new_session('u2net', 2)
@@ -0,0 +1,119 @@
+"""
+任务事件总线 单元测试
+
+覆盖:
+- Redis 不可用时降级为进程内缓冲：发布后等待中的读取方被唤醒
+- 无 SSE 读取方的进程（Celery worker）不写进程内缓冲，直接丢弃
+- Last-Event-ID 补发：从指定 id 之后按顺序返回
+- tasks 行 → SSE 事件：订阅标识、事件类型与 TaskEvent 字段一致
+"""
+
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+bus_module = _load_module('task_event_bus_under_test', 'app/services/task_event_bus.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _memory_bus():
+    return bus_module.TaskEventBus(redis_url=None)
+
+
+def test_reader_wakes_on_publish():
+    bus = _memory_bus()
+
+    async def scenario():
+        cursor = await bus.latest_id('s1')
+        reader = asyncio.create_task(bus.read('s1', cursor, timeout=5))
+        await asyncio.sleep(0.01)
+        await bus.publish('s1', 'progress', {'task_id': 't1', 'progress': 40})
+        await bus.publish('s2', 'progress', {'task_id': 'other'})
+        return await asyncio.wait_for(reader, 1)
+
+    events = run(scenario())
+    assert [(e[1], e[2]['task_id']) for e in events] == [('progress', 't1')]
+
+
+def test_replay_after_last_event_id():
+    bus = _memory_bus()
+    run(bus.latest_id('s1'))  # 本进程有 SSE 连接
+    ids = [bus.publish_sync('s1', 'progress', {'progress': p}) for p in (10, 20, 30)]
+    ids.append(bus.publish_sync('s1', 'completed', {'progress': 100}))
+
+    assert len(set(ids)) == 4
+    assert all(bus_module.is_valid_event_id(i) for i in ids)
+    assert not bus_module.is_valid_event_id('garbage')
+
+    replayed = run(bus.read('s1', ids[1], timeout=0.01))
+    assert [e[0] for e in replayed] == ids[2:]
+    assert [e[1] for e in replayed] == ['progress', 'completed']
+    # 已读到最新 → 超时返回空
+    assert run(bus.read('s1', ids[-1], timeout=0.01)) == []
+
+
+def test_redis_failure_falls_back_to_memory(monkeypatch):
+    bus = bus_module.TaskEventBus(redis_url='redis://unreachable:6379/0')
+
+    def broken():
+        raise ConnectionError('refused')
+
+    monkeypatch.setattr(bus, '_get_sync_redis', broken)
+    monkeypatch.setattr(bus, '_get_async_redis', broken)
+    assert run(bus.latest_id('s1')) == '0-0'
+    event_id = bus.publish_sync('s1', 'progress', {'progress': 5})
+    assert bus_module.is_valid_event_id(event_id)
+    assert not bus._redis_available()
+    assert run(bus.read('s1', '0-0', timeout=0.01))[0][2] == {'progress': 5}
+
+
+def test_worker_without_readers_drops_events_when_redis_down(monkeypatch, caplog):
+    bus = bus_module.TaskEventBus(redis_url='redis://unreachable:6379/0')
+
+    def broken():
+        raise ConnectionError('refused')
+
+    monkeypatch.setattr(bus, '_get_sync_redis', broken)
+    with caplog.at_level('WARNING'):
+        assert bus.publish_sync('t1', 'progress', {'progress': 5}) is None
+        assert bus.publish_sync('t1', 'progress', {'progress': 6}) is None
+    assert sum('事件未送达' in r.getMessage() for r in caplog.records) == 1
+    assert bus._memory.last_id('t1') == '0-0'
+
+
+def test_task_row_event_fields():
+    session_id, event_type, data = bus_module.build_task_row_event({
+        'id': 't1', 'project_id': 'p1', 'status': 'processing', 'progress': 45,
+        'status_message': 'AI 处理中', 'output_url': None,
+    })
+    assert (session_id, event_type) == ('p1', 'progress')
+    assert data['task_id'] == 't1' and data['message'] == 'AI 处理中'
+    assert 'result_url' not in data
+
+    _, event_type, data = bus_module.build_task_row_event({
+        'id': 't1', 'session_id': 's1', 'status': 'failed', 'error_message': 'timeout',
+    })
+    assert event_type == 'failed' and data['error'] == 'timeout'
+    # 无会话 / 项目的任务以 task id 作为订阅标识
+    assert bus_module.build_task_row_event({'id': 't1', 'status': 'completed'})[0] == 't1'
+    assert bus_module.build_task_row_event({'status': 'completed'}) is None
@@ -0,0 +1,226 @@
+"""
+模板采集任务 检查点 / 接管 单元测试
+
+覆盖:
+- 续跑：已完成的检测 / 分析 / 入库不再执行，只补齐剩余转场，结果按转场顺序输出
+- 转场分析按并发上限并行，单个失败时其余结果仍写入检查点
+- 抢占：已结束任务跳过，心跳未过期的执行中任务抛 IngestJobBusy，过期任务可接管
+"""
+
+import asyncio
+import importlib.util
+import sys
+import types
+from copy import deepcopy
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+_supabase_stub = types.ModuleType('app.services.supabase_client')
+_supabase_stub.get_supabase = lambda: None
+with patch.dict(sys.modules, {'app.services.supabase_client': _supabase_stub}):
+    ingest_module = _load_module('template_ingest_jobs_under_test', 'app/services/template_ingest_service.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = rows
+        self.action = None
+        self.filters = []
+        self.is_single = False
+
+    def select(self, *args):
+        return self
+
+    def update(self, data):
+        self.action = ('update', data)
+        return self
+
+    def eq(self, key, value):
+        self.filters.append((key, value))
+        return self
+
+    def in_(self, key, values):
+        self.filters.append((key, tuple(values)))
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def execute(self):
+        matched = [r for r in self.rows.values() if all(
+            r.get(k) in v if isinstance(v, tuple) else r.get(k) == v for k, v in self.filters
+        )]
+        if self.action:
+            for row in matched:
+                row.update(deepcopy(self.action[1]))
+        if self.is_single:
+            return _Result(deepcopy(matched[0]) if matched else None)
+        return _Result(deepcopy(matched))
+
+
+class _Supabase:
+    def __init__(self, *rows):
+        self.rows = {row['id']: row for row in rows}
+
+    def table(self, name):
+        return _Query(self.rows)
+
+
+def _job(**overrides):
+    job = {
+        'id': 'job-1', 'status': 'queued', 'source_type': 'video', 'template_type': 'transition',
+        'source_url': 'https://cdn/viral.mp4', 'updated_at': '2026-01-01T00:00:00+00:00',
+        'started_at': None, 'checkpoint': {},
+    }
+    job.update(overrides)
+    return job
+
+
+def _detect(count):
+    return {
+        'pack_id': 'pack-1',
+        'ranges': [[1.0 + 2 * i, 1.5 + 2 * i] for i in range(count)],
+        'detected_segments': count, 'deduped_templates': 0, 'auto_detected_count': count,
+        'detection_debug': {'duration_sec': 2.0 * count + 2},
+    }
+
+
+def _asset(index):
+    return ingest_module.TemplateAsset(
+        template_id=f'transition-{index}', name=f'转场 {index}', category='transition', type='transition',
+        storage_path=f'p/{index}.jpg', thumbnail_path=None, url=f'https://u/{index}', thumbnail_url='',
+    )
+
+
+def _service(monkeypatch, supabase, analyze_delay=0.0, fail_index=None):
+    monkeypatch.setattr(ingest_module, 'get_supabase', lambda: supabase)
+    service = ingest_module.TemplateIngestService()
+    calls = {'timestamps': [], 'analyzed': [], 'published': [], 'active': 0, 'peak': 0}
+
+    async def fake_frames(video_url, timestamps):
+        calls['timestamps'].append(len(timestamps))
+        return [Image.new('RGB', (4, 4)) for _ in timestamps]
+
+    async def fake_analyze(frame_a, frame_mid, frame_b, index, video_url=None, start_sec=None, end_sec=None):
+        calls['active'] += 1
+        calls['peak'] = max(calls['peak'], calls['active'])
+        try:
+            await asyncio.sleep(analyze_delay)
+        finally:
+            calls['active'] -= 1
+        if index == fail_index:
+            raise RuntimeError('Ark 429')
+        calls['analyzed'].append(index)
+        return {'transition_type': 'whip_pan', 'index': index}
+
+    async def fake_create(image, job, index, source_timecode=None, metadata_extra=None):
+        calls['published'].append(index)
+        return _asset(index)
+
+    monkeypatch.setattr(service, '_extract_frames_at_timestamps', fake_frames)
+    monkeypatch.setattr(service, '_analyze_transition_frames', fake_analyze)
+    monkeypatch.setattr(service, '_create_template_from_image', fake_create)
+    return service, calls
+
+
+def test_resume_skips_completed_stages(monkeypatch):
+    checkpoint = {
+        'detect': _detect(3),
+        'analyze': {'0': {'transition_type': 'flash_cut'}, '1': {'transition_type': 'spin'}},
+        'publish': {'0': ingest_module.asdict(_asset(0))},
+    }
+    supabase = _Supabase(_job(status='processing', started_at='2026-01-01T00:00:00', checkpoint=checkpoint))
+    service, calls = _service(monkeypatch, supabase)
+
+    run(service.process_job('job-1'))
+
+    row = supabase.rows['job-1']
+    assert row['status'] == 'succeeded'
+    # 只为未入库的 2 个转场提取帧，只分析缺失的转场 2
+    assert calls['timestamps'] == [6]
+    assert calls['analyzed'] == [2]
+    assert sorted(calls['published']) == [1, 2]
+    assert [t['template_id'] for t in row['result']['templates']] == ['transition-0', 'transition-1', 'transition-2']
+    assert row['result']['pack_id'] == 'pack-1'
+    assert set(row['checkpoint']['publish']) == {'0', '1', '2'}
+
+
+def test_analysis_is_bounded_and_checkpointed_on_failure(monkeypatch):
+    supabase = _Supabase(_job(checkpoint={'detect': _detect(5)}))
+    service, calls = _service(monkeypatch, supabase, analyze_delay=0.01, fail_index=3)
+    monkeypatch.setattr(ingest_module, 'INGEST_ANALYSIS_CONCURRENCY', 2)
+    progress = []
+    save_checkpoint = service._save_checkpoint
+
+    def record(job, stage, value, key=None, **kwargs):
+        if stage == 'analyze':
+            progress.append(kwargs.get('progress'))
+        return save_checkpoint(job, stage, value, key=key, **kwargs)
+
+    monkeypatch.setattr(service, '_save_checkpoint', record)
+
+    run(service.process_job('job-1'))
+
+    row = supabase.rows['job-1']
+    assert row['status'] == 'failed' and '转场 3' in row['error_message']
+    assert calls['peak'] == 2
+    assert set(row['checkpoint']['analyze']) == {'0', '1', '2', '4'}
+    # 每个完成的转场推进进度：0.2 + 0.5 * n / 5
+    assert progress == pytest.approx([0.3, 0.4, 0.5, 0.6])
+    assert calls['published'] == []
+
+
+def test_claim_respects_terminal_and_live_jobs(monkeypatch):
+    fresh = datetime.utcnow().isoformat()
+    stale = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    supabase = _Supabase(
+        _job(id='done', status='succeeded'),
+        _job(id='live', status='processing', updated_at=fresh),
+        _job(id='crashed', status='processing', updated_at=stale, started_at=stale),
+    )
+    service, _ = _service(monkeypatch, supabase)
+
+    assert service._claim_job('done') is None
+    with pytest.raises(ingest_module.IngestJobBusy):
+        service._claim_job('live')
+
+    claimed = service._claim_job('crashed')
+    assert claimed['started_at'] == stale
+    assert supabase.rows['crashed']['updated_at'] != stale
+
+    # 启动扫描只重新入队心跳过期的任务
+    enqueued = []
+    monkeypatch.setattr(service, 'enqueue', enqueued.append)
+    supabase.rows['crashed']['updated_at'] = stale
+    assert run(service.resume_interrupted_jobs()) == ['crashed']
+    assert enqueued == ['crashed']
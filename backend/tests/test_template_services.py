@@ -89,9 +89,14 @@ template_render_module = _load_module(
     'template_render_service_under_test',
     'app/services/template_render_service.py',
 )
+template_catalog_module = _load_module(
+    'template_catalog_under_test',
+    'app/services/template_catalog.py',
+)
 
 TemplateIngestService = template_ingest_module.TemplateIngestService
 TemplateRenderService = template_render_module.TemplateRenderService
+TemplateCatalog = template_catalog_module.TemplateCatalog
 
 
 class _FakeResult:
@@ -123,7 +128,15 @@ class _FakeTable:
         return self
 
     def eq(self, field: str, value):
-        self._filters.append((field, value))
+        self._filters.append((field, lambda v, expected=value: v == expected))
+        return self
+
+    def gt(self, field: str, value):
+        self._filters.append((field, lambda v, bound=value: v is not None and v > bound))
+        return self
+
+    def in_(self, field: str, values):
+        self._filters.append((field, lambda v, allowed=tuple(values): v in allowed))
         return self
 
     def single(self):
@@ -134,7 +147,7 @@ class _FakeTable:
         rows = self._db.setdefault(self._name, [])
 
         def _matches(row):
-            return all(row.get(k) == v for k, v in self._filters)
+            return all(check(row.get(k)) for k, check in self._filters)
 
         if self._action == 'insert':
             row = deepcopy(self._payload)
@@ -634,6 +647,78 @@ def test_create_transition_replica_batch_creates_multi_attempt_tasks():
         template_render_module.process_image_to_video = original_process_i2v
 
 
+def _catalog_row(template_id, updated_at, **overrides):
+    row = {
+        'template_id': template_id,
+        'name': template_id,
+        'category': 'ad',
+        'type': 'transition',
+        'tags': [],
+        'status': 'published',
+        'created_at': updated_at,
+        'updated_at': updated_at,
+        'workflow': {'pacing': 'fast'},
+        'metadata': {},
+    }
+    row.update(overrides)
+    return row
+
+
+def test_template_catalog_filters_and_scores_from_memory():
+    db = {
+        'template_records': [
+            _catalog_row('t-old', '2026-01-01', tags=['旅行', 'Vlog'], scopes=['outfit']),
+            _catalog_row('t-new', '2026-01-02', tags=['美食']),
+            _catalog_row('t-pack', '2026-01-03', tags=['旅行'], pack_id='pack-1', scopes=['scene']),
+            _catalog_row('t-bg', '2026-01-04', type='background', tags=['旅行']),
+        ]
+    }
+    original_get_supabase = template_catalog_module.get_supabase
+    template_catalog_module.get_supabase = lambda: _FakeSupabase(db)
+    try:
+        catalog = TemplateCatalog(refresh_interval=3600)
+        ranked = catalog.lookup('ad', 'transition', 'outfit', None, '旅行 vlog 穿搭')
+        # t-pack 的 scopes 不含 outfit 被过滤；t-new 无 scopes 视为全适用，同分按 created_at 倒序
+        assert ranked == [('t-old', 4.0), ('t-new', 0.0)]
+
+        assert [tid for tid, _ in catalog.lookup(None, None, None, 'pack-1', '')] == ['t-pack']
+
+        # 查询不再访问数据库
+        db['template_records'].append(_catalog_row('t-later', '2026-01-05', tags=['旅行']))
+        assert 't-later' not in [tid for tid, _ in catalog.lookup('ad', 'transition', None, None, '旅行')]
+    finally:
+        template_catalog_module.get_supabase = original_get_supabase
+
+
+def test_template_catalog_incremental_refresh_applies_updates_and_unpublish():
+    db = {
+        'template_records': [
+            _catalog_row('t-1', '2026-01-01', tags=['夏日']),
+            _catalog_row('t-2', '2026-01-02', tags=['夏日']),
+        ]
+    }
+    original_get_supabase = template_catalog_module.get_supabase
+    template_catalog_module.get_supabase = lambda: _FakeSupabase(db)
+    try:
+        catalog = TemplateCatalog(refresh_interval=3600)
+        assert {tid for tid, _ in catalog.lookup(None, None, None, None, '夏日')} == {'t-1', 't-2'}
+        assert [r['template_id'] for r in catalog.get_records(['t-2', 't-1'])] == ['t-2', 't-1']
+
+        db['template_records'][0].update({'status': 'draft', 'updated_at': '2026-02-01'})
+        db['template_records'][1].update({'tags': ['冬日'], 'updated_at': '2026-02-02'})
+        catalog.invalidate()
+
+        ranked = catalog.lookup(None, None, None, None, '冬日')
+        assert ranked == [('t-2', 2.0)]
+        # 已变更的完整记录重新补全
+        assert catalog.get_records(['t-2'])[0]['tags'] == ['冬日']
+
+        catalog.remove(['t-2'])
+        assert catalog.lookup(None, None, None, None, '冬日') == []
+    finally:
+        template_catalog_module.get_supabase = original_get_supabase
+
+
 if __name__ == '__main__':
     test_normalize_clip_ranges_supports_seconds_and_milliseconds()
     test_allocate_frame_timestamps_matches_requested_count_and_range()
@@ -651,4 +736,6 @@ if __name__ == '__main__':
     test_transition_default_endpoint_is_multi_image_to_video()
     test_prompt_seed_falls_back_when_invalid_placeholder_seed()
     test_create_transition_replica_batch_creates_multi_attempt_tasks()
+    test_template_catalog_filters_and_scores_from_memory()
+    test_template_catalog_incremental_refresh_applies_updates_and_unpublish()
     print('template service checks passed')
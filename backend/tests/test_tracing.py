@@ -0,0 +1,174 @@
+"""
+请求级耗时追踪 单元测试
+
+覆盖:
+- span 嵌套：同一 trace、父子关系、根 span 耗时分解、直方图指标与错误状态
+- Celery：发布时注入 traceparent，worker 侧 prerun / postrun 接续同一 trace
+- httpx：传输层挂钩按 host 归类 provider（同步 / 异步客户端）
+- ASGI 中间件：路由模板作为 span 名、接续上游 traceparent、回写 X-Trace-Id，SSE 响应不计入指标
+"""
+
+import asyncio
+import contextvars
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.services import tracing
+from benchmarks.fakes import FakeProviderServer
+
+
+@pytest.fixture
+def finished():
+    spans = []
+    tracing.reset_metrics()
+    tracing.register_span_processor(spans.append)
+    yield spans
+    tracing.unregister_span_processor(spans.append)
+
+
+def test_nested_spans_share_trace_and_feed_breakdown_and_metrics(finished):
+    with tracing.span("export.project") as root:
+        with tracing.span("export.prepare_assets"):
+            pass
+        for _ in range(2):
+            with tracing.subprocess_span(["/usr/bin/ffmpeg", "-i", "x"], "render"):
+                pass
+        with pytest.raises(RuntimeError):
+            with tracing.span("export.upload"):
+                raise RuntimeError("boom")
+
+    assert tracing.current_span() is None
+    assert [s.name for s in finished] == [
+        "export.prepare_assets", "ffmpeg.render", "ffmpeg.render", "export.upload", "export.project",
+    ]
+    assert {s.trace_id for s in finished} == {root.trace_id}
+    assert all(s.parent_id == root.span_id for s in finished[:-1]) and root.parent_id is None
+    assert finished[3].status == "error" and finished[3].attributes["error.type"] == "RuntimeError"
+
+    breakdown = root.breakdown()
+    assert breakdown["ffmpeg.render"][0] == 2 and set(breakdown) == {
+        "export.prepare_assets", "ffmpeg.render", "export.upload",
+    }
+
+    text = tracing.render_prometheus()
+    assert 'lepus_span_duration_seconds_count{kind="subprocess",name="ffmpeg.render",status="ok"} 2' in text
+    assert 'lepus_span_duration_seconds_count{kind="internal",name="export.upload",status="error"} 1' in text
+    assert 'le="+Inf"' in text
+
+
+def test_celery_publish_and_worker_continue_trace(finished):
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-" + "1" * 16 + "-01") is None
+    assert tracing.parse_traceparent("garbage") is None
+
+    headers = {}
+    with tracing.span("POST /api/export", "server") as api_span:
+        tracing._on_before_task_publish(headers=headers, body=None)
+    assert tracing.parse_traceparent(headers["traceparent"]) == (api_span.trace_id, api_span.span_id)
+
+    # worker 进程：新 context，任务请求上带着消息头
+    task = SimpleNamespace(name="app.tasks.export.export_video_task",
+                           request=SimpleNamespace(traceparent=headers["traceparent"]))
+
+    def worker():
+        tracing._on_task_prerun(task_id="t-1", task=task)
+        with tracing.span("export.project"):
+            pass
+        tracing._on_task_postrun(task_id="t-1", task=task, state="FAILURE")
+
+    contextvars.Context().run(worker)
+
+    consumer = finished[-1]
+    assert consumer.name == "app.tasks.export.export_video_task" and consumer.kind == "consumer"
+    assert consumer.trace_id == api_span.trace_id and consumer.parent_id == api_span.span_id
+    assert consumer.status == "error"
+    assert finished[-2].name == "export.project" and finished[-2].parent_id == consumer.span_id
+    assert consumer.breakdown() == {"export.project": (1, finished[-2].duration)}
+
+
+@pytest.fixture
+def httpx_tracing(monkeypatch):
+    """安装传输层挂钩，测试结束后还原 httpx，避免影响其他测试"""
+    monkeypatch.setattr(httpx.HTTPTransport, 'handle_request', httpx.HTTPTransport.handle_request)
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, 'handle_async_request', httpx.AsyncHTTPTransport.handle_async_request)
+    monkeypatch.setattr(tracing, '_httpx_installed', False)
+    tracing.install_httpx_tracing()
+
+
+def test_httpx_transport_spans_are_grouped_by_provider(finished, httpx_tracing):
+    with FakeProviderServer(polls_to_complete=1) as server:
+        tracing.register_provider_host(server.url, "kling")
+
+        with tracing.span("kling.poll") as root:
+            with httpx.Client(base_url=server.kling_base_url) as client:
+                task_id = client.post("/images/omni-image", json={}).json()["data"]["task_id"]
+                assert client.get("/images/omni-image/missing").status_code == 404
+
+            async def poll():
+                async with httpx.AsyncClient(base_url=server.kling_base_url) as client:
+                    return (await client.get(f"/images/omni-image/{task_id}")).json()
+
+            loop = asyncio.new_event_loop()
+            try:
+                assert loop.run_until_complete(poll())["data"]["task_status"] == "succeed"
+            finally:
+                loop.close()
+
+    client_spans = [s for s in finished if s.kind == "client"]
+    assert [(s.name, s.attributes["http.method"], s.status) for s in client_spans] == [
+        ("kling", "POST", "ok"), ("kling", "GET", "4xx"), ("kling", "GET", "ok"),
+    ]
+    assert all(s.trace_id == root.trace_id for s in client_spans)
+    assert root.breakdown()["kling"][0] == 3
+
+    assert tracing.provider_for_host("xyz.supabase.co") == "supabase"
+    assert tracing.provider_for_host("ark.cn-beijing.volces.com") == "ark"
+    assert tracing.provider_for_host("api.fish.audio") == "fish_audio"
+    assert tracing.provider_for_host("example.com") == "other"
+
+
+def test_asgi_middleware_names_span_by_route_template(finished):
+    app = FastAPI()
+    app.add_middleware(tracing.TracingMiddleware)
+    inner = {}
+
+    @app.get("/api/projects/{project_id}")
+    async def get_project(project_id: str):
+        with tracing.span("projects.fetch_clips") as child:
+            inner["trace_id"] = child.trace_id
+        return {"id": project_id}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/api/tasks/events/{session_id}")
+    async def events(session_id: str):
+        async def stream():
+            yield "event: progress\ndata: {}\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    client = TestClient(app)
+    upstream = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    response = client.get("/api/projects/p-123", headers={"traceparent": upstream})
+    assert response.status_code == 200
+    assert response.headers["x-trace-id"] == "a" * 32 == inner["trace_id"]
+
+    missing = client.get("/nope")
+    assert missing.status_code == 404
+    client.get("/health")
+    sse = client.get("/api/tasks/events/s1")
+    assert sse.status_code == 200 and "x-trace-id" in sse.headers
+
+    servers = [s for s in finished if s.kind == "server"]
+    assert [(s.name, s.status) for s in servers] == [
+        ("GET /api/projects/{project_id}", "ok"), ("GET <unmatched>", "4xx"),
+    ]
+    assert servers[0].parent_id == "b" * 16
+    assert servers[0].breakdown() == {"projects.fetch_clips": (1, finished[0].duration)}
+    assert missing.headers["x-trace-id"] != "a" * 32
+    assert "/api/tasks/events/{session_id}" not in tracing.render_prometheus()
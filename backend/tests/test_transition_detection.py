@@ -0,0 +1,181 @@
+"""
+转场范围检测（NumPy 场景信号）单元测试
+
+覆盖:
+- _SceneSignal: 任意字节边界分块喂入与一次喂入结果一致，硬切位置分数最高
+- 向量化聚类与逐个事件遍历的参考实现结果一致
+- _detect_transition_ranges: 一次解码同时得到时长与转场区域（按每帧 pts），不再调用 ffprobe
+- 原生帧率解码：25fps 平移镜头不产生伪硬切（不再重采样插入重复帧）
+"""
+
+import asyncio
+import importlib.util
+import shutil
+import subprocess
+import sys
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+_supabase_stub = types.ModuleType('app.services.supabase_client')
+_supabase_stub.get_supabase = lambda: None
+with patch.dict(sys.modules, {'app.services.supabase_client': _supabase_stub}):
+    ingest_module = _load_module('transition_detection_under_test', 'app/services/template_ingest_service.py')
+
+TemplateIngestService = ingest_module.TemplateIngestService
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _frames_with_cuts(count, cuts, width=16, height=9, seed=0):
+    """每个镜头一个底色 + 轻微噪声，cuts 为新镜头的首帧序号"""
+    rng = np.random.default_rng(seed)
+    frames = np.empty((count, height, width), dtype=np.uint8)
+    level = 40
+    for i in range(count):
+        if i in cuts:
+            level = (level + 90) % 256
+        noise = rng.integers(-2, 3, size=(height, width))
+        frames[i] = np.clip(level + noise, 0, 255)
+    return frames
+
+
+def test_scene_signal_is_chunk_invariant_and_peaks_at_cuts():
+    frames = _frames_with_cuts(60, cuts={20, 45})
+    raw = frames.tobytes()
+
+    whole = ingest_module._SceneSignal(16, 9)
+    whole.feed(raw)
+    chunked = ingest_module._SceneSignal(16, 9)
+    for offset in range(0, len(raw), 1000):  # 1000 字节不是帧大小的整数倍
+        chunked.feed(raw[offset:offset + 1000])
+
+    assert whole.frame_count == chunked.frame_count == 60
+    np.testing.assert_array_equal(whole.scores(), chunked.scores())
+    # 分数 i 对应帧 i+1
+    top = sorted(np.argsort(whole.scores())[-2:] + 1)
+    assert top == [20, 45]
+
+
+def _reference_zones(scene_events, total, gap=0.45, min_width=0.12):
+    """改造前的逐事件聚类实现"""
+    events = sorted(scene_events, key=lambda x: x[0])
+    clusters, cluster = [], [events[0]]
+    for event in events[1:]:
+        if event[0] - cluster[-1][0] <= gap:
+            cluster.append(event)
+        else:
+            clusters.append(cluster)
+            cluster = [event]
+    clusters.append(cluster)
+
+    zones = []
+    for cluster in clusters:
+        peak = max(cluster, key=lambda x: x[1])
+        start, end = cluster[0][0], cluster[-1][0]
+        if end - start < min_width:
+            center = (start + end) / 2.0
+            start, end = max(0.0, center - min_width / 2.0), min(total, center + min_width / 2.0)
+        zones.append({
+            'start': round(start, 3), 'end': round(end, 3), 'peak_ts': round(peak[0], 3),
+            'peak_score': round(peak[1], 4), 'event_count': len(cluster),
+        })
+    return zones
+
+
+def test_vectorized_clustering_matches_reference():
+    rng = np.random.default_rng(1)
+    timestamps = np.round(np.sort(rng.uniform(0, 120, size=400)), 3)
+    # 制造并列最高分，验证取簇内第一个
+    scores = np.round(rng.choice([0.05, 0.1, 0.3], size=400), 4)
+    events = list(zip(timestamps.tolist(), scores.tolist()))
+    shuffled = [events[i] for i in rng.permutation(len(events))]
+
+    zones = TemplateIngestService._cluster_into_transition_zones(shuffled, total_duration_sec=120.0)
+
+    assert zones == _reference_zones(events, 120.0)
+
+
+def test_detect_ranges_from_single_decode(monkeypatch):
+    fps = 25
+    frames = _frames_with_cuts(int(fps * 6), cuts={int(fps * 2), int(fps * 4)})
+    service = TemplateIngestService()
+
+    async def fake_local(video_url):
+        return '/tmp/source.mp4'
+
+    async def fake_decode(video_path):
+        signal = ingest_module._SceneSignal(16, 9)
+        signal.feed(frames.tobytes())
+        signal.pts = [i / fps for i in range(len(frames))]
+        return signal
+
+    async def forbidden_probe(video_path):
+        raise AssertionError('不应再单独调用 ffprobe')
+
+    monkeypatch.setattr(service, '_ensure_local_video', fake_local)
+    monkeypatch.setattr(service, '_decode_scene_signal', fake_decode)
+    monkeypatch.setattr(service, '_probe_video_duration', forbidden_probe)
+
+    ranges, debug = run(service._detect_transition_ranges(
+        video_url='https://cdn/viral.mp4', max_ranges=8, clip_ranges=[], transition_duration_ms=1200,
+    ))
+
+    assert debug['duration_sec'] == 6.0
+    assert debug['scene_signal'] == 'numpy_mafd'
+    assert debug['ranges_source'] == 'dynamic_zones'
+    assert len(ranges) == 2
+    assert ranges[0][0] <= 2.0 <= ranges[0][1]
+    assert ranges[1][0] <= 4.0 <= ranges[1][1]
+
+
+def test_frame_times_fall_back_to_even_spacing():
+    signal = ingest_module._SceneSignal(16, 9)
+    signal.feed(_frames_with_cuts(4, cuts=set()).tobytes())
+    assert signal.duration() is None
+    np.testing.assert_allclose(signal.frame_times(2.0), [0.0, 0.5, 1.0, 1.5])
+
+    signal.pts = [0.0, 0.04, 0.08, 0.12]
+    assert signal.duration() == pytest.approx(0.16)
+    assert '-vsync' in ingest_module._scene_signal_command('in.mp4', 128, 72)
+    assert not any('fps=' in arg for arg in ingest_module._scene_signal_command('in.mp4', 128, 72))
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='未安装 ffmpeg')
+def test_native_rate_pan_produces_no_false_cuts(tmp_path):
+    # 25fps 匀速平移（每帧 2px），重采样到 30fps 时每 5 帧插入一个重复帧，产生伪硬切
+    video = tmp_path / 'pan25.mp4'
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-f', 'lavfi',
+        '-i', "nullsrc=s=960x180:r=25:d=4,geq=lum='128+100*sin(X/23)*cos(Y/17)':cb=128:cr=128,crop=320:180:'n*2':0",
+        '-c:v', 'libx264', '-qp', '0', '-pix_fmt', 'yuv420p', str(video),
+    ], check=True)
+
+    signal = run(TemplateIngestService()._decode_scene_signal(str(video)))
+
+    assert signal.frame_count == len(signal.pts) == 100
+    assert signal.duration() == pytest.approx(4.0)
+    events = ingest_module._scene_events_from_scores(signal.scores(), signal.frame_times(), signal.duration())
+    # 只有首帧（与空白前帧比较）超过阈值
+    assert [ts for ts, _ in events] == [0.04]
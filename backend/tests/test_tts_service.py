@@ -0,0 +1,176 @@
+"""
+TTS 服务 单元测试
+
+覆盖:
+- split_sentences: 中英文分句 / 碎句合并 / 超长句切分
+- concat_wav / wav_duration: 无缝拼接与精确时长
+- text_to_speech: 句级缓存，修改一句只重新合成该句；结果以字节上传到 Storage
+- TTSCache: 超出大小上限时按最近使用淘汰
+"""
+
+import asyncio
+import importlib.util
+import io
+import os
+import sys
+import wave
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    module_path = ROOT / relative_path
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+tts_module = _load_module('tts_service_under_test', 'app/services/tts_service.py')
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _make_wav(n_frames: int, rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(b'\x01\x00' * n_frames)
+    return buf.getvalue()
+
+
+class _Bucket:
+    def __init__(self, objects, bucket):
+        self.objects = objects
+        self.bucket = bucket
+
+    def upload(self, path, data, file_options=None):
+        assert isinstance(data, bytes)
+        self.objects.append((self.bucket, path))
+
+    def get_public_url(self, path):
+        return f'https://storage/{self.bucket}/{path}'
+
+
+class _FakeStorage:
+    """supabase 客户端的 storage 部分替身，记录上传的 (bucket, path)"""
+
+    def __init__(self):
+        self.objects = []
+        self.storage = self
+
+    def from_(self, bucket):
+        return _Bucket(self.objects, bucket)
+
+
+@pytest.fixture
+def storage():
+    return _FakeStorage()
+
+
+def _make_service(tmp_path, storage_client):
+    service = tts_module.TTSService(
+        api_key='test-key',
+        cache=tts_module.TTSCache(root=str(tmp_path)),
+        max_concurrency=2,
+        storage_client=storage_client,
+    )
+    requested = []
+
+    async def _fake_request(text, model_id, speed):
+        requested.append(text)
+        return _make_wav(len(text) * 1600)  # 每字 0.1s
+
+    async def _fake_encode(wav_bytes, output_format):
+        return wav_bytes
+
+    service._request_tts = _fake_request
+    service._encode_audio = _fake_encode
+    return service, requested
+
+
+def test_split_sentences_handles_cjk_and_english_punctuation():
+    text = '第一句话。第二句话！Is this third? Yes. Ok. 好'
+    assert tts_module.split_sentences(text) == [
+        '第一句话。',
+        '第二句话！',
+        'Is this third?',
+        'Yes. Ok.好',
+    ]
+
+
+def test_split_sentences_breaks_overlong_sentence_on_clauses():
+    clause = '很长的分句' * 30 + '，'
+    sentences = tts_module.split_sentences(clause * 3 + '结束。')
+    assert all(len(s) <= tts_module.TTS_MAX_SENTENCE_CHARS for s in sentences)
+    assert ''.join(sentences) == clause * 3 + '结束。'
+
+
+def test_concat_wav_is_gapless_and_duration_exact():
+    merged = tts_module.concat_wav([_make_wav(16000), _make_wav(8000)])
+    assert tts_module.wav_duration(merged) == 1.5
+
+
+def test_text_to_speech_only_resynthesizes_edited_sentence(tmp_path, storage):
+    service, requested = _make_service(tmp_path, storage)
+
+    first = run(service.text_to_speech('第一句话。第二句话。第三句话。', model_id='m1'))
+    assert requested == ['第一句话。', '第二句话。', '第三句话。']
+    assert abs(first['duration'] - 1.5) < 1e-6
+    uploaded = [path for bucket, path in storage.objects if bucket == tts_module.STORAGE_BUCKET]
+    assert len(uploaded) == 1 and uploaded[0].startswith('tts_audio/') and uploaded[0].endswith('.mp3')
+    assert uploaded[0] in first['audio_url']
+
+    requested.clear()
+    second = run(service.text_to_speech('第一句话。第二句改过了。第三句话。', model_id='m1'))
+    assert requested == ['第二句改过了。']
+    assert second['cached_sentences'] == 2
+    assert abs(second['duration'] - 1.7) < 1e-6
+
+
+def test_text_to_speech_reuses_full_result_for_identical_request(tmp_path, storage):
+    service, requested = _make_service(tmp_path, storage)
+
+    first = run(service.text_to_speech('同样的文案。', model_id='m1'))
+    requested.clear()
+    second = run(service.text_to_speech('同样的文案。', model_id='m1'))
+
+    assert requested == []
+    assert second['cached'] is True
+    assert second['audio_url'] == first['audio_url']
+
+    # pitch 不发给 API，不能产生新的缓存条目
+    third = run(service.text_to_speech('同样的文案。', model_id='m1', pitch=3.0))
+    assert requested == [] and third['audio_url'] == first['audio_url']
+    assert len(storage.objects) == 1
+
+    # 参数变化（语速）不能命中缓存
+    run(service.text_to_speech('同样的文案。', model_id='m1', speed=1.2))
+    assert requested == ['同样的文案。']
+
+
+def test_cache_evicts_least_recently_used_over_limit(tmp_path):
+    cache = tts_module.TTSCache(root=str(tmp_path), max_bytes=3000)
+    for i, key in enumerate(['aa1', 'bb2', 'cc3']):
+        cache.put_chunk(key, b'x' * 1000)
+        os.utime(cache._path('chunks', key, 'wav'), (100 + i, 100 + i))
+
+    # 命中刷新最近使用时间：aa1 变为最新
+    assert cache.get_chunk('aa1') == b'x' * 1000
+    cache.put_chunk('dd4', b'x' * 1000)
+
+    # 超出上限后删除最旧的 bb2、cc3，降到上限的 90% 以内
+    assert [cache.get_chunk(key) is not None for key in ['aa1', 'bb2', 'cc3', 'dd4']] == [True, False, False, True]
+    assert cache._size == 2000
@@ -0,0 +1,251 @@
+"""
+背景替换分片流程 单元测试
+
+覆盖:
+- build_segment_cut_command: 起点在关键帧上流复制，否则只重编码该分片
+- build_concat_command: 编码一致时 concat 流复制
+- snap_segment_boundaries: 相邻分片共享边界吸附到关键帧，超出偏移上限或时长不合法时保留
+- cut_segments_for_tasks: 裁剪前按关键帧调整分片区间，ffmpeg 并发受上限约束
+- execute_segment_tasks: 原视频只裁剪一轮，分片并发受上限约束，全部完成后只合并一次
+"""
+
+import asyncio
+import importlib.util
+import sys
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(module_name: str, relative_path: str):
+    """以包内名称加载（模块使用相对导入），依赖的 Kling / Supabase 客户端用桩替换，加载后还原 sys.modules"""
+    kling_stub = types.ModuleType('app.services.kling_ai_service')
+    kling_stub.KlingAIClient = lambda: None
+    supabase_stub = types.ModuleType('app.services.supabase_client')
+    supabase_stub.supabase = None
+    supabase_stub.get_file_url = lambda bucket, path, expires_in=None: f'https://storage/{bucket}/{path}'
+
+    app_pkg = types.ModuleType('app')
+    app_pkg.__path__ = []
+    services_pkg = types.ModuleType('app.services')
+    services_pkg.__path__ = []
+    stubs = {
+        'app.services.kling_ai_service': kling_stub,
+        'app.services.supabase_client': supabase_stub,
+    }
+    with patch.dict(sys.modules, stubs):
+        sys.modules.setdefault('app', app_pkg)
+        sys.modules.setdefault('app.services', services_pkg)
+        spec = importlib.util.spec_from_file_location(module_name, ROOT / relative_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+ver_module = _load_module(
+    'app.services.video_element_replace_service', 'app/services/video_element_replace_service.py',
+)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_cut_stream_copies_at_keyframes_and_reencodes_elsewhere():
+    keyframes = [0.0, 2.002, 4.004, 6.006]
+
+    cmd, copied = ver_module.build_segment_cut_command('in.mp4', 'out.mp4', 4.0, 5.0, keyframes)
+    assert copied
+    assert cmd[cmd.index('-ss') + 1] == '4.004'
+    assert cmd[cmd.index('-c') + 1] == 'copy'
+    assert cmd.index('-ss') < cmd.index('-i')
+
+    cmd, copied = ver_module.build_segment_cut_command('in.mp4', 'out.mp4', 3.0, 5.0, keyframes)
+    assert not copied
+    assert 'libx264' in cmd
+    # 输入级 seek，不再从头解码
+    assert cmd.index('-ss') < cmd.index('-i')
+
+
+def test_snap_moves_shared_boundaries_to_keyframes():
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0]
+    bounds = [(0, 4300), (4300, 8900), (8900, 12500)]
+
+    assert ver_module.snap_segment_boundaries(bounds, keyframes, max_shift_ms=500) == [
+        (0, 4000), (4000, 8900), (8900, 12500),
+    ]
+    assert ver_module.snap_segment_boundaries(bounds, keyframes, max_shift_ms=1200) == [
+        (0, 4000), (4000, 8000), (8000, 12500),
+    ]
+    # 移动后时长不合法（这里要求 ≥ 4.5s）时保留原边界
+    assert ver_module.snap_segment_boundaries(
+        bounds, keyframes, is_valid=lambda sec: sec >= 4.5, max_shift_ms=1200,
+    ) == [(0, 4300), (4300, 8900), (8900, 12500)]
+    # 不相邻的分片不移动
+    assert ver_module.snap_segment_boundaries([(0, 4300), (5000, 9000)], keyframes) == [(0, 4300), (5000, 9000)]
+
+
+def test_cut_snaps_plan_and_bounds_ffmpeg_concurrency(monkeypatch):
+    tasks = [_segment_task(i, 4) for i in range(4)]
+    for task, (start_ms, end_ms) in zip(tasks, [(0, 4300), (4300, 8800), (8800, 13200), (13200, 17000)]):
+        task.segment_info.update(start_ms=start_ms, end_ms=end_ms)
+    service = _service(tasks)
+    state = {'active': 0, 'peak': 0, 'cuts': {}}
+
+    async def fake_download(video_url, dest_path, clip_id=None):
+        return dest_path
+
+    async def fake_keyframes(path):
+        return [i * 1.0 for i in range(21)]
+
+    async def fake_cut(input_path, keyframes, start_ms, end_ms, task_id, work_dir):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.01)
+        state['active'] -= 1
+        state['cuts'][task_id] = (start_ms, end_ms)
+        return f'https://storage/seg/{task_id}.mp4'
+
+    splitter_stub = types.ModuleType('app.services.smart_clip_splitter')
+    splitter_stub.is_valid_duration = lambda sec: 2.0 <= sec <= 5.0
+    service._download_source_video = fake_download
+    service._cut_and_upload_segment = fake_cut
+    monkeypatch.setattr(ver_module, 'probe_keyframe_times', fake_keyframes)
+    monkeypatch.setattr(ver_module, 'SEGMENT_CUT_CONCURRENCY', 2)
+
+    with patch.dict(sys.modules, {'app.services.smart_clip_splitter': splitter_stub}):
+        urls = run(service.cut_segments_for_tasks(list(reversed(tasks))))
+
+    assert set(urls) == {task.id for task in tasks}
+    assert state['peak'] == 2
+    # 内部边界吸附到最近的关键帧，首尾不变
+    assert [state['cuts'][task.id] for task in tasks] == [
+        (0, 4000), (4000, 9000), (9000, 13000), (13000, 17000),
+    ]
+    assert tasks[1].segment_info['duration_ms'] == 5000
+
+
+def test_concat_command_copies_only_when_requested():
+    assert ver_module.build_concat_command('l.txt', 'o.mp4', True)[-5:] == [
+        '-c', 'copy', '-movflags', '+faststart', 'o.mp4',
+    ]
+    assert 'libx264' in ver_module.build_concat_command('l.txt', 'o.mp4', False)
+
+
+def _segment_task(index, total):
+    task = ver_module.ReplaceTask(
+        id=f'task-{index}', clip_id='clip-1', video_url='https://cdn/source.mp4',
+        strategy=ver_module.ReplaceStrategy.BACKGROUND_SWAP,
+        status=ver_module.ReplaceStatus.PENDING, progress=0,
+    )
+    task.segment_info = {
+        'parent_task_id': 'parent-1', 'segment_index': index, 'total_segments': total,
+        'start_ms': index * 5000, 'end_ms': (index + 1) * 5000,
+    }
+    return task
+
+
+def _service(tasks):
+    service = ver_module.VideoElementReplaceService.__new__(ver_module.VideoElementReplaceService)
+    service._tasks = {task.id: task for task in tasks}
+    return service
+
+
+def test_segments_run_with_in_flight_limit_and_merge_once():
+    tasks = [_segment_task(i, 5) for i in range(5)]
+    service = _service(tasks)
+    state = {'active': 0, 'peak': 0, 'cut_rounds': 0, 'merged': None}
+
+    async def fake_cut(batch):
+        state['cut_rounds'] += 1
+        return {task.id: f'https://storage/seg/{task.id}.mp4' for task in batch}
+
+    async def fake_execute(task_id, progress_callback=None, segment_video_url=None, auto_merge=True):
+        assert not auto_merge
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.01)
+        state['active'] -= 1
+        task = service._tasks[task_id]
+        task.result_video_url = segment_video_url.replace('/seg/', '/out/')
+        task.status = ver_module.ReplaceStatus.COMPLETED
+        return task
+
+    async def fake_merge(urls, output_task_id):
+        state['merged'] = (urls, output_task_id)
+        return 'https://storage/merged.mp4'
+
+    service.cut_segments_for_tasks = fake_cut
+    service.execute_background_replace_with_split = fake_execute
+    service.merge_segment_videos = fake_merge
+
+    progress = []
+
+    async def on_progress(value, message):
+        progress.append(value)
+
+    merged = run(service.execute_segment_tasks(
+        [t.id for t in reversed(tasks)], progress_callback=on_progress, max_in_flight=2,
+    ))
+
+    assert merged == 'https://storage/merged.mp4'
+    assert state['peak'] == 2
+    assert state['cut_rounds'] == 1
+    assert state['merged'] == ([f'https://storage/out/task-{i}.mp4' for i in range(5)], 'parent-1')
+    assert progress[-1] == 100
+
+
+def test_unmerged_segments_return_without_merging():
+    tasks = [_segment_task(i, 2) for i in range(2)]
+    service = _service(tasks)
+
+    async def fake_cut(batch):
+        return {task.id: 'https://storage/seg.mp4' for task in batch}
+
+    async def fake_execute(task_id, progress_callback=None, segment_video_url=None, auto_merge=True):
+        task = service._tasks[task_id]
+        task.result_video_url = 'https://storage/out.mp4'
+        return task
+
+    async def fake_merge(urls, output_task_id):
+        raise AssertionError('should not merge')
+
+    service.cut_segments_for_tasks = fake_cut
+    service.execute_background_replace_with_split = fake_execute
+    service.merge_segment_videos = fake_merge
+
+    assert run(service.execute_segment_tasks([t.id for t in tasks], merge=False)) is None
+
+
+def test_failed_segment_skips_merge():
+    tasks = [_segment_task(i, 3) for i in range(3)]
+    service = _service(tasks)
+
+    async def fake_cut(batch):
+        return {task.id: 'https://storage/seg.mp4' for task in batch}
+
+    async def fake_execute(task_id, progress_callback=None, segment_video_url=None, auto_merge=True):
+        if task_id == 'task-1':
+            raise ValueError('Kling 400')
+        task = service._tasks[task_id]
+        task.result_video_url = 'https://storage/out.mp4'
+        return task
+
+    async def fake_merge(urls, output_task_id):
+        raise AssertionError('should not merge')
+
+    service.cut_segments_for_tasks = fake_cut
+    service.execute_background_replace_with_split = fake_execute
+    service.merge_segment_videos = fake_merge
+
+    with pytest.raises(RuntimeError, match='1/3'):
+        run(service.execute_segment_tasks([t.id for t in tasks]))
@@ -253,6 +253,9 @@ export function WorkflowCanvas({ shots, projectId, aspectRatio = '16:9', onShotS
   // ★ 背景替换工作流状态
   const backgroundWorkflow = useBackgroundReplaceWorkflow();
 
+  // 已用 first_result 提前预览的占位节点（收到撤回事件或任务失败时撤回预览，文件已被后端清理）
+  const firstResultPreviewsRef = useRef<Set<string>>(new Set());
+
   // SSE 任务进度 (仅保留 addTask 用于添加任务追踪)
   const { addTask } = useTaskProgress({
     subscriberId: projectId || '',
@@ -265,6 +268,7 @@ export function WorkflowCanvas({ shots, projectId, aspectRatio = '16:9', onShotS
       // ★ 自动更新画布上的占位节点 — 将 AI 生成结果渲染到节点上
       const latestFreeNodes = useVisualEditorStore.getState().freeNodes;
       const placeholderFreeNode = latestFreeNodes.find(n => n.generatingTaskId === taskId);
+      if (placeholderFreeNode) firstResultPreviewsRef.current.delete(placeholderFreeNode.id);
       if (placeholderFreeNode && resultUrl) {
         console.log('[WorkflowCanvas] ✅ AI 任务完成，更新占位节点:', placeholderFreeNode.id, resultUrl);
         // ★ 根据 URL 类型决定：图片设 thumbnail（不设 videoUrl），视频设 videoUrl（不设 thumbnail）
@@ -297,6 +301,28 @@ export function WorkflowCanvas({ shots, projectId, aspectRatio = '16:9', onShotS
         });
       }
     },
+    onFirstResult: (taskId: string, resultUrl: string) => {
+      // ★ 多结果任务：第一个结果先渲染到占位节点，保留生成状态直到 completed
+      const latestFreeNodes = useVisualEditorStore.getState().freeNodes;
+      const placeholderFreeNode = latestFreeNodes.find(n => n.generatingTaskId === taskId);
+      if (!placeholderFreeNode) return;
+      console.log('[WorkflowCanvas] 首个结果就绪，提前预览:', placeholderFreeNode.id, resultUrl);
+      firstResultPreviewsRef.current.add(placeholderFreeNode.id);
+      const isVideoUrl = /\.(mp4|webm|mov|m3u8)(\?|$)/i.test(resultUrl);
+      updateFreeNode(placeholderFreeNode.id, {
+        videoUrl: isVideoUrl ? resultUrl : undefined,
+        thumbnail: isVideoUrl ? undefined : resultUrl,
+        mediaType: isVideoUrl ? 'video' : 'image',
+      });
+    },
+    onFirstResultRetracted: (taskId: string, resultUrl: string) => {
+      // ★ 后端转存失败并将删除该文件：撤回提前预览，生成状态交给随后的 failed 事件处理
+      const latestFreeNodes = useVisualEditorStore.getState().freeNodes;
+      const placeholderFreeNode = latestFreeNodes.find(n => n.generatingTaskId === taskId);
+      if (!placeholderFreeNode || !firstResultPreviewsRef.current.delete(placeholderFreeNode.id)) return;
+      console.log('[WorkflowCanvas] 首个结果已撤回:', placeholderFreeNode.id, resultUrl);
+      updateFreeNode(placeholderFreeNode.id, { videoUrl: undefined, thumbnail: undefined });
+    },
     onTaskFailed: (taskId: string, error: string) => {
       console.error('[WorkflowCanvas] 任务失败:', taskId, error);
 
@@ -305,9 +331,11 @@ export function WorkflowCanvas({ shots, projectId, aspectRatio = '16:9', onShotS
       const placeholderFreeNode = latestFreeNodes.find(n => n.generatingTaskId === taskId);
       if (placeholderFreeNode) {
         console.log('[WorkflowCanvas] ❌ AI 任务失败，清除占位节点生成状态:', placeholderFreeNode.id);
+        const hadPreview = firstResultPreviewsRef.current.delete(placeholderFreeNode.id);
         updateFreeNode(placeholderFreeNode.id, {
           generatingTaskId: undefined,
           generatingCapability: undefined,
+          ...(hadPreview ? { videoUrl: undefined, thumbnail: undefined } : {}),
         });
       }
 
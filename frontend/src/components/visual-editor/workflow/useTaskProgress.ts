@@ -8,7 +8,7 @@ import { useState, useEffect, useCallback, useRef } from 'react';
 export interface TaskEvent {
   task_id: string;
   session_id: string;
-  event_type: 'progress' | 'completed' | 'failed' | 'connected' | 'heartbeat';
+  event_type: 'progress' | 'first_result' | 'first_result_retracted' | 'completed' | 'failed' | 'connected' | 'heartbeat';
   status: string;
   progress: number;
   message?: string;
@@ -31,27 +31,38 @@ interface UseTaskProgressOptions {
   subscriberId: string;
   onTaskComplete?: (taskId: string, resultUrl?: string) => void;
   onTaskFailed?: (taskId: string, error: string) => void;
+  /** 多结果任务的第一个结果已转存（其余结果仍在处理），可提前展示 */
+  onFirstResult?: (taskId: string, resultUrl: string) => void;
+  /** 其余结果转存失败，撤回 onFirstResult 给出的 URL（对应文件已被删除） */
+  onFirstResultRetracted?: (taskId: string, resultUrl: string) => void;
 }
 
-export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }: UseTaskProgressOptions) {
+export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed, onFirstResult, onFirstResultRetracted }: UseTaskProgressOptions) {
   const [tasks, setTasks] = useState<Map<string, Task>>(new Map());
   const [isConnected, setIsConnected] = useState(false);
   const eventSourceRef = useRef<EventSource | null>(null);
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  // 最后收到的事件 id，重连时让服务端补发断线期间的事件
+  const lastEventIdRef = useRef<string>('');
   
   // 用 ref 存储回调，避免 useEffect 依赖变化
   const onTaskCompleteRef = useRef(onTaskComplete);
   const onTaskFailedRef = useRef(onTaskFailed);
+  const onFirstResultRef = useRef(onFirstResult);
+  const onFirstResultRetractedRef = useRef(onFirstResultRetracted);
   
   // 更新 ref
   useEffect(() => {
     onTaskCompleteRef.current = onTaskComplete;
     onTaskFailedRef.current = onTaskFailed;
-  }, [onTaskComplete, onTaskFailed]);
+    onFirstResultRef.current = onFirstResult;
+    onFirstResultRetractedRef.current = onFirstResultRetracted;
+  }, [onTaskComplete, onTaskFailed, onFirstResult, onFirstResultRetracted]);
 
   // 连接 SSE - 只在 subscriberId 变化时重新连接
   useEffect(() => {
     if (!subscriberId) return;
+    lastEventIdRef.current = '';
     
     // 关闭现有连接
     if (eventSourceRef.current) {
@@ -72,7 +83,8 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
       // NEXT_PUBLIC_API_URL 可能包含 /api，需要去掉后再添加正确路径
       let backendUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
       backendUrl = backendUrl.replace(/\/api\/?$/, ''); // 去掉末尾的 /api
-      const eventSource = new EventSource(`${backendUrl}/api/ai-capabilities/events/${subscriberId}`);
+      const query = lastEventIdRef.current ? `?last_event_id=${encodeURIComponent(lastEventIdRef.current)}` : '';
+      const eventSource = new EventSource(`${backendUrl}/api/ai-capabilities/events/${subscriberId}${query}`);
       eventSourceRef.current = eventSource;
 
       eventSource.onopen = () => {
@@ -98,7 +110,10 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
       };
       
       // 处理事件的内部函数
-      const handleTaskEvent = (event: TaskEvent) => {
+      const handleTaskEvent = (event: TaskEvent, eventId?: string) => {
+        if (eventId) {
+          lastEventIdRef.current = eventId;
+        }
         setTasks((prev) => {
           const newTasks = new Map(prev);
           const existing = newTasks.get(event.task_id);
@@ -108,7 +123,10 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
             status: event.status as Task['status'],
             progress: event.progress,
             message: event.message || existing?.message,
-            resultUrl: event.result_url || existing?.resultUrl,
+            // 撤回事件：清掉提前预览的 URL
+            resultUrl: event.event_type === 'first_result_retracted'
+              ? undefined
+              : event.result_url || existing?.resultUrl,
             error: event.error || existing?.error,
           });
           
@@ -120,6 +138,10 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
           onTaskCompleteRef.current?.(event.task_id, event.result_url);
         } else if (event.event_type === 'failed') {
           onTaskFailedRef.current?.(event.task_id, event.error || '未知错误');
+        } else if (event.event_type === 'first_result' && event.result_url) {
+          onFirstResultRef.current?.(event.task_id, event.result_url);
+        } else if (event.event_type === 'first_result_retracted' && event.result_url) {
+          onFirstResultRetractedRef.current?.(event.task_id, event.result_url);
         }
       };
 
@@ -133,17 +155,38 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
         try {
           const event: TaskEvent = JSON.parse(e.data);
           console.log('[SSE] 进度更新:', event);
-          handleTaskEvent(event);
+          handleTaskEvent(event, e.lastEventId);
         } catch (err) {
           console.error('[SSE] 解析进度事件失败:', err);
         }
       });
 
+      // 多结果任务：第一个结果先就绪，任务仍为 processing
+      eventSource.addEventListener('first_result', (e) => {
+        try {
+          const event: TaskEvent = JSON.parse(e.data);
+          console.log('[SSE] 首个结果就绪:', event);
+          handleTaskEvent(event, e.lastEventId);
+        } catch (err) {
+          console.error('[SSE] 解析首个结果事件失败:', err);
+        }
+      });
+
+      eventSource.addEventListener('first_result_retracted', (e) => {
+        try {
+          const event: TaskEvent = JSON.parse(e.data);
+          console.log('[SSE] 首个结果已撤回:', event);
+          handleTaskEvent(event, e.lastEventId);
+        } catch (err) {
+          console.error('[SSE] 解析撤回事件失败:', err);
+        }
+      });
+
       eventSource.addEventListener('completed', (e) => {
         try {
           const event: TaskEvent = JSON.parse(e.data);
           console.log('[SSE] 任务完成:', event);
-          handleTaskEvent(event);
+          handleTaskEvent(event, e.lastEventId);
         } catch (err) {
           console.error('[SSE] 解析完成事件失败:', err);
         }
@@ -153,7 +196,7 @@ export function useTaskProgress({ subscriberId, onTaskComplete, onTaskFailed }:
         try {
           const event: TaskEvent = JSON.parse(e.data);
           console.log('[SSE] 任务失败:', event);
-          handleTaskEvent(event);
+          handleTaskEvent(event, e.lastEventId);
         } catch (err) {
           console.error('[SSE] 解析失败事件失败:', err);
         }
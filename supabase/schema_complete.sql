@@ -1,10 +1,11 @@
 -- ============================================================================
 -- Lepus AI - 完整数据库 Schema
 -- 生成日期: 2026-01-15
--- 最后更新: 2026-02-14
+-- 最后更新: 2026-10-18
 -- 说明: 纯表定义 + 索引 + 种子数据，无函数/触发器/视图（benchmark_segments 除外）
 -- 
 -- 更新记录:
+--   - 2026-10-18: template_ingest_jobs 新增 checkpoint 字段（阶段检查点，worker 崩溃后续跑）
 --   - 2026-02-14: 归并 20260213~20260214 迁移
 --     • 新增: prompt_library, enhancement_strategies, quality_references (向量库 + RPC)
 --     • tasks.task_type CHECK 补充: doubao_image
@@ -942,6 +943,7 @@ CREATE TABLE template_ingest_jobs (
     tags_hint JSONB DEFAULT '[]'::jsonb,
     params JSONB DEFAULT '{}'::jsonb,
     result JSONB DEFAULT '{}'::jsonb,
+    checkpoint JSONB DEFAULT '{}'::jsonb,      -- 阶段检查点: detect / analyze / publish
     error_code TEXT,
     error_message TEXT,
     created_at TIMESTAMPTZ DEFAULT NOW(),